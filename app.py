@@ -2,9 +2,10 @@ import os
 import sys
 import sqlite3
 import hashlib
-from datetime import datetime, timedelta
+from datetime import datetime
 from flask import Flask, request, jsonify, render_template, send_file, redirect, url_for, session, abort
 import staff_db as db
+import sync_codec
 
 # Base directory for absolute paths
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -15,6 +16,17 @@ app = Flask(__name__,
 
 app.secret_key = 'rainstaff_secure_key'
 
+# Request threads share a small pool of WAL connections
+db.configure_connections(mode="pool", pool_size=int(os.environ.get('DB_POOL_SIZE', '8')))
+
+# gzip/zstd: sikistirilmis JSON govdeleri Flask okumadan acilir, JSON yanitlar sikistirilir
+app.wsgi_app = sync_codec.DecodedJSONRequests(app.wsgi_app)
+
+
+@app.after_request
+def compress_json(response):
+    return sync_codec.compress_response(response, request.headers.get('Accept-Encoding'))
+
 # Version Tag for Verification
 VERSION = "staff-v3-final-verified"
 
@@ -22,59 +34,6 @@ VERSION = "staff-v3-final-verified"
 def inject_now():
     return {'now': datetime.now()}
 
-# --- UTILS ---
-
-def calculate_dashboard_stats(timesheets, employees):
-    """Calculate summary stats for the dashboard"""
-    stats = {
-        'overtime_hours': 0,
-        'worked_hours': 0,
-        'night_hours': 0,
-        'special_hours': 0
-    }
-    
-    overtime_by_employee = {} # employee_id -> hours
-    emp_map = {e[0]: e[1] for e in employees} # id -> name
-    
-    for ts in timesheets:
-        # ts format from staff_db.list_timesheets:
-        # (id, emp_id, name, date, start, end, break, special, notes, region)
-        try:
-            start = datetime.strptime(ts[4], "%H:%M")
-            end = datetime.strptime(ts[5], "%H:%M")
-            if end < start:
-                end += timedelta(days=1)
-            
-            worked = (end - start).total_seconds() / 3600 - (ts[6] / 60)
-            stats['worked_hours'] += worked
-            
-            # Simple overtime calculation (> 9 hours)
-            if worked > 9:
-                ov = worked - 9
-                stats['overtime_hours'] += ov
-                emp_id = ts[1]
-                overtime_by_employee[emp_id] = overtime_by_employee.get(emp_id, 0) + ov
-                
-            if ts[7]: # is_special
-                stats['special_hours'] += worked
-        except:
-            continue
-            
-    # Find top overtime
-    top_overtime = None
-    if overtime_by_employee:
-        top_emp_id = max(overtime_by_employee, key=overtime_by_employee.get)
-        top_overtime = {
-            'name': emp_map.get(top_emp_id, "Bilinmiyor"),
-            'overtime': overtime_by_employee[top_emp_id]
-        }
-    
-    # Round everything
-    for k in stats:
-        stats[k] = round(stats[k], 1)
-        
-    return stats, top_overtime
-
 # --- ROUTES ---
 
 @app.route('/health')
@@ -138,15 +97,16 @@ def dashboard():
     
     try:
         user = db.get_user(session['user_id'])
-        employees = db.get_all_employees()
-        timesheets = db.get_all_timesheets()
         
-        # Calculate stats
-        summary, top_overtime = calculate_dashboard_stats(timesheets, employees)
+        # Sayfa iskelet: KPI ve seriler /api/dashboard/summary'den (SQL GROUP BY, onbellekli)
+        summary = {}
+        top_overtime = None
         
         # Safe defaults for dashboard template variables
         alert_counts = {'urgent': 0, 'bad': 0, 'repeat': 0, 'total': 0, 'good': 0}
         oil_counts = {'urgent': 0, 'warning': 0}
+        quality_counts = {'critical': 0, 'total': 0}
+        range_summary = {}
         open_faults = []
         quality_alerts = []
         monthly_summary = []
@@ -160,12 +120,12 @@ def dashboard():
         
         return render_template('dashboard.html', 
                              user=user,
-                             employees=employees,
-                             timesheets=timesheets,
                              summary=summary,
                              top_overtime=top_overtime,
                              alert_counts=alert_counts,
                              oil_counts=oil_counts,
+                             quality_counts=quality_counts,
+                             range_summary=range_summary,
                              open_faults=open_faults,
                              quality_alerts=quality_alerts,
                              monthly_summary=monthly_summary,
@@ -181,31 +141,52 @@ def dashboard():
     except Exception as e:
         return render_template('error.html', error=str(e)), 500
 
+@app.route('/api/dashboard/summary')
+def api_dashboard_summary():
+    """Bu ayin KPI'lari ve gunluk/haftalik/aylik saat serileri (veri nesli basina onbellekli)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        user = db.get_user(session['user_id'])
+        region = None if user['region'] == 'ALL' else user['region']
+        return jsonify(db.dashboard_summary(region=region)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/sync', methods=['POST'])
 def sync_upload():
     try:
-        if 'db' not in request.files:
-            return jsonify({'success': False, 'error': 'No file part'}), 400
-        
-        file = request.files['db']
-        if file.filename == '':
-            return jsonify({'success': False, 'error': 'No selected file'}), 400
-
-        # Save incoming DB temporarily
         temp_path = os.path.join(db.DB_DIR, f"incoming_{datetime.now().timestamp()}.db")
-        file.save(temp_path)
+        if request.mimetype == 'application/octet-stream':
+            # Ham govde (gzip/zstd olabilir): bellege almadan diske acilir
+            try:
+                sync_codec.decode_stream(request.stream, temp_path, request.headers.get('Content-Encoding'))
+            except sync_codec.UnsupportedEncoding:
+                return jsonify({'success': False, 'error': 'Unsupported Content-Encoding'}), 415, {
+                    'Accept-Encoding': sync_codec.accept_encoding_header()
+                }
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+        else:
+            if 'db' not in request.files:
+                return jsonify({'success': False, 'error': 'No file part'}), 400
+            
+            file = request.files['db']
+            if file.filename == '':
+                return jsonify({'success': False, 'error': 'No selected file'}), 400
+
+            # Save incoming DB temporarily
+            file.save(temp_path)
         
         # Merge using the logic in staff_db
-        success, message = db.merge_databases(temp_path, db.DB_PATH)
-        
-        # Clean up
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        try:
+            merged = db.merge_databases(temp_path, db.DB_PATH)
+        finally:
+            # Clean up
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
             
-        if success:
-            return jsonify({'success': True, 'message': message})
-        else:
-            return jsonify({'success': False, 'error': message}), 500
+        return jsonify({'success': True, 'merged': merged})
             
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -216,7 +197,46 @@ def sync_download():
     if not os.path.exists(db.DB_PATH):
         return jsonify({'success': False, 'error': 'Master DB not found'}), 404
         
-    return send_file(db.DB_PATH, as_attachment=True, download_name='puantaj.db')
+    # Icerik ozeti ETag: If-None-Match -> 304, Range ile yarim kalan indirme devam eder;
+    # ALL disindaki X-Region yalnizca o bolgenin satirlarini (ve baglandiklari satirlari) alir
+    snapshot_path, etag = db.download_snapshot(db.DB_PATH, request.headers.get('X-Region', '') or 'ALL')
+    # gzip/zstd kabul eden istemciye onceden sikistirilmis kopya (Range sikistirilmis baytlara uygulanir)
+    encoding = sync_codec.choose_encoding(request.headers.get('Accept-Encoding'))
+    if encoding:
+        snapshot_path = sync_codec.encoded_copy(snapshot_path, encoding)
+        etag = f"{etag}-{encoding}"
+    response = send_file(snapshot_path, as_attachment=True, download_name='puantaj.db',
+                         etag=etag, conditional=True, max_age=0)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.update(('Accept-Encoding', 'X-Region'))
+    return response
+
+@app.route('/sync/delta', methods=['GET', 'POST'])
+def sync_delta():
+    # Satir bazli senkron; 409 -> istemci /sync + /sync/download'a doner
+    try:
+        region = request.headers.get('X-Region', '') or 'ALL'
+        # Istemcinin indirdigi bolgesel kopya: cekilen satirlar o bolgeyle sinirli
+        scope = request.headers.get('X-Sync-Scope', '') or 'ALL'
+        payload = (request.get_json(silent=True) or {}) if request.method == 'POST' else {}
+        since = request.args.get('since', type=int)
+        if since is None:
+            since = payload.get('since')
+        if not isinstance(since, int):
+            return jsonify({'success': False, 'error': 'since required'}), 400
+        if not os.path.exists(db.DB_PATH) or not db.sync_delta_available(since):
+            return jsonify({'success': False, 'error': 'full_sync_required'}), 409
+
+        applied = {}
+        if payload.get('upserts') or payload.get('deletes'):
+            applied = db.apply_sync_delta(payload, origin=region)
+        delta = db.collect_sync_delta(since, skip_origin=region, region=None if scope == 'ALL' else scope)
+        db.set_sync_watermark(region, push_seq=payload.get('seq'), pull_seq=delta['seq'])
+        db.compact_change_log(db.min_sync_pull_seq())
+        return jsonify({'success': True, 'applied': applied, **delta})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
 
 # --- ADDITIONAL MODULE ROUTES ---
 
@@ -27,6 +27,9 @@ from tkcalendar import DateEntry
 
 import puantaj_db as db
 import report
+import sync_codec
+import sync_scheduler
+import http_transport
 
 try:
     import winsound
@@ -34,19 +37,34 @@ except ImportError:
     winsound = None
 try:
     import requests
+    # Raw (undecoded) response reads raise urllib3 errors directly
+    from urllib3.exceptions import HTTPError as TransferError
 except ImportError:
     requests = None
+    TransferError = None
 
 DATE_FMT = "YYYY-MM-DD"
 TIME_FMT = "HH:MM"
 KEEPALIVE_SECONDS = 300
+SYNC_DOWNLOAD_ATTEMPTS = 3
 REGIONS = ["Ankara", "Izmir", "Bursa", "Istanbul"]
 VIEW_REGIONS = ["Tum Bolgeler"] + REGIONS
 DEFAULT_OIL_INTERVAL_KM = 14000
 DEFAULT_OIL_SOON_KM = 2000
+# Alert tree labels for db.list_deadlines kinds
+DEADLINE_LABELS = {
+    "inspection": "Muayene",
+    "insurance": "Sigorta",
+    "maintenance": "Bakim",
+    "license": "Ehliyet",
+}
 LOG_DIR = os.path.join(os.path.dirname(db.DB_DIR), "logs")
 LOG_PATH = os.path.join(LOG_DIR, "rainstaff.log")
 
+
+class SyncError(Exception):
+    """Senkron basarisiz (HTTP hatasi); zamanlayici geri cekilip tekrar dener."""
+
 VEHICLE_CHECKLIST = [
     ("body_dent", "Govde ezik/cizik"),
     ("paint_damage", "Boya hasari"),
@@ -93,17 +111,6 @@ def build_header_aliases(alias_config):
     return result
 
 
-def days_until(date_str):
-    """Return days from today to the given ISO date (positive = future, negative = past)."""
-    if not date_str:
-        return None
-    try:
-        target = datetime.strptime(date_str, "%Y-%m-%d").date()
-    except ValueError:
-        return None
-    return (target - datetime.now().date()).days
-
-
 def normalize_date_value(value):
     """Import icin flexible tarih normalizasyonu; Excel float veya string kabul eder."""
     if value is None or value == "":
@@ -455,8 +462,12 @@ class PuantajApp(tk.Tk):
         self.current_user = None
         self.current_region = None
         self.is_admin = False
+        # Tek saat hesaplama iscisi; calisirken gelen istekler bir sonraki tura eklenir
+        self._hours_recompute_lock = threading.Lock()
+        self._hours_recompute_reasons = []
+        self._hours_recompute_running = False
 
-        self.settings = db.get_all_settings()
+        self._reload_settings()
         self.themes = {
             "Gece": {
                 "bg_app": "#1E1E1E",
@@ -515,6 +526,10 @@ class PuantajApp(tk.Tk):
         self.service_visit_map = {}
         self.shift_template_map = {}
         self.status_var = tk.StringVar()
+        self.sync_state_var = tk.StringVar()
+        # Tek senkron is parcacigi: tetikler kuyrukta birlesir, hatada geri cekilir
+        self._sync_target = None
+        self.sync_scheduler = sync_scheduler.SyncScheduler(self._run_scheduled_sync, self._on_sync_state)
         self.ts_original = None
         self.ts_editing_id = None
         self.vehicle_original_plate = None
@@ -559,6 +574,8 @@ class PuantajApp(tk.Tk):
     def _startup_step_data(self):
         self._load_tab_data(self.tab_employees)
         self._start_keepalive()
+        self.sync_scheduler.start()
+        self._start_hours_recompute("startup")
         self.protocol("WM_DELETE_WINDOW", self._on_close)
         self._hide_loading()
 
@@ -638,13 +655,16 @@ class PuantajApp(tk.Tk):
             try:
                 headers = {"X-API-KEY": token} if token else {}
                 url = sync_url.rstrip("/") + "/health"
-                requests.get(url, headers=headers, timeout=6)
+                # Havuzdaki baglanti acik kalir: sonraki senkron TLS el sikismasi odemez
+                http_transport.get(url, headers=headers)
             except Exception:
                 pass
 
     def _on_close(self):
         if hasattr(self, "_keepalive_stop"):
             self._keepalive_stop.set()
+        self.sync_scheduler.stop(timeout=0)
+        http_transport.close()
         self.destroy()
 
     def _login_prompt(self):
@@ -1056,8 +1076,12 @@ class PuantajApp(tk.Tk):
 
         self.notebook.bind("<<NotebookTabChanged>>", self._on_tab_changed)
 
-        status_bar = ttk.Label(self, textvariable=self.status_var, anchor=tk.W, foreground="#5B9BD5")
-        status_bar.pack(fill=tk.X, padx=10, pady=(0, 8))
+        status_frame = ttk.Frame(self)
+        status_frame.pack(fill=tk.X, padx=10, pady=(0, 8))
+        sync_state_label = ttk.Label(status_frame, textvariable=self.sync_state_var, anchor=tk.E, foreground="#B0B0B0")
+        sync_state_label.pack(side=tk.RIGHT)
+        status_bar = ttk.Label(status_frame, textvariable=self.status_var, anchor=tk.W, foreground="#5B9BD5")
+        status_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
         self.status_var.set("Hazir")
 
     def _on_tab_changed(self, _event):
@@ -1158,6 +1182,42 @@ class PuantajApp(tk.Tk):
             self.log_text.see(tk.END)
         self.after(500, self._drain_log_queue)
 
+    def _reload_settings(self):
+        """Re-read settings; calc rules are rebuilt only if an hour setting changed."""
+        self.settings = db.get_all_settings()
+        try:
+            self.calc_rules = calc.get_rules(self.settings)
+        except ValueError:
+            # Gecersiz saat ayari: hesaplar eskisi gibi satir bazinda hata verir
+            self.calc_rules = self.settings
+
+    def _start_hours_recompute(self, reason):
+        with self._hours_recompute_lock:
+            self._hours_recompute_reasons.append(reason)
+            if self._hours_recompute_running:
+                return
+            self._hours_recompute_running = True
+        thread = threading.Thread(target=self._hours_recompute_worker, daemon=True)
+        thread.start()
+
+    def _hours_recompute_worker(self):
+        """Saat ayarlari degisen puantaj satirlarinin hesaplanmis saatlerini arka planda gunceller."""
+        while True:
+            with self._hours_recompute_lock:
+                reasons = self._hours_recompute_reasons
+                self._hours_recompute_reasons = []
+                if not reasons:
+                    self._hours_recompute_running = False
+                    return
+            reason = ", ".join(dict.fromkeys(reasons))
+            try:
+                count = db.recompute_stale_timesheets()
+                if count and self.logger:
+                    self.logger.info("Recomputed hours for %s timesheets (%s)", count, reason)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error("Hours recompute error (%s): %s", reason, str(e))
+
     def clear_log_view(self):
         if hasattr(self, "log_text"):
             self.log_text.configure(state=tk.NORMAL)
@@ -1171,7 +1231,7 @@ class PuantajApp(tk.Tk):
             sync_url = self.sync_url_var.get().strip()
             token = self.sync_token_var.get().strip()
         else:
-            self.settings = db.get_all_settings()
+            self._reload_settings()
             enabled = self.settings.get("sync_enabled") == "1"
             sync_url = self.settings.get("sync_url", "").strip()
             token = self.settings.get("sync_token", "").strip()
@@ -1184,98 +1244,294 @@ class PuantajApp(tk.Tk):
         if not sync_url:
             self.status_var.set("Senkron URL bos")
             return
-        self.status_var.set("Senkron basladi...")
-        thread = threading.Thread(target=self._sync_worker, args=(sync_url, token, reason), daemon=True)
-        thread.start()
+        # Elle senkron hemen (ve kaydedilmemis ayarlarla) calisir; yazma tetikleri birlesip bekler
+        immediate = force or reason == "manual"
+        if force:
+            self._sync_target = (sync_url, token)
+        if immediate:
+            self.status_var.set("Senkron basladi...")
+        self.sync_scheduler.trigger(reason, immediate=immediate)
+
+    def _run_scheduled_sync(self, reasons):
+        """SyncScheduler is parcaciginda tek calisma; tetik nedenleri tek senkronda toplanir."""
+        reason = "manual" if "manual" in reasons else reasons[-1]
+        target, self._sync_target = self._sync_target, None
+        if target is None:
+            settings = db.get_all_settings()
+            if settings.get("sync_enabled") != "1" or not settings.get("sync_url", "").strip():
+                return
+            target = (settings.get("sync_url", "").strip(), settings.get("sync_token", "").strip())
+        if self.logger and len(reasons) > 1:
+            self.logger.info("Coalesced sync triggers: %s", ", ".join(reasons))
+        self._sync_worker(target[0], target[1], reason)
+
+    def _on_sync_state(self, state):
+        self.after(0, lambda: self.sync_state_var.set(self._format_sync_state(state)))
+
+    def _format_sync_state(self, state):
+        """Durum cubugu metni: bosta / calisiyor / sonraki calisma / son sure."""
+        last = ""
+        if state["last_duration"] is not None:
+            last = f" (son: {state['last_duration']:.1f} sn)"
+        next_run = ""
+        if state["next_run"] is not None:
+            next_run = datetime.fromtimestamp(state["next_run"]).strftime("%H:%M:%S")
+        if state["state"] == sync_scheduler.RUNNING:
+            return "Senkron: calisiyor..."
+        if state["state"] == sync_scheduler.WAITING:
+            return f"Senkron: {next_run} bekliyor{last}"
+        if state["state"] == sync_scheduler.BACKOFF:
+            return f"Senkron: hata, tekrar {next_run} ({state['failures']}. deneme){last}"
+        if state["state"] == sync_scheduler.STOPPED:
+            return "Senkron: durdu"
+        return f"Senkron: bosta{last}"
 
     def _sync_worker(self, sync_url, token, reason):
-        """Senkronizasyon worker; upload + download + merge logic (19 Ocak)."""
+        """
+        Tek senkron calismasi; once satir bazli delta, gerekirse tam dosya upload + download.
+        Basarisizsa sonucu bildirip SyncError firlatir (zamanlayici geri cekilir).
+        """
         msg = None
+        failed = False
         try:
-            # Step 1: Upload local DB to server
             # Get region from settings or use default
             settings = db.get_all_settings()
             user_region = settings.get("user_region", "Ankara")
             current_region = user_region or "ALL"
+            # Admin tum bolgeleri, kullanici yalnizca kendi bolgesini indirir; yerel dosyanin
+            # hangi kapsamda oldugu son indirmeden bilinir, kapsam degistiyse tam senkron
+            scope = "ALL" if self.is_admin else (self.current_region or current_region)
+            held_scope = settings.get("sync_download_scope") or "ALL"
+
+            # Sunucu watermark'lari ve "kendi degisikligi" suzmesi bu kurulumun kimligiyle tutulur
+            client = db.sync_client_id()
+            if scope == held_scope and db.get_sync_watermark(client) is not None:
+                msg = self._sync_delta(sync_url, token, reason, current_region, client, scope)
+            if msg is None:
+                msg = self._sync_full(sync_url, token, reason, current_region, client, held_scope, scope)
             
-            with open(db.DB_PATH, "rb") as handle:
-                files = {"db": ("puantaj.db", handle, "application/octet-stream")}
-                headers = {
-                    "X-API-KEY": token,
-                    "X-Region": current_region,
-                    "X-Reason": reason
-                }
-                url = sync_url.rstrip("/") + "/sync"
-                resp = requests.post(url, headers=headers, files=files, timeout=10)
-
-            # Basarili upload doğrulama
-            if resp.status_code != 200:
-                msg = f"Senkron hatasi: Upload HTTP {resp.status_code}"
-                if self.logger:
-                    self.logger.warning("Cloud sync upload error: %s", msg)
-                self.after(0, lambda: self._notify_sync_result(msg, reason))
-                return
-            
-            # Log DEBUG info from server if available
-            try:
-                data = resp.json()
-                if "debug_logs" in data and self.logger:
-                    self.logger.info("--- SERVER SYNC DEBUG LOGS ---")
-                    for log_line in data["debug_logs"]:
-                        self.logger.info("SERVER: %s", log_line)
-                    self.logger.info("------------------------------")
-            except Exception as e:
-                if self.logger:
-                    self.logger.warning("Could not parse server debug logs: %s", str(e))
-
-            # Step 2: Download merged DB from server
-            headers = {"X-API-KEY": token}
-            download_url = sync_url.rstrip("/") + "/sync/download"
-            
-            resp = requests.get(download_url, headers=headers, timeout=10)
-            
-            if resp.status_code != 200:
-                msg = f"Senkron hatasi: Download HTTP {resp.status_code}"
-                if self.logger:
-                    self.logger.warning("Cloud sync download error: %s", msg)
-                self.after(0, lambda: self._notify_sync_result(msg, reason))
-                return
-
-            # Step 3: Backup current local database
-            import shutil
-            backup_path = db.DB_PATH + ".sync_backup"
-            if os.path.isfile(db.DB_PATH):
-                shutil.copy2(db.DB_PATH, backup_path)
-
-            # Step 4: Write downloaded database as new local DB
-            with open(db.DB_PATH, "wb") as f:
-                f.write(resp.content)
-
-            # Step 4.5: Ensure DB schema is up to date (creates deleted_records table if missing)
-            db.init_db()
-
-            # Step 5: Refresh UI to reflect merged data
-            self.after(0, self._refresh_all_after_sync)
-
-            msg = "Senkron basarili"
-            if self.logger:
-                self.logger.info("Cloud sync completed (upload+download+merge): %s", reason)
-            
+        except SyncError as e:
+            msg, failed = str(e), True
         except requests.Timeout:
-            msg = "Senkron hatasi: Baglanti timeout"
+            msg, failed = "Senkron hatasi: Baglanti timeout", True
             if self.logger:
                 self.logger.warning("Cloud sync timeout")
         except requests.RequestException as e:
-            msg = f"Senkron hatasi: {str(e)[:80]}"
+            msg, failed = f"Senkron hatasi: {str(e)[:80]}", True
             if self.logger:
                 self.logger.warning("Cloud sync request error: %s", str(e))
         except Exception as e:
-            msg = f"Senkron hatasi: {str(e)[:80]}"
+            msg, failed = f"Senkron hatasi: {str(e)[:80]}", True
             if self.logger:
                 self.logger.error("Cloud sync unexpected error: %s", str(e))
 
         if msg:
             self.after(0, lambda: self._notify_sync_result(msg, reason))
+        if failed:
+            raise SyncError(msg)
+
+    def _sync_delta(self, sync_url, token, reason, current_region, client, scope="ALL"):
+        """Sadece degisen satirlari gonderir/alir; tam senkron gerekiyorsa None doner."""
+        push_seq, pull_seq = db.get_sync_watermark(client)
+        outgoing = db.collect_sync_delta(push_seq)
+        payload = {
+            "since": pull_seq,
+            "seq": outgoing["seq"],
+            "upserts": outgoing["upserts"],
+            "deletes": outgoing["deletes"],
+        }
+        headers = {
+            "X-API-KEY": token,
+            "X-Region": current_region,
+            "X-Sync-Scope": scope,
+            "X-Sync-Client": client,
+            "X-Reason": reason
+        }
+        url = sync_url.rstrip("/") + "/sync/delta"
+        resp = sync_codec.post_json(http_transport.post, url, payload, headers=headers)
+
+        # Eski sunucu (404) veya bilinmeyen watermark (409): tam senkrona don
+        if resp.status_code in (404, 409):
+            if self.logger:
+                self.logger.info("Delta sync unavailable (HTTP %s), falling back to full sync", resp.status_code)
+            return None
+        if resp.status_code != 200:
+            msg = f"Senkron hatasi: Delta HTTP {resp.status_code}"
+            if self.logger:
+                self.logger.warning("Cloud sync delta error: %s", msg)
+            raise SyncError(msg)
+
+        incoming = resp.json()
+        # Istek surerken yapilan yerel degisiklikler ezilmez, bir sonraki senkronda gider
+        applied = db.apply_sync_delta(incoming, protect_after=outgoing["seq"])
+        db.set_sync_watermark(client, push_seq=outgoing["seq"], pull_seq=incoming["seq"])
+        # Sunucunun aldigi yerel degisiklikler artik gerekmez
+        db.compact_change_log(outgoing["seq"])
+        if applied:
+            db.recompute_stale_timesheets()
+            self.after(0, self._refresh_all_after_sync)
+
+        if self.logger:
+            self.logger.info(
+                "Cloud sync completed (delta, sent=%s, received=%s): %s",
+                incoming.get("applied"), applied, reason
+            )
+        return "Senkron basarili"
+
+    def _sync_full(self, sync_url, token, reason, current_region, client, held_scope="ALL", scope="ALL"):
+        """
+        Tam dosya senkronu (upload + download + merge logic, 19 Ocak); delta icin watermark kurar.
+        held_scope: yerel dosyanin kapsami (yuklenen), scope: indirilecek kapsam (bolge ya da ALL).
+        """
+        # Step 1: Upload local DB to server
+        # WAL icerigini ana dosyaya yaz; yuklenen dosya guncel olsun
+        db.checkpoint()
+        headers = {
+            "X-API-KEY": token,
+            "X-Region": current_region,
+            "X-Sync-Scope": held_scope,
+            "X-Sync-Client": client,
+            "X-Reason": reason,
+            # Birlestirme sunucuda kuyruga alinir: 202 + is kimligi, durum sorgulanir
+            "Prefer": "respond-async"
+        }
+        url = sync_url.rstrip("/") + "/sync"
+
+        def upload_multipart():
+            # Sunucu sikistirilmis ham govdeyi tanimiyor: eski multipart yukleme
+            with open(db.DB_PATH, "rb") as handle:
+                files = {"db": ("puantaj.db", handle, "application/octet-stream")}
+                return http_transport.post(url, headers=headers, files=files)
+
+        # Parcali, kaldigi yerden devam eden yukleme (/sync/uploads); oturum DB disinda saklanir
+        resp = sync_codec.upload_resumable(http_transport.request, sync_url, db.DB_PATH, headers=headers,
+                                           state_path=db.DB_PATH + ".upload.json")
+        if resp is None:
+            # Sunucuda /sync/uploads yok: gzip/zstd ile sikistirilmis tek govde
+            resp = sync_codec.post_file(http_transport.post, url, db.DB_PATH, headers=headers,
+                                        fallback=upload_multipart)
+
+        # Indirme birlestirme bittikten sonra: kuyruktaki isin durumu sorgulanir
+        resp = http_transport.wait_for_job(resp, headers={"X-API-KEY": token})
+
+        # Basarili upload doğrulama
+        if resp.status_code == 202:
+            msg = "Senkron hatasi: Sunucu birlestirmesi zaman asimina ugradi"
+            if self.logger:
+                self.logger.warning("Cloud sync merge still running: %s", resp.headers.get("Location"))
+            raise SyncError(msg)
+        if resp.status_code != 200:
+            msg = f"Senkron hatasi: Upload HTTP {resp.status_code}"
+            if self.logger:
+                self.logger.warning("Cloud sync upload error: %s", msg)
+            raise SyncError(msg)
+        
+        # Log server merge counts if available
+        try:
+            data = resp.json()
+            if "merged" in data and self.logger:
+                self.logger.info("Server merge tombstones: %s", data["merged"].get("tombstones"))
+                for table, counts in data["merged"].get("tables", {}).items():
+                    self.logger.info("Server merge %s: %s", table, counts)
+        except Exception as e:
+            if self.logger:
+                self.logger.warning("Could not parse server merge counts: %s", str(e))
+
+        # Step 2: Download merged DB from server
+        # X-Region: sunucu bu bolgenin alt kumesini gonderir (ALL = tum DB)
+        headers = {"X-API-KEY": token, "X-Region": scope}
+        download_url = sync_url.rstrip("/") + "/sync/download"
+        # Saklanan ETag yerel dosyayi ancak o indirmeden beri yerel degisiklik yoksa tanimlar
+        settings = db.get_all_settings()
+        etag = None
+        if scope == held_scope and settings.get("sync_download_seq") == str(db.latest_change_seq()):
+            etag = settings.get("sync_download_etag") or None
+
+        download_path = db.DB_PATH + ".download"
+        status, new_etag = self._download_db(download_url, headers, download_path, etag)
+
+        if status == 304:
+            # Sunucu kopyasi degismedi: yerel DB zaten ayni, yeniden yazilmaz
+            db.compact_change_log(db.reset_sync_watermark(client))
+            if self.logger:
+                self.logger.info("Cloud sync completed (upload, download not modified): %s", reason)
+            return "Senkron basarili"
+        if status != 200:
+            msg = f"Senkron hatasi: Download HTTP {status}"
+            if self.logger:
+                self.logger.warning("Cloud sync download error: %s", msg)
+            raise SyncError(msg)
+
+        # Step 3: Backup current local database
+        backup_path = db.DB_PATH + ".sync_backup"
+        if os.path.isfile(db.DB_PATH):
+            db.create_backup(backup_path)
+
+        # Step 4: Swap the downloaded database in as the new local DB
+        db.replace_db_file(download_path)
+
+        # Step 4.5: Ensure DB schema is up to date (creates deleted_records table if missing)
+        db.init_db()
+        db.recompute_stale_timesheets()
+        # Sonraki senkronlar bu dosyadan itibaren delta ile yapilir
+        db.compact_change_log(db.reset_sync_watermark(client))
+        db.set_setting("sync_download_scope", scope)
+        # Indirilen dosyanin ayarlari sunucudan gelir; kurulum kimligi korunur
+        db.set_setting("sync_client_id", client)
+        if new_etag:
+            db.set_setting("sync_download_etag", new_etag)
+            db.set_setting("sync_download_seq", str(db.latest_change_seq()))
+
+        # Step 5: Refresh UI to reflect merged data
+        self.after(0, self._refresh_all_after_sync)
+
+        if self.logger:
+            self.logger.info("Cloud sync completed (upload+download+merge): %s", reason)
+        return "Senkron basarili"
+
+    def _download_db(self, download_url, headers, download_path, etag=None):
+        """
+        /sync/download -> download_path, akisla. Kopan indirme Range + If-Range ile kaldigi
+        yerden devam eder. Doner: (HTTP durum, ETag); 304 = etag hala gecerli, dosya yazilmadi.
+        Sunucu gzip/zstd gonderirse sikistirilmis baytlar indirilir, sonra diske acilir.
+        """
+        transfer_path = download_path + ".transfer"
+        offset = 0
+        response_etag = None
+        encoding = None
+        for attempt in range(SYNC_DOWNLOAD_ATTEMPTS):
+            request_headers = dict(headers, **{"Accept-Encoding": sync_codec.accept_encoding_header()})
+            if offset and response_etag:
+                request_headers["Range"] = f"bytes={offset}-"
+                request_headers["If-Range"] = response_etag
+            elif etag:
+                request_headers["If-None-Match"] = etag
+            try:
+                with http_transport.get(download_url, headers=request_headers, stream=True) as resp:
+                    if resp.status_code == 304:
+                        return 304, etag
+                    if resp.status_code == 200:
+                        # Tam icerik (ilk istek ya da sunucu kopyasi degisti): bastan yaz
+                        offset = 0
+                    elif resp.status_code != 206:
+                        return resp.status_code, None
+                    response_etag = resp.headers.get("ETag")
+                    encoding = resp.headers.get("Content-Encoding")
+                    with open(transfer_path, "r+b" if offset else "wb") as handle:
+                        handle.seek(offset)
+                        handle.truncate()
+                        # Ham baytlar: Range ofsetleri sikistirilmis govdeye aittir
+                        for chunk in resp.raw.stream(sync_codec.CHUNK_SIZE, decode_content=False):
+                            handle.write(chunk)
+                            offset += len(chunk)
+                sync_codec.decode_file(transfer_path, download_path, encoding)
+                os.remove(transfer_path)
+                return 200, response_etag
+            except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError, TransferError) as e:
+                if not (offset and response_etag) or attempt == SYNC_DOWNLOAD_ATTEMPTS - 1:
+                    raise
+                if self.logger:
+                    self.logger.warning("Download interrupted at %s bytes, resuming: %s", offset, str(e))
 
     def manual_sync(self):
         if not self.sync_enabled_var.get():
@@ -1291,7 +1547,7 @@ class PuantajApp(tk.Tk):
     def _refresh_all_after_sync(self):
         """Refresh all UI views after sync download to reflect merged data."""
         try:
-            self.settings = db.get_all_settings()
+            self._reload_settings()
             self.refresh_employees()
             self.refresh_timesheets()
             if hasattr(self, 'refresh_report_archive'):
@@ -1699,30 +1955,21 @@ class PuantajApp(tk.Tk):
             end_date=end_date,
             region=self._view_region(),
         )
-        for ts in records:
+        hours = calc.calc_timesheet_rows(records, self.calc_rules, skip_invalid=True)
+        for ts, row_hours in zip(records, hours):
             ts_id, _emp_id, name, work_date, start_time, end_time, break_minutes, is_special, notes, region = ts
-            try:
-                (
-                    worked,
-                    scheduled,
-                    overtime,
-                    night_hours,
-                    overnight_hours,
-                    spec_norm,
-                    spec_ot,
-                    spec_night,
-                ) = calc.calc_day_hours(
-                    work_date,
-                    start_time,
-                    end_time,
-                    break_minutes,
-                    self.settings,
-                    is_special,
-                )
-            except Exception:
-                worked = scheduled = overtime = ""
-                night_hours = overnight_hours = ""
-                spec_norm = spec_ot = spec_night = ""
+            if row_hours is None:
+                row_hours = ("",) * 8
+            (
+                worked,
+                scheduled,
+                overtime,
+                night_hours,
+                overnight_hours,
+                spec_norm,
+                spec_ot,
+                spec_night,
+            ) = row_hours
             tag = "odd" if len(self.timesheet_tree.get_children()) % 2 else "even"
             self.timesheet_tree.insert(
                 "",
@@ -1822,18 +2069,18 @@ class PuantajApp(tk.Tk):
         self.notify("Puantaj kaydedildi.")
 
     def delete_timesheet(self):
-        ts_id = self.ts_editing_id
-        if not ts_id:
-            selected = self.timesheet_tree.selection()
-            if selected:
-                values = self.timesheet_tree.item(selected[0], "values")
-                ts_id = values[0]
-        if not ts_id:
+        ts_ids = [self.ts_editing_id] if self.ts_editing_id else [
+            self.timesheet_tree.item(item, "values")[0] for item in self.timesheet_tree.selection()
+        ]
+        if not ts_ids:
             messagebox.showwarning("Uyari", "Silmek icin puantaj secin.")
             return
-        if messagebox.askyesno("Onay", "Puantaj kaydini silmek istiyor musunuz?"):
-            db.delete_timesheet(parse_int(ts_id))
-            self._log_action("timesheet_delete", f"id={ts_id}")
+        question = "Puantaj kaydini silmek istiyor musunuz?"
+        if len(ts_ids) > 1:
+            question = f"{len(ts_ids)} puantaj kaydini silmek istiyor musunuz?"
+        if messagebox.askyesno("Onay", question):
+            db.delete_timesheets_bulk([parse_int(ts_id) for ts_id in ts_ids])
+            self._log_action("timesheet_delete", f"id={','.join(str(ts_id) for ts_id in ts_ids)}")
             self.refresh_timesheets()
             self.clear_timesheet_form()
             self.notify("Puantaj silindi.")
@@ -1927,9 +2174,8 @@ class PuantajApp(tk.Tk):
 
         header_map = map_headers(rows[0], EMP_HEADER_MAP)
         start_idx = 1 if "full_name" in header_map else 0
-        existing_names = set(self.employee_map.keys())
-        imported = 0
-        skipped = 0
+        region = self._entry_region()
+        employees = []
         for row in rows[start_idx:]:
             def cell(idx):
                 return row[idx] if idx is not None and idx < len(row) else ""
@@ -1945,17 +2191,21 @@ class PuantajApp(tk.Tk):
                 department = str(cell(2)).strip() if len(row) > 2 else ""
                 title = str(cell(3)).strip() if len(row) > 3 else ""
 
-            key = (name, self._entry_region())
-            if not name or key in existing_names:
-                skipped += 1
-                continue
-            db.add_employee(name, identity_no, department, title, self._entry_region())
-            existing_names.add(key)
-            imported += 1
+            employees.append((name, identity_no, department, title, region))
+
+        outcomes = db.upsert_employees_bulk(employees)
+        imported = outcomes.count(db.BULK_INSERTED)
+        updated = outcomes.count(db.BULK_UPDATED)
+        skipped = len(outcomes) - imported - updated
 
         self.refresh_employees()
-        self._log_action("employee_import", f"file={os.path.basename(path)} added={imported} skipped={skipped}")
-        messagebox.showinfo("Bilgi", f"Iceri aktarma tamamlandi. Eklenen: {imported}, Atlanan: {skipped}")
+        self._log_action(
+            "employee_import",
+            f"file={os.path.basename(path)} added={imported} updated={updated} skipped={skipped}",
+        )
+        messagebox.showinfo(
+            "Bilgi", f"Iceri aktarma tamamlandi. Eklenen: {imported}, Guncellenen: {updated}, Atlanan: {skipped}"
+        )
 
     def import_timesheets(self):
         if not self.employee_map:
@@ -1977,9 +2227,9 @@ class PuantajApp(tk.Tk):
 
         header_map = map_headers(rows[0], TS_HEADER_MAP)
         start_idx = 1 if "employee" in header_map else 0
-        imported = 0
         skipped = 0
         missing_employee = 0
+        timesheets = []
 
         for row in rows[start_idx:]:
             def cell(idx):
@@ -2026,17 +2276,13 @@ class PuantajApp(tk.Tk):
             break_minutes = parse_int(break_minutes, 0)
             is_special = 1 if parse_bool(is_special) else 0
 
-            db.add_timesheet(
-                employee_id,
-                work_date,
-                start_time,
-                end_time,
-                break_minutes,
-                is_special,
-                notes,
-                self._entry_region(),
+            timesheets.append(
+                (employee_id, work_date, start_time, end_time, break_minutes, is_special, notes, self._entry_region())
             )
-            imported += 1
+
+        outcomes = db.add_timesheets_bulk(timesheets)
+        imported = outcomes.count(db.BULK_INSERTED)
+        missing_employee += len(outcomes) - imported
 
         self.refresh_timesheets()
         self._log_action(
@@ -2312,7 +2558,10 @@ class PuantajApp(tk.Tk):
         dept_overtime = {}
         alerts = []
         work_days = {}
-        for _ts_id, _emp_id, name, work_date, start_time, end_time, break_minutes, is_special, _notes, _region in records:
+        matched = []
+        departments = []
+        for record in records:
+            name, _notes, _region = record[2], record[8], record[9]
             details = self.employee_details.get((name, _region or ""), {})
             department = details.get("department", "")
             title = details.get("title", "")
@@ -2324,7 +2573,12 @@ class PuantajApp(tk.Tk):
                 hay = " ".join([name, department, title, str(_notes or "")]).lower()
                 if search_text not in hay:
                     continue
+            matched.append(record)
+            departments.append(department)
 
+        hours = calc.calc_timesheet_rows(matched, self.calc_rules)
+        for record, department, row_hours in zip(matched, departments, hours):
+            _ts_id, _emp_id, name, work_date, start_time, end_time, break_minutes, is_special, _notes, _region = record
             (
                 worked,
                 _scheduled,
@@ -2334,14 +2588,7 @@ class PuantajApp(tk.Tk):
                 spec_norm,
                 spec_ot,
                 spec_night,
-            ) = calc.calc_day_hours(
-                work_date,
-                start_time,
-                end_time,
-                break_minutes,
-                self.settings,
-                is_special,
-            )
+            ) = row_hours
             key = (name, _region or "")
             if key not in totals:
                 totals[key] = {
@@ -2906,10 +3153,6 @@ class PuantajApp(tk.Tk):
         self.vehicle_map = {}
 
         oil_due = 0
-        insp_due = 0
-        ins_due = 0
-        maint_due = 0
-        lic_due = 0
 
         for vehicle in vehicles:
             (
@@ -2943,30 +3186,6 @@ class PuantajApp(tk.Tk):
                 elif remaining <= DEFAULT_OIL_SOON_KM:
                     oil_flag = "oil_soon"
 
-            insp_days = days_until(inspection_date)
-            if insp_days is not None and insp_days <= 30:
-                insp_due += 1
-                detail = f"{inspection_date} ({insp_days} gun)"
-                if insp_days < 0:
-                    detail = f"{inspection_date} ({abs(insp_days)} gun gecikme)"
-                self.vehicle_alert_tree.insert("", tk.END, values=(plate, "Muayene", detail))
-
-            ins_days = days_until(insurance_date)
-            if ins_days is not None and ins_days <= 30:
-                ins_due += 1
-                detail = f"{insurance_date} ({ins_days} gun)"
-                if ins_days < 0:
-                    detail = f"{insurance_date} ({abs(ins_days)} gun gecikme)"
-                self.vehicle_alert_tree.insert("", tk.END, values=(plate, "Sigorta", detail))
-
-            maint_days = days_until(maintenance_date)
-            if maint_days is not None and maint_days <= 30:
-                maint_due += 1
-                detail = f"{maintenance_date} ({maint_days} gun)"
-                if maint_days < 0:
-                    detail = f"{maintenance_date} ({abs(maint_days)} gun gecikme)"
-                self.vehicle_alert_tree.insert("", tk.END, values=(plate, "Bakim", detail))
-
             inspections = db.list_vehicle_inspections(vehicle_id=_vid, region=self._view_region())
             last_check = "-"
             last_driver = "-"
@@ -3019,15 +3238,16 @@ class PuantajApp(tk.Tk):
                 tags=(oil_flag,) if oil_flag else (),
             )
 
-        for driver in drivers:
-            _did, name, _cls, license_expiry, _phone, _notes, _region = driver
-            days = days_until(license_expiry)
-            if days is not None and days <= 30:
-                lic_due += 1
-                detail = f"{license_expiry} ({days} gun)"
-                if days < 0:
-                    detail = f"{license_expiry} ({abs(days)} gun gecikme)"
-                self.driver_alert_tree.insert("", tk.END, values=(name, "Ehliyet", detail))
+        due_counts = {}
+        for entity, _eid, name, kind, due_date, days, _severity, _region in db.list_deadlines(
+            region=self._view_region()
+        ):
+            due_counts[kind] = due_counts.get(kind, 0) + 1
+            detail = f"{due_date} ({days} gun)"
+            if days < 0:
+                detail = f"{due_date} ({abs(days)} gun gecikme)"
+            tree = self.vehicle_alert_tree if entity == "vehicle" else self.driver_alert_tree
+            tree.insert("", tk.END, values=(name, DEADLINE_LABELS[kind], detail))
 
         faults = db.list_vehicle_faults(region=self._view_region())
         now = datetime.now().date()
@@ -3086,10 +3306,10 @@ class PuantajApp(tk.Tk):
         self.dashboard_stats["vehicles"].set(str(len(vehicles)))
         self.dashboard_stats["drivers"].set(str(len(drivers)))
         self.dashboard_stats["oil_due"].set(str(oil_due))
-        self.dashboard_stats["inspection_due"].set(str(insp_due))
-        self.dashboard_stats["insurance_due"].set(str(ins_due))
-        self.dashboard_stats["maintenance_due"].set(str(maint_due))
-        self.dashboard_stats["license_due"].set(str(lic_due))
+        self.dashboard_stats["inspection_due"].set(str(due_counts.get("inspection", 0)))
+        self.dashboard_stats["insurance_due"].set(str(due_counts.get("insurance", 0)))
+        self.dashboard_stats["maintenance_due"].set(str(due_counts.get("maintenance", 0)))
+        self.dashboard_stats["license_due"].set(str(due_counts.get("license", 0)))
 
     def clear_vehicle_form(self):
         self.vehicle_id_var.set("")
@@ -3741,7 +3961,7 @@ class PuantajApp(tk.Tk):
                 start_time,
                 end_time,
                 break_minutes,
-                self.settings,
+                self.calc_rules,
                 is_special,
             )
             special_total = round(spec_norm + spec_ot + spec_night, 2)
@@ -5158,6 +5378,7 @@ class PuantajApp(tk.Tk):
     def save_settings(self):
         prev_entry_region = self.settings.get("admin_entry_region", "Ankara")
         prev_view_region = self.settings.get("admin_view_region", "Tum Bolgeler")
+        prev_hour_settings = [self.settings.get(key) for key in calc.HOUR_SETTING_KEYS]
         db.set_setting("company_name", self.company_name_var.get().strip())
         db.set_setting("report_title", self.report_title_var.get().strip())
         db.set_setting("weekday_hours", self.weekday_hours_var.get().strip())
@@ -5172,7 +5393,9 @@ class PuantajApp(tk.Tk):
             new_view_region = self.admin_view_region_var.get().strip() or "Tum Bolgeler"
             db.set_setting("admin_entry_region", new_entry_region)
             db.set_setting("admin_view_region", new_view_region)
-        self.settings = db.get_all_settings()
+        self._reload_settings()
+        if prev_hour_settings != [self.settings.get(key) for key in calc.HOUR_SETTING_KEYS]:
+            self._start_hours_recompute("settings")
         if self.is_admin and prev_view_region != (self.admin_view_region_var.get().strip() or "Tum Bolgeler"):
             self._refresh_region_views()
         self._log_action("settings_save")
@@ -5452,73 +5675,69 @@ class PuantajApp(tk.Tk):
 
             # Parse nested Excel structure
             # Format: Stok header row followed by seri_no child rows (with empty stok_kod)
-            imported = 0
-            with db.get_conn() as conn:
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM stock_inventory WHERE bolge = ?", (bolge,))
-
-                i = start_row
-                while i < len(rows):
-                    row = rows[i]
-
-                    # Check if this is a product header (stok_kod not empty)
-                    stok_kod = str(row[stok_kod_idx]).strip() if stok_kod_idx < len(row) and row[stok_kod_idx] else ''
-
-                    if stok_kod and stok_kod not in ['', 'nan', 'None', 'None']:
-                        # This is a product header
-                        stok_adi = str(row[stok_adi_idx]).strip() if stok_adi_idx < len(row) and row[stok_adi_idx] else ''
-                        seri_sayi = 0
-                        try:
-                            seri_sayi = int(row[seri_sayi_idx]) if seri_sayi_idx < len(row) and row[seri_sayi_idx] else 0
-                        except (ValueError, TypeError):
-                            pass
-
-                        # Collect all following seri_no rows (child rows where stok_kod is empty)
-                        i += 1
-                        seri_count = 0
-                        while i < len(rows):
-                            child_row = rows[i]
-                            child_stok_kod = str(child_row[stok_kod_idx]).strip() if stok_kod_idx < len(child_row) and child_row[stok_kod_idx] else ''
-
-                            # If stok_kod is empty/None, this is a seri_no row
-                            child_stok_kod_value = child_row[stok_kod_idx] if stok_kod_idx < len(child_row) else None
-                            
-                            if child_stok_kod_value is None or not child_stok_kod or child_stok_kod in ['', 'nan', 'None']:
-                                try:
-                                    # Seri no is in seri_no column (column 2) for child rows
-                                    seri_no_value = child_row[seri_no_idx] if seri_no_idx < len(child_row) else None
-                                    seri_no = str(seri_no_value).strip() if seri_no_value is not None else ''
-
-                                    # Extract actual serial number (remove numbering like "1 ST87088" or "1. ST87088")
-                                    if seri_no:
-                                        parts = seri_no.split(maxsplit=1)
-                                        # Fix: Handle both "1" and "1." prefixes
-                                        if len(parts) == 2 and parts[0].replace('.', '', 1).isdigit():
-                                            seri_no = parts[1]
-                                    
-                                    # Skip if seri_no is empty (but allow pure numbers as valid serials)
-                                    if seri_no and seri_no not in ['', 'nan', 'None', 'None']:
-                                        cursor.execute(
-                                            """INSERT INTO stock_inventory
-                                               (stok_kod, stok_adi, seri_no, durum, tarih, girdi_yapan, bolge, adet, updated_at)
-                                               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                                            (stok_kod, stok_adi, seri_no, "OK", datetime.now().strftime("%Y-%m-%d"),
-                                             "system", bolge, 1, datetime.now().isoformat())
-                                        )
-                                        imported += 1
-                                        seri_count += 1
-
-                                    i += 1
-                                except Exception as e:
-                                    if self.logger:
-                                        self.logger.debug(f"Stock seri row error: {e}")
-                                    i += 1
-                                    break
-                            else:
-                                # Next product header found
+            stock_rows = []
+            today = datetime.now().strftime("%Y-%m-%d")
+            i = start_row
+            while i < len(rows):
+                row = rows[i]
+
+                # Check if this is a product header (stok_kod not empty)
+                stok_kod = str(row[stok_kod_idx]).strip() if stok_kod_idx < len(row) and row[stok_kod_idx] else ''
+
+                if stok_kod and stok_kod not in ['', 'nan', 'None', 'None']:
+                    # This is a product header
+                    stok_adi = str(row[stok_adi_idx]).strip() if stok_adi_idx < len(row) and row[stok_adi_idx] else ''
+                    seri_sayi = 0
+                    try:
+                        seri_sayi = int(row[seri_sayi_idx]) if seri_sayi_idx < len(row) and row[seri_sayi_idx] else 0
+                    except (ValueError, TypeError):
+                        pass
+
+                    # Collect all following seri_no rows (child rows where stok_kod is empty)
+                    i += 1
+                    seri_count = 0
+                    while i < len(rows):
+                        child_row = rows[i]
+                        child_stok_kod = str(child_row[stok_kod_idx]).strip() if stok_kod_idx < len(child_row) and child_row[stok_kod_idx] else ''
+
+                        # If stok_kod is empty/None, this is a seri_no row
+                        child_stok_kod_value = child_row[stok_kod_idx] if stok_kod_idx < len(child_row) else None
+                        
+                        if child_stok_kod_value is None or not child_stok_kod or child_stok_kod in ['', 'nan', 'None']:
+                            try:
+                                # Seri no is in seri_no column (column 2) for child rows
+                                seri_no_value = child_row[seri_no_idx] if seri_no_idx < len(child_row) else None
+                                seri_no = str(seri_no_value).strip() if seri_no_value is not None else ''
+
+                                # Extract actual serial number (remove numbering like "1 ST87088" or "1. ST87088")
+                                if seri_no:
+                                    parts = seri_no.split(maxsplit=1)
+                                    # Fix: Handle both "1" and "1." prefixes
+                                    if len(parts) == 2 and parts[0].replace('.', '', 1).isdigit():
+                                        seri_no = parts[1]
+                                
+                                # Skip if seri_no is empty (but allow pure numbers as valid serials)
+                                if seri_no and seri_no not in ['', 'nan', 'None', 'None']:
+                                    stock_rows.append((stok_kod, stok_adi, seri_no, "OK", today, "system", 1))
+                                    seri_count += 1
+
+                                i += 1
+                            except Exception as e:
+                                if self.logger:
+                                    self.logger.debug(f"Stock seri row error: {e}")
+                                i += 1
                                 break
-                    else:
-                        i += 1
+                        else:
+                            # Next product header found
+                            break
+                else:
+                    i += 1
+
+            outcomes = db.replace_stock_bulk(bolge, stock_rows)
+            imported = outcomes.count(db.BULK_INSERTED)
+            duplicates = outcomes.count(db.BULK_DUPLICATE)
+            if duplicates and self.logger:
+                self.logger.warning("Stock upload: %s duplicate serial numbers skipped", duplicates)
 
             self.stock_status_var.set(f"✓ {imported} kayit yuklendi ({bolge})")
             self._log_action("stock_upload", f"file={os.path.basename(file_path)} region={bolge} count={imported}")
@@ -5629,5 +5848,7 @@ class PuantajApp(tk.Tk):
 if __name__ == "__main__":
     ensure_app_dirs()
     db.init_db()
+    # Senkron hic calismadiysa change_log'u okuyan yok; her yazimla buyumesin
+    db.compact_unsynced_change_log()
     app = PuantajApp()
     app.mainloop()
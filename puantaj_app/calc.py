@@ -1,4 +1,19 @@
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+NIGHT_WINDOWS = (
+    (22 * 60, 24 * 60),
+    (0, 6 * 60),
+    (22 * 60 + 24 * 60, 24 * 60 + 24 * 60),
+    (0 + 24 * 60, 6 * 60 + 24 * 60),
+)
+HOUR_SETTING_KEYS = ("weekday_hours", "saturday_start", "saturday_end")
+SHAPE_CACHE_SIZE = 2048
 
 
 def parse_time(value):
@@ -20,7 +35,7 @@ def hours_between(start_time, end_time):
     start_dt = datetime.combine(date.today(), start_time)
     end_dt = datetime.combine(date.today(), end_time)
     if end_dt < start_dt:
-        end_dt = end_dt.replace(day=end_dt.day + 1)
+        end_dt += timedelta(days=1)
     delta = end_dt - start_dt
     return delta.total_seconds() / 3600.0
 
@@ -33,18 +48,12 @@ def _overlap(start_a, end_a, start_b, end_b):
     return max(0, min(end_a, end_b) - max(start_a, start_b))
 
 
-def night_hours_between(start_time, end_time):
+def night_hours_between(start_time, end_time, windows=NIGHT_WINDOWS):
     start_min = _to_minutes(start_time)
     end_min = _to_minutes(end_time)
     if end_min <= start_min:
         end_min += 24 * 60
     total = 0
-    windows = [
-        (22 * 60, 24 * 60),
-        (0, 6 * 60),
-        (22 * 60 + 24 * 60, 24 * 60 + 24 * 60),
-        (0 + 24 * 60, 6 * 60 + 24 * 60),
-    ]
     for w_start, w_end in windows:
         total += _overlap(start_min, end_min, w_start, w_end)
     return total / 60.0
@@ -60,36 +69,91 @@ def overnight_hours_between(start_time, end_time):
     return (end_min - 24 * 60) / 60.0
 
 
-def calc_day_hours(work_date, start_time, end_time, break_minutes, settings, is_special=0):
-    work_dt = parse_date(work_date)
-    weekday = work_dt.weekday()  # 0=Mon, 5=Sat, 6=Sun
+class CalcRules:
+    """Hour rules compiled once from the settings table.
+
+    Holds the scheduled hours per weekday (0=Mon .. 6=Sun) and the night
+    windows as minute ranges, so calculations do not re-read and re-parse
+    settings for every row. Every calc function accepts a CalcRules wherever
+    it accepts a settings dict.
+    """
+
+    def __init__(self, weekday_hours="9", saturday_start="09:00", saturday_end="14:00"):
+        self.weekday_hours = float(weekday_hours or 9)
+        self.saturday_start = saturday_start
+        self.saturday_end = saturday_end
+        try:
+            saturday_hours = hours_between(parse_time(saturday_start), parse_time(saturday_end))
+        except (ValueError, TypeError):
+            # Only Saturday rows fail, as they did when the window was parsed per row
+            saturday_hours = None
+        self.scheduled_hours = (self.weekday_hours,) * 5 + (saturday_hours, 0.0)
+        self.night_windows = NIGHT_WINDOWS
+        self.version = (weekday_hours, saturday_start, saturday_end)
+        # Stamp stored with materialized hours (puantaj_db.timesheets.hours_version)
+        self.stamp = "|".join(str(value) for value in self.version)
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            settings.get("weekday_hours", "9"),
+            settings.get("saturday_start", "09:00"),
+            settings.get("saturday_end", "14:00"),
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, CalcRules) and self.version == other.version
+
+    def __hash__(self):
+        return hash(self.version)
+
+    def scheduled_for(self, weekday):
+        scheduled = self.scheduled_hours[weekday]
+        if scheduled is None:
+            raise ValueError(f"Invalid Saturday window: {self.saturday_start}-{self.saturday_end}")
+        return scheduled
+
+
+_rules_cache = {}
 
+
+def get_rules(settings):
+    """Return the CalcRules for a settings dict, rebuilding only when an hour key changed."""
+    if isinstance(settings, CalcRules):
+        return settings
+    key = tuple(settings.get(name) for name in HOUR_SETTING_KEYS)
+    rules = _rules_cache.get(key)
+    if rules is None:
+        rules = CalcRules.from_settings(settings)
+        _rules_cache.clear()
+        _rules_cache[key] = rules
+        clear_shape_cache()
+    return rules
+
+
+@lru_cache(maxsize=4096)
+def _weekday_of(work_date):
+    return parse_date(work_date).weekday()  # 0=Mon, 5=Sat, 6=Sun
+
+
+@lru_cache(maxsize=SHAPE_CACHE_SIZE)
+def _calc_shape(start_time, end_time, break_minutes, day_class, is_special, rules):
+    """Hours for one shift shape; weekdays share day_class 0, Saturday 5, Sunday 6."""
     st = parse_time(start_time)
     et = parse_time(end_time)
     gross_hours = hours_between(st, et)
     
     # Break minutes validation
-    break_minutes = max(0, int(break_minutes))
+    break_minutes = max(0, break_minutes)
     if break_minutes > gross_hours * 60:
         break_minutes = int(gross_hours * 60)  # Max break = gross hours
     
     worked_hours = gross_hours - (break_minutes / 60.0)
     if worked_hours < 0:
         worked_hours = 0.0
-    night_hours = night_hours_between(st, et)
+    night_hours = night_hours_between(st, et, rules.night_windows)
     overnight_hours = overnight_hours_between(st, et)
-
-    weekday_hours = float(settings.get("weekday_hours", "9") or 9)
-    saturday_start = settings.get("saturday_start", "09:00")
-    saturday_end = settings.get("saturday_end", "14:00")
-
-    if weekday <= 4:
-        scheduled_hours = weekday_hours
-    elif weekday == 5:
-        sat_hours = hours_between(parse_time(saturday_start), parse_time(saturday_end))
-        scheduled_hours = sat_hours
-    else:
-        scheduled_hours = 0.0
+    scheduled_hours = rules.scheduled_for(day_class)
 
     if is_special:
         scheduled_hours = 0.0
@@ -116,3 +180,167 @@ def calc_day_hours(work_date, start_time, end_time, break_minutes, settings, is_
         round(special_overtime, 2),
         round(special_night, 2),
     )
+
+
+def shape_cache_info():
+    """Hit/miss counters of the shift-shape cache (functools CacheInfo)."""
+    return _calc_shape.cache_info()
+
+
+def clear_shape_cache():
+    _calc_shape.cache_clear()
+
+
+def calc_day_hours(work_date, start_time, end_time, break_minutes, settings, is_special=0):
+    rules = get_rules(settings)
+    weekday = _weekday_of(work_date)
+    day_class = weekday if weekday >= 5 else 0
+    return _calc_shape(start_time, end_time, int(break_minutes), day_class, bool(is_special), rules)
+
+
+def _round_hours(values):
+    """np.round(values, 2), falling back to the builtin round() near .5 ties."""
+    rounded = np.round(values, 2)
+    scaled = values * 100.0
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for idx in np.flatnonzero(near_tie):
+        rounded[idx] = round(float(values[idx]), 2)
+    return rounded
+
+
+def _calc_many_scalar(rows, settings, skip_invalid):
+    results = []
+    for work_date, start_time, end_time, break_minutes, is_special in rows:
+        try:
+            results.append(calc_day_hours(work_date, start_time, end_time, break_minutes, settings, is_special))
+        except (ValueError, TypeError):
+            if not skip_invalid:
+                raise
+            results.append(None)
+    return results
+
+
+def calc_many(work_dates, start_times, end_times, break_minutes, settings, is_special=None, skip_invalid=False):
+    """Batch version of calc_day_hours over whole columns.
+
+    Every distinct date and time string is parsed once, then the hours are
+    computed on integer minute arrays with NumPy. Returns one calc_day_hours
+    tuple per row, in input order. With skip_invalid=True rows that cannot be
+    parsed come back as None instead of raising.
+    """
+    work_dates = list(work_dates)
+    start_times = list(start_times)
+    end_times = list(end_times)
+    break_minutes = list(break_minutes)
+    count = len(work_dates)
+    if is_special is None:
+        is_special = [0] * count
+    else:
+        is_special = list(is_special)
+    if count == 0:
+        return []
+    try:
+        rules = get_rules(settings)
+    except ValueError:
+        if not skip_invalid:
+            raise
+        return [None] * count
+    rows = zip(work_dates, start_times, end_times, break_minutes, is_special)
+    if np is None:
+        return _calc_many_scalar(rows, rules, skip_invalid)
+
+    weekday_of = {}
+    minutes_of = {}
+    valid = []
+    weekdays = []
+    starts = []
+    ends = []
+    breaks = []
+    for work_date, start_time, end_time, brk, _special in rows:
+        try:
+            weekday = weekday_of.get(work_date)
+            if weekday is None:
+                weekday = weekday_of[work_date] = parse_date(work_date).weekday()
+            start_min = minutes_of.get(start_time)
+            if start_min is None:
+                start_min = minutes_of[start_time] = _to_minutes(parse_time(start_time))
+            end_min = minutes_of.get(end_time)
+            if end_min is None:
+                end_min = minutes_of[end_time] = _to_minutes(parse_time(end_time))
+            brk = int(brk)
+        except (ValueError, TypeError):
+            if not skip_invalid:
+                raise
+            valid.append(False)
+            weekdays.append(0)
+            starts.append(0)
+            ends.append(0)
+            breaks.append(0)
+            continue
+        valid.append(True)
+        weekdays.append(weekday)
+        starts.append(start_min)
+        ends.append(end_min)
+        breaks.append(brk)
+
+    start_min = np.array(starts, dtype=np.int64)
+    end_min = np.array(ends, dtype=np.int64)
+    special = np.fromiter((bool(value) for value in is_special), dtype=bool, count=count)
+
+    gross_min = np.where(end_min < start_min, end_min + 24 * 60, end_min) - start_min
+    gross_hours = gross_min / 60.0
+    brk = np.maximum(0, np.array(breaks, dtype=np.int64)).astype(np.float64)
+    max_break = gross_hours * 60
+    brk = np.where(brk > max_break, np.trunc(max_break), brk)
+    worked_hours = gross_hours - brk / 60.0
+    worked_hours = np.where(worked_hours < 0, 0.0, worked_hours)
+
+    span_end = np.where(end_min <= start_min, end_min + 24 * 60, end_min)
+    night_min = np.zeros(count, dtype=np.int64)
+    for w_start, w_end in rules.night_windows:
+        night_min += np.maximum(0, np.minimum(span_end, w_end) - np.maximum(start_min, w_start))
+    night_hours = night_min / 60.0
+    overnight_hours = np.where(span_end <= 24 * 60, 0.0, (span_end - 24 * 60) / 60.0)
+
+    weekdays = np.array(weekdays, dtype=np.int64)
+    valid = np.array(valid, dtype=bool)
+    if rules.scheduled_hours[5] is None:
+        saturday = valid & (weekdays == 5)
+        if saturday.any():
+            if not skip_invalid:
+                rules.scheduled_for(5)
+            valid &= ~saturday
+    schedule = np.array([hours if hours is not None else 0.0 for hours in rules.scheduled_hours])
+    scheduled_hours = schedule[weekdays]
+    regular_overtime = np.where(
+        scheduled_hours == 0.0,
+        np.maximum(0.0, worked_hours),
+        np.maximum(0.0, gross_hours - scheduled_hours),
+    )
+    zeros = np.zeros(count)
+
+    columns = [
+        _round_hours(worked_hours).tolist(),
+        _round_hours(np.where(special, 0.0, scheduled_hours)).tolist(),
+        _round_hours(np.where(special, 0.0, regular_overtime)).tolist(),
+        _round_hours(night_hours).tolist(),
+        _round_hours(overnight_hours).tolist(),
+        _round_hours(np.where(special, worked_hours, 0.0)).tolist(),
+        zeros.tolist(),
+        _round_hours(np.where(special, night_hours, 0.0)).tolist(),
+    ]
+    return [row if ok else None for row, ok in zip(zip(*columns), valid.tolist())]
+
+
+def calc_timesheet_rows(records, settings, skip_invalid=False):
+    """calc_many over rows shaped like puantaj_db.list_timesheets() results."""
+    records = list(records)
+    return calc_many(
+        [r[3] for r in records],
+        [r[4] for r in records],
+        [r[5] for r in records],
+        [r[6] for r in records],
+        settings,
+        [r[7] for r in records],
+        skip_invalid=skip_invalid,
+    )
@@ -4,13 +4,22 @@ SQLite database operations for employee management, timesheets, vehicles, etc.
 """
 
 import os
+import re
+import glob
 import sqlite3
 import shutil
 import zipfile
+import time
 import hashlib
+import uuid
+import threading
+import weakref
+from pathlib import Path
 from datetime import datetime, timedelta
 from contextlib import contextmanager
 
+import calc
+
 # ============================================================================
 # CONFIGURATION
 # ============================================================================
@@ -58,6 +67,96 @@ DEFAULT_SETTINGS = {
     "admin_view_region": "Tum Bolgeler",
 }
 
+# Computed hour columns materialized on timesheets (same names as the v2 Timesheet model)
+TIMESHEET_HOURS_COLUMNS = (
+    "worked_hours",
+    "scheduled_hours",
+    "overtime_hours",
+    "night_hours",
+    "overnight_hours",
+    "special_normal_hours",
+    "special_overtime_hours",
+    "special_night_hours",
+)
+HOURS_RECOMPUTE_CHUNK = 500
+TIMESHEET_PAGE_SIZE = 500
+# Web dashboard series: days in the daily, weeks in the weekly and months in the monthly series
+DASHBOARD_DAYS = 30
+DASHBOARD_WEEKS = 12
+DASHBOARD_MONTHS = 12
+
+# Online backups copy this many pages per step and sleep between steps so writers keep going
+BACKUP_PAGES_PER_STEP = 1024
+BACKUP_STEP_SLEEP = 0.005
+
+# Tables exchanged by sync (file merge and row-level delta), parents first (deletes run in reverse)
+SYNC_TABLES = ("employees", "timesheets", "vehicles", "drivers", "stock_inventory")
+# Region column of each region-scoped table (regional download subsets, delta pulls)
+REGION_COLUMNS = {
+    "employees": "region",
+    "timesheets": "region",
+    "vehicles": "region",
+    "drivers": "region",
+    "stock_inventory": "bolge",
+    "vehicle_faults": "region",
+    "vehicle_service_visits": "region",
+}
+# Tables journaled in change_log (delta sync, incremental consumers)
+CHANGE_LOG_TABLES = SYNC_TABLES + ("vehicle_faults", "vehicle_service_visits", "vehicle_inspections")
+CHANGE_LOG_PAGE_SIZE = 1000
+# change_log.op values
+CHANGE_INSERT = "I"
+CHANGE_UPDATE = "U"
+CHANGE_DELETE = "D"
+# Timesheet columns whose change is a real edit; computed hours are re-materialized locally
+TIMESHEET_INPUT_COLUMNS = (
+    "employee_id", "work_date", "start_time", "end_time", "break_minutes", "is_special", "notes", "region",
+)
+
+# Per-row outcome codes returned by the *_bulk functions
+BULK_INSERTED = "inserted"
+BULK_UPDATED = "updated"
+BULK_UNCHANGED = "unchanged"
+BULK_DELETED = "deleted"
+BULK_DUPLICATE = "duplicate"
+BULK_MISSING = "missing"
+BULK_INVALID = "invalid"
+
+# Secondary indexes (name, "table (columns)")
+SCHEMA_INDEXES = (
+    # list_timesheets filters; rollup day-count triggers look up same-day rows
+    ("idx_timesheets_employee_date", "timesheets (employee_id, work_date)"),
+    ("idx_timesheets_region_date", "timesheets (region, work_date)"),
+    ("idx_timesheets_work_date", "timesheets (work_date)"),
+    ("idx_employees_region", "employees (region, full_name)"),
+    ("idx_vehicles_region", "vehicles (region, plate)"),
+    ("idx_drivers_region", "drivers (region, full_name)"),
+    ("idx_vehicle_faults_vehicle_status", "vehicle_faults (vehicle_id, status)"),
+    ("idx_vehicle_faults_region_status", "vehicle_faults (region, status)"),
+    ("idx_vehicle_inspections_vehicle_week", "vehicle_inspections (vehicle_id, week_start)"),
+    ("idx_vehicle_inspections_driver_date", "vehicle_inspections (driver_id, inspection_date)"),
+    ("idx_vehicle_inspection_results_inspection", "vehicle_inspection_results (inspection_id)"),
+    ("idx_vehicle_service_visits_vehicle_date", "vehicle_service_visits (vehicle_id, start_date)"),
+    ("idx_stock_inventory_bolge_durum", "stock_inventory (bolge, durum)"),
+    ("idx_stock_inventory_kod_seri", "stock_inventory (stok_kod, seri_no)"),
+    ("idx_deleted_records_table_record", "deleted_records (table_name, record_id)"),
+)
+
+# Expiry dates tracked in deadlines: table -> (entity, ((kind, column), ...))
+DEADLINE_SOURCES = {
+    "vehicles": ("vehicle", (
+        ("inspection", "inspection_date"),
+        ("insurance", "insurance_date"),
+        ("maintenance", "maintenance_date"),
+    )),
+    "drivers": ("driver", (("license", "license_expiry"),)),
+}
+# Only ISO dates are indexed; anything else never raises an alert
+DEADLINE_DATE_GLOB = "[0-9][0-9][0-9][0-9]-[0-1][0-9]-[0-3][0-9]"
+# Severity thresholds (days left): expired < 0 <= critical <= 7 < warning <= 30 < upcoming
+DEADLINE_CRITICAL_DAYS = 7
+DEADLINE_WARNING_DAYS = 30
+
 DEFAULT_USERS = [
     ("ankara1", "060106", "user", "Ankara"),
     ("izmir1", "350235", "user", "Izmir"),
@@ -75,259 +174,493 @@ def ensure_db_dir():
     if not os.path.isdir(DB_DIR):
         os.makedirs(DB_DIR, exist_ok=True)
 
+class _ThreadConnections(dict):
+    """(path, readonly) -> (conn, generation) held by one thread"""
+
+
+class ConnectionManager:
+    """
+    Reuses SQLite connections instead of opening one per call.
+    mode="thread": each thread keeps its connection (desktop, Tk + worker threads)
+    mode="pool": up to pool_size idle connections shared by threads (Flask server)
+    Connection PRAGMAs run once when a connection is opened.
+    """
+
+    def __init__(self, mode="thread", pool_size=4, cache_size=-16000, mmap_size=64 * 1024 * 1024):
+        self.mode = mode
+        self.pool_size = pool_size
+        self.cache_size = cache_size  # negative = KiB (SQLite convention)
+        self.mmap_size = mmap_size
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+        self._local = threading.local()
+        self._idle = {}  # (path, readonly) -> [conn], pool mode
+        self._depth = {}  # open conn -> nesting depth (0 = idle)
+        self._generation = 0
+        self._owner = None  # thread holding exclusive(); other threads wait to check out
+
+    def configure(self, mode=None, pool_size=None, cache_size=None, mmap_size=None):
+        if mode is not None:
+            self.mode = mode
+        if pool_size is not None:
+            self.pool_size = pool_size
+        if cache_size is not None:
+            self.cache_size = cache_size
+        if mmap_size is not None:
+            self.mmap_size = mmap_size
+        self.close_all()
+
+    def _connect(self, path, readonly):
+        if readonly:
+            uri = Path(os.path.abspath(path)).as_uri() + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, timeout=30.0, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+            # WAL: readers never wait for a writer (e.g. a sync merge)
+            conn.execute("PRAGMA journal_mode = WAL;")
+        conn.execute("PRAGMA synchronous = NORMAL;")
+        conn.execute("PRAGMA foreign_keys = ON;")
+        conn.execute("PRAGMA busy_timeout = 30000;")
+        # INSERT OR REPLACE must fire DELETE triggers so timesheet_rollups stay exact
+        conn.execute("PRAGMA recursive_triggers = ON;")
+        conn.execute(f"PRAGMA cache_size = {int(self.cache_size)};")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)};")
+        if readonly:
+            conn.execute("PRAGMA query_only = ON;")
+        return conn
+
+    def _held(self):
+        held = getattr(self._local, "held", None)
+        if held is None:
+            held = self._local.held = _ThreadConnections()
+            owned = held.owned = []
+            # Close thread-mode connections when their thread exits
+            weakref.finalize(held, self._discard, owned)
+        return held
+
+    def _discard(self, conns):
+        with self._lock:
+            closing = [conn for conn in conns if self._depth.pop(conn, None) is not None]
+            self._released.notify_all()
+        for conn in closing:
+            conn.close()
+
+    def acquire(self, path, readonly=False):
+        """Connection for this thread; nested calls share the outer connection"""
+        key = (path, readonly)
+        held = self._held()
+        with self._lock:
+            conn, generation = held.get(key, (None, None))
+            depth = self._depth.get(conn)
+            if depth is not None and (depth > 0 or generation == self._generation):
+                self._depth[conn] = depth + 1
+                return conn
+            while self._owner not in (None, threading.get_ident()):
+                self._released.wait()
+            idle = self._idle.get(key) if self.mode == "pool" else None
+            conn = idle.pop() if idle else None
+        if conn is None:
+            conn = self._connect(path, readonly)
+            held.owned.append(conn)
+        with self._lock:
+            self._depth[conn] = 1
+            held[key] = (conn, self._generation)
+        return conn
+
+    def release(self, conn):
+        held = self._held()
+        with self._lock:
+            depth = self._depth.get(conn)
+            if depth is None:
+                return
+            self._depth[conn] = depth - 1
+            if depth > 1:
+                return
+            self._released.notify_all()
+            key, (_, generation) = next((k, v) for k, v in held.items() if v[0] is conn)
+            if generation == self._generation and self.mode != "pool":
+                return  # stays with this thread
+            del held[key]
+            if conn in held.owned:
+                held.owned.remove(conn)
+            idle = self._idle.setdefault(key, [])
+            if generation == self._generation and len(idle) < self.pool_size:
+                idle.append(conn)
+                return
+            del self._depth[conn]
+        conn.close()
+
+    def close_all(self):
+        """Close idle connections; busy ones are closed when released"""
+        with self._lock:
+            self._generation += 1
+            self._idle.clear()
+            idle = [conn for conn, depth in self._depth.items() if depth == 0]
+            for conn in idle:
+                del self._depth[conn]
+        for conn in idle:
+            conn.close()
+
+    @contextmanager
+    def exclusive(self, timeout=30.0):
+        """
+        Block new checkouts by other threads, wait until their connections are released and
+        close everything, so the database file can be swapped or removed (Windows refuses to
+        replace an open file). Raises TimeoutError if a connection stays busy past timeout.
+        """
+        me = threading.get_ident()
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            try:
+                while self._owner is not None:
+                    if not self._released.wait(deadline - time.monotonic()):
+                        raise TimeoutError("database file is held by another thread")
+                self._owner = me
+                own = {conn for conn, _ in self._held().values()}
+                while any(depth for conn, depth in self._depth.items() if conn not in own):
+                    if not self._released.wait(deadline - time.monotonic()):
+                        raise TimeoutError("database connections still in use")
+            except BaseException:
+                if self._owner == me:
+                    self._owner = None
+                    self._released.notify_all()
+                raise
+        try:
+            self.close_all()
+            yield
+        finally:
+            with self._lock:
+                self._owner = None
+                self._released.notify_all()
+
+
+connections = ConnectionManager()
+
+def configure_connections(mode=None, pool_size=None, cache_size=None, mmap_size=None):
+    """Change connection reuse mode / pool size / cache_size / mmap_size"""
+    connections.configure(mode, pool_size, cache_size, mmap_size)
+
+def close_connections():
+    """Close pooled connections (before the database file is replaced)"""
+    connections.close_all()
+
 @contextmanager
 def get_conn():
     """SQLite connection with automatic commit and rollback"""
     ensure_db_dir()
-    conn = sqlite3.connect(DB_PATH, timeout=30.0)
+    conn = connections.acquire(DB_PATH)
+    outermost = connections._depth[conn] == 1
     try:
-        conn.execute("PRAGMA foreign_keys = ON;")
-        conn.execute("PRAGMA busy_timeout = 30000;")
         yield conn
-        conn.commit()
+        if outermost:
+            conn.commit()
     except Exception:
-        conn.rollback()
+        if outermost:
+            conn.rollback()
         raise
     finally:
-        conn.close()
+        connections.release(conn)
+
+@contextmanager
+def get_read_conn():
+    """Read-only connection for listings and reports (never blocks behind a writer)"""
+    ensure_db_dir()
+    conn = connections.acquire(DB_PATH, readonly=True)
+    try:
+        yield conn
+    finally:
+        connections.release(conn)
+
+def checkpoint():
+    """Fold the WAL into the main file so DB_PATH can be copied or uploaded as is"""
+    with get_conn() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+
+def replace_db_file(source_path):
+    """Atomically replace the database with source_path (sync download, restore, import)"""
+    # Connections checked out by other threads are waited for, not left open on the old file
+    with connections.exclusive():
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(DB_PATH + suffix):
+                os.remove(DB_PATH + suffix)
+        os.replace(source_path, DB_PATH)
 
 # ============================================================================
 # DATABASE INITIALIZATION
 # ============================================================================
 
 def init_db():
-    """Initialize database schema"""
+    """Initialize database schema; skips all DDL when the schema is current"""
     with get_conn() as conn:
-        # Employees table
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS employees (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                full_name TEXT NOT NULL,
-                identity_no TEXT,
-                department TEXT,
-                title TEXT,
-                region TEXT
-            );
-        """)
-        
-        # Timesheets table
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS timesheets (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                employee_id INTEGER NOT NULL,
-                work_date TEXT NOT NULL,
-                start_time TEXT NOT NULL,
-                end_time TEXT NOT NULL,
-                break_minutes INTEGER NOT NULL DEFAULT 0,
-                is_special INTEGER NOT NULL DEFAULT 0,
-                notes TEXT,
-                region TEXT,
-                FOREIGN KEY (employee_id) REFERENCES employees (id) ON DELETE CASCADE
-            );
-        """)
-        
-        # Settings table
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS settings (
-                key TEXT PRIMARY KEY,
-                value TEXT NOT NULL
-            );
-        """)
-        
-        # Reports table
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS reports (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                file_path TEXT NOT NULL,
-                created_at TEXT NOT NULL,
-                employee TEXT,
-                start_date TEXT,
-                end_date TEXT
-            );
-        """)
-        
-        # Shift templates table
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS shift_templates (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE,
-                start_time TEXT NOT NULL,
-                end_time TEXT NOT NULL,
-                break_minutes INTEGER NOT NULL DEFAULT 0
-            );
-        """)
-        
-        # Vehicles table
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS vehicles (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                plate TEXT NOT NULL UNIQUE,
-                brand TEXT,
-                model TEXT,
-                year TEXT,
-                km INTEGER,
-                inspection_date TEXT,
-                insurance_date TEXT,
-                maintenance_date TEXT,
-                oil_change_date TEXT,
-                oil_change_km INTEGER,
-                oil_interval_km INTEGER,
-                notes TEXT,
-                region TEXT
-            );
-        """)
-        
-        # Drivers table
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS drivers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                full_name TEXT NOT NULL,
-                license_class TEXT,
-                license_expiry TEXT,
-                phone TEXT,
-                notes TEXT,
-                region TEXT
-            );
-        """)
-        
-        # Users table
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL UNIQUE,
-                password_hash TEXT NOT NULL,
-                role TEXT NOT NULL,
-                region TEXT NOT NULL
-            );
-        """)
-        
-        # Vehicle faults table
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS vehicle_faults (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                vehicle_id INTEGER NOT NULL,
-                title TEXT NOT NULL,
-                description TEXT,
-                opened_date TEXT,
-                closed_date TEXT,
-                status TEXT DEFAULT 'Acik',
-                region TEXT,
-                FOREIGN KEY (vehicle_id) REFERENCES vehicles (id) ON DELETE CASCADE
-            );
-        """)
-        
-        # Vehicle inspections table
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS vehicle_inspections (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                vehicle_id INTEGER NOT NULL,
-                driver_id INTEGER,
-                inspection_date TEXT NOT NULL,
-                week_start TEXT NOT NULL,
-                km INTEGER,
-                notes TEXT,
-                fault_id INTEGER,
-                fault_status TEXT,
-                service_visit INTEGER DEFAULT 0,
-                FOREIGN KEY (vehicle_id) REFERENCES vehicles (id) ON DELETE CASCADE,
-                FOREIGN KEY (driver_id) REFERENCES drivers (id) ON DELETE SET NULL,
-                FOREIGN KEY (fault_id) REFERENCES vehicle_faults (id) ON DELETE SET NULL
-            );
-        """)
-        
-        # Vehicle service visits table
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS vehicle_service_visits (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                vehicle_id INTEGER NOT NULL,
-                fault_id INTEGER,
-                start_date TEXT NOT NULL,
-                end_date TEXT,
-                reason TEXT,
-                cost REAL,
-                notes TEXT,
-                region TEXT,
-                FOREIGN KEY (vehicle_id) REFERENCES vehicles (id) ON DELETE CASCADE,
-                FOREIGN KEY (fault_id) REFERENCES vehicle_faults (id) ON DELETE SET NULL
-            );
-        """)
-        
-        # Vehicle inspection results table
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS vehicle_inspection_results (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                inspection_id INTEGER NOT NULL,
-                item_key TEXT NOT NULL,
-                status TEXT NOT NULL,
-                note TEXT,
-                FOREIGN KEY (inspection_id) REFERENCES vehicle_inspections (id) ON DELETE CASCADE
-            );
-        """)
-        
-        # Stock inventory table
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS stock_inventory (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                stok_kod TEXT,
-                stok_adi TEXT,
-                seri_no TEXT NOT NULL UNIQUE,
-                durum TEXT,
-                tarih TEXT,
-                girdi_yapan TEXT,
-                bolge TEXT NOT NULL,
-                adet INTEGER,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        
-        # Deleted records tracking table (for multi-PC sync)
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS deleted_records (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                table_name TEXT NOT NULL,
-                record_id INTEGER NOT NULL,
-                deleted_at TEXT NOT NULL,
-                deleted_by TEXT
-            );
-        """)
-        
-        # Insert default settings
-        for key, value in DEFAULT_SETTINGS.items():
-            conn.execute(
-                "INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?);",
-                (key, value)
-            )
-        
-        # Insert default shift templates
-        cur = conn.execute("SELECT COUNT(*) FROM shift_templates;")
-        if cur.fetchone()[0] == 0:
-            conn.executemany(
-                "INSERT INTO shift_templates (name, start_time, end_time, break_minutes) VALUES (?, ?, ?, ?);",
-                [
-                    ("Hafta Ici 09-18", "09:00", "18:00", 60),
-                    ("Cumartesi 09-14", "09:00", "14:00", 0),
-                ]
-            )
-        
-        # Ensure schema is up to date
-        _ensure_timesheet_columns(conn)
-        _ensure_vehicle_columns(conn)
-        _ensure_region_columns(conn)
-        _ensure_deleted_records_table(conn)
-        _seed_default_users(conn)
-        
+        _run_migrations(conn)
+    
+    start_auto_backup()
+
+def _run_migrations(conn):
+    """Apply pending MIGRATIONS, one transaction per step, tracked in PRAGMA user_version"""
+    version = conn.execute("PRAGMA user_version;").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+    conn.commit()
+    while True:
+        conn.execute("BEGIN IMMEDIATE;")
+        # Another process may have migrated while we waited for the lock
+        version = conn.execute("PRAGMA user_version;").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            conn.commit()
+            return
+        MIGRATIONS[version](conn)
+        conn.execute(f"PRAGMA user_version = {version + 1};")
         conn.commit()
+
+def _migrate_base_schema(conn):
+    """v1: tables, default rows and column probes for databases created before versioning"""
+    # Employees table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS employees (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            full_name TEXT NOT NULL,
+            identity_no TEXT,
+            department TEXT,
+            title TEXT,
+            region TEXT
+        );
+    """)
+    
+    # Timesheets table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS timesheets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            employee_id INTEGER NOT NULL,
+            work_date TEXT NOT NULL,
+            start_time TEXT NOT NULL,
+            end_time TEXT NOT NULL,
+            break_minutes INTEGER NOT NULL DEFAULT 0,
+            is_special INTEGER NOT NULL DEFAULT 0,
+            notes TEXT,
+            region TEXT,
+            worked_hours REAL,
+            scheduled_hours REAL,
+            overtime_hours REAL,
+            night_hours REAL,
+            overnight_hours REAL,
+            special_normal_hours REAL,
+            special_overtime_hours REAL,
+            special_night_hours REAL,
+            hours_version TEXT,
+            FOREIGN KEY (employee_id) REFERENCES employees (id) ON DELETE CASCADE
+        );
+    """)
+    
+    # Settings table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """)
+    
+    # Reports table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS reports (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_path TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            employee TEXT,
+            start_date TEXT,
+            end_date TEXT
+        );
+    """)
+    
+    # Shift templates table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS shift_templates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            start_time TEXT NOT NULL,
+            end_time TEXT NOT NULL,
+            break_minutes INTEGER NOT NULL DEFAULT 0
+        );
+    """)
+    
+    # Vehicles table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS vehicles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            plate TEXT NOT NULL UNIQUE,
+            brand TEXT,
+            model TEXT,
+            year TEXT,
+            km INTEGER,
+            inspection_date TEXT,
+            insurance_date TEXT,
+            maintenance_date TEXT,
+            oil_change_date TEXT,
+            oil_change_km INTEGER,
+            oil_interval_km INTEGER,
+            notes TEXT,
+            region TEXT
+        );
+    """)
+    
+    # Drivers table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS drivers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            full_name TEXT NOT NULL,
+            license_class TEXT,
+            license_expiry TEXT,
+            phone TEXT,
+            notes TEXT,
+            region TEXT
+        );
+    """)
+    
+    # Users table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            password_hash TEXT NOT NULL,
+            role TEXT NOT NULL,
+            region TEXT NOT NULL
+        );
+    """)
+    
+    # Vehicle faults table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS vehicle_faults (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            vehicle_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            description TEXT,
+            opened_date TEXT,
+            closed_date TEXT,
+            status TEXT DEFAULT 'Acik',
+            region TEXT,
+            FOREIGN KEY (vehicle_id) REFERENCES vehicles (id) ON DELETE CASCADE
+        );
+    """)
+    
+    # Vehicle inspections table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS vehicle_inspections (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            vehicle_id INTEGER NOT NULL,
+            driver_id INTEGER,
+            inspection_date TEXT NOT NULL,
+            week_start TEXT NOT NULL,
+            km INTEGER,
+            notes TEXT,
+            fault_id INTEGER,
+            fault_status TEXT,
+            service_visit INTEGER DEFAULT 0,
+            FOREIGN KEY (vehicle_id) REFERENCES vehicles (id) ON DELETE CASCADE,
+            FOREIGN KEY (driver_id) REFERENCES drivers (id) ON DELETE SET NULL,
+            FOREIGN KEY (fault_id) REFERENCES vehicle_faults (id) ON DELETE SET NULL
+        );
+    """)
+    
+    # Vehicle service visits table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS vehicle_service_visits (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            vehicle_id INTEGER NOT NULL,
+            fault_id INTEGER,
+            start_date TEXT NOT NULL,
+            end_date TEXT,
+            reason TEXT,
+            cost REAL,
+            notes TEXT,
+            region TEXT,
+            FOREIGN KEY (vehicle_id) REFERENCES vehicles (id) ON DELETE CASCADE,
+            FOREIGN KEY (fault_id) REFERENCES vehicle_faults (id) ON DELETE SET NULL
+        );
+    """)
+    
+    # Vehicle inspection results table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS vehicle_inspection_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            inspection_id INTEGER NOT NULL,
+            item_key TEXT NOT NULL,
+            status TEXT NOT NULL,
+            note TEXT,
+            FOREIGN KEY (inspection_id) REFERENCES vehicle_inspections (id) ON DELETE CASCADE
+        );
+    """)
+    
+    # Stock inventory table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS stock_inventory (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            stok_kod TEXT,
+            stok_adi TEXT,
+            seri_no TEXT NOT NULL UNIQUE,
+            durum TEXT,
+            tarih TEXT,
+            girdi_yapan TEXT,
+            bolge TEXT NOT NULL,
+            adet INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
     
-    _backup_db_if_needed()
+    # Deleted records tracking table (for multi-PC sync)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS deleted_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            record_id INTEGER NOT NULL,
+            deleted_at TEXT NOT NULL,
+            deleted_by TEXT
+        );
+    """)
+    
+    # Insert default settings
+    for key, value in DEFAULT_SETTINGS.items():
+        conn.execute(
+            "INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?);",
+            (key, value)
+        )
+    
+    # Insert default shift templates
+    cur = conn.execute("SELECT COUNT(*) FROM shift_templates;")
+    if cur.fetchone()[0] == 0:
+        conn.executemany(
+            "INSERT INTO shift_templates (name, start_time, end_time, break_minutes) VALUES (?, ?, ?, ?);",
+            [
+                ("Hafta Ici 09-18", "09:00", "18:00", 60),
+                ("Cumartesi 09-14", "09:00", "14:00", 0),
+            ]
+        )
+    
+    # Ensure schema is up to date
+    _ensure_timesheet_columns(conn)
+    _ensure_vehicle_columns(conn)
+    _ensure_region_columns(conn)
+    _ensure_deleted_records_table(conn)
+    _ensure_timesheet_rollups(conn)
+    _seed_default_users(conn)
+
+def _migrate_indexes(conn):
+    """v2: secondary indexes for list filters, lookups and sync merges"""
+    for name, target in SCHEMA_INDEXES:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target};")
 
 def _ensure_timesheet_columns(conn):
-    """Ensure timesheets table has region column"""
+    """Ensure timesheets table has region and computed hour columns"""
     try:
         cursor = conn.execute("PRAGMA table_info(timesheets)")
         columns = [row[1] for row in cursor.fetchall()]
         if 'region' not in columns:
             conn.execute("ALTER TABLE timesheets ADD COLUMN region TEXT;")
+        for column in TIMESHEET_HOURS_COLUMNS:
+            if column not in columns:
+                conn.execute(f"ALTER TABLE timesheets ADD COLUMN {column} REAL;")
+        if 'hours_version' not in columns:
+            conn.execute("ALTER TABLE timesheets ADD COLUMN hours_version TEXT;")
     except Exception:
         pass
 
@@ -370,6 +703,81 @@ def _ensure_deleted_records_table(conn):
     except Exception:
         pass
 
+def _rollup_key(row):
+    """Rollup key expressions for the NEW/OLD row inside a timesheets trigger"""
+    return f"{row}.employee_id, COALESCE({row}.region, ''), substr({row}.work_date, 1, 7)"
+
+def _rollup_day_is_unique(row):
+    """1 when no other timesheet covers the same employee/region/day as the trigger row"""
+    return f"""CASE WHEN EXISTS (SELECT 1 FROM timesheets WHERE employee_id = {row}.employee_id
+               AND work_date = {row}.work_date AND COALESCE(region, '') = COALESCE({row}.region, '')
+               AND id != {row}.id) THEN 0 ELSE 1 END"""
+
+def _rollup_add_sql():
+    columns = ", ".join(TIMESHEET_HOURS_COLUMNS)
+    values = ", ".join(f"COALESCE(NEW.{column}, 0)" for column in TIMESHEET_HOURS_COLUMNS)
+    updates = ", ".join(f"{column} = {column} + excluded.{column}" for column in TIMESHEET_HOURS_COLUMNS)
+    return f"""
+        INSERT INTO timesheet_rollups (employee_id, region, year_month, {columns}, row_count, day_count)
+        VALUES ({_rollup_key("NEW")}, {values}, 1, {_rollup_day_is_unique("NEW")})
+        ON CONFLICT (employee_id, region, year_month) DO UPDATE SET {updates},
+            row_count = row_count + 1, day_count = day_count + excluded.day_count;
+    """
+
+def _rollup_remove_sql():
+    updates = ", ".join(f"{column} = {column} - COALESCE(OLD.{column}, 0)" for column in TIMESHEET_HOURS_COLUMNS)
+    key = "employee_id = OLD.employee_id AND region = COALESCE(OLD.region, '') AND year_month = substr(OLD.work_date, 1, 7)"
+    return f"""
+        UPDATE timesheet_rollups SET {updates}, row_count = row_count - 1,
+            day_count = day_count - {_rollup_day_is_unique("OLD")}
+        WHERE {key};
+        DELETE FROM timesheet_rollups WHERE {key} AND row_count <= 0;
+    """
+
+def _ensure_timesheet_rollups(conn):
+    """Per employee/region/month totals kept current by triggers on timesheets"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'timesheet_rollups';"
+    ).fetchone()
+    hour_columns = ",\n".join(f"                {column} REAL NOT NULL DEFAULT 0" for column in TIMESHEET_HOURS_COLUMNS)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS timesheet_rollups (
+            employee_id INTEGER NOT NULL,
+            region TEXT NOT NULL DEFAULT '',
+            year_month TEXT NOT NULL,
+{hour_columns},
+            row_count INTEGER NOT NULL DEFAULT 0,
+            day_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (employee_id, region, year_month)
+        );
+    """)
+    watched = ", ".join(("employee_id", "work_date", "region") + TIMESHEET_HOURS_COLUMNS)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_timesheets_rollup_insert AFTER INSERT ON timesheets
+        BEGIN {_rollup_add_sql()} END;
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_timesheets_rollup_delete AFTER DELETE ON timesheets
+        BEGIN {_rollup_remove_sql()} END;
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_timesheets_rollup_update AFTER UPDATE OF {watched} ON timesheets
+        BEGIN {_rollup_remove_sql()} {_rollup_add_sql()} END;
+    """)
+    if not exists:
+        _rebuild_timesheet_rollups(conn)
+
+def _rebuild_timesheet_rollups(conn):
+    columns = ", ".join(TIMESHEET_HOURS_COLUMNS)
+    sums = ", ".join(f"SUM(COALESCE({column}, 0))" for column in TIMESHEET_HOURS_COLUMNS)
+    conn.execute("DELETE FROM timesheet_rollups;")
+    conn.execute(f"""
+        INSERT INTO timesheet_rollups (employee_id, region, year_month, {columns}, row_count, day_count)
+        SELECT employee_id, COALESCE(region, ''), substr(work_date, 1, 7), {sums}, COUNT(*), COUNT(DISTINCT work_date)
+        FROM timesheets
+        GROUP BY employee_id, COALESCE(region, ''), substr(work_date, 1, 7);
+    """)
+
 def _seed_default_users(conn):
     """Seed default users if users table is empty"""
     try:
@@ -384,6 +792,115 @@ def _seed_default_users(conn):
     except Exception:
         pass
 
+def _migrate_change_log(conn):
+    """v3: change_log fed by triggers on SYNC_TABLES, and per-region sync watermarks"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            ts TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%S', 'now')),
+            origin TEXT
+        );
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sync_watermarks (
+            region TEXT PRIMARY KEY,
+            push_seq INTEGER NOT NULL DEFAULT 0,
+            pull_seq INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT
+        );
+    """)
+    _create_change_log_triggers(conn, SYNC_TABLES)
+
+def _migrate_change_log_tables(conn):
+    """v4: journal the remaining vehicle tables; index change_log for per-table reads"""
+    _create_change_log_triggers(conn, CHANGE_LOG_TABLES[len(SYNC_TABLES):])
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_change_log_table_seq ON change_log (table_name, seq);")
+
+def _create_change_log_triggers(conn, tables):
+    for table in tables:
+        update_of = f" OF {', '.join(TIMESHEET_INPUT_COLUMNS)}" if table == "timesheets" else ""
+        events = (
+            ("INSERT", CHANGE_INSERT, "NEW"),
+            (f"UPDATE{update_of}", CHANGE_UPDATE, "NEW"),
+            ("DELETE", CHANGE_DELETE, "OLD"),
+        )
+        for event, op, ref in events:
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_log_{op.lower()} AFTER {event} ON {table}
+                BEGIN INSERT INTO change_log (table_name, row_id, op) VALUES ('{table}', {ref}.id, '{op}'); END;
+            """)
+
+def _migrate_deadlines(conn):
+    """v5: deadlines kept current by triggers on vehicles and drivers, indexed on due_date"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS deadlines (
+            entity TEXT NOT NULL,
+            entity_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            due_date TEXT NOT NULL,
+            region TEXT,
+            PRIMARY KEY (entity, entity_id, kind)
+        );
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_deadlines_due_date ON deadlines (due_date);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_deadlines_region_due_date ON deadlines (region, due_date);")
+    for table, (entity, kinds) in DEADLINE_SOURCES.items():
+        watched = ", ".join(("id", "region") + tuple(column for _, column in kinds))
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_deadlines_insert AFTER INSERT ON {table}
+            BEGIN {_deadlines_add_sql(entity, kinds, "NEW")} END;
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_deadlines_delete AFTER DELETE ON {table}
+            BEGIN DELETE FROM deadlines WHERE entity = '{entity}' AND entity_id = OLD.id; END;
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_deadlines_update AFTER UPDATE OF {watched} ON {table}
+            BEGIN
+                DELETE FROM deadlines WHERE entity = '{entity}' AND entity_id = OLD.id;
+                {_deadlines_add_sql(entity, kinds, "NEW")}
+            END;
+        """)
+        conn.execute(f"DELETE FROM deadlines WHERE entity = '{entity}';")
+        conn.execute(_deadlines_add_sql(entity, kinds, table))
+
+def _deadlines_add_sql(entity, kinds, ref):
+    """INSERT of one deadline per well-formed date column of ref (NEW in triggers, the table for backfills)"""
+    source = "" if ref == "NEW" else f" FROM {ref}"
+    rows = " UNION ALL ".join(
+        f"SELECT '{entity}', {ref}.id, '{kind}', {ref}.{column}, {ref}.region{source} "
+        f"WHERE {ref}.{column} GLOB '{DEADLINE_DATE_GLOB}'"
+        for kind, column in kinds
+    )
+    return f"INSERT OR REPLACE INTO deadlines (entity, entity_id, kind, due_date, region) {rows};"
+
+def _migrate_sync_clients(conn):
+    """v6: sync watermarks per client installation instead of per region"""
+    # Region-keyed positions cannot be split per client: each client starts with one full sync
+    conn.execute("DROP TABLE IF EXISTS sync_watermarks;")
+    conn.execute("""
+        CREATE TABLE sync_watermarks (
+            client TEXT PRIMARY KEY,
+            push_seq INTEGER NOT NULL DEFAULT 0,
+            pull_seq INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT
+        );
+    """)
+
+# MIGRATIONS[n] upgrades a database from user_version n to n + 1; only append
+MIGRATIONS = [
+    _migrate_base_schema,
+    _migrate_indexes,
+    _migrate_change_log,
+    _migrate_change_log_tables,
+    _migrate_deadlines,
+    _migrate_sync_clients,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
 # ============================================================================
 # USER AUTHENTICATION
 # ============================================================================
@@ -442,6 +959,11 @@ def get_all_settings():
         cursor = conn.execute("SELECT key, value FROM settings;")
         return {row[0]: row[1] for row in cursor.fetchall()}
 
+def get_hour_rules():
+    """Compiled calc rules for the hour settings (None if invalid); reads only the hour keys"""
+    with get_read_conn() as conn:
+        return _hour_rules(conn)
+
 def set_setting(key, value):
     """Set a setting value"""
     with get_conn() as conn:
@@ -456,7 +978,7 @@ def set_setting(key, value):
 
 def list_employees(region=None):
     """List all employees, optionally filtered by region"""
-    with get_conn() as conn:
+    with get_read_conn() as conn:
         if region:
             cursor = conn.execute(
                 "SELECT id, full_name, identity_no, department, title, region FROM employees WHERE region = ? ORDER BY full_name;",
@@ -494,6 +1016,54 @@ def delete_employee(employee_id):
             ("employees", employee_id, datetime.now().isoformat())
         )
 
+def upsert_employees_bulk(rows):
+    """
+    Insert or update employees in one transaction.
+    rows: iterable of (full_name, identity_no, department, title, region); an
+    existing employee with the same name and region is updated.
+    Returns one BULK_* code per row.
+    """
+    rows = list(rows)
+    outcomes = []
+    inserts = []
+    updates = []
+    with get_conn() as conn:
+        existing = {
+            (name, region): (emp_id, (identity_no, department, title))
+            for emp_id, name, identity_no, department, title, region in conn.execute(
+                "SELECT id, full_name, identity_no, department, title, region FROM employees;"
+            )
+        }
+        pending = {}
+        for full_name, identity_no, department, title, region in rows:
+            key = (full_name, region)
+            details = (identity_no, department, title)
+            if not full_name:
+                outcomes.append(BULK_INVALID)
+            elif key in pending:
+                inserts[pending[key]] = (full_name,) + details + (region,)
+                outcomes.append(BULK_DUPLICATE)
+            elif key not in existing:
+                pending[key] = len(inserts)
+                inserts.append((full_name,) + details + (region,))
+                outcomes.append(BULK_INSERTED)
+            elif existing[key][1] == details:
+                outcomes.append(BULK_UNCHANGED)
+            else:
+                emp_id = existing[key][0]
+                existing[key] = (emp_id, details)
+                updates.append(details + (emp_id,))
+                outcomes.append(BULK_UPDATED)
+        conn.executemany(
+            "INSERT INTO employees (full_name, identity_no, department, title, region) VALUES (?, ?, ?, ?, ?);",
+            inserts
+        )
+        conn.executemany(
+            "UPDATE employees SET identity_no = ?, department = ?, title = ? WHERE id = ?;",
+            updates
+        )
+    return outcomes
+
 def get_all_employees():
     """Get all employees (for server API)"""
     return list_employees()
@@ -502,54 +1072,279 @@ def get_all_employees():
 # TIMESHEETS
 # ============================================================================
 
+def _timesheet_query(employee_id=None, start_date=None, end_date=None, region=None, month=None):
+    """SELECT ... WHERE for list_timesheets shaped rows, without ORDER BY (month: 'MM' of any year)"""
+    query = """
+        SELECT t.id, t.employee_id, e.full_name, t.work_date, t.start_time, t.end_time,
+               t.break_minutes, t.is_special, t.notes, t.region
+        FROM timesheets t
+        JOIN employees e ON t.employee_id = e.id
+        WHERE 1=1
+    """
+    params = []
+    
+    if employee_id:
+        query += " AND t.employee_id = ?"
+        params.append(employee_id)
+    if start_date:
+        query += " AND t.work_date >= ?"
+        params.append(start_date)
+    if end_date:
+        query += " AND t.work_date <= ?"
+        params.append(end_date)
+    if region:
+        query += " AND t.region = ?"
+        params.append(region)
+    if month:
+        query += " AND substr(t.work_date, 6, 2) = ?"
+        params.append(month)
+    return query, params
+
 def list_timesheets(employee_id=None, start_date=None, end_date=None, region=None):
     """List timesheets with optional filters"""
-    with get_conn() as conn:
-        query = """
-            SELECT t.id, t.employee_id, e.full_name, t.work_date, t.start_time, t.end_time,
-                   t.break_minutes, t.is_special, t.notes, t.region
-            FROM timesheets t
-            JOIN employees e ON t.employee_id = e.id
-            WHERE 1=1
-        """
-        params = []
-        
-        if employee_id:
-            query += " AND t.employee_id = ?"
-            params.append(employee_id)
-        if start_date:
-            query += " AND t.work_date >= ?"
-            params.append(start_date)
-        if end_date:
-            query += " AND t.work_date <= ?"
-            params.append(end_date)
-        if region:
-            query += " AND t.region = ?"
-            params.append(region)
-        
-        query += " ORDER BY t.work_date DESC, e.full_name;"
-        
+    query, params = _timesheet_query(employee_id, start_date, end_date, region)
+    query += " ORDER BY t.work_date DESC, e.full_name;"
+    with get_read_conn() as conn:
+        cursor = conn.execute(query, params)
+        return cursor.fetchall()
+
+def list_timesheets_page(after_work_date=None, after_id=None, limit=TIMESHEET_PAGE_SIZE,
+                         employee_id=None, start_date=None, end_date=None, region=None, month=None):
+    """
+    One keyset page of timesheets, newest first (work_date DESC, id DESC).
+    Pass the last row's work_date and id as after_work_date / after_id for the next page.
+    """
+    query, params = _timesheet_query(employee_id, start_date, end_date, region, month)
+    if after_work_date is not None and after_id is not None:
+        query += " AND (t.work_date, t.id) < (?, ?)"
+        params.extend([after_work_date, after_id])
+    query += " ORDER BY t.work_date DESC, t.id DESC LIMIT ?;"
+    params.append(int(limit))
+    with get_read_conn() as conn:
         cursor = conn.execute(query, params)
         return cursor.fetchall()
 
+def iter_timesheets(employee_id=None, start_date=None, end_date=None, region=None,
+                    batch_size=TIMESHEET_PAGE_SIZE, after_work_date=None, after_id=None, month=None):
+    """
+    Yield list_timesheets rows page by page (work_date DESC, id DESC); memory stays at one page.
+    after_work_date / after_id start after that row (a list_timesheets_page cursor).
+    """
+    while True:
+        page = list_timesheets_page(after_work_date, after_id, batch_size, employee_id, start_date, end_date,
+                                    region, month)
+        yield from page
+        if len(page) < batch_size:
+            return
+        after_work_date, after_id = page[-1][3], page[-1][0]
+
+def _hour_rules(conn):
+    """Compiled calc rules for the settings stored in this database (None if invalid)"""
+    keys = calc.HOUR_SETTING_KEYS
+    cursor = conn.execute(f"SELECT key, value FROM settings WHERE key IN ({', '.join('?' * len(keys))});", keys)
+    try:
+        return calc.get_rules({row[0]: row[1] for row in cursor.fetchall()})
+    except ValueError:
+        return None
+
+def _timesheet_hours(rules, work_date, start_time, end_time, break_minutes, is_special):
+    """Computed hour columns plus rules stamp for one timesheet row"""
+    if rules is None:
+        return (None,) * len(TIMESHEET_HOURS_COLUMNS) + (None,)
+    hours = calc.calc_many([work_date], [start_time], [end_time], [break_minutes], rules, [is_special],
+                           skip_invalid=True)[0]
+    if hours is None:
+        hours = (None,) * len(TIMESHEET_HOURS_COLUMNS)
+    return tuple(hours) + (rules.stamp,)
+
 def add_timesheet(employee_id, work_date, start_time, end_time, break_minutes, is_special, notes, region):
-    """Add a new timesheet entry"""
+    """Add a new timesheet entry with its computed hours"""
     with get_conn() as conn:
+        hours = _timesheet_hours(_hour_rules(conn), work_date, start_time, end_time, break_minutes, is_special)
         conn.execute(
-            """INSERT INTO timesheets (employee_id, work_date, start_time, end_time, break_minutes, is_special, notes, region)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?);""",
-            (employee_id, work_date, start_time, end_time, break_minutes, is_special, notes, region)
+            """INSERT INTO timesheets (employee_id, work_date, start_time, end_time, break_minutes, is_special, notes, region,
+                                       worked_hours, scheduled_hours, overtime_hours, night_hours, overnight_hours,
+                                       special_normal_hours, special_overtime_hours, special_night_hours, hours_version)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);""",
+            (employee_id, work_date, start_time, end_time, break_minutes, is_special, notes, region) + hours
         )
 
 def update_timesheet(timesheet_id, employee_id, work_date, start_time, end_time, break_minutes, is_special, notes, region):
-    """Update an existing timesheet entry"""
+    """Update an existing timesheet entry and its computed hours"""
     with get_conn() as conn:
+        hours = _timesheet_hours(_hour_rules(conn), work_date, start_time, end_time, break_minutes, is_special)
         conn.execute(
             """UPDATE timesheets SET employee_id = ?, work_date = ?, start_time = ?, end_time = ?,
-               break_minutes = ?, is_special = ?, notes = ?, region = ? WHERE id = ?;""",
-            (employee_id, work_date, start_time, end_time, break_minutes, is_special, notes, region, timesheet_id)
+               break_minutes = ?, is_special = ?, notes = ?, region = ?,
+               worked_hours = ?, scheduled_hours = ?, overtime_hours = ?, night_hours = ?, overnight_hours = ?,
+               special_normal_hours = ?, special_overtime_hours = ?, special_night_hours = ?, hours_version = ?
+               WHERE id = ?;""",
+            (employee_id, work_date, start_time, end_time, break_minutes, is_special, notes, region) + hours
+            + (timesheet_id,)
         )
 
+def recompute_stale_timesheets(chunk_size=HOURS_RECOMPUTE_CHUNK):
+    """
+    Re-materialize computed hours for rows stamped with other rules.
+    Works in chunks, one short transaction per chunk, so it can run on a
+    background thread after weekday_hours / Saturday window changes or a sync.
+    Returns the number of rows updated.
+    """
+    total = 0
+    while True:
+        with get_conn() as conn:
+            rules = _hour_rules(conn)
+            if rules is None:
+                return total
+            rows = conn.execute(
+                """SELECT id, work_date, start_time, end_time, break_minutes, is_special FROM timesheets
+                   WHERE hours_version IS NULL OR hours_version != ? LIMIT ?;""",
+                (rules.stamp, chunk_size)
+            ).fetchall()
+            if not rows:
+                return total
+            ids, dates, starts, ends, breaks, specials = zip(*rows)
+            hours = calc.calc_many(dates, starts, ends, breaks, rules, specials, skip_invalid=True)
+            empty = (None,) * len(TIMESHEET_HOURS_COLUMNS)
+            conn.executemany(
+                """UPDATE timesheets SET worked_hours = ?, scheduled_hours = ?, overtime_hours = ?, night_hours = ?,
+                   overnight_hours = ?, special_normal_hours = ?, special_overtime_hours = ?, special_night_hours = ?,
+                   hours_version = ? WHERE id = ?;""",
+                [tuple(row_hours or empty) + (rules.stamp, ts_id) for ts_id, row_hours in zip(ids, hours)]
+            )
+            total += len(rows)
+
+def rebuild_timesheet_rollups():
+    """Recreate timesheet_rollups from scratch (repair after bulk file replacement)"""
+    with get_conn() as conn:
+        _rebuild_timesheet_rollups(conn)
+
+def list_timesheet_rollups(year_month=None, region=None, employee_id=None):
+    """
+    Per-employee monthly totals.
+    Returns (employee_id, full_name, department, region, year_month, worked, scheduled, overtime,
+    night, overnight, special_normal, special_overtime, special_night, row_count, day_count).
+    """
+    with get_read_conn() as conn:
+        hours = ", ".join(f"ROUND(r.{column}, 2)" for column in TIMESHEET_HOURS_COLUMNS)
+        query = f"""
+            SELECT r.employee_id, e.full_name, e.department, r.region, r.year_month, {hours},
+                   r.row_count, r.day_count
+            FROM timesheet_rollups r
+            JOIN employees e ON r.employee_id = e.id
+            WHERE 1=1
+        """
+        params = []
+
+        if year_month:
+            query += " AND r.year_month = ?"
+            params.append(year_month)
+        if region:
+            query += " AND r.region = ?"
+            params.append(region)
+        if employee_id:
+            query += " AND r.employee_id = ?"
+            params.append(employee_id)
+
+        query += " ORDER BY r.year_month DESC, e.full_name;"
+
+        cursor = conn.execute(query, params)
+        return cursor.fetchall()
+
+def _whole_months(start_date, end_date):
+    """(first, last) year_month when [start_date, end_date] covers whole months (either may be None), else None"""
+    first = last = None
+    if start_date:
+        if start_date[8:] != "01":
+            return None
+        first = start_date[:7]
+    if end_date:
+        try:
+            month_start = datetime.strptime(end_date[:7], "%Y-%m")
+            end_day = int(end_date[8:])
+        except ValueError:
+            return None
+        month_end = (month_start + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+        if end_day < month_end.day:
+            return None
+        last = end_date[:7]
+    return first, last
+
+def list_employee_overtime(start_date=None, end_date=None, month=None, region=None):
+    """
+    Employees (of region) with their overtime over timesheets in [start_date, end_date];
+    month ('MM') matches that month of any year. Periods of whole months are summed from
+    timesheet_rollups, others with one grouped query over timesheets. Rows stamped with
+    other rules are recomputed in a single calc batch and replace their materialized hours;
+    with invalid hour settings every total is 0.
+    Returns (id, full_name, identity_no, department, title, region, overtime_hours).
+    """
+    period = ""
+    params = []
+    if start_date:
+        period += " AND t.work_date >= ?"
+        params.append(start_date)
+    if end_date:
+        period += " AND t.work_date <= ?"
+        params.append(end_date)
+    if month:
+        period += " AND substr(t.work_date, 6, 2) = ?"
+        params.append(month)
+    scope = " AND e.region = ?" if region else ""
+    scope_params = [region] if region else []
+
+    months = _whole_months(start_date, end_date)
+    if months is not None:
+        # A few rollup rows per employee instead of every timesheet
+        first, last = months
+        totals = "timesheet_rollups r ON r.employee_id = e.id"
+        totals += " AND r.year_month >= ?" if first else ""
+        totals += " AND r.year_month <= ?" if last else ""
+        totals += " AND substr(r.year_month, 6, 2) = ?" if month else ""
+        total_params = [value for value in (first, last, month) if value]
+        overtime = "r.overtime_hours"
+    else:
+        totals = f"timesheets t ON t.employee_id = e.id{period}"
+        total_params = params
+        overtime = "t.overtime_hours"
+
+    with get_read_conn() as conn:
+        rules = _hour_rules(conn)
+        if rules is None:
+            # Invalid hour settings: no row can be computed, every employee totals 0
+            rows = conn.execute(f"""
+                SELECT e.id, e.full_name, e.identity_no, e.department, e.title, e.region
+                FROM employees e
+                WHERE 1=1{scope}
+                ORDER BY e.full_name;
+            """, scope_params).fetchall()
+            return [row + (0.0,) for row in rows]
+        rows = conn.execute(f"""
+            SELECT e.id, e.full_name, e.identity_no, e.department, e.title, e.region,
+                   COALESCE(SUM({overtime}), 0)
+            FROM employees e
+            LEFT JOIN {totals}
+            WHERE 1=1{scope}
+            GROUP BY e.id
+            ORDER BY e.full_name;
+        """, total_params + scope_params).fetchall()
+        stale = conn.execute(f"""
+            SELECT t.employee_id, t.work_date, t.start_time, t.end_time, t.break_minutes, t.is_special,
+                   t.overtime_hours
+            FROM timesheets t
+            JOIN employees e ON t.employee_id = e.id
+            WHERE (t.hours_version IS NULL OR t.hours_version != ?){period}{scope};
+        """, [rules.stamp] + params + scope_params).fetchall()
+
+    extra = {}
+    if stale:
+        employee_ids, dates, starts, ends, breaks, specials, materialized = zip(*stale)
+        hours = calc.calc_many(dates, starts, ends, breaks, rules, specials, skip_invalid=True)
+        for employee_id, row_hours, old in zip(employee_ids, hours, materialized):
+            fresh = row_hours[2] if row_hours is not None else 0.0
+            extra[employee_id] = extra.get(employee_id, 0.0) + fresh - (old or 0.0)
+    return [row[:6] + (row[6] + extra.get(row[0], 0.0),) for row in rows]
+
 def delete_timesheet(timesheet_id):
     """Delete a timesheet entry"""
     with get_conn() as conn:
@@ -560,6 +1355,73 @@ def delete_timesheet(timesheet_id):
             ("timesheets", timesheet_id, datetime.now().isoformat())
         )
 
+def add_timesheets_bulk(rows):
+    """
+    Add many timesheet entries (with computed hours) in one transaction.
+    rows: iterable of (employee_id, work_date, start_time, end_time, break_minutes, is_special, notes, region)
+    Returns one BULK_* code per row; rows for unknown employees are BULK_INVALID.
+    """
+    rows = [tuple(row) for row in rows]
+    with get_conn() as conn:
+        employee_ids = {row[0] for row in conn.execute("SELECT id FROM employees;")}
+        outcomes = [BULK_INSERTED if row[0] in employee_ids else BULK_INVALID for row in rows]
+        valid = [row for row, outcome in zip(rows, outcomes) if outcome == BULK_INSERTED]
+        if not valid:
+            return outcomes
+        rules = _hour_rules(conn)
+        empty = (None,) * len(TIMESHEET_HOURS_COLUMNS)
+        if rules is None:
+            hours = [empty + (None,)] * len(valid)
+        else:
+            _, dates, starts, ends, breaks, specials, _, _ = zip(*valid)
+            hours = [
+                tuple(row_hours or empty) + (rules.stamp,)
+                for row_hours in calc.calc_many(dates, starts, ends, breaks, rules, specials, skip_invalid=True)
+            ]
+        conn.executemany(
+            """INSERT INTO timesheets (employee_id, work_date, start_time, end_time, break_minutes, is_special, notes, region,
+                                       worked_hours, scheduled_hours, overtime_hours, night_hours, overnight_hours,
+                                       special_normal_hours, special_overtime_hours, special_night_hours, hours_version)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);""",
+            [row + row_hours for row, row_hours in zip(valid, hours)]
+        )
+    return outcomes
+
+def delete_timesheets_bulk(timesheet_ids):
+    """
+    Delete many timesheet entries in one transaction and record sync tombstones.
+    Returns BULK_DELETED or BULK_MISSING per id.
+    """
+    timesheet_ids = list(timesheet_ids)
+    with get_conn() as conn:
+        found = set()
+        for start in range(0, len(timesheet_ids), 500):
+            chunk = timesheet_ids[start:start + 500]
+            found.update(row[0] for row in conn.execute(
+                f"SELECT id FROM timesheets WHERE id IN ({', '.join('?' * len(chunk))});", chunk
+            ))
+        outcomes = []
+        deleted = []
+        for timesheet_id in timesheet_ids:
+            if timesheet_id in found:
+                found.discard(timesheet_id)
+                deleted.append(timesheet_id)
+                outcomes.append(BULK_DELETED)
+            else:
+                outcomes.append(BULK_MISSING)
+        deleted_at = datetime.now().isoformat()
+        conn.executemany("DELETE FROM timesheets WHERE id = ?;", [(ts_id,) for ts_id in deleted])
+        conn.executemany(
+            "INSERT INTO deleted_records (table_name, record_id, deleted_at) VALUES (?, ?, ?);",
+            [("timesheets", ts_id, deleted_at) for ts_id in deleted]
+        )
+    return outcomes
+
+def count_timesheets():
+    """Number of timesheet rows"""
+    with get_read_conn() as conn:
+        return conn.execute("SELECT COUNT(*) FROM timesheets;").fetchone()[0]
+
 def get_all_timesheets():
     """Get all timesheets (for server API)"""
     return list_timesheets()
@@ -605,7 +1467,7 @@ def add_report_log(file_path, created_at, employee, start_date, end_date):
 
 def list_report_logs():
     """List all report logs"""
-    with get_conn() as conn:
+    with get_read_conn() as conn:
         cursor = conn.execute(
             "SELECT id, file_path, created_at, employee, start_date, end_date FROM reports ORDER BY created_at DESC;"
         )
@@ -617,7 +1479,7 @@ def list_report_logs():
 
 def list_vehicles(region=None):
     """List all vehicles, optionally filtered by region"""
-    with get_conn() as conn:
+    with get_read_conn() as conn:
         if region:
             cursor = conn.execute(
                 """SELECT id, plate, brand, model, year, km, inspection_date, insurance_date,
@@ -685,7 +1547,7 @@ def delete_vehicle(vehicle_id):
 
 def list_drivers(region=None):
     """List all drivers, optionally filtered by region"""
-    with get_conn() as conn:
+    with get_read_conn() as conn:
         if region:
             cursor = conn.execute(
                 "SELECT id, full_name, license_class, license_expiry, phone, notes, region FROM drivers WHERE region = ? ORDER BY full_name;",
@@ -732,13 +1594,50 @@ def delete_driver(driver_id):
             ("drivers", driver_id, datetime.now().isoformat())
         )
 
+# ============================================================================
+# DEADLINES
+# ============================================================================
+
+def list_deadlines(within_days=DEADLINE_WARNING_DAYS, region=None, today=None):
+    """Deadlines due within within_days of today or already overdue, soonest first.
+
+    Rows are (entity, entity_id, name, kind, due_date, days_left, severity, region); name is
+    the vehicle plate or driver name, severity one of expired/critical/warning/upcoming.
+    """
+    today = today or datetime.now().date()
+    params = {
+        "today": today.isoformat(),
+        "critical": (today + timedelta(days=DEADLINE_CRITICAL_DAYS)).isoformat(),
+        "warning": (today + timedelta(days=DEADLINE_WARNING_DAYS)).isoformat(),
+        "until": (today + timedelta(days=within_days)).isoformat(),
+        "region": region,
+    }
+    region_filter = "d.region = :region AND " if region else ""
+    with get_read_conn() as conn:
+        cursor = conn.execute(
+            f"""SELECT d.entity, d.entity_id, COALESCE(v.plate, dr.full_name), d.kind, d.due_date,
+                       CAST(julianday(d.due_date) - julianday(:today) AS INTEGER),
+                       CASE WHEN d.due_date < :today THEN 'expired'
+                            WHEN d.due_date <= :critical THEN 'critical'
+                            WHEN d.due_date <= :warning THEN 'warning'
+                            ELSE 'upcoming' END,
+                       d.region
+                FROM deadlines d
+                LEFT JOIN vehicles v ON d.entity = 'vehicle' AND v.id = d.entity_id
+                LEFT JOIN drivers dr ON d.entity = 'driver' AND dr.id = d.entity_id
+                WHERE {region_filter}d.due_date <= :until
+                ORDER BY d.due_date, d.entity, d.entity_id, d.kind;""",
+            params
+        )
+        return cursor.fetchall()
+
 # ============================================================================
 # VEHICLE FAULTS
 # ============================================================================
 
 def list_vehicle_faults(vehicle_id=None, region=None):
     """List vehicle faults"""
-    with get_conn() as conn:
+    with get_read_conn() as conn:
         query = """
             SELECT f.id, f.vehicle_id, v.plate, f.title, f.description, f.opened_date,
                    f.closed_date, f.status, f.region
@@ -762,7 +1661,7 @@ def list_vehicle_faults(vehicle_id=None, region=None):
 
 def list_open_vehicle_faults(vehicle_id=None, region=None):
     """List open vehicle faults"""
-    with get_conn() as conn:
+    with get_read_conn() as conn:
         query = """
             SELECT f.id, f.vehicle_id, v.plate, f.title, f.description, f.opened_date,
                    f.closed_date, f.status, f.region
@@ -825,7 +1724,7 @@ def delete_vehicle_fault(fault_id):
 
 def list_vehicle_inspections(vehicle_id=None, week_start=None, region=None):
     """List vehicle inspections"""
-    with get_conn() as conn:
+    with get_read_conn() as conn:
         query = """
             SELECT i.id, i.vehicle_id, v.plate, i.driver_id, d.full_name, i.inspection_date,
                    i.week_start, i.km, i.notes, i.fault_id, i.fault_status, i.service_visit
@@ -853,7 +1752,7 @@ def list_vehicle_inspections(vehicle_id=None, week_start=None, region=None):
 
 def list_driver_inspections(driver_id, region=None):
     """List inspections by driver"""
-    with get_conn() as conn:
+    with get_read_conn() as conn:
         query = """
             SELECT i.id, i.vehicle_id, v.plate, i.driver_id, d.full_name, i.inspection_date,
                    i.week_start, i.km, i.notes, i.fault_id, i.fault_status, i.service_visit
@@ -908,7 +1807,7 @@ def add_vehicle_inspection_result(inspection_id, item_key, status, note):
 
 def list_vehicle_service_visits(vehicle_id=None, start_date=None, end_date=None, region=None):
     """List vehicle service visits"""
-    with get_conn() as conn:
+    with get_read_conn() as conn:
         query = """
             SELECT s.id, s.vehicle_id, v.plate, s.fault_id, f.title, s.start_date, s.end_date,
                    s.reason, s.cost, s.notes, s.region
@@ -972,18 +1871,538 @@ def delete_vehicle_service_visit(visit_id):
             ("vehicle_service_visits", visit_id, datetime.now().isoformat())
         )
 
+# ============================================================================
+# STOCK INVENTORY
+# ============================================================================
+
+def replace_stock_bulk(bolge, rows):
+    """
+    Replace a region's stock_inventory with rows in one transaction.
+    rows: iterable of (stok_kod, stok_adi, seri_no, durum, tarih, girdi_yapan, adet)
+    seri_no is unique across regions; repeats are BULK_DUPLICATE.
+    Returns one BULK_* code per row.
+    """
+    rows = list(rows)
+    updated_at = datetime.now().isoformat()
+    with get_conn() as conn:
+        conn.execute("DELETE FROM stock_inventory WHERE bolge = ?;", (bolge,))
+        taken = {row[0] for row in conn.execute("SELECT seri_no FROM stock_inventory;")}
+        outcomes = []
+        inserts = []
+        for stok_kod, stok_adi, seri_no, durum, tarih, girdi_yapan, adet in rows:
+            if not seri_no:
+                outcomes.append(BULK_INVALID)
+            elif seri_no in taken:
+                outcomes.append(BULK_DUPLICATE)
+            else:
+                taken.add(seri_no)
+                inserts.append((stok_kod, stok_adi, seri_no, durum, tarih, girdi_yapan, bolge, adet, updated_at))
+                outcomes.append(BULK_INSERTED)
+        conn.executemany(
+            """INSERT INTO stock_inventory
+               (stok_kod, stok_adi, seri_no, durum, tarih, girdi_yapan, bolge, adet, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);""",
+            inserts
+        )
+    return outcomes
+
+# ============================================================================
+# DASHBOARD
+# ============================================================================
+
+_dashboard_summary_lock = threading.Lock()
+_dashboard_summaries = {}
+
+def dashboard_summary(region=None, today=None):
+    """
+    KPIs for the current month and time-bucketed hour series for the web dashboard, all
+    from GROUP BY queries (monthly figures from timesheet_rollups). Cached per
+    data_generation() and region; only the current generation is kept.
+    """
+    today = today or datetime.now().date()
+    key = (region or "ALL", today.isoformat())
+    generation = data_generation()
+    with _dashboard_summary_lock:
+        cached = _dashboard_summaries.get(key)
+        if cached and cached[0] == generation:
+            return cached[1]
+    summary = _build_dashboard_summary(region, today)
+    summary["generation"] = generation
+    with _dashboard_summary_lock:
+        for stale in [k for k, (g, _) in _dashboard_summaries.items() if g != generation]:
+            del _dashboard_summaries[stale]
+        _dashboard_summaries[key] = (generation, summary)
+    return summary
+
+def _build_dashboard_summary(region, today):
+    month = today.strftime("%Y-%m")
+    # Monthly series covers the months after this one
+    months = today.year * 12 + today.month - 1 - DASHBOARD_MONTHS
+    before_month = f"{months // 12}-{months % 12 + 1:02d}"
+    first_day = (today - timedelta(days=DASHBOARD_DAYS - 1)).isoformat()
+    first_week = (today - timedelta(days=today.weekday() + 7 * (DASHBOARD_WEEKS - 1))).isoformat()
+    end_day = today.isoformat()
+    # worked, overtime, night (incl. past midnight), special day hours
+    rollup_hours = """ROUND(SUM(r.worked_hours), 2), ROUND(SUM(r.overtime_hours), 2),
+        ROUND(SUM(r.night_hours + r.overnight_hours), 2),
+        ROUND(SUM(r.special_normal_hours + r.special_overtime_hours), 2)"""
+    timesheet_hours = """ROUND(SUM(COALESCE(t.worked_hours, 0)), 2), ROUND(SUM(COALESCE(t.overtime_hours, 0)), 2),
+        ROUND(SUM(COALESCE(t.night_hours, 0) + COALESCE(t.overnight_hours, 0)), 2),
+        ROUND(SUM(COALESCE(t.special_normal_hours, 0) + COALESCE(t.special_overtime_hours, 0)), 2)"""
+    region_params = [region] if region else []
+
+    def where_region(column):
+        return f" AND {column} = ?" if region else ""
+
+    def hours_row(bucket, row):
+        worked, overtime, night, special = (value or 0 for value in row)
+        return {"bucket": bucket, "worked": worked, "overtime": overtime, "night": night, "special": special}
+
+    with get_read_conn() as conn:
+        def count(table, column):
+            return conn.execute(
+                f"SELECT COUNT(*) FROM {table} WHERE 1=1{where_region(column)};", region_params
+            ).fetchone()[0]
+
+        current = conn.execute(
+            f"SELECT {rollup_hours} FROM timesheet_rollups r WHERE r.year_month = ?{where_region('r.region')};",
+            [month] + region_params,
+        ).fetchone()
+        top = conn.execute(f"""
+            SELECT e.full_name, ROUND(SUM(r.overtime_hours), 2) AS overtime
+            FROM timesheet_rollups r JOIN employees e ON e.id = r.employee_id
+            WHERE r.year_month = ?{where_region('r.region')}
+            GROUP BY r.employee_id HAVING overtime > 0 ORDER BY overtime DESC LIMIT 1;
+        """, [month] + region_params).fetchone()
+        open_faults = conn.execute(
+            f"SELECT COUNT(*) FROM vehicle_faults WHERE status = 'Acik'{where_region('region')};", region_params
+        ).fetchone()[0]
+        current = hours_row(month, current)
+        kpis = {
+            "employees": count("employees", "region"),
+            "timesheets": count("timesheets", "region"),
+            "vehicles": count("vehicles", "region"),
+            "drivers": count("drivers", "region"),
+            "open_faults": open_faults,
+            "worked_hours": current["worked"],
+            "overtime_hours": current["overtime"],
+            "night_hours": current["night"],
+            "special_hours": current["special"],
+            "top_overtime": {"name": top[0], "overtime": top[1]} if top else None,
+        }
+
+        monthly = [hours_row(row[0], row[1:]) for row in conn.execute(f"""
+            SELECT r.year_month, {rollup_hours} FROM timesheet_rollups r
+            WHERE r.year_month > ?{where_region('r.region')}
+            GROUP BY r.year_month ORDER BY r.year_month;
+        """, [before_month] + region_params)]
+        daily = [hours_row(row[0], row[1:]) for row in conn.execute(f"""
+            SELECT t.work_date, {timesheet_hours} FROM timesheets t
+            WHERE t.work_date BETWEEN ? AND ?{where_region('t.region')}
+            GROUP BY t.work_date ORDER BY t.work_date;
+        """, [first_day, end_day] + region_params)]
+
+        def overtime_series(bucket, since, key):
+            rows = conn.execute(f"""
+                SELECT {bucket} AS bucket, {key} AS key, ROUND(SUM(COALESCE(t.overtime_hours, 0)), 2)
+                FROM timesheets t JOIN employees e ON e.id = t.employee_id
+                WHERE t.work_date BETWEEN ? AND ?{where_region('t.region')}
+                GROUP BY bucket, key ORDER BY bucket, key;
+            """, [since, end_day] + region_params)
+            return [{"bucket": row[0], "key": row[1], "overtime": row[2]} for row in rows]
+
+        # Weeks start on Monday
+        week = "date(t.work_date, 'weekday 0', '-6 days')"
+        department = "COALESCE(NULLIF(e.department, ''), '-')"
+        region_key = "COALESCE(NULLIF(t.region, ''), '-')"
+        overtime = {
+            "daily": {
+                "department": overtime_series("t.work_date", first_day, department),
+                "region": overtime_series("t.work_date", first_day, region_key),
+            },
+            "weekly": {
+                "department": overtime_series(week, first_week, department),
+                "region": overtime_series(week, first_week, region_key),
+            },
+        }
+
+    return {
+        "region": region or "ALL",
+        "month": month,
+        "kpis": kpis,
+        "series": {"monthly": monthly, "daily": daily, "overtime": overtime},
+    }
+
+# ============================================================================
+# CHANGE LOG
+# ============================================================================
+
+def _change_seq(conn):
+    """Highest change_log seq ever issued (survives deleted log rows)"""
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log';").fetchone()
+    return row[0] if row else 0
+
+def _change_floor(conn):
+    """Oldest seq still readable: changes after it are all in change_log"""
+    first = conn.execute("SELECT MIN(seq) FROM change_log;").fetchone()[0]
+    return _change_seq(conn) if first is None else first - 1
+
+def latest_change_seq():
+    """Current change_log position (0 for a database without changes)"""
+    with get_read_conn() as conn:
+        return _change_seq(conn)
+
+def data_generation():
+    """
+    Token that changes whenever a write lands: change_log position plus the file state of the
+    database and its WAL (settings and file replacements are not journaled). Cache key for
+    views derived from the data.
+    """
+    with get_read_conn() as conn:
+        seq = _change_seq(conn)
+    return hashlib.sha1(repr((seq, _file_state(DB_PATH))).encode()).hexdigest()[:16]
+
+def list_changes(since_seq=0, limit=CHANGE_LOG_PAGE_SIZE, tables=None):
+    """
+    change_log entries after since_seq, oldest first.
+    Returns (seq, table_name, row_id, op, ts); raises ValueError when since_seq
+    is older than the compacted part of the log (the reader must rebuild).
+    """
+    with get_read_conn() as conn:
+        if since_seq < _change_floor(conn):
+            raise ValueError(f"change_log compacted past seq {since_seq}")
+        query = "SELECT seq, table_name, row_id, op, ts FROM change_log WHERE seq > ?"
+        params = [since_seq]
+        if tables:
+            query += f" AND table_name IN ({', '.join('?' * len(tables))})"
+            params.extend(tables)
+        query += " ORDER BY seq LIMIT ?;"
+        params.append(limit)
+        return conn.execute(query, params).fetchall()
+
+def compact_change_log(up_to_seq):
+    """Drop acknowledged entries (seq <= up_to_seq); returns the number removed"""
+    with get_conn() as conn:
+        return conn.execute("DELETE FROM change_log WHERE seq <= ?;", (up_to_seq,)).rowcount
+
+def compact_unsynced_change_log():
+    """
+    Drop the whole change_log while no sync watermark exists (sync off or never run): nothing
+    reads it, and the first sync is a full one that resets the log anyway. Returns rows removed.
+    """
+    with get_conn() as conn:
+        if conn.execute("SELECT 1 FROM sync_watermarks LIMIT 1;").fetchone():
+            return 0
+        return conn.execute("DELETE FROM change_log;").rowcount
+
+# ============================================================================
+# DELTA SYNC
+# ============================================================================
+
+def sync_client_id():
+    """
+    Id of this installation for sync (settings.sync_client_id, created on first use): the
+    master keeps watermarks per client and does not send a client its own changes back.
+    """
+    client = get_all_settings().get("sync_client_id")
+    if not client:
+        client = uuid.uuid4().hex
+        set_setting("sync_client_id", client)
+    return client
+
+def min_sync_pull_seq():
+    """Lowest master position any client has pulled; entries up to it are acknowledged"""
+    with get_read_conn() as conn:
+        return conn.execute("SELECT COALESCE(MIN(pull_seq), 0) FROM sync_watermarks;").fetchone()[0]
+
+def get_sync_watermark(client):
+    """(push_seq, pull_seq) recorded for client, or None before its first delta sync"""
+    with get_read_conn() as conn:
+        row = conn.execute(
+            "SELECT push_seq, pull_seq FROM sync_watermarks WHERE client = ?;", (client,)
+        ).fetchone()
+    return tuple(row) if row else None
+
+def set_sync_watermark(client, push_seq=None, pull_seq=None):
+    """Advance the watermarks for client; None keeps the stored value"""
+    with get_conn() as conn:
+        conn.execute(
+            """INSERT INTO sync_watermarks (client, push_seq, pull_seq, updated_at) VALUES (?, COALESCE(?, 0), COALESCE(?, 0), ?)
+               ON CONFLICT(client) DO UPDATE SET push_seq = COALESCE(?, push_seq), pull_seq = COALESCE(?, pull_seq),
+               updated_at = excluded.updated_at;""",
+            (client, push_seq, pull_seq, datetime.now().isoformat(), push_seq, pull_seq)
+        )
+
+def reset_sync_watermark(client):
+    """
+    Start delta sync from the current file (after a full /sync/download).
+    The file came from the master, so both local and master positions are its last seq.
+    """
+    with get_conn() as conn:
+        seq = _change_seq(conn)
+        conn.execute("DELETE FROM sync_watermarks;")
+        conn.execute(
+            "INSERT INTO sync_watermarks (client, push_seq, pull_seq, updated_at) VALUES (?, ?, ?, ?);",
+            (client, seq, seq, datetime.now().isoformat())
+        )
+    return seq
+
+def sync_delta_available(since):
+    """False when since is not a readable position in this change_log (compacted, reset or replaced)"""
+    with get_read_conn() as conn:
+        return _change_floor(conn) <= since <= _change_seq(conn)
+
+def collect_sync_delta(since, skip_origin=None, region=None):
+    """
+    Rows of SYNC_TABLES changed after change_log seq since.
+    Returns {"seq", "upserts": {table: {"columns", "rows"}}, "deletes": {table: [ids]}};
+    rows whose latest change came from skip_origin are left out (no echo to the sender).
+    With a region only that region's rows are upserted (regional download subsets).
+    """
+    delta = {"seq": since, "upserts": {}, "deletes": {}}
+    with get_read_conn() as conn:
+        conn.execute("BEGIN;")
+        try:
+            delta["seq"] = _change_seq(conn)
+            for table in SYNC_TABLES:
+                # Bare origin comes from the MAX(seq) row: the latest change of each row
+                changed = [
+                    row_id for row_id, origin, _ in conn.execute(
+                        """SELECT row_id, origin, MAX(seq) FROM change_log
+                           WHERE table_name = ? AND seq > ? AND seq <= ? GROUP BY row_id;""",
+                        (table, since, delta["seq"])
+                    ) if skip_origin is None or origin != skip_origin
+                ]
+                if not changed:
+                    continue
+                rows = []
+                for start in range(0, len(changed), 500):
+                    chunk = changed[start:start + 500]
+                    cursor = conn.execute(f"SELECT * FROM {table} WHERE id IN ({', '.join('?' * len(chunk))});", chunk)
+                    rows.extend(cursor.fetchall())
+                columns = [column[0] for column in cursor.description]
+                present = {row[0] for row in rows}
+                if region and table in REGION_COLUMNS:
+                    # Rows of other regions are not deletions: they are simply not sent
+                    position = columns.index(REGION_COLUMNS[table])
+                    rows = [row for row in rows if row[position] == region]
+                if rows:
+                    delta["upserts"][table] = {"columns": columns, "rows": [list(row) for row in rows]}
+                removed = [row_id for row_id in changed if row_id not in present]
+                if removed:
+                    delta["deletes"][table] = removed
+        finally:
+            conn.rollback()
+    return delta
+
+def apply_sync_delta(delta, origin=None, protect_after=None):
+    """
+    Apply a collect_sync_delta() payload in one transaction; deletes leave deleted_records tombstones.
+    origin: sync client the delta came from; its change_log rows are stamped with it. With None (a
+    client applying the master's delta) they are dropped so the rows are not pushed back.
+    protect_after: local seq; rows changed locally after it keep their local version.
+    Returns {table: {"upserted": n, "deleted": n, "skipped": n}}.
+    """
+    counts = {}
+    with get_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE;")
+        before = _change_seq(conn)
+        protected = set()
+        if protect_after is not None:
+            protected = set(conn.execute(
+                "SELECT table_name, row_id FROM change_log WHERE seq > ?;", (protect_after,)
+            ).fetchall())
+        upserts = delta.get("upserts") or {}
+        deletes = delta.get("deletes") or {}
+        for table in SYNC_TABLES:
+            if table not in upserts:
+                continue
+            known = {column[1] for column in conn.execute(f"PRAGMA table_info({table});")}
+            columns = upserts[table]["columns"]
+            keep = [i for i, column in enumerate(columns) if column in known]
+            names = [columns[i] for i in keep]
+            values = ", ".join("?" * len(names))
+            updates = ", ".join(f"{name} = excluded.{name}" for name in names if name != "id")
+            upsert_sql = f"INSERT INTO {table} ({', '.join(names)}) VALUES ({values}) ON CONFLICT(id) DO UPDATE SET {updates};"
+            replace_sql = f"INSERT OR REPLACE INTO {table} ({', '.join(names)}) VALUES ({values});"
+            table_counts = counts.setdefault(table, {"upserted": 0, "deleted": 0, "skipped": 0})
+            for row in upserts[table]["rows"]:
+                params = [row[i] for i in keep]
+                if (table, params[names.index("id")]) in protected:
+                    table_counts["skipped"] += 1
+                    continue
+                try:
+                    conn.execute(upsert_sql, params)
+                except sqlite3.IntegrityError:
+                    # Same natural key (plate, seri_no) under another id: the incoming row wins
+                    try:
+                        conn.execute(replace_sql, params)
+                    except sqlite3.IntegrityError:
+                        table_counts["skipped"] += 1
+                        continue
+                table_counts["upserted"] += 1
+        deleted_at = datetime.now().isoformat()
+        for table in reversed(SYNC_TABLES):
+            ids = [row_id for row_id in deletes.get(table) or () if (table, row_id) not in protected]
+            if not ids:
+                continue
+            table_counts = counts.setdefault(table, {"upserted": 0, "deleted": 0, "skipped": 0})
+            for row_id in ids:
+                table_counts["deleted"] += conn.execute(f"DELETE FROM {table} WHERE id = ?;", (row_id,)).rowcount
+            conn.executemany(
+                "INSERT INTO deleted_records (table_name, record_id, deleted_at) VALUES (?, ?, ?);",
+                [(table, row_id, deleted_at) for row_id in ids]
+            )
+        if origin is None:
+            conn.execute("DELETE FROM change_log WHERE seq > ?;", (before,))
+        else:
+            conn.execute("UPDATE change_log SET origin = ? WHERE seq > ?;", (origin, before))
+    return counts
+
+# ============================================================================
+# SYNC MERGE
+# ============================================================================
+
+def _table_columns(conn, schema, table):
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table});")]
+
+def merge_databases(incoming_path, master_path=None, replace_tables=(), region=None, origin=None):
+    """
+    Merge an uploaded database file into the master in one transaction with a few
+    set-based statements over ATTACH: incoming tombstones are recorded and applied,
+    tombstoned rows are excluded, changed rows are upserted (last writer wins) and
+    identical rows are left alone. replace_tables mirror incoming exactly; with a region
+    (upload from a regional subset) only that region's rows of them are replaced.
+    origin: sync client that uploaded the file; the change_log rows of the merge are stamped
+    with it, so its next delta does not send them back.
+    Returns {"tombstones": n, "tables": {table: {"inserted", "updated", "unchanged", "excluded", "deleted"}}}.
+    """
+    conn = sqlite3.connect(master_path or DB_PATH, timeout=30.0)
+    try:
+        # FK actions stay off so REPLACE never cascades into a replaced parent's children;
+        # recursive triggers keep timesheet_rollups and change_log exact through REPLACE
+        conn.execute("PRAGMA foreign_keys = OFF;")
+        conn.execute("PRAGMA busy_timeout = 30000;")
+        conn.execute("PRAGMA recursive_triggers = ON;")
+        conn.execute("ATTACH DATABASE ? AS incoming;", (incoming_path,))
+        try:
+            conn.execute("BEGIN IMMEDIATE;")
+            before = _change_seq(conn)
+            result = _merge_attached(conn, replace_tables, region)
+            if origin is not None:
+                conn.execute("UPDATE main.change_log SET origin = ? WHERE seq > ?;", (origin, before))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.execute("DETACH DATABASE incoming;")
+        return result
+    finally:
+        conn.close()
+
+def _merge_attached(conn, replace_tables, region=None):
+    master_tables = {row[0] for row in conn.execute("SELECT name FROM main.sqlite_master WHERE type = 'table';")}
+    incoming_tables = {row[0] for row in conn.execute("SELECT name FROM incoming.sqlite_master WHERE type = 'table';")}
+    _ensure_deleted_records_table(conn)
+    result = {"tombstones": 0, "tables": {}}
+
+    def table_counts(table):
+        return result["tables"].setdefault(
+            table, {"inserted": 0, "updated": 0, "unchanged": 0, "excluded": 0, "deleted": 0}
+        )
+
+    # 1. Incoming tombstones: record the new ones, delete their rows from master
+    if "deleted_records" in incoming_tables:
+        result["tombstones"] = conn.execute("""
+            INSERT INTO main.deleted_records (table_name, record_id, deleted_at, deleted_by)
+            SELECT table_name, record_id, MIN(deleted_at), MAX(deleted_by) FROM incoming.deleted_records d
+            WHERE NOT EXISTS (SELECT 1 FROM main.deleted_records m
+                              WHERE m.table_name = d.table_name AND m.record_id = d.record_id)
+            GROUP BY table_name, record_id;
+        """).rowcount
+        for (table,) in conn.execute("SELECT DISTINCT table_name FROM incoming.deleted_records;").fetchall():
+            if table in master_tables:
+                table_counts(table)["deleted"] += conn.execute(
+                    f"DELETE FROM main.{table} WHERE id IN "
+                    "(SELECT record_id FROM incoming.deleted_records WHERE table_name = ?);",
+                    (table,)
+                ).rowcount
+
+    # 2. Upsert changed rows, skipping anything tombstoned in master
+    for table in SYNC_TABLES:
+        if table not in master_tables or table not in incoming_tables:
+            continue
+        shared = set(_table_columns(conn, "incoming", table))
+        columns = [column for column in _table_columns(conn, "main", table) if column in shared]
+        if "id" not in columns:
+            continue
+        live = "NOT EXISTS (SELECT 1 FROM main.deleted_records d WHERE d.table_name = ? AND d.record_id = i.id)"
+        same = " AND ".join(f"m.{column} IS i.{column}" for column in columns)
+        identical = f"EXISTS (SELECT 1 FROM main.{table} m WHERE m.id = i.id AND {same})"
+        known = f"EXISTS (SELECT 1 FROM main.{table} m WHERE m.id = i.id)"
+        kinds = dict(conn.execute(f"""
+            SELECT kind, COUNT(*) FROM (
+                SELECT CASE WHEN NOT {live} THEN 'excluded' WHEN {identical} THEN 'unchanged'
+                            WHEN {known} THEN 'updated' ELSE 'inserted' END AS kind
+                FROM incoming.{table} i
+            ) GROUP BY kind;
+        """, (table,)).fetchall())
+        counts = table_counts(table)
+        if table in replace_tables:
+            scope, params = "", (table,)
+            if region and table in REGION_COLUMNS:
+                scope, params = f" AND {REGION_COLUMNS[table]} = ?", (table, region)
+            counts["deleted"] += conn.execute(
+                f"DELETE FROM main.{table} WHERE id NOT IN (SELECT i.id FROM incoming.{table} i WHERE {live}){scope};",
+                params
+            ).rowcount
+        column_list = ", ".join(columns)
+        conn.execute(f"""
+            INSERT OR REPLACE INTO main.{table} ({column_list})
+            SELECT {", ".join(f"i.{column}" for column in columns)} FROM incoming.{table} i
+            WHERE {live} AND NOT {identical};
+        """, (table,))
+        for kind in ("inserted", "updated", "unchanged", "excluded"):
+            counts[kind] = kinds.get(kind, 0)
+    return result
+
 # ============================================================================
 # BACKUP & RESTORE
 # ============================================================================
 
-def _backup_db_if_needed():
+_auto_backup_lock = threading.Lock()
+_auto_backup_thread = None
+
+def start_auto_backup():
+    """Run the daily backup on a background thread so startup never waits on the copy"""
+    global _auto_backup_thread
+    # Paths are bound now; the thread must not follow a later DB_PATH change
+    _auto_backup_thread = threading.Thread(
+        target=_backup_db_if_needed,
+        args=(DB_PATH, BACKUP_DIR, BACKUP_MARKER),
+        name="puantaj-auto-backup",
+        daemon=True,
+    )
+    _auto_backup_thread.start()
+    return _auto_backup_thread
+
+def wait_for_auto_backup(timeout=None):
+    """Block until a running daily backup finishes (e.g. before exit)"""
+    thread = _auto_backup_thread
+    if thread is not None:
+        thread.join(timeout)
+
+def _backup_db_if_needed(db_path, backup_dir, marker_path):
     """Create automatic backup if needed (once per day)"""
+    if not _auto_backup_lock.acquire(blocking=False):
+        return  # Another thread is already backing up
     try:
-        os.makedirs(BACKUP_DIR, exist_ok=True)
+        os.makedirs(backup_dir, exist_ok=True)
         
         # Check last backup time
-        if os.path.exists(BACKUP_MARKER):
-            with open(BACKUP_MARKER, 'r') as f:
+        if os.path.exists(marker_path):
+            with open(marker_path, 'r') as f:
                 last_backup = f.read().strip()
                 last_date = datetime.fromisoformat(last_backup).date()
                 if last_date >= datetime.now().date():
@@ -991,43 +2410,190 @@ def _backup_db_if_needed():
         
         # Create backup
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_path = os.path.join(BACKUP_DIR, f"puantaj_auto_{timestamp}.db")
-        shutil.copy2(DB_PATH, backup_path)
+        backup_path = os.path.join(backup_dir, f"puantaj_auto_{timestamp}.db")
+        _copy_database(db_path, backup_path)
         
         # Update marker
-        with open(BACKUP_MARKER, 'w') as f:
+        with open(marker_path, 'w') as f:
             f.write(datetime.now().isoformat())
         
         # Clean old backups (keep last 7 days)
-        _cleanup_old_backups()
+        _cleanup_old_backups(backup_dir)
     except Exception:
         pass
+    finally:
+        _auto_backup_lock.release()
 
-def _cleanup_old_backups():
+def _cleanup_old_backups(backup_dir):
     """Remove backups older than 7 days"""
     try:
         cutoff = datetime.now() - timedelta(days=7)
-        for filename in os.listdir(BACKUP_DIR):
+        for filename in os.listdir(backup_dir):
             if filename.startswith("puantaj_auto_") and filename.endswith(".db"):
-                filepath = os.path.join(BACKUP_DIR, filename)
+                filepath = os.path.join(backup_dir, filename)
                 if os.path.getmtime(filepath) < cutoff.timestamp():
                     os.remove(filepath)
     except Exception:
         pass
 
+def _copy_database(source_path, target_path):
+    """Consistent online copy through the SQLite backup API, BACKUP_PAGES_PER_STEP pages at a time"""
+    partial_path = target_path + ".part"
+    if os.path.exists(partial_path):
+        os.remove(partial_path)
+    # Read-only source: reads through the WAL, never blocks writers, rejects non-database files
+    source = sqlite3.connect(Path(os.path.abspath(source_path)).as_uri() + "?mode=ro", uri=True, timeout=30.0)
+    try:
+        target = sqlite3.connect(partial_path)
+        try:
+            source.backup(target, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP)
+            # Keep the copy a single self-contained file (no -wal/-shm beside it)
+            target.execute("PRAGMA journal_mode = DELETE;")
+        finally:
+            target.close()
+    except Exception:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    finally:
+        source.close()
+    os.replace(partial_path, target_path)
+    return target_path
+
 def create_backup(output_path):
     """Create a manual backup"""
-    shutil.copy2(DB_PATH, output_path)
-    return output_path
+    return _copy_database(DB_PATH, output_path)
+
+_download_snapshot_lock = threading.Lock()
+_download_snapshots = {}
+
+def _file_state(path):
+    """(mtime, size) of the database and its WAL; changes whenever a write lands"""
+    state = []
+    for candidate in (path, path + "-wal"):
+        try:
+            stat = os.stat(candidate)
+            state.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            state.append(None)
+    return tuple(state)
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def download_snapshot(db_path=None, region=None):
+    """
+    Consistent copy of the database for /sync/download and its content hash (the ETag).
+    The copy is rebuilt only after the database changed; identical content keeps its ETag.
+    A region other than ALL gets that region's subset, cut from the full copy once per
+    generation (full ETag) and cached until the next change.
+    """
+    db_path = db_path or DB_PATH
+    with _download_snapshot_lock:
+        state = _file_state(db_path)
+        full = _download_snapshots.get(db_path)
+        if not (full and full[0] == state and os.path.exists(full[1])):
+            partial_path = _copy_database(db_path, db_path + ".snapshot")
+            full = _store_snapshot(db_path, partial_path, state, f"{db_path}.snapshot-")
+        if not region or region == "ALL":
+            return full[1], full[2]
+        subset = _download_snapshots.get((db_path, region))
+        if not (subset and subset[0] == full[2] and os.path.exists(subset[1])):
+            label = re.sub(r"[^0-9A-Za-z_-]", "_", region)
+            partial_path = _copy_database(full[1], f"{db_path}.snapshot.{label}")
+            _reduce_to_region(partial_path, region)
+            subset = _store_snapshot((db_path, region), partial_path, full[2], f"{db_path}.snapshot-{label}-")
+        return subset[1], subset[2]
+
+def _store_snapshot(key, partial_path, generation, prefix):
+    """Name a finished snapshot by its content hash and drop the one it replaces"""
+    etag = _file_sha256(partial_path)
+    # Named by content: a response still streaming an older snapshot keeps its own file
+    snapshot_path = f"{prefix}{etag[:16]}"
+    os.replace(partial_path, snapshot_path)
+    previous = _download_snapshots.get(key)
+    if previous and previous[1] != snapshot_path:
+        # The old snapshot and its compressed copies (sync_codec.encoded_copy)
+        for stale_path in glob.glob(glob.escape(previous[1]) + "*"):
+            try:
+                os.remove(stale_path)
+            except OSError:
+                pass
+    _download_snapshots[key] = (generation, snapshot_path, etag)
+    return _download_snapshots[key]
+
+def _reduce_to_region(path, region):
+    """
+    Cut a snapshot copy down to one region: the region's REGION_COLUMNS rows plus every row
+    they, or region-less rows hanging off them (inspections), reference; other tables stay whole.
+    Deletes run through the triggers so rollups stay exact; their change_log entries are dropped.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA foreign_keys = ON;")
+        conn.execute("BEGIN IMMEDIATE;")
+        before = _change_seq(conn)
+        conn.execute("""
+            CREATE TEMP TABLE keep (table_name TEXT NOT NULL, id INTEGER NOT NULL, PRIMARY KEY (table_name, id))
+            WITHOUT ROWID;
+        """)
+        for table, column in REGION_COLUMNS.items():
+            conn.execute(f"INSERT INTO keep SELECT ?, id FROM {table} WHERE {column} = ?;", (table, region))
+
+        tables = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%';"
+        )]
+        # (child, column, parent, on_delete) for every reference into a region-scoped table
+        links = [
+            (table, fk[3], fk[2], fk[6])
+            for table in tables
+            for fk in conn.execute(f"PRAGMA foreign_key_list({table});").fetchall()
+            if fk[2] in REGION_COLUMNS
+        ]
+        survivors = {}
+        for child, column, parent, on_delete in links:
+            if child in REGION_COLUMNS:
+                survivors[child] = f"c.id IN (SELECT id FROM keep WHERE table_name = '{child}')"
+            elif on_delete == "CASCADE":
+                # A region-less row survives while each of its cascading parents does
+                condition = f"(c.{column} IS NULL OR c.{column} IN (SELECT id FROM keep WHERE table_name = '{parent}'))"
+                survivors[child] = f"{survivors[child]} AND {condition}" if child in survivors else condition
+        while True:
+            added = 0
+            for child, column, parent, _ in links:
+                added += conn.execute(f"""
+                    INSERT OR IGNORE INTO keep SELECT ?, c.{column} FROM {child} c
+                    WHERE c.{column} IS NOT NULL AND {survivors.get(child, "1")};
+                """, (parent,)).rowcount
+            if not added:
+                break
+
+        for table in REGION_COLUMNS:
+            conn.execute(
+                f"DELETE FROM {table} WHERE id NOT IN (SELECT id FROM keep WHERE table_name = ?);", (table,)
+            )
+        # The cut is not a local change: the client's push watermark starts at the master's seq
+        conn.execute("DELETE FROM change_log WHERE seq > ?;", (before,))
+        conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'change_log';", (before,))
+        conn.commit()
+        conn.execute("VACUUM;")
+    finally:
+        conn.close()
 
 def restore_backup(backup_path):
     """Restore database from backup"""
-    shutil.copy2(backup_path, DB_PATH)
+    # Copy (and validate) next to the live file first, then swap it in with one rename
+    replace_db_file(_copy_database(backup_path, DB_PATH + ".restore"))
 
 def export_data_zip(output_path):
     """Export database and backups as ZIP"""
     os.makedirs(EXPORT_DIR, exist_ok=True)
     
+    checkpoint()
     with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zf:
         # Add main database
         zf.write(DB_PATH, "puantaj.db")
@@ -1044,8 +2610,11 @@ def export_data_zip(output_path):
 def import_data_zip(zip_path):
     """Import database from ZIP"""
     with zipfile.ZipFile(zip_path, 'r') as zf:
-        # Extract main database
-        zf.extract("puantaj.db", DB_DIR)
+        # Extract main database next to the live one, then swap it in
+        temp_path = DB_PATH + ".import"
+        with zf.open("puantaj.db") as source, open(temp_path, "wb") as target:
+            shutil.copyfileobj(source, target)
+        replace_db_file(temp_path)
         
         # Extract backups if present
         for name in zf.namelist():
@@ -5,7 +5,7 @@ from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 from openpyxl.drawing.image import Image
 
-from calc import calc_day_hours
+from calc import calc_timesheet_rows
 
 logger = logging.getLogger("rainstaff")
 
@@ -89,7 +89,9 @@ def export_report(output_path, records, settings, date_range_text):
     totals = {}
     special_records = []
     overnight_records = []
-    for _, emp_id, name, work_date, start_time, end_time, break_minutes, is_special, notes, region in records:
+    hours = calc_timesheet_rows(records, settings)
+    for record, row_hours in zip(records, hours):
+        _, emp_id, name, work_date, start_time, end_time, break_minutes, is_special, notes, region = record
         (
             worked,
             scheduled,
@@ -99,14 +101,7 @@ def export_report(output_path, records, settings, date_range_text):
             special_normal,
             special_overtime,
             special_night,
-        ) = calc_day_hours(
-            work_date,
-            start_time,
-            end_time,
-            break_minutes,
-            settings,
-            is_special,
-        )
+        ) = row_hours
         ws.cell(row=row, column=1, value=name).border = BORDER
         ws.cell(row=row, column=2, value=region or "").border = BORDER
         ws.cell(row=row, column=3, value=work_date).border = BORDER
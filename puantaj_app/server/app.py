@@ -5,19 +5,89 @@ Flask application with auto-sync support
 
 import os
 import sys
+import json
+import base64
 import sqlite3
+import threading
 from datetime import datetime
 from contextlib import contextmanager
 from functools import wraps
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session
+from flask import Flask, Response, render_template, request, jsonify, redirect, url_for, session, stream_with_context, send_file
 
 # Add parent to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import puantaj_db as db
+import sync_codec
+import merge_queue
+import chunked_upload
+import response_cache
 
 app = Flask(__name__, template_folder='templates', static_folder='static')
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 
+# Request threads share a small pool of WAL connections
+db.configure_connections(mode="pool", pool_size=int(os.environ.get('DB_POOL_SIZE', '8')))
+
+# Clients that do not ask for 202 (Prefer: respond-async) wait this long for their merge
+SYNC_UPLOAD_WAIT_SECONDS = 25
+# Chunk size suggested to resumable upload clients
+SYNC_UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+# /api/timesheets: largest page (limit=) and the fields a client may project (fields=)
+TIMESHEET_PAGE_MAX = 1000
+TIMESHEET_FIELDS = ('id', 'employee_id', 'employee_name', 'work_date', 'start_time', 'end_time',
+                    'break_minutes', 'is_special', 'notes', 'region')
+# /api/deadlines?days= upper bound
+DEADLINE_DAYS_MAX = 365
+# Bytes of read API responses kept by api_cache
+API_CACHE_MAX_BYTES = int(os.environ.get('API_CACHE_MAX_BYTES', str(response_cache.MAX_BYTES)))
+
+# gzip/zstd: encoded JSON bodies are decoded before Flask parses them
+app.wsgi_app = sync_codec.DecodedJSONRequests(app.wsgi_app)
+
+
+@app.after_request
+def compress_json(response):
+    """Compress JSON responses for clients that accept gzip/zstd"""
+    return sync_codec.compress_response(response, request.headers.get('Accept-Encoding'))
+
+
+def _api_generation():
+    """Data generation plus today's date: expiry alerts count days from today"""
+    return db.data_generation(), datetime.now().date().isoformat()
+
+
+# Read API responses per (route, region, query args); merges and sync writes bump it
+api_cache = response_cache.ResponseCache(_api_generation, API_CACHE_MAX_BYTES)
+
+
+def cached_api(view):
+    """Serve a read-only JSON view from api_cache, revalidated with ETag / If-None-Match"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if 'user_id' not in session:
+            return view(*args, **kwargs)
+        try:
+            user = db.get_user(session['user_id'])
+            generation = api_cache.generation()
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+        if not user:
+            return view(*args, **kwargs)
+        key = (request.path, user['region'], tuple(sorted(request.args.items(multi=True))))
+        cached = api_cache.get(key, generation)
+        if cached is None:
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.mimetype != 'application/json':
+                return response
+            cached = api_cache.put(key, generation, response.get_data())
+        body, etag = cached
+        response = app.response_class(body, mimetype='application/json')
+        # Weak: the same body may go out gzip/zstd encoded
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
+    return wrapper
+
 
 # Decorator to mark endpoints as public (exempt from auth)
 def public_endpoint(f):
@@ -114,11 +184,14 @@ def sync_reset():
             return jsonify({'error': 'Invalid reset key'}), 403
         
         db_path = db.DB_PATH
-        if os.path.exists(db_path):
-            os.remove(db_path)
-        
-        # Reinitialize empty database
-        db.init_db()
+        with merge_jobs().write_lock, db.connections.exclusive():
+            for path in (db_path, db_path + "-wal", db_path + "-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
+            
+            # Reinitialize empty database
+            db.init_db()
+            api_cache.bump()
         
         return jsonify({
             'success': True,
@@ -134,238 +207,228 @@ def sync_reset():
 @public_endpoint
 def sync_upload():
     """
-    Upload database file from desktop app with merge support.
+    Upload database file from desktop app; the merge runs on the background merge worker.
     Respects deleted_records table to prevent deleted data from reappearing.
+    X-Sync-Scope names the region of a subset upload: only its stock rows are replaced.
+    Prefer: respond-async -> 202 with a job id to poll at /sync/jobs/<id>; otherwise the
+    request waits for the merge (200) or answers 202 when it takes too long.
     """
     try:
-        # Accept both 'db' and 'file' keys for backwards compatibility
-        if 'db' in request.files:
-            file = request.files['db']
-        elif 'file' in request.files:
-            file = request.files['file']
-        else:
-            return jsonify({'error': 'No file provided'}), 400
-        
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
+        queue = merge_jobs()
+        job_id = queue.new_job_id()
+        temp_path = queue.upload_path(job_id)
         
-        db_path = db.DB_PATH
-        print(f"DEBUG: Sync Upload Target Path: {db_path}") # Log to server console
-        
-        os.makedirs(os.path.dirname(db_path), exist_ok=True)
-        
-        # Save incoming DB to temp location
-        temp_path = db_path + ".incoming"
-        file.save(temp_path)
+        if request.mimetype == 'application/octet-stream':
+            # Raw body, optionally gzip/zstd encoded: decoded straight to disk
+            try:
+                sync_codec.decode_stream(request.stream, temp_path, request.headers.get('Content-Encoding'))
+            except sync_codec.UnsupportedEncoding:
+                return jsonify({'error': 'Unsupported Content-Encoding'}), 415, {
+                    'Accept-Encoding': sync_codec.accept_encoding_header()
+                }
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        else:
+            # Accept both 'db' and 'file' keys for backwards compatibility
+            if 'db' in request.files:
+                file = request.files['db']
+            elif 'file' in request.files:
+                file = request.files['file']
+            else:
+                return jsonify({'error': 'No file provided'}), 400
+            
+            if file.filename == '':
+                return jsonify({'error': 'No file selected'}), 400
+            
+            # Save incoming DB to the job queue directory
+            file.save(temp_path)
         print(f"DEBUG: Saved incoming file to {temp_path}, size: {os.path.getsize(temp_path)}")
-        
-        # If master DB doesn't exist, just use incoming as master
-        if not os.path.exists(db_path):
-            os.rename(temp_path, db_path)
-            return jsonify({
-                'success': True,
-                'action': 'sync_upload_new',
-                'timestamp': datetime.now().isoformat()
-            }), 200
-
-        # Ensure master DB schema is up to date (creates deleted_records if missing)
-        db.init_db()
-        
-        # Merge incoming DB into master
-        try:
-            debug_logs = _merge_databases(temp_path, db_path)
-        finally:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-        
-        return jsonify({
-            'success': True,
-            'action': 'sync_upload_merged',
-            'debug_logs': debug_logs,
-            'timestamp': datetime.now().isoformat()
-        }), 200
+        return _enqueue_merge(queue, job_id)
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
-def _merge_databases(incoming_path, master_path):
+def _sync_client(region):
+    """X-Sync-Client: id of the uploading installation (clients that do not send one count as their region)"""
+    return request.headers.get('X-Sync-Client', '') or region
+
+
+def _enqueue_merge(queue, job_id):
+    """Queue a saved upload with the request's region/scope/client; answer like /sync"""
+    region = request.headers.get('X-Region', '') or 'ALL'
+    scope = request.headers.get('X-Sync-Scope', '') or 'ALL'
+    job = queue.enqueue(job_id, region, scope, _sync_client(region))
+    if 'respond-async' not in request.headers.get('Prefer', ''):
+        job = queue.wait(job_id, SYNC_UPLOAD_WAIT_SECONDS)
+    return _merge_job_response(job)
+
+
+@app.route('/sync/uploads', methods=['POST'])
+@public_endpoint
+def sync_upload_create():
     """
-    Merge incoming database into master, respecting deletions.
-    Returns a list of debug log strings.
+    Start a resumable upload: JSON {"size", "sha256", "encoding"} of the (encoded) file.
+    Chunks go to PUT /sync/uploads/<id> with Upload-Offset and X-Chunk-SHA256 headers;
+    GET returns the acknowledged offset to resume from; POST .../finalize merges it like /sync.
     """
-    logs = []
-    incoming_conn = sqlite3.connect(incoming_path)
-    master_conn = sqlite3.connect(master_path)
-    
+    payload = request.get_json(silent=True) or {}
+    encoding = payload.get('encoding') or None
+    if encoding is not None and encoding not in sync_codec.supported_encodings():
+        return jsonify({'error': 'Unsupported encoding'}), 415, {
+            'Accept-Encoding': sync_codec.accept_encoding_header()
+        }
     try:
-        # Ensure deleted_records table exists in both DBs
-        for conn in [incoming_conn, master_conn]:
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS deleted_records (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    table_name TEXT NOT NULL,
-                    record_id INTEGER NOT NULL,
-                    deleted_at TEXT NOT NULL,
-                    deleted_by TEXT
-                );
-            """)
-        master_conn.commit()
-        
-        # 1. Get deleted records from incoming
-        deleted = set()
-        try:
-            cursor = incoming_conn.execute("SELECT table_name, record_id FROM deleted_records")
-            rows = cursor.fetchall()
-            logs.append(f"Incoming deleted_records count: {len(rows)}")
-            for row in rows:
-                deleted.add((row[0], row[1]))
-                logs.append(f"Incoming deleted: {row[0]} #{row[1]}")
-        except sqlite3.OperationalError:
-            logs.append("No deleted_records table in incoming")
-        
-        # 2. Apply deletions to master and track them
-        for table_name, record_id in deleted:
-            # Delete from master
-            master_conn.execute(f"DELETE FROM {table_name} WHERE id = ?", (record_id,))
-            # Record deletion in master's deleted_records
-            master_conn.execute(
-                "INSERT OR IGNORE INTO deleted_records (table_name, record_id, deleted_at) VALUES (?, ?, ?)",
-                (table_name, record_id, datetime.now().isoformat())
-            )
-            logs.append(f"Applied deletion to master: {table_name} #{record_id}")
-        
-        # 3. Get existing deleted records from master (to skip during merge)
-        master_deleted = set()
-        try:
-            cursor = master_conn.execute("SELECT table_name, record_id FROM deleted_records")
-            rows = cursor.fetchall()
-            logs.append(f"Master deleted_records count: {len(rows)}")
-            for row in rows:
-                master_deleted.add((row[0], row[1]))
-        except sqlite3.OperationalError:
-            pass
-        
-        # Combine both deletion sets
-        all_deleted = deleted | master_deleted
-        
-        # 4. Merge timesheets from incoming (skip deleted)
-        try:
-            cursor = incoming_conn.execute(
-                "SELECT id, employee_id, work_date, start_time, end_time, break_minutes, is_special, notes, region FROM timesheets"
-            )
-            count = 0
-            skipped = 0
-            for row in cursor.fetchall():
-                record_id = row[0]
-                if ("timesheets", record_id) in all_deleted:
-                    skipped += 1
-                    continue  # Skip deleted record
-                # Upsert: Insert or replace
-                master_conn.execute(
-                    "INSERT OR REPLACE INTO timesheets (id, employee_id, work_date, start_time, end_time, break_minutes, is_special, notes, region) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                    row
-                )
-                count += 1
-            logs.append(f"Merged timesheets: {count} inserted/updated, {skipped} skipped (deleted)")
-        except sqlite3.OperationalError as e:
-            logs.append(f"Error merging timesheets: {e}")
-        
-        # 5. Merge employees from incoming (skip deleted)
-        try:
-            cursor = incoming_conn.execute(
-                "SELECT id, full_name, identity_no, department, title, region FROM employees"
-            )
-            count = 0
-            skipped = 0
-            for row in cursor.fetchall():
-                record_id = row[0]
-                if ("employees", record_id) in all_deleted:
-                    skipped += 1
-                    continue  # Skip deleted record
-                master_conn.execute(
-                    "INSERT OR REPLACE INTO employees (id, full_name, identity_no, department, title, region) VALUES (?, ?, ?, ?, ?, ?)",
-                    row
-                )
-                count += 1
-            logs.append(f"Merged employees: {count} inserted/updated, {skipped} skipped (deleted)")
-        except sqlite3.OperationalError as e:
-            logs.append(f"Error merging employees: {e}")
-        
-        # 6. OVERWRITE stock_inventory from incoming (Full Replace)
-        # User accepted to fully replace stock data on sync to handle deletions
-        try:
-            # First, wipe existing stock data
-            master_conn.execute("DELETE FROM stock_inventory")
-            logs.append("Cleared all existing stock_inventory records (Full Replace Mode)")
-
-            cursor = incoming_conn.execute(
-                "SELECT id, stok_kod, stok_adi, seri_no, durum, tarih, girdi_yapan, bolge, adet FROM stock_inventory"
-            )
-            count = 0
-            skipped = 0
-            for row in cursor.fetchall():
-                record_id = row[0]
-                if ("stock_inventory", record_id) in all_deleted:
-                    skipped += 1
-                    continue
-                master_conn.execute(
-                    "INSERT OR REPLACE INTO stock_inventory (id, stok_kod, stok_adi, seri_no, durum, tarih, girdi_yapan, bolge, adet) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                    row
-                )
-                count += 1
-            logs.append(f"Merged stock_inventory: {count} inserted/updated, {skipped} skipped (deleted)")
-        except sqlite3.OperationalError as e:
-            logs.append(f"Error merging stock_inventory: {e}")
-        
-        # 7. Merge vehicles from incoming (skip deleted)
-        try:
-            cursor = incoming_conn.execute(
-                "SELECT id, plate, brand, model, year, km, inspection_date, insurance_date, maintenance_date, oil_change_date, oil_change_km, oil_interval_km, notes, region FROM vehicles"
-            )
-            count = 0
-            skipped = 0
-            for row in cursor.fetchall():
-                record_id = row[0]
-                if ("vehicles", record_id) in all_deleted:
-                    skipped += 1
-                    continue
-                master_conn.execute(
-                    "INSERT OR REPLACE INTO vehicles (id, plate, brand, model, year, km, inspection_date, insurance_date, maintenance_date, oil_change_date, oil_change_km, oil_interval_km, notes, region) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                    row
-                )
-                count += 1
-            logs.append(f"Merged vehicles: {count} inserted/updated, {skipped} skipped (deleted)")
-        except sqlite3.OperationalError as e:
-            logs.append(f"Error merging vehicles: {e}")
-        
-        # 8. Merge drivers from incoming (skip deleted)
+        upload = uploads().create(payload.get('size'), payload.get('sha256'), encoding)
+    except chunked_upload.UploadError as e:
+        return _upload_error(e)
+    upload['chunk_size'] = SYNC_UPLOAD_CHUNK_SIZE
+    return jsonify(upload), 201, {'Location': url_for('sync_upload_chunk', upload_id=upload['upload_id'])}
+
+
+@app.route('/sync/uploads/<upload_id>', methods=['GET', 'PUT'])
+@public_endpoint
+def sync_upload_chunk(upload_id):
+    """GET: upload status (offset to resume from). PUT: append the body at Upload-Offset."""
+    try:
+        if request.method == 'GET':
+            return jsonify(uploads().status(upload_id)), 200
+        offset = request.headers.get('Upload-Offset', type=int)
+        if offset is None:
+            return jsonify({'error': 'Upload-Offset required'}), 400
+        data = request.get_data(cache=False)
+        new_offset = uploads().write(upload_id, offset, data, request.headers.get('X-Chunk-SHA256'))
+        return jsonify({'upload_id': upload_id, 'offset': new_offset}), 200
+    except chunked_upload.UploadError as e:
+        return _upload_error(e)
+
+
+@app.route('/sync/uploads/<upload_id>/finalize', methods=['POST'])
+@public_endpoint
+def sync_upload_finalize(upload_id):
+    """Verify the whole-file SHA-256, decode it and queue the merge (same answers as /sync)"""
+    try:
+        part_path, encoding = uploads().finish(upload_id)
+    except chunked_upload.UploadError as e:
+        return _upload_error(e)
+    try:
+        queue = merge_jobs()
+        job_id = queue.new_job_id()
         try:
-            cursor = incoming_conn.execute(
-                "SELECT id, full_name, license_class, license_expiry, phone, notes, region FROM drivers"
-            )
-            count = 0
-            skipped = 0
-            for row in cursor.fetchall():
-                record_id = row[0]
-                if ("drivers", record_id) in all_deleted:
-                    skipped += 1
-                    continue
-                master_conn.execute(
-                    "INSERT OR REPLACE INTO drivers (id, full_name, license_class, license_expiry, phone, notes, region) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                    row
-                )
-                count += 1
-            logs.append(f"Merged drivers: {count} inserted/updated, {skipped} skipped (deleted)")
-        except sqlite3.OperationalError as e:
-            logs.append(f"Error merging drivers: {e}")
-        
-        master_conn.commit()
-        return logs
-    
-    finally:
-        incoming_conn.close()
-        master_conn.close()
+            sync_codec.decode_file(part_path, queue.upload_path(job_id), encoding)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 422
+        finally:
+            os.remove(part_path)
+        return _enqueue_merge(queue, job_id)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def _upload_error(error):
+    body = {'error': str(error)}
+    if error.offset is not None:
+        body['offset'] = error.offset
+    return jsonify(body), error.status
+
+
+_uploads = None
+_uploads_lock = threading.Lock()
+
+
+def uploads():
+    """Resumable upload sessions next to the master DB"""
+    global _uploads
+    with _uploads_lock:
+        if _uploads is None:
+            _uploads = chunked_upload.ChunkedUploads(os.path.join(db.DB_DIR, 'sync_uploads'))
+        return _uploads
+
+
+@app.route('/sync/jobs/<job_id>', methods=['GET'])
+@public_endpoint
+def sync_job(job_id):
+    """Merge job status: queued (with position) / running -> 202, done -> 200, failed -> 500"""
+    job = merge_jobs().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return _merge_job_response(job)
+
+
+def _merge_job_response(job):
+    body = {
+        'success': job['status'] != merge_queue.FAILED,
+        'action': 'sync_upload_' + job['status'],
+        **job,
+        'status_url': url_for('sync_job', job_id=job['job_id']),
+        'timestamp': datetime.now().isoformat()
+    }
+    if job['status'] == merge_queue.DONE:
+        # Same fields as the synchronous upload used to return
+        body.update(job['result'] or {})
+        return jsonify(body), 200
+    if job['status'] == merge_queue.FAILED:
+        return jsonify(body), 500
+    return jsonify(body), 202, {'Location': body['status_url'], 'Retry-After': '1'}
+
+
+_merge_queue = None
+_merge_queue_lock = threading.Lock()
+
+
+def merge_jobs():
+    """The merge job queue next to the master DB; its worker starts on first use."""
+    global _merge_queue
+    with _merge_queue_lock:
+        if _merge_queue is None:
+            _merge_queue = merge_queue.MergeQueue(os.path.join(db.DB_DIR, 'sync_jobs'), _merge_upload)
+            _merge_queue.start()
+        return _merge_queue
+
+
+def _merge_upload(upload_path, region, scope, client):
+    """Merge worker body: the only place uploads are written into the master DB."""
+    db_path = db.DB_PATH
+    # If master DB doesn't exist, just use incoming as master
+    if not os.path.exists(db_path):
+        db.replace_db_file(upload_path)
+        db.init_db()
+        _register_sync_client(client)
+        api_cache.bump()
+        return {'action': 'sync_upload_new', **_recompute_hours()}
+
+    # Ensure master DB schema is up to date (creates deleted_records if missing)
+    db.init_db()
+    # Merge incoming DB into master (stock_inventory is fully replaced to carry deletions)
+    merged = db.merge_databases(upload_path, db_path, replace_tables=("stock_inventory",),
+                                region=None if scope == 'ALL' else scope, origin=client)
+    _register_sync_client(client)
+    api_cache.bump()
+    app.logger.info("Merged upload from %s: %s", region, merged.get('tables'))
+    return {'action': 'sync_upload_merged', 'merged': merged, **_recompute_hours()}
+
+
+def _register_sync_client(client):
+    """
+    A full upload is followed by a download of the merged master: the client's delta
+    position starts no earlier than now, so change_log compaction keeps everything after it.
+    """
+    db.set_sync_watermark(client, pull_seq=db.latest_change_seq())
+
+
+def _recompute_hours():
+    """
+    Re-materialize timesheet hours a merge or delta push left stale. Runs on the writer
+    (merge job or write_lock holder), so it never overlaps another write to the master.
+    The rows are already committed: a failure is reported back, not raised.
+    """
+    try:
+        result = {'hours_recomputed': db.recompute_stale_timesheets()}
+    except Exception as e:
+        app.logger.exception("Hours recompute failed")
+        result = {'hours_recompute_error': str(e)}
+    api_cache.bump()
+    return result
 
 
 @app.route('/sync/download', methods=['GET'])
@@ -373,25 +436,92 @@ def _merge_databases(incoming_path, master_path):
 def sync_download():
     """
     Download current database from server
-    Returns: SQLite DB file (binary)
+    Returns: SQLite DB file (binary), streamed from a snapshot
+    ETag is the content hash: If-None-Match -> 304, Range/If-Range resume a partial download
+    Accept-Encoding gzip/zstd serves a precompressed copy (Range applies to the encoded bytes)
+    X-Region other than ALL gets only that region's rows (and the rows they reference)
     """
     try:
         db_path = db.DB_PATH
         if not os.path.exists(db_path):
             return jsonify({'error': 'Database not found'}), 404
         
-        with open(db_path, 'rb') as f:
-            db_content = f.read()
-        
-        return db_content, 200, {
-            'Content-Type': 'application/octet-stream',
-            'Content-Disposition': 'attachment; filename=puantaj.db'
-        }
+        region = request.headers.get('X-Region', '') or 'ALL'
+        snapshot_path, etag = db.download_snapshot(db_path, region)
+        encoding = sync_codec.choose_encoding(request.headers.get('Accept-Encoding'))
+        if encoding:
+            snapshot_path = sync_codec.encoded_copy(snapshot_path, encoding)
+            etag = f"{etag}-{encoding}"
+        response = send_file(
+            snapshot_path,
+            mimetype='application/octet-stream',
+            as_attachment=True,
+            download_name='puantaj.db',
+            etag=etag,
+            conditional=True,
+            max_age=0
+        )
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.update(('Accept-Encoding', 'X-Region'))
+        return response
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/sync/delta', methods=['GET', 'POST'])
+@public_endpoint
+def sync_delta():
+    """
+    Row-level sync. POST applies the client's changed rows and tombstones;
+    both methods return master rows changed since the client's watermark
+    (?since= or body "since"), minus rows the client itself sent (delta or merged upload).
+    X-Sync-Client identifies the client; watermarks are kept per client.
+    X-Sync-Scope (the region of the client's download subset) limits them to that region.
+    409 means the watermark is unknown here: fall back to /sync + /sync/download.
+    """
+    try:
+        region = request.headers.get('X-Region', '') or 'ALL'
+        scope = request.headers.get('X-Sync-Scope', '') or 'ALL'
+        client = _sync_client(region)
+        payload = (request.get_json(silent=True) or {}) if request.method == 'POST' else {}
+        since = request.args.get('since', type=int)
+        if since is None:
+            since = payload.get('since')
+        if not isinstance(since, int):
+            return jsonify({'error': 'since required'}), 400
+        if not os.path.exists(db.DB_PATH):
+            return jsonify({'error': 'full_sync_required'}), 409
+        if not db.sync_delta_available(since):
+            return jsonify({'error': 'full_sync_required', 'seq': since}), 409
+
+        applied, recomputed = {}, {}
+        # Pushes, watermarks and compaction write the master: same single writer as the merge worker
+        with merge_jobs().write_lock:
+            if payload.get('upserts') or payload.get('deletes'):
+                applied = db.apply_sync_delta(payload, origin=client)
+                recomputed = _recompute_hours()
+            delta = db.collect_sync_delta(since, skip_origin=client, region=None if scope == 'ALL' else scope)
+            db.set_sync_watermark(client, push_seq=payload.get('seq'), pull_seq=delta['seq'])
+            # Entries every delta client has pulled are no longer needed
+            db.compact_change_log(db.min_sync_pull_seq())
+
+        return jsonify({
+            'success': True,
+            'action': 'sync_delta',
+            'applied': applied,
+            **recomputed,
+            'seq': delta['seq'],
+            'upserts': delta['upserts'],
+            'deletes': delta['deletes'],
+            'timestamp': datetime.now().isoformat()
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 # ============================================================================
 # AUTHENTICATION CHECK (Protect Dashboard/Admin Routes)
 # ============================================================================
@@ -410,7 +540,7 @@ def check_auth():
             return
 
     # Hardcoded whitelist fallback (legacy support)
-    public_endpoints = {'static', 'auto_sync', 'health', 'sync_upload', 'sync_download', 'login', 'index', 'debug_auth', 'sync_reset'}
+    public_endpoints = {'static', 'auto_sync', 'health', 'sync_upload', 'sync_job', 'sync_upload_create', 'sync_upload_chunk', 'sync_upload_finalize', 'sync_download', 'sync_delta', 'login', 'index', 'debug_auth', 'sync_reset'}
     
     if request.endpoint in public_endpoints:
         return  # Public endpoint - no auth required
@@ -461,18 +591,28 @@ def dashboard():
         return redirect(url_for('login'))
     
     try:
+        # Sayfa iskelet olarak gelir; sayilar /api/dashboard/summary'den okunur
         user = db.get_user(session['user_id'])
-        employees = db.get_all_employees()
-        timesheets = db.get_all_timesheets()
-        
-        return render_template('modern_dashboard.html', 
-                             user=user,
-                             employees=employees,
-                             timesheets=timesheets)
+        return render_template('modern_dashboard.html', user=user)
     except Exception as e:
         return render_template('error.html', error=str(e)), 500
 
 
+@app.route('/api/dashboard/summary')
+@cached_api
+def api_dashboard_summary():
+    """Current month KPIs and daily/weekly/monthly hour series (cached per data generation)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    try:
+        user = db.get_user(session['user_id'])
+        region = None if user['region'] == 'ALL' else user['region']
+        return jsonify(db.dashboard_summary(region=region)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 
 
 
@@ -553,6 +693,7 @@ def vehicle_faults():
 
 
 @app.route('/api/employee-timesheets/<int:emp_id>')
+@cached_api
 def api_employee_timesheets(emp_id):
     """Get timesheet details for a specific employee with calculations"""
     if 'user_id' not in session:
@@ -584,42 +725,38 @@ def api_employee_timesheets(emp_id):
                 })
             return jsonify(result), 200
         
-        # Get settings
-        settings = db.get_all_settings()
+        # Compiled hour rules: reads the three hour keys, rebuilt only when they change
+        rules = db.get_hour_rules()
         
         # Get filter parameters
         month = request.args.get('month')
         year = request.args.get('year')
         
-        # Get timesheets
-        timesheets = db.list_timesheets(employee_id=emp_id)
+        # Get timesheets and apply date filters
+        timesheets = [
+            ts for ts in db.list_timesheets(employee_id=emp_id)
+            if (not month or ts[3][5:7] == month) and (not year or ts[3][0:4] == year)
+        ]
+        if rules is None:
+            # Invalid hour settings: no row can be computed
+            hours = [None] * len(timesheets)
+        else:
+            hours = calc.calc_timesheet_rows(timesheets, rules, skip_invalid=True)
         result = []
         
-        for ts in timesheets:
-            try:
-                work_date, start_time, end_time, break_minutes, is_special = ts[3], ts[4], ts[5], ts[6], ts[7]
-                
-                # Apply date filters
-                if month and work_date[5:7] != month:
-                    continue
-                if year and work_date[0:4] != year:
-                    continue
-                
-                # Calculate hours
-                worked, regular, overtime, night, overnight, special_day, special_night, special_overnight = calc.calc_day_hours(
-                    work_date, start_time, end_time, break_minutes, settings, is_special
-                )
-                
+        for ts, row_hours in zip(timesheets, hours):
+            if row_hours is not None:
+                worked, regular, overtime, night, overnight, special_day, special_night, special_overnight = row_hours
                 result.append({
-                    'work_date': work_date,
-                    'start_time': start_time,
-                    'end_time': end_time,
-                    'break_minutes': break_minutes,
+                    'work_date': ts[3],
+                    'start_time': ts[4],
+                    'end_time': ts[5],
+                    'break_minutes': ts[6],
                     'worked_hours': round(worked, 2),
                     'overtime': round(overtime, 2),
                     'night_hours': round(night + overnight, 2)
                 })
-            except Exception:
+            else:
                 result.append({
                     'work_date': ts[3],
                     'start_time': ts[4],
@@ -640,89 +777,155 @@ def api_employee_timesheets(emp_id):
 
 @app.route('/api/timesheets')
 def api_timesheets():
-    """Get all timesheets data"""
+    """
+    Timesheets, newest first, streamed as a JSON array (NDJSON with format=ndjson or
+    Accept: application/x-ndjson).
+    Filters: region (admins; other users always get their own), employee_id, start_date,
+    end_date, month, year. fields=a,b,... keeps only those keys.
+    limit=N returns one page; X-Next-Cursor and Link rel="next" carry the cursor= of the next
+    page. Without limit every matching row is streamed.
+    """
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     
     try:
-        # Tüm puantaj kayıtlarını al (joinli)
-        timesheets = db.list_timesheets()
+        user = db.get_user(session['user_id'])
+        region = request.args.get('region') or None
+        if user['region'] != 'ALL':
+            region = user['region']
+        fields = [name.strip() for name in request.args.get('fields', '').split(',') if name.strip()]
+        unknown = [name for name in fields if name not in TIMESHEET_FIELDS]
+        if unknown:
+            return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+        fields = fields or list(TIMESHEET_FIELDS)
+        limit = request.args.get('limit', type=int)
+        if limit is not None and not 0 < limit <= TIMESHEET_PAGE_MAX:
+            return jsonify({'error': f'limit must be 1-{TIMESHEET_PAGE_MAX}'}), 400
+        try:
+            after_work_date, after_id = _decode_cursor(request.args.get('cursor'))
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        start_date, end_date, month = _period_args()
+        filters = {
+            'employee_id': request.args.get('employee_id', type=int),
+            'start_date': request.args.get('start_date') or start_date,
+            'end_date': request.args.get('end_date') or end_date,
+            'region': region,
+            'month': month,
+        }
         
-        # Tuple listesini JSON'a çevir
-        result = []
-        for ts in timesheets:
-             # ts: (id, employee_id, full_name, work_date, start_time, end_time, break_minutes, is_special, notes, region)
-            result.append({
-                'id': ts[0],
-                'employee_id': ts[1],
-                'employee_name': ts[2],
-                'work_date': ts[3],
-                'start_time': ts[4],
-                'end_time': ts[5],
-                'break_minutes': ts[6],
-                'is_special': ts[7],
-                'notes': ts[8],
-                'region': ts[9]
-            })
-            
-        return jsonify(result), 200
+        next_cursor = None
+        if limit is None:
+            # Tüm eşleşen kayıtlar sayfa sayfa okunur; JSON parça parça gönderilir
+            timesheets = db.iter_timesheets(after_work_date=after_work_date, after_id=after_id, **filters)
+        else:
+            # Bir fazla satır: sonraki sayfa var mı
+            page = db.list_timesheets_page(after_work_date, after_id, limit + 1, **filters)
+            if len(page) > limit:
+                next_cursor = _encode_cursor(page[limit - 1])
+            timesheets = iter(page[:limit])
+        first = next(timesheets, None)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+    ndjson = request.args.get('format') == 'ndjson' or 'application/x-ndjson' in request.headers.get('Accept', '')
+
+    def row_json(ts):
+        row = _timesheet_json(ts)
+        return json.dumps({name: row[name] for name in fields})
+
+    def generate():
+        if ndjson:
+            if first is not None:
+                yield row_json(first) + '\n'
+                for ts in timesheets:
+                    yield row_json(ts) + '\n'
+            return
+        yield '['
+        if first is not None:
+            yield row_json(first)
+            for ts in timesheets:
+                yield ',' + row_json(ts)
+        yield ']'
+
+    response = Response(stream_with_context(generate()),
+                        mimetype='application/x-ndjson' if ndjson else 'application/json')
+    response.vary.add('Accept')
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+        next_args = {**request.args.to_dict(), 'cursor': next_cursor}
+        response.headers['Link'] = f'<{url_for("api_timesheets", **next_args)}>; rel="next"'
+    return response
+
+
+def _encode_cursor(ts):
+    """Opaque keyset cursor for the row after ts (work_date DESC, id DESC)"""
+    return base64.urlsafe_b64encode(f"{ts[3]}|{ts[0]}".encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor):
+    """(after_work_date, after_id) of a cursor, (None, None) without one; ValueError if malformed"""
+    if not cursor:
+        return None, None
+    work_date, _, ts_id = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode().partition('|')
+    return work_date, int(ts_id)
+
+
+def _period_args():
+    """
+    (start_date, end_date, month) of the month/year query args: with a year they become a
+    work_date range (indexed); a month alone matches that month of any year.
+    """
+    month = request.args.get('month')
+    year = request.args.get('year')
+    if month:
+        month = month.zfill(2)
+    if year:
+        return f"{year}-{month or '01'}-01", f"{year}-{month or '12'}-31", None
+    return None, None, month
+
+
+def _timesheet_json(ts):
+    # ts: (id, employee_id, full_name, work_date, start_time, end_time, break_minutes, is_special, notes, region)
+    return {
+        'id': ts[0],
+        'employee_id': ts[1],
+        'employee_name': ts[2],
+        'work_date': ts[3],
+        'start_time': ts[4],
+        'end_time': ts[5],
+        'break_minutes': ts[6],
+        'is_special': ts[7],
+        'notes': ts[8],
+        'region': ts[9]
+    }
+
 
 @app.route('/api/employee-overtime')
+@cached_api
 def api_employee_overtime():
     """Get all employees with calculated overtime"""
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     
     try:
-        # Import calc module explicitly
-        import sys
-        import os
-        parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        if parent_dir not in sys.path:
-            sys.path.insert(0, parent_dir)
-        import calc
-        
-        settings = db.get_all_settings()
-        employees = db.get_all_employees()
-        result = []
+        user = db.get_user(session['user_id'])
+        region = None if user['region'] == 'ALL' else user['region']
         
-        # Filtre parametrelerini al (opsiyonel)
-        month = request.args.get('month')
-        year = request.args.get('year')
+        # Filtre parametrelerini al (opsiyonel); ay/yil work_date araligina cevrilir (indeksli)
+        start_date, end_date, month = _period_args()
         
-        for emp in employees:
-            emp_id = emp[0]
-            # Fazla mesai hesapla
-            timesheets = db.list_timesheets(employee_id=emp_id)
-            total_overtime = 0
-            
-            for ts in timesheets:
-                try:
-                    # Tarih filtresi uygula
-                    wd = ts[3] # YYYY-MM-DD
-                    if month and wd[5:7] != month: continue
-                    if year and wd[0:4] != year: continue
-                    
-                    # Basit hesap
-                    worked, regular, overtime, night, overnight, special_day, special_night, special_overnight = calc.calc_day_hours(
-                        ts[3], ts[4], ts[5], ts[6], settings, ts[7]
-                    )
-                    total_overtime += overtime
-                except Exception:
-                    pass
-            
-            result.append({
-                'id': emp[0],
-                'name': emp[1],
-                'identity': emp[2],
-                'department': emp[3],
-                'title': emp[4],
-                'region': emp[5],
-                'overtime': round(total_overtime, 2)
-            })
+        # Tek gruplu sorgu: calisan basina fazla mesai toplami
+        rows = db.list_employee_overtime(start_date=start_date, end_date=end_date, month=month, region=region)
+        result = [{
+            'id': emp[0],
+            'name': emp[1],
+            'identity': emp[2],
+            'department': emp[3],
+            'title': emp[4],
+            'region': emp[5],
+            'overtime': round(emp[6], 2)
+        } for emp in rows]
             
         return jsonify(result), 200
     except Exception as e:
@@ -734,6 +937,7 @@ def api_employee_overtime():
 # ============================================================================
 
 @app.route('/api/vehicles')
+@cached_api
 def api_vehicles():
     """Get all vehicles with alert status"""
     if 'user_id' not in session:
@@ -744,60 +948,15 @@ def api_vehicles():
         region = None if user['region'] == 'ALL' else user['region']
         
         vehicles = db.list_vehicles(region=region)
+        alerts_by_vehicle = {}
+        for entity, entity_id, _, kind, _, days, severity, _ in db.list_deadlines(region=region):
+            if entity == 'vehicle':
+                alerts_by_vehicle.setdefault(entity_id, []).append({'type': kind, 'status': severity, 'days': days})
         result = []
         
-        from datetime import datetime, timedelta
-        today = datetime.now().date()
-        
         for v in vehicles:
             # v: (id, plate, brand, model, year, km, inspection_date, insurance_date,
             #     maintenance_date, oil_change_date, oil_change_km, oil_interval_km, notes, region)
-            
-            # Calculate alerts
-            alerts = []
-            
-            # Inspection alert
-            if v[6]:  # inspection_date
-                try:
-                    inspection_date = datetime.strptime(v[6], '%Y-%m-%d').date()
-                    days_until = (inspection_date - today).days
-                    if days_until < 0:
-                        alerts.append({'type': 'inspection', 'status': 'expired', 'days': days_until})
-                    elif days_until <= 7:
-                        alerts.append({'type': 'inspection', 'status': 'critical', 'days': days_until})
-                    elif days_until <= 30:
-                        alerts.append({'type': 'inspection', 'status': 'warning', 'days': days_until})
-                except:
-                    pass
-            
-            # Insurance alert
-            if v[7]:  # insurance_date
-                try:
-                    insurance_date = datetime.strptime(v[7], '%Y-%m-%d').date()
-                    days_until = (insurance_date - today).days
-                    if days_until < 0:
-                        alerts.append({'type': 'insurance', 'status': 'expired', 'days': days_until})
-                    elif days_until <= 7:
-                        alerts.append({'type': 'insurance', 'status': 'critical', 'days': days_until})
-                    elif days_until <= 30:
-                        alerts.append({'type': 'insurance', 'status': 'warning', 'days': days_until})
-                except:
-                    pass
-            
-            # Maintenance alert
-            if v[8]:  # maintenance_date
-                try:
-                    maintenance_date = datetime.strptime(v[8], '%Y-%m-%d').date()
-                    days_until = (maintenance_date - today).days
-                    if days_until < 0:
-                        alerts.append({'type': 'maintenance', 'status': 'expired', 'days': days_until})
-                    elif days_until <= 7:
-                        alerts.append({'type': 'maintenance', 'status': 'critical', 'days': days_until})
-                    elif days_until <= 30:
-                        alerts.append({'type': 'maintenance', 'status': 'warning', 'days': days_until})
-                except:
-                    pass
-            
             result.append({
                 'id': v[0],
                 'plate': v[1],
@@ -813,7 +972,7 @@ def api_vehicles():
                 'oil_interval_km': v[11],
                 'notes': v[12],
                 'region': v[13],
-                'alerts': alerts
+                'alerts': alerts_by_vehicle.get(v[0], [])
             })
         
         return jsonify(result), 200
@@ -822,6 +981,7 @@ def api_vehicles():
 
 
 @app.route('/api/drivers')
+@cached_api
 def api_drivers():
     """Get all drivers"""
     if 'user_id' not in session:
@@ -832,29 +992,15 @@ def api_drivers():
         region = None if user['region'] == 'ALL' else user['region']
         
         drivers = db.list_drivers(region=region)
+        alert_by_driver = {
+            entity_id: {'status': severity, 'days': days}
+            for entity, entity_id, _, _, _, days, severity, _ in db.list_deadlines(region=region)
+            if entity == 'driver'
+        }
         result = []
         
-        from datetime import datetime
-        today = datetime.now().date()
-        
         for d in drivers:
             # d: (id, full_name, license_class, license_expiry, phone, notes, region)
-            
-            # Calculate license expiry alert
-            alert = None
-            if d[3]:  # license_expiry
-                try:
-                    expiry_date = datetime.strptime(d[3], '%Y-%m-%d').date()
-                    days_until = (expiry_date - today).days
-                    if days_until < 0:
-                        alert = {'status': 'expired', 'days': days_until}
-                    elif days_until <= 7:
-                        alert = {'status': 'critical', 'days': days_until}
-                    elif days_until <= 30:
-                        alert = {'status': 'warning', 'days': days_until}
-                except:
-                    pass
-            
             result.append({
                 'id': d[0],
                 'full_name': d[1],
@@ -863,7 +1009,37 @@ def api_drivers():
                 'phone': d[4],
                 'notes': d[5],
                 'region': d[6],
-                'alert': alert
+                'alert': alert_by_driver.get(d[0])
+            })
+        
+        return jsonify(result), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/deadlines')
+@cached_api
+def api_deadlines():
+    """Vehicle and driver deadlines due within ?days= (default 30) or already overdue"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    try:
+        user = db.get_user(session['user_id'])
+        region = None if user['region'] == 'ALL' else user['region']
+        days = min(max(request.args.get('days', db.DEADLINE_WARNING_DAYS, type=int), 0), DEADLINE_DAYS_MAX)
+        
+        result = []
+        for entity, entity_id, name, kind, due_date, days_left, severity, row_region in db.list_deadlines(days, region):
+            result.append({
+                'entity': entity,
+                'id': entity_id,
+                'name': name,
+                'kind': kind,
+                'due_date': due_date,
+                'days': days_left,
+                'severity': severity,
+                'region': row_region
             })
         
         return jsonify(result), 200
@@ -872,6 +1048,7 @@ def api_drivers():
 
 
 @app.route('/api/vehicle-faults')
+@cached_api
 def api_vehicle_faults():
     """Get vehicle faults"""
     if 'user_id' not in session:
@@ -912,6 +1089,7 @@ def api_vehicle_faults():
 
 
 @app.route('/api/stock-data')
+@cached_api
 def api_stock_data():
     """Get stock inventory data grouped by stok_kod"""
     if 'user_id' not in session:
@@ -0,0 +1,142 @@
+"""
+Resumable chunked uploads for /sync/uploads.
+A session is created with the final size and SHA-256, chunks are appended at their offset
+(each with its own checksum) to a .part file on disk, and finish() verifies the whole file
+before handing it on. A dropped connection loses at most the chunk in flight.
+"""
+
+import os
+import re
+import json
+import uuid
+import hashlib
+import threading
+from datetime import datetime, timedelta
+
+# Largest chunk a client may send in one PUT
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+# Largest upload accepted (encoded bytes)
+MAX_UPLOAD_SIZE = 2 * 1024 * 1024 * 1024
+# Unfinished sessions are dropped after this long without a chunk
+SESSION_EXPIRY = timedelta(hours=24)
+
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+_SHA256 = re.compile(r"^[0-9a-f]{64}$")
+
+
+class UploadError(Exception):
+    """Rejected request; status is the HTTP status to answer with"""
+
+    def __init__(self, status, message, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class ChunkedUploads:
+    def __init__(self, directory):
+        self.directory = directory
+        # One writer per session: a retried chunk must not interleave with the original
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, upload_id):
+        if not _UPLOAD_ID.match(upload_id or ""):
+            raise UploadError(404, "Upload not found")
+        base = os.path.join(self.directory, upload_id)
+        return base + ".json", base + ".part"
+
+    def _load(self, upload_id):
+        meta_path, part_path = self._paths(upload_id)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            raise UploadError(404, "Upload not found")
+        meta["offset"] = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        return meta
+
+    def create(self, size, sha256, encoding=None):
+        """New session for size bytes hashing to sha256; returns its status"""
+        if not isinstance(size, int) or not 0 < size <= MAX_UPLOAD_SIZE:
+            raise UploadError(400, "Invalid size")
+        if not isinstance(sha256, str) or not _SHA256.match(sha256):
+            raise UploadError(400, "Invalid sha256")
+        self.expire()
+        upload_id = uuid.uuid4().hex
+        meta_path, part_path = self._paths(upload_id)
+        meta = {
+            "upload_id": upload_id,
+            "size": size,
+            "sha256": sha256,
+            "encoding": encoding,
+            "created_at": datetime.now().isoformat(),
+        }
+        open(part_path, "wb").close()
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        return self.status(upload_id)
+
+    def status(self, upload_id):
+        """{"upload_id", "size", "sha256", "encoding", "offset"}: offset = bytes acknowledged"""
+        meta = self._load(upload_id)
+        return {key: meta[key] for key in ("upload_id", "size", "sha256", "encoding", "offset")}
+
+    def write(self, upload_id, offset, data, sha256):
+        """Append a chunk at offset (must equal the acknowledged offset); returns the new offset"""
+        if len(data) > MAX_CHUNK_SIZE:
+            raise UploadError(413, "Chunk too large")
+        if hashlib.sha256(data).hexdigest() != (sha256 or "").lower():
+            raise UploadError(400, "Chunk checksum mismatch")
+        with self._lock:
+            meta = self._load(upload_id)
+            if offset != meta["offset"]:
+                raise UploadError(409, "Offset mismatch", offset=meta["offset"])
+            if offset + len(data) > meta["size"]:
+                raise UploadError(400, "Chunk beyond declared size", offset=meta["offset"])
+            _, part_path = self._paths(upload_id)
+            with open(part_path, "r+b") as f:
+                f.seek(offset)
+                f.write(data)
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+            return offset + len(data)
+
+    def finish(self, upload_id):
+        """Verify a complete upload; returns (part_path, encoding). The caller consumes the file."""
+        with self._lock:
+            meta = self._load(upload_id)
+            if meta["offset"] != meta["size"]:
+                raise UploadError(409, "Upload incomplete", offset=meta["offset"])
+            meta_path, part_path = self._paths(upload_id)
+            digest = hashlib.sha256()
+            with open(part_path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(block)
+            if digest.hexdigest() != meta["sha256"]:
+                # Nothing to resume: the client starts a new session
+                self.discard(upload_id)
+                raise UploadError(422, "Upload checksum mismatch")
+            os.remove(meta_path)
+            return part_path, meta["encoding"]
+
+    def discard(self, upload_id):
+        for path in self._paths(upload_id):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def expire(self):
+        """Drop sessions idle for longer than SESSION_EXPIRY"""
+        cutoff = (datetime.now() - SESSION_EXPIRY).timestamp()
+        last_used = {}
+        for name in os.listdir(self.directory):
+            try:
+                mtime = os.path.getmtime(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            upload_id = name.split(".")[0]
+            last_used[upload_id] = max(last_used.get(upload_id, 0), mtime)
+        for upload_id, mtime in last_used.items():
+            if mtime < cutoff and _UPLOAD_ID.match(upload_id):
+                self.discard(upload_id)
@@ -0,0 +1,188 @@
+"""
+Persisted merge job queue for /sync uploads.
+Uploads are saved next to a small SQLite job table and merged by one worker thread, one at a
+time, so the master database has a single writer for merges. Queued uploads survive a restart.
+Other writes to the master (delta pushes, resets) hold write_lock, which every merge runs under.
+"""
+
+import os
+import json
+import uuid
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+# Finished jobs stay readable this long for polling clients
+JOB_RETENTION = timedelta(hours=24)
+# Worker re-checks the table this often even without a wake-up (jobs queued by another process)
+IDLE_POLL_SECONDS = 5.0
+
+
+class MergeQueue:
+    """
+    merge(upload_path, region, scope, client) -> result dict runs on the worker thread only.
+    Back-to-back uploads from the same sync client (region and scope) are coalesced: a client
+    syncs from one database, so its newest upload carries everything the older ones did and
+    only that file is merged; the older jobs finish with the same result. Uploads of two
+    clients in one region are both merged.
+    """
+
+    def __init__(self, directory, merge):
+        self.directory = directory
+        self.path = os.path.join(directory, "merge_jobs.db")
+        self.merge = merge
+        # Held for each merge; other writers of the master DB take it too
+        self.write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._finished = threading.Condition()
+        self._thread = None
+        os.makedirs(directory, exist_ok=True)
+        with self._conn() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS merge_jobs (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    id TEXT NOT NULL UNIQUE,
+                    region TEXT NOT NULL,
+                    scope TEXT NOT NULL,
+                    client TEXT,
+                    status TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    started_at TEXT,
+                    finished_at TEXT,
+                    coalesced_into TEXT,
+                    result TEXT,
+                    error TEXT
+                );
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_merge_jobs_status ON merge_jobs (status, seq);")
+            if "client" not in {row["name"] for row in conn.execute("PRAGMA table_info(merge_jobs);")}:
+                # Jobs queued before clients were told apart: their region was the client
+                conn.execute("ALTER TABLE merge_jobs ADD COLUMN client TEXT;")
+                conn.execute("UPDATE merge_jobs SET client = region;")
+            # A merge cut short by a restart runs again: merges are single transactions
+            conn.execute("UPDATE merge_jobs SET status = ?, started_at = NULL WHERE status = ?;", (QUEUED, RUNNING))
+
+    @contextmanager
+    def _conn(self):
+        conn = sqlite3.connect(self.path, timeout=30.0)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def new_job_id(self):
+        return uuid.uuid4().hex
+
+    def upload_path(self, job_id):
+        """Where the upload of a job is saved before enqueue()"""
+        return os.path.join(self.directory, f"{job_id}.db")
+
+    def enqueue(self, job_id, region, scope="ALL", client=None):
+        """Queue a saved upload (upload_path(job_id)); client defaults to region. Returns the job status"""
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO merge_jobs (id, region, scope, client, status, created_at) VALUES (?, ?, ?, ?, ?, ?);",
+                (job_id, region, scope, client or region, QUEUED, datetime.now().isoformat()),
+            )
+        self._wake.set()
+        return self.get(job_id)
+
+    def get(self, job_id):
+        """Job status dict (position counts queued jobs ahead of it), None if unknown"""
+        with self._conn() as conn:
+            row = conn.execute("SELECT * FROM merge_jobs WHERE id = ?;", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = {
+                "job_id": row["id"],
+                "status": row["status"],
+                "region": row["region"],
+                "created_at": row["created_at"],
+                "started_at": row["started_at"],
+                "finished_at": row["finished_at"],
+                "coalesced_into": row["coalesced_into"],
+                "result": json.loads(row["result"]) if row["result"] else None,
+                "error": row["error"],
+            }
+            if row["status"] == QUEUED:
+                job["position"] = conn.execute(
+                    "SELECT COUNT(*) FROM merge_jobs WHERE status = ? AND seq < ?;", (QUEUED, row["seq"])
+                ).fetchone()[0]
+        return job
+
+    def wait(self, job_id, timeout):
+        """Block until the job finished or timeout passed; returns its status"""
+        deadline = datetime.now() + timedelta(seconds=timeout)
+        with self._finished:
+            while True:
+                job = self.get(job_id)
+                remaining = (deadline - datetime.now()).total_seconds()
+                if job is None or job["status"] in (DONE, FAILED) or remaining <= 0:
+                    return job
+                self._finished.wait(min(remaining, IDLE_POLL_SECONDS))
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._worker, name="merge-queue", daemon=True)
+            self._thread.start()
+
+    def _worker(self):
+        while True:
+            batch = self._claim()
+            if batch is None:
+                self._wake.wait(IDLE_POLL_SECONDS)
+                self._wake.clear()
+                continue
+            self._run(*batch)
+
+    def _claim(self):
+        """Mark the oldest queued job and every queued job of its client running; None if idle"""
+        with self._conn() as conn:
+            conn.execute("BEGIN IMMEDIATE;")
+            cutoff = (datetime.now() - JOB_RETENTION).isoformat()
+            conn.execute("DELETE FROM merge_jobs WHERE status IN (?, ?) AND finished_at < ?;", (DONE, FAILED, cutoff))
+            oldest = conn.execute(
+                "SELECT region, scope, client FROM merge_jobs WHERE status = ? ORDER BY seq LIMIT 1;", (QUEUED,)
+            ).fetchone()
+            if oldest is None:
+                return None
+            job_ids = [row[0] for row in conn.execute(
+                "SELECT id FROM merge_jobs WHERE status = ? AND client = ? AND region = ? AND scope = ? ORDER BY seq;",
+                (QUEUED, oldest["client"], oldest["region"], oldest["scope"]),
+            )]
+            newest = job_ids[-1]
+            conn.executemany(
+                "UPDATE merge_jobs SET status = ?, started_at = ?, coalesced_into = ? WHERE id = ?;",
+                [(RUNNING, datetime.now().isoformat(), None if job_id == newest else newest, job_id)
+                 for job_id in job_ids],
+            )
+        return job_ids, oldest["region"], oldest["scope"], oldest["client"]
+
+    def _run(self, job_ids, region, scope, client):
+        newest = job_ids[-1]
+        result, error = None, None
+        try:
+            with self.write_lock:
+                result = self.merge(self.upload_path(newest), region, scope, client)
+        except Exception as e:
+            error = str(e)
+        finally:
+            for job_id in job_ids:
+                path = self.upload_path(job_id)
+                if os.path.exists(path):
+                    os.remove(path)
+        with self._conn() as conn:
+            conn.executemany(
+                "UPDATE merge_jobs SET status = ?, finished_at = ?, result = ?, error = ? WHERE id = ?;",
+                [(FAILED if error else DONE, datetime.now().isoformat(),
+                  json.dumps(result) if result is not None else None, error, job_id) for job_id in job_ids],
+            )
+        with self._finished:
+            self._finished.notify_all()
@@ -0,0 +1,67 @@
+"""
+Generation-keyed cache for read-only JSON API responses.
+Entries are keyed by (route, region, query args) and remember the data generation they were
+built from; a lookup under any other generation misses, so a write never serves stale data.
+Each body carries a content ETag for If-None-Match revalidation. The total size of cached
+bodies is bounded; least recently used entries are evicted first.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Upper bound on the bytes of all cached bodies
+MAX_BYTES = 32 * 1024 * 1024
+
+
+class ResponseCache:
+    def __init__(self, data_generation, max_bytes=MAX_BYTES):
+        """data_generation() returns a token that changes whenever the underlying data does"""
+        self.data_generation = data_generation
+        self.max_bytes = max_bytes
+        # key -> (generation, body, etag), least recently used first
+        self._entries = OrderedDict()
+        self._size = 0
+        self._bumps = 0
+        self._lock = threading.Lock()
+
+    def generation(self):
+        """Current generation: local bumps plus the data generation"""
+        return self._bumps, self.data_generation()
+
+    def bump(self):
+        """Data was written: every cached entry is stale"""
+        with self._lock:
+            self._bumps += 1
+            self._entries.clear()
+            self._size = 0
+
+    def get(self, key, generation):
+        """(body, etag) cached for key under generation, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != generation:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1], entry[2]
+
+    def put(self, key, generation, body):
+        """Cache body for key under generation; returns (body, etag)"""
+        etag = hashlib.sha1(body).hexdigest()
+        with self._lock:
+            # A bump since generation was read: the body may predate the write
+            if generation[0] != self._bumps or len(body) > self.max_bytes:
+                return body, etag
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[1])
+            self._entries[key] = (generation, body, etag)
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+        return body, etag
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._size}
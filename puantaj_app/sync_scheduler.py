@@ -0,0 +1,152 @@
+"""
+Single background sync worker for the desktop app.
+Triggers go through a queue: bursts collapse into one run, write triggers are debounced,
+failures are retried with exponential backoff plus jitter. Only this thread ever syncs.
+"""
+
+import time
+import queue
+import random
+import threading
+
+# A write trigger waits this long for more writes before syncing...
+DEBOUNCE_SECONDS = 5.0
+# ...but a steady stream of writes still syncs this long after the first one
+MAX_DEBOUNCE_SECONDS = 30.0
+# Retry delays after failed runs: BACKOFF_BASE * 2^(failures - 1), capped, then jittered
+BACKOFF_BASE_SECONDS = 10.0
+BACKOFF_MAX_SECONDS = 600.0
+
+IDLE = "idle"
+WAITING = "waiting"
+RUNNING = "running"
+BACKOFF = "backoff"
+STOPPED = "stopped"
+
+_STOP = object()
+
+
+class SyncScheduler:
+    """
+    run(reasons) performs one sync for the collected trigger reasons (oldest first) and
+    raises on failure; on_state(state) receives a state() dict after every change, on the
+    worker thread. trigger() is safe to call from any thread.
+    """
+
+    def __init__(self, run, on_state=None, debounce=DEBOUNCE_SECONDS, max_debounce=MAX_DEBOUNCE_SECONDS,
+                 backoff_base=BACKOFF_BASE_SECONDS, backoff_max=BACKOFF_MAX_SECONDS):
+        self.run = run
+        self.on_state = on_state
+        self.debounce = debounce
+        self.max_debounce = max_debounce
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._state = IDLE
+        self._pending = []
+        self._first_pending = None
+        self._due = None
+        self._urgent = False
+        self._backoff_until = 0.0
+        self._failures = 0
+        self._last_duration = None
+        self._last_error = None
+        self._last_run = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._worker, name="sync-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop after the current run; pending triggers are dropped"""
+        self._queue.put(_STOP)
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def trigger(self, reason, immediate=False):
+        """Ask for a sync: immediate runs as soon as the worker is free (and skips any backoff)"""
+        self._queue.put((reason, immediate))
+
+    def state(self):
+        """{"state", "next_run" (epoch seconds), "last_run", "last_duration", "last_error", "failures", "pending"}"""
+        with self._lock:
+            next_run = None
+            if self._due is not None:
+                next_run = time.time() + max(0.0, self._due - time.monotonic())
+            return {
+                "state": self._state,
+                "next_run": next_run,
+                "last_run": self._last_run,
+                "last_duration": self._last_duration,
+                "last_error": self._last_error,
+                "failures": self._failures,
+                "pending": list(self._pending),
+            }
+
+    def _set(self, **values):
+        with self._lock:
+            for name, value in values.items():
+                setattr(self, "_" + name, value)
+        if self.on_state is not None:
+            try:
+                self.on_state(self.state())
+            except Exception:
+                pass
+
+    def _schedule(self, reason, immediate):
+        now = time.monotonic()
+        pending = self._pending if reason in self._pending else self._pending + [reason]
+        first = self._first_pending if self._first_pending is not None else now
+        if immediate:
+            due, urgent = now, True
+        elif self._urgent:
+            due, urgent = self._due, True
+        else:
+            # Debounce: every write pushes the run out, up to max_debounce after the first one
+            due, urgent = max(self._backoff_until, min(now + self.debounce, first + self.max_debounce)), False
+        state = BACKOFF if due == self._backoff_until and due > now else WAITING
+        self._set(pending=pending, first_pending=first, due=due, urgent=urgent, state=state)
+
+    def _worker(self):
+        while True:
+            timeout = None if self._due is None else max(0.0, self._due - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                self._set(state=STOPPED, due=None)
+                return
+            if item is not None:
+                # Drain the burst before deciding when to run
+                self._schedule(*item)
+                continue
+            if self._due is None or time.monotonic() < self._due:
+                continue
+            self._run_pending()
+
+    def _run_pending(self):
+        reasons = self._pending
+        started = time.monotonic()
+        self._set(state=RUNNING, pending=[], first_pending=None, due=None, urgent=False, last_run=time.time())
+        try:
+            self.run(reasons)
+        except Exception as e:
+            failures = self._failures + 1
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (failures - 1))
+            # Jitter spreads clients that failed together (server restart) over the window
+            delay *= random.uniform(0.5, 1.0)
+            retry_at = time.monotonic() + delay
+            # The failed reasons stay queued: the retry carries them plus anything new
+            self._set(
+                state=BACKOFF, failures=failures, last_error=str(e), backoff_until=retry_at,
+                last_duration=time.monotonic() - started,
+                pending=reasons + [reason for reason in self._pending if reason not in reasons],
+                first_pending=started, due=retry_at,
+            )
+            return
+        self._set(failures=0, last_error=None, backoff_until=0.0, last_duration=time.monotonic() - started,
+                  state=IDLE)
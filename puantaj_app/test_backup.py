@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""Test online backups (SQLite backup API) and atomic restore in puantaj_db"""
+
+import sys
+import os
+import time
+import sqlite3
+import tempfile
+import threading
+
+# Add parent dir to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import puantaj_db as db
+
+
+def test_backup_restore():
+    """Daily backup runs in the background; restore rejects bad files and swaps good ones in"""
+    print("1. Testing backup and restore...")
+    saved = db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER
+    db.DB_DIR = tempfile.mkdtemp()
+    db.DB_PATH = os.path.join(db.DB_DIR, "puantaj.db")
+    db.BACKUP_DIR = os.path.join(db.DB_DIR, "backups")
+    db.BACKUP_MARKER = os.path.join(db.BACKUP_DIR, "last_backup.txt")
+    try:
+        db.init_db()
+        db.wait_for_auto_backup()
+        autos = [name for name in os.listdir(db.BACKUP_DIR) if name.startswith("puantaj_auto_")]
+        assert len(autos) == 1 and os.path.exists(db.BACKUP_MARKER)
+
+        db.add_employee("Ali", "1", "", "", "Ankara")
+        backup_path = os.path.join(db.DB_DIR, "manual.db")
+        # Uncommitted writes on another connection are not part of the copy
+        with db.get_conn() as writer:
+            writer.execute("INSERT INTO employees (full_name, region) VALUES ('Veli', 'Ankara');")
+            db.create_backup(backup_path)
+        assert len(db.list_employees()) == 2
+
+        bad_path = os.path.join(db.DB_DIR, "bad.db")
+        with open(bad_path, "wb") as f:
+            f.write(b"not a database" * 100)
+        try:
+            db.restore_backup(bad_path)
+        except Exception:
+            pass
+        else:
+            raise AssertionError("restore_backup should reject non-database files")
+        assert len(db.list_employees()) == 2
+
+        db.restore_backup(backup_path)
+        assert [row[1] for row in db.list_employees()] == ["Ali"]
+        assert not os.path.exists(db.DB_PATH + ".restore")
+    finally:
+        db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER = saved
+    print("   ✓ backup consistent, restore swapped atomically")
+
+
+def test_download_snapshot():
+    """The /sync/download snapshot keeps its content ETag until the database changes"""
+    print("2. Testing download snapshot...")
+    saved = db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER
+    db.DB_DIR = tempfile.mkdtemp()
+    db.DB_PATH = os.path.join(db.DB_DIR, "puantaj.db")
+    db.BACKUP_DIR = os.path.join(db.DB_DIR, "backups")
+    db.BACKUP_MARKER = os.path.join(db.BACKUP_DIR, "last_backup.txt")
+    try:
+        db.init_db()
+        db.add_employee("Ali", "1", "", "", "Ankara")
+        path, etag = db.download_snapshot()
+        # A checkpoint or a fresh copy of the same content keeps the ETag
+        db.checkpoint()
+        db._download_snapshots.clear()
+        assert db.download_snapshot() == (path, etag)
+
+        db.add_employee("Veli", "2", "", "", "Ankara")
+        new_path, new_etag = db.download_snapshot()
+        assert new_etag != etag and not os.path.exists(path)
+        snapshots = [name for name in os.listdir(db.DB_DIR) if ".snapshot" in name]
+        assert snapshots == [os.path.basename(new_path)]
+    finally:
+        db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER = saved
+    print("   ✓ ETag follows content")
+
+
+def test_region_snapshot():
+    """A region snapshot holds that region's rows and the rows they reference, nothing else"""
+    print("3. Testing region snapshot...")
+    saved = db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER
+    db.DB_DIR = tempfile.mkdtemp()
+    db.DB_PATH = os.path.join(db.DB_DIR, "puantaj.db")
+    db.BACKUP_DIR = os.path.join(db.DB_DIR, "backups")
+    db.BACKUP_MARKER = os.path.join(db.BACKUP_DIR, "last_backup.txt")
+    try:
+        db.init_db()
+
+        def row_id(table, column, value):
+            with db.get_conn() as conn:
+                return conn.execute(f"SELECT id FROM {table} WHERE {column} = ?", (value,)).fetchone()[0]
+
+        db.add_employee("Ali", "1", "", "", "Ankara")
+        db.add_employee("Veli", "2", "", "", "Izmir")
+        ankara, izmir = row_id("employees", "full_name", "Ali"), row_id("employees", "full_name", "Veli")
+        db.add_timesheet(ankara, "2024-01-02", "08:00", "18:00", 60, 0, "", "Ankara")
+        db.add_timesheet(izmir, "2024-01-02", "08:00", "18:00", 60, 0, "", "Izmir")
+        db.add_vehicle("06 ABC 1", "", "", 2020, 0, "", "", "", "", 0, 0, "", "Izmir")
+        db.add_driver("Ayse", "B", "", "", "", "Izmir")
+        vehicle, driver = row_id("vehicles", "plate", "06 ABC 1"), row_id("drivers", "full_name", "Ayse")
+        # An Ankara service visit on an Izmir vehicle pulls that vehicle in; inspections follow it
+        db.add_vehicle_service_visit(vehicle, None, "2024-01-03", "", "Bakim", 0, "", "Ankara")
+        db.add_vehicle_inspection(vehicle, driver, "2024-01-03", "2024-01-01", 0, "")
+        db.add_driver("Mehmet", "B", "", "", "", "Izmir")
+        full_path, full_etag = db.download_snapshot()
+        last_seq = db.latest_change_seq()
+
+        path, etag = db.download_snapshot(region="Ankara")
+        assert etag != full_etag and db.download_snapshot(region="Ankara") == (path, etag)
+        assert db.download_snapshot(region="ALL") == (full_path, full_etag)
+        conn = sqlite3.connect(path)
+        try:
+            def names(table, column="full_name"):
+                return sorted(row[0] for row in conn.execute(f"SELECT {column} FROM {table}"))
+            assert names("employees") == ["Ali"]
+            assert conn.execute("SELECT COUNT(*), MIN(region) FROM timesheets").fetchone() == (1, "Ankara")
+            assert names("vehicles", "plate") == ["06 ABC 1"] and names("drivers") == ["Ayse"]
+            assert conn.execute("SELECT driver_id FROM vehicle_inspections").fetchall() == [(driver,)]
+            assert conn.execute("SELECT MAX(seq) FROM change_log").fetchone()[0] == last_seq
+            assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
+        finally:
+            conn.close()
+
+        # The subset is rebuilt with the next generation, its old file removed
+        db.add_employee("Can", "3", "", "", "Ankara")
+        new_path, new_etag = db.download_snapshot(region="Ankara")
+        assert new_etag != etag and not os.path.exists(path)
+    finally:
+        db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER = saved
+    print("   ✓ subset keeps its references")
+
+
+def test_restore_waits_for_connections():
+    """The swap waits for connections other threads have checked out; new checkouts wait for it"""
+    print("4. Testing restore with busy connections...")
+    saved = db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER
+    db.DB_DIR = tempfile.mkdtemp()
+    db.DB_PATH = os.path.join(db.DB_DIR, "puantaj.db")
+    db.BACKUP_DIR = os.path.join(db.DB_DIR, "backups")
+    db.BACKUP_MARKER = os.path.join(db.BACKUP_DIR, "last_backup.txt")
+    try:
+        db.init_db()
+        db.add_employee("Ali", "1", "", "", "Ankara")
+        backup_path = os.path.join(db.DB_DIR, "manual.db")
+        db.create_backup(backup_path)
+        db.add_employee("Veli", "2", "", "", "Ankara")
+
+        checked_out, release = threading.Event(), threading.Event()
+        events = []
+
+        def reader():
+            with db.get_read_conn() as conn:
+                conn.execute("SELECT COUNT(*) FROM employees;").fetchone()
+                checked_out.set()
+                release.wait()
+                events.append("released")
+
+        def restorer():
+            db.restore_backup(backup_path)
+            events.append("restored")
+
+        def late_reader():
+            events.append([row[1] for row in db.list_employees()])
+
+        threads = [threading.Thread(target=reader, daemon=True)]
+        threads[0].start()
+        checked_out.wait()
+        threads.append(threading.Thread(target=restorer, daemon=True))
+        threads[1].start()
+        time.sleep(0.2)
+        threads.append(threading.Thread(target=late_reader, daemon=True))
+        threads[2].start()
+        time.sleep(0.2)
+        assert events == [] and all(thread.is_alive() for thread in threads)
+
+        release.set()
+        for thread in threads:
+            thread.join(10)
+        assert events == ["released", "restored", ["Ali"]], events
+    finally:
+        db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER = saved
+    print("   ✓ busy connections released before the swap")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🧪 BACKUP TEST")
+    print("=" * 60)
+
+    try:
+        test_backup_restore()
+        test_download_snapshot()
+        test_region_snapshot()
+        test_restore_waits_for_connections()
+    except Exception as e:
+        print(f"   ✗ Test error: {e}")
+        sys.exit(1)
+    print("✅ All tests passed!")
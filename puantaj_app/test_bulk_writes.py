@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Test puantaj_db *_bulk write functions and paged timesheet reads"""
+
+import sys
+import os
+import tempfile
+
+# Add parent dir to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import puantaj_db as db
+
+
+def _use_temp_db():
+    saved = db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER
+    db.DB_DIR = tempfile.mkdtemp()
+    db.DB_PATH = os.path.join(db.DB_DIR, "puantaj.db")
+    db.BACKUP_DIR = os.path.join(db.DB_DIR, "backups")
+    db.BACKUP_MARKER = os.path.join(db.BACKUP_DIR, "last_backup.txt")
+    return saved
+
+
+def test_bulk_writes():
+    """Bulk functions return one outcome code per input row"""
+    print("1. Testing bulk writes...")
+    saved = _use_temp_db()
+    try:
+        db.init_db()
+        outcomes = db.upsert_employees_bulk([
+            ("Ali", "1", "Depo", "", "Ankara"),
+            ("", "", "", "", "Ankara"),
+            ("Ali", "1", "Depo", "", "Izmir"),
+        ])
+        assert outcomes == [db.BULK_INSERTED, db.BULK_INVALID, db.BULK_INSERTED]
+        outcomes = db.upsert_employees_bulk([("Ali", "1", "Depo", "", "Ankara"), ("Ali", "1", "Saha", "", "Izmir")])
+        assert outcomes == [db.BULK_UNCHANGED, db.BULK_UPDATED]
+
+        emp_id = db.list_employees("Ankara")[0][0]
+        outcomes = db.add_timesheets_bulk([
+            (emp_id, "2026-01-14", "09:00", "20:00", 60, 0, "", "Ankara"),
+            (9999, "2026-01-14", "09:00", "18:00", 60, 0, "", "Ankara"),
+            (emp_id, "2026-01-15", "bad", "18:00", 0, 0, "", "Ankara"),
+        ])
+        assert outcomes == [db.BULK_INSERTED, db.BULK_INVALID, db.BULK_INSERTED]
+        with db.get_conn() as conn:
+            hours = conn.execute("SELECT worked_hours FROM timesheets ORDER BY id;").fetchall()
+        assert hours == [(10.0,), (None,)]
+
+        ids = [row[0] for row in db.list_timesheets()]
+        outcomes = db.delete_timesheets_bulk(ids + [9999])
+        assert outcomes == [db.BULK_DELETED, db.BULK_DELETED, db.BULK_MISSING]
+        with db.get_conn() as conn:
+            tombstones = conn.execute("SELECT COUNT(*) FROM deleted_records WHERE table_name = 'timesheets';").fetchone()
+        assert tombstones == (2,)
+
+        stock = [("K1", "Urun", "S1", "OK", "2026-01-14", "system", 1)] * 2
+        assert db.replace_stock_bulk("Ankara", stock) == [db.BULK_INSERTED, db.BULK_DUPLICATE]
+        assert db.replace_stock_bulk("Ankara", stock[:1]) == [db.BULK_INSERTED]
+    finally:
+        db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER = saved
+    print("   ✓ outcome codes match")
+
+
+def test_timesheet_pages():
+    """Keyset pages and iter_timesheets cover every row exactly once"""
+    print("2. Testing keyset pagination...")
+    saved = _use_temp_db()
+    try:
+        db.init_db()
+        db.upsert_employees_bulk([("Ali", "", "", "", "Ankara")])
+        emp_id = db.list_employees()[0][0]
+        db.add_timesheets_bulk([
+            (emp_id, f"2026-01-{day:02d}", "09:00", "18:00", 60, 0, "", "Ankara")
+            for day in range(1, 29) for _ in range(3)
+        ])
+        page = db.list_timesheets_page(limit=10)
+        assert len(page) == 10 and page[0][3] == "2026-01-28"
+        following = db.list_timesheets_page(page[-1][3], page[-1][0], limit=10)
+        assert (following[0][3], following[0][0]) < (page[-1][3], page[-1][0])
+        rows = list(db.iter_timesheets(batch_size=7))
+        assert len(rows) == 84 and len({row[0] for row in rows}) == 84
+        assert sorted(rows) == sorted(db.list_timesheets())
+        # Resuming after a page's last row continues exactly where it stopped
+        assert page + list(db.iter_timesheets(after_work_date=page[-1][3], after_id=page[-1][0])) == rows
+        assert list(db.iter_timesheets(month="01", batch_size=50)) == rows
+        assert db.list_timesheets_page(month="02") == []
+    finally:
+        db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER = saved
+    print("   ✓ pages are contiguous")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🧪 BULK WRITE TEST")
+    print("=" * 60)
+
+    try:
+        test_bulk_writes()
+        test_timesheet_pages()
+    except Exception as e:
+        print(f"   ✗ Test error: {e}")
+        sys.exit(1)
+    print("✅ All tests passed!")
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""Test calc.calc_many against calc.calc_day_hours"""
+
+import sys
+import os
+import random
+import tempfile
+
+# Add parent dir to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import calc
+
+SETTINGS = [
+    {"weekday_hours": "9", "saturday_start": "09:00", "saturday_end": "14:00"},
+    {"weekday_hours": "7.5", "saturday_start": "10:00", "saturday_end": "13:20"},
+    {"weekday_hours": "0"},
+]
+
+
+def _random_rows(count, seed=7):
+    rng = random.Random(seed)
+
+    def rand_time():
+        return f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}"
+
+    rows = []
+    for _ in range(count):
+        rows.append((
+            f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            rand_time(),
+            rand_time(),
+            rng.choice([0, 30, 60, 90, 2000, -10, "45"]),
+            rng.choice([0, 0, 0, 1]),
+        ))
+    return rows
+
+
+def test_batch_matches_scalar():
+    """calc_many returns exactly what calc_day_hours returns row by row"""
+    print("1. Testing calc_many == calc_day_hours...")
+    rows = _random_rows(5000)
+    columns = list(zip(*rows))
+    for settings in SETTINGS:
+        expected = [calc.calc_day_hours(d, s, e, b, settings, sp) for d, s, e, b, sp in rows]
+        actual = calc.calc_many(columns[0], columns[1], columns[2], columns[3], settings, columns[4])
+        assert repr(actual) == repr(expected)
+    print(f"   ✓ {len(rows)} rows x {len(SETTINGS)} settings match")
+
+
+def test_invalid_rows():
+    """Invalid rows raise by default and become None with skip_invalid"""
+    print("2. Testing invalid rows...")
+    settings = SETTINGS[0]
+    dates = ["2026-01-14", "bad-date", "2026-01-17"]
+    starts = ["09:00", "09:00", "25:00"]
+    ends = ["18:00", "18:00", "14:00"]
+    breaks = [60, 0, 0]
+    result = calc.calc_many(dates, starts, ends, breaks, settings, skip_invalid=True)
+    assert result[0] == calc.calc_day_hours("2026-01-14", "09:00", "18:00", 60, settings)
+    assert result[1] is None and result[2] is None
+    try:
+        calc.calc_many(dates, starts, ends, breaks, settings)
+    except ValueError:
+        print("   ✓ ValueError raised without skip_invalid")
+    else:
+        raise AssertionError("calc_many should raise on invalid rows")
+    assert calc.calc_many([], [], [], [], settings) == []
+
+
+def test_timesheet_rows():
+    """calc_timesheet_rows reads list_timesheets shaped tuples"""
+    print("3. Testing calc_timesheet_rows...")
+    record = (1, 1, "Test", "2026-01-17", "09:00", "16:00", 0, 0, "", "Ankara")
+    result = calc.calc_timesheet_rows([record], SETTINGS[0])
+    assert result == [calc.calc_day_hours("2026-01-17", "09:00", "16:00", 0, SETTINGS[0], 0)]
+    print("   ✓ Saturday row computed")
+
+
+def test_shape_cache():
+    """Repeated shift shapes hit the cache; changing hour settings clears it"""
+    print("4. Testing shift-shape cache...")
+    settings = dict(SETTINGS[0])
+    calc.get_rules(settings)
+    calc.clear_shape_cache()
+    for day in ("2026-01-12", "2026-01-13", "2026-01-14"):
+        calc.calc_day_hours(day, "09:00", "18:00", 60, settings, 0)
+    info = calc.shape_cache_info()
+    assert info.misses == 1 and info.hits == 2
+    settings["weekday_hours"] = "8"
+    assert calc.calc_day_hours("2026-01-12", "09:00", "18:00", 60, settings, 0)[2] == 1.0
+    assert calc.shape_cache_info().currsize == 1
+    print(f"   ✓ {info}")
+
+
+def test_materialized_hours():
+    """Timesheet writes store computed hours; recompute refreshes stale stamps"""
+    print("5. Testing materialized timesheet hours...")
+    import puantaj_db as db
+    saved = db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER
+    db.DB_DIR = tempfile.mkdtemp()
+    db.DB_PATH = os.path.join(db.DB_DIR, "puantaj.db")
+    db.BACKUP_DIR = os.path.join(db.DB_DIR, "backups")
+    db.BACKUP_MARKER = os.path.join(db.BACKUP_DIR, "last_backup.txt")
+    try:
+        db.init_db()
+        db.add_employee("Test", "1", "", "", "Ankara")
+        emp_id = db.list_employees()[0][0]
+        db.add_timesheet(emp_id, "2026-01-14", "09:00", "20:00", 60, 0, "", "Ankara")
+        query = "SELECT worked_hours, overtime_hours, hours_version FROM timesheets;"
+        with db.get_conn() as conn:
+            assert conn.execute(query).fetchone() == (10.0, 2.0, "9|09:00|14:00")
+        db.set_setting("weekday_hours", "8")
+        assert db.recompute_stale_timesheets() == 1
+        assert db.recompute_stale_timesheets() == 0
+        with db.get_conn() as conn:
+            assert conn.execute(query).fetchone() == (10.0, 3.0, "8|09:00|14:00")
+
+        # Only the hour keys are read; other settings leave the compiled rules alone
+        rules = db.get_hour_rules()
+        db.set_setting("company_name", "X")
+        assert rules.stamp == "8|09:00|14:00" and db.get_hour_rules() is rules
+        db.set_setting("weekday_hours", "dokuz")
+        assert db.get_hour_rules() is None
+    finally:
+        db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER = saved
+    print("   ✓ hours stored and recomputed")
+
+
+def test_rules():
+    """get_rules rebuilds only on an hour-setting change; bad hour settings raise ValueError"""
+    print("6. Testing compiled hour rules...")
+    settings = dict(SETTINGS[0], company_name="X")
+    rules = calc.get_rules(settings)
+    assert calc.get_rules(dict(settings, company_name="Y")) is rules
+    assert calc.get_rules(rules) is rules
+    calc.calc_day_hours("2026-01-12", "09:00", "18:00", 60, rules, 0)
+    assert calc.shape_cache_info().currsize > 0
+
+    changed = calc.get_rules(dict(settings, weekday_hours="8"))
+    assert changed is not rules and changed != rules
+    assert changed.stamp != rules.stamp and changed.stamp == "8|09:00|14:00"
+    assert calc.shape_cache_info().currsize == 0
+    assert calc.calc_day_hours("2026-01-12", "09:00", "18:00", 60, changed, 0)[2] == 1.0
+
+    # Invalid Saturday window: weekday rows still compute, Saturday rows raise
+    broken = calc.get_rules(dict(settings, saturday_start="25:00"))
+    assert calc.calc_day_hours("2026-01-12", "09:00", "18:00", 60, broken, 0)[1] == 9.0
+    for call in (
+        lambda: calc.calc_day_hours("2026-01-17", "09:00", "14:00", 0, broken, 0),
+        lambda: calc.get_rules(dict(settings, weekday_hours="dokuz")),
+    ):
+        try:
+            call()
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("invalid hour settings should raise ValueError")
+    print("   ✓ stamp follows hour settings, invalid windows rejected")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🧪 CALC BATCH TEST")
+    print("=" * 60)
+
+    tests = [
+        test_batch_matches_scalar,
+        test_invalid_rows,
+        test_timesheet_rows,
+        test_shape_cache,
+        test_materialized_hours,
+        test_rules,
+    ]
+
+    failed = 0
+    for test in tests:
+        try:
+            test()
+        except Exception as e:
+            print(f"   ✗ Test error: {e}")
+            failed += 1
+
+    print("=" * 60)
+    if failed == 0:
+        print("✅ All tests passed!")
+        sys.exit(0)
+    print(f"❌ {failed} test(s) failed!")
+    sys.exit(1)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""Test the trigger-fed change_log journal in puantaj_db"""
+
+import sys
+import os
+import tempfile
+
+# Add parent dir to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import puantaj_db as db
+
+
+def test_change_log():
+    """Writes on journaled tables append entries; compaction moves the readable floor"""
+    print("1. Testing change_log...")
+    saved = db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER
+    db.DB_DIR = tempfile.mkdtemp()
+    db.DB_PATH = os.path.join(db.DB_DIR, "puantaj.db")
+    db.BACKUP_DIR = os.path.join(db.DB_DIR, "backups")
+    db.BACKUP_MARKER = os.path.join(db.BACKUP_DIR, "last_backup.txt")
+    try:
+        db.init_db()
+        assert db.latest_change_seq() == 0 and db.list_changes() == []
+        db.add_vehicle("06ABC01", "Ford", "Transit", "2020", 1000, "", "", "", "", 0, 10000, "", "Ankara")
+        vehicle_id = db.list_vehicles()[0][0]
+        db.add_vehicle_fault(vehicle_id, "Fren", "", "2026-01-10", "", "Acik", "Ankara")
+        fault_id = db.list_vehicle_faults()[0][0]
+        db.update_vehicle_fault(fault_id, vehicle_id, "Fren", "", "2026-01-10", "2026-01-12", "Kapali", "Ankara")
+        db.add_vehicle_service_visit(vehicle_id, fault_id, "2026-01-11", "2026-01-12", "Fren", 500, "", "Ankara")
+        db.add_vehicle_inspection(vehicle_id, None, "2026-01-12", "2026-01-12", 1200, "")
+        db.delete_vehicle_fault(fault_id)
+        # Settings are not journaled
+        db.set_setting("company_name", "Rainstaff")
+
+        changes = db.list_changes()
+        assert [(table, op) for _, table, _, op, _ in changes] == [
+            ("vehicles", db.CHANGE_INSERT),
+            ("vehicle_faults", db.CHANGE_INSERT),
+            ("vehicle_faults", db.CHANGE_UPDATE),
+            ("vehicle_service_visits", db.CHANGE_INSERT),
+            ("vehicle_inspections", db.CHANGE_INSERT),
+            # ON DELETE SET NULL on the visit, then the fault itself
+            ("vehicle_service_visits", db.CHANGE_UPDATE),
+            ("vehicle_faults", db.CHANGE_DELETE),
+        ]
+        assert [row[0] for row in db.list_changes(changes[1][0], limit=2)] == [changes[2][0], changes[3][0]]
+        assert {row[1] for row in db.list_changes(tables=["vehicle_faults"])} == {"vehicle_faults"}
+
+        assert db.compact_change_log(changes[2][0]) == 3
+        assert db.latest_change_seq() == changes[-1][0]
+        assert len(db.list_changes(changes[2][0])) == 4
+        assert not db.sync_delta_available(changes[0][0])
+        try:
+            db.list_changes(changes[0][0])
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("list_changes should refuse a compacted position")
+    finally:
+        db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER = saved
+    print(f"   ✓ {len(changes)} entries journaled and compacted")
+
+
+def test_unsynced_compaction():
+    """Without any sync watermark the log is dropped; once sync has run it is kept"""
+    print("2. Testing compaction without sync...")
+    saved = db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER
+    db.DB_DIR = tempfile.mkdtemp()
+    db.DB_PATH = os.path.join(db.DB_DIR, "puantaj.db")
+    db.BACKUP_DIR = os.path.join(db.DB_DIR, "backups")
+    db.BACKUP_MARKER = os.path.join(db.BACKUP_DIR, "last_backup.txt")
+    try:
+        db.init_db()
+        db.add_employee("Ali", "1", "", "", "Ankara")
+        db.add_employee("Veli", "2", "", "", "Ankara")
+        seq = db.latest_change_seq()
+        assert db.compact_unsynced_change_log() == 2
+        assert db.list_changes(seq) == [] and db.latest_change_seq() == seq
+
+        db.reset_sync_watermark("Ankara")
+        db.add_employee("Can", "3", "", "", "Ankara")
+        assert db.compact_unsynced_change_log() == 0
+        assert len(db.list_changes(seq)) == 1
+    finally:
+        db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER = saved
+    print("   ✓ log dropped only while sync is unused")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🧪 CHANGE LOG TEST")
+    print("=" * 60)
+
+    try:
+        test_change_log()
+        test_unsynced_compaction()
+    except Exception as e:
+        print(f"   ✗ Test error: {e}")
+        sys.exit(1)
+    print("✅ All tests passed!")
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""Test resumable /sync/uploads: chunk checksums, offsets, resume after a dropped connection"""
+
+import sys
+import os
+import json
+import sqlite3
+import hashlib
+import tempfile
+import importlib.util
+
+# Add parent and server dirs to path
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, "server"))
+
+import puantaj_db as db
+import sync_codec
+import chunked_upload
+
+
+def sha(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_sessions():
+    """Chunks append only at the acknowledged offset; finish() checks the whole file"""
+    print("1. Testing upload sessions...")
+    uploads = chunked_upload.ChunkedUploads(tempfile.mkdtemp())
+    data = os.urandom(10000)
+    upload = uploads.create(len(data), sha(data), "gzip")
+    upload_id = upload["upload_id"]
+    assert upload["offset"] == 0
+
+    assert uploads.write(upload_id, 0, data[:4000], sha(data[:4000])) == 4000
+    for offset, chunk, checksum, status in (
+        (0, data[:4000], sha(data[:4000]), 409),           # replayed chunk
+        (4000, data[4000:8000], sha(b"other"), 400),      # corrupted in transit
+    ):
+        try:
+            uploads.write(upload_id, offset, chunk, checksum)
+            raise AssertionError("chunk accepted")
+        except chunked_upload.UploadError as e:
+            assert e.status == status
+    try:
+        uploads.finish(upload_id)
+        raise AssertionError("incomplete upload finished")
+    except chunked_upload.UploadError as e:
+        assert e.status == 409 and e.offset == 4000
+    assert uploads.write(upload_id, 4000, data[4000:], sha(data[4000:])) == 10000
+    part_path, encoding = uploads.finish(upload_id)
+    with open(part_path, "rb") as f:
+        assert f.read() == data and encoding == "gzip"
+
+    # Declared hash does not match the bytes: session is dropped
+    upload_id = uploads.create(4, sha(b"abcd"))["upload_id"]
+    uploads.write(upload_id, 0, b"abce", sha(b"abce"))
+    try:
+        uploads.finish(upload_id)
+        raise AssertionError("checksum mismatch accepted")
+    except chunked_upload.UploadError as e:
+        assert e.status == 422
+    try:
+        uploads.status(upload_id)
+        raise AssertionError("discarded session still open")
+    except chunked_upload.UploadError as e:
+        assert e.status == 404
+    print("   ✓ offsets, chunk and file checksums")
+
+
+class Response:
+    """requests-like view of a Flask test response"""
+
+    def __init__(self, response):
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self._response = response
+
+    def json(self):
+        return self._response.get_json()
+
+
+def test_resumable_sync():
+    """A dropped connection resumes from the server's offset; the finalized upload is merged"""
+    print("2. Testing resumable /sync upload...")
+    saved = db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER
+    db.DB_DIR = tempfile.mkdtemp()
+    db.DB_PATH = os.path.join(db.DB_DIR, "puantaj.db")
+    db.BACKUP_DIR = os.path.join(db.DB_DIR, "backups")
+    db.BACKUP_MARKER = os.path.join(db.BACKUP_DIR, "last_backup.txt")
+    saved_sleep = sync_codec.time.sleep
+    sync_codec.time.sleep = lambda seconds: None
+    try:
+        spec = importlib.util.spec_from_file_location("puantaj_server", os.path.join(APP_DIR, "server", "app.py"))
+        server = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(server)
+        server.db.DB_DIR, server.db.DB_PATH = db.DB_DIR, db.DB_PATH
+        server.db.BACKUP_DIR, server.db.BACKUP_MARKER = db.BACKUP_DIR, db.BACKUP_MARKER
+        server.SYNC_UPLOAD_CHUNK_SIZE = 4096
+        db.init_db()
+        db.add_employee("Ali", "1", "", "", "Ankara")
+        db.checkpoint()
+        upload = os.path.join(db.DB_DIR, "client.db")
+        db.create_backup(upload)
+        with open(upload, "ab") as f:
+            # Incompressible tail so the upload spans several chunks
+            f.write(os.urandom(20000))
+        state_path = upload + ".upload.json"
+        client = server.app.test_client()
+        calls = []
+        faults = {"lost_reply": 1, "down_after": None}
+
+        def request(method, url, data=None, json=None, headers=None):
+            path = url.split("://", 1)[-1].split("/", 1)[-1]
+            calls.append((method, "/" + path, (headers or {}).get("Upload-Offset")))
+            puts = sum(1 for call in calls if call[0] == "PUT")
+            if method == "PUT" and faults["down_after"] is not None and puts > faults["down_after"]:
+                raise ConnectionError("connection reset")
+            response = client.open("/" + path, method=method, data=data, json=json, headers=headers)
+            if method == "PUT" and puts == 2 and faults["lost_reply"]:
+                # Chunk stored, reply lost: the retry gets 409 with the real offset
+                faults["lost_reply"] = 0
+                raise ConnectionError("read timed out")
+            return Response(response)
+
+        headers = {"X-Region": "Ankara", "Prefer": "respond-async"}
+        faults["down_after"] = 3
+        try:
+            sync_codec.upload_resumable(request, "http://server", upload, headers=headers, state_path=state_path)
+            raise AssertionError("upload survived a dead connection")
+        except ConnectionError:
+            pass
+        session = json.load(open(state_path))
+        status = client.get(f"/sync/uploads/{session['upload_id']}").get_json()
+        assert status["offset"] == 2 * 4096 and status["size"] > status["offset"]
+
+        # Unchanged file: the kept snapshot is continued and nothing else is sent
+        calls.clear()
+        faults["down_after"] = None
+        response = sync_codec.upload_resumable(request, "http://server", upload, headers=headers,
+                                               state_path=state_path)
+        assert calls[0] == ("GET", f"/sync/uploads/{session['upload_id']}", None)
+        assert ("POST", "/sync/uploads", None) not in calls
+        assert calls[1] == ("PUT", f"/sync/uploads/{session['upload_id']}", str(2 * 4096))
+        assert not os.path.exists(state_path) and not os.path.exists(session["snapshot"])
+
+        job = response.json()
+        while response.status_code == 202:
+            response = Response(client.get(job["status_url"]))
+        assert response.status_code == 200 and response.json()["status"] == "done"
+
+        # A write between attempts: the snapshot still resumes, then the changed file follows
+        calls.clear()
+        faults["down_after"] = 3
+        try:
+            sync_codec.upload_resumable(request, "http://server", upload, headers=headers, state_path=state_path)
+            raise AssertionError("upload survived a dead connection")
+        except ConnectionError:
+            pass
+        session = json.load(open(state_path))
+        conn = sqlite3.connect(upload)
+        conn.execute("UPDATE employees SET title = 'Usta';")
+        conn.commit()
+        conn.close()
+        os.utime(upload, ns=(0, 0))
+
+        calls.clear()
+        faults["down_after"] = None
+        response = sync_codec.upload_resumable(request, "http://server", upload, headers=headers,
+                                               state_path=state_path)
+        assert calls[0] == ("GET", f"/sync/uploads/{session['upload_id']}", None)
+        assert calls[1] == ("PUT", f"/sync/uploads/{session['upload_id']}", str(3 * 4096))
+        assert calls.index(("POST", "/sync/uploads", None)) > \
+            calls.index(("POST", f"/sync/uploads/{session['upload_id']}/finalize", None))
+        assert not os.path.exists(state_path) and not os.path.exists(session["snapshot"])
+
+        job = response.json()
+        while response.status_code == 202:
+            response = Response(client.get(job["status_url"]))
+        body = response.json()
+        assert response.status_code == 200 and body["status"] == "done", body
+        # The merged upload is the changed file, not the snapshot
+        assert body["merged"]["tables"]["employees"]["updated"] == 1
+        assert not os.listdir(os.path.join(db.DB_DIR, "sync_uploads"))
+    finally:
+        sync_codec.time.sleep = saved_sleep
+        db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER = saved
+    print("   ✓ interrupted upload resumed from its snapshot and merged")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🧪 CHUNKED UPLOAD TEST")
+    print("=" * 60)
+
+    try:
+        test_sessions()
+        test_resumable_sync()
+    except Exception as e:
+        print(f"   ✗ Test error: {e}")
+        sys.exit(1)
+    print("✅ All tests passed!")
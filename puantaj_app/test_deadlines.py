@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Test the deadlines index: trigger maintenance, backfill on upgrade, SQL severity thresholds"""
+
+import sys
+import os
+import sqlite3
+import tempfile
+from datetime import date
+
+# Add parent dir to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import puantaj_db as db
+
+TODAY = date(2026, 3, 1)
+
+
+def _use_temp_db():
+    saved = db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER
+    db.DB_DIR = tempfile.mkdtemp()
+    db.DB_PATH = os.path.join(db.DB_DIR, "puantaj.db")
+    db.BACKUP_DIR = os.path.join(db.DB_DIR, "backups")
+    db.BACKUP_MARKER = os.path.join(db.BACKUP_DIR, "last_backup.txt")
+    return saved
+
+
+def test_deadline_writes():
+    """Vehicle/driver writes keep deadlines current; only rows due within the window are returned"""
+    print("1. Testing deadline maintenance...")
+    saved = _use_temp_db()
+    try:
+        db.init_db()
+        db.add_vehicle("06 ABC 01", "", "", "", 1000, "2026-02-20", "2026-03-05", "01.03.2026",
+                       None, None, None, "", "Ankara")
+        db.add_vehicle("35 XYZ 02", "", "", "", 1000, "2026-03-25", "2026-06-01", "", None, None, None, "", "Izmir")
+        db.add_driver("Ali", "B", "2026-03-31", "", "", "Ankara")
+        rows = db.list_deadlines(today=TODAY)
+        assert [(row[2], row[3], row[5], row[6]) for row in rows] == [
+            ("06 ABC 01", "inspection", -9, "expired"),
+            ("06 ABC 01", "insurance", 4, "critical"),
+            ("35 XYZ 02", "inspection", 24, "warning"),
+            ("Ali", "license", 30, "warning"),
+        ]
+        assert [row[2] for row in db.list_deadlines(region="Izmir", today=TODAY)] == ["35 XYZ 02"]
+        assert len(db.list_deadlines(120, today=TODAY)) == 5
+        assert db.list_deadlines(120, today=TODAY)[-1][6] == "upcoming"
+
+        vehicle = db.list_vehicles("Ankara")[0]
+        db.update_vehicle(vehicle[0], "06 ABC 01", "", "", "", 1000, "2026-08-20", "2026-03-05", "",
+                          None, None, None, "", "Bursa")
+        assert [(row[2], row[3], row[7]) for row in db.list_deadlines(region="Bursa", today=TODAY)] == [
+            ("06 ABC 01", "insurance", "Bursa"),
+        ]
+        db.delete_vehicle(vehicle[0])
+        db.delete_driver(db.list_drivers()[0][0])
+        assert [row[2] for row in db.list_deadlines(today=TODAY)] == ["35 XYZ 02"]
+
+        with db.get_conn() as conn:
+            plan = conn.execute(
+                "EXPLAIN QUERY PLAN SELECT * FROM deadlines d WHERE d.due_date <= ?;", ("2026-03-31",)
+            ).fetchall()
+        assert "idx_deadlines_due_date" in plan[0][3]
+    finally:
+        db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER = saved
+    print("   ✓ inserts, updates and deletes reflected")
+
+
+def test_deadline_backfill():
+    """Upgrading a v4 database indexes the dates already stored"""
+    print("2. Testing deadline backfill...")
+    saved = _use_temp_db()
+    try:
+        migrations = db.MIGRATIONS
+        db.MIGRATIONS = migrations[:4]
+        db.SCHEMA_VERSION = 4
+        try:
+            db.init_db()
+            db.add_vehicle("06 ABC 01", "", "", "", 0, "2026-03-02", None, None, None, None, None, "", "Ankara")
+            db.add_driver("Ali", "B", "2026-01-01", "", "", "Ankara")
+        finally:
+            db.MIGRATIONS = migrations
+            db.SCHEMA_VERSION = len(migrations)
+        db.close_connections()
+        conn = sqlite3.connect(db.DB_PATH)
+        assert not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'deadlines';").fetchone()
+        conn.close()
+
+        db.init_db()
+        rows = db.list_deadlines(today=TODAY)
+        assert [(row[2], row[6]) for row in rows] == [("Ali", "expired"), ("06 ABC 01", "critical")]
+    finally:
+        db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER = saved
+    print("   ✓ existing rows indexed")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🧪 DEADLINES TEST")
+    print("=" * 60)
+
+    try:
+        test_deadline_writes()
+        test_deadline_backfill()
+    except Exception as e:
+        print(f"   ✗ Test error: {e}")
+        sys.exit(1)
+    print("✅ All tests passed!")
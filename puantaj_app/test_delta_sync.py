@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""Test row-level delta sync between a client and a master puantaj_db"""
+
+import sys
+import os
+import sqlite3
+import tempfile
+import importlib.util
+
+# Add parent and server dirs to path
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, "server"))
+
+import puantaj_db as db
+
+
+def _use(path):
+    db.DB_PATH = path
+
+
+def _timesheets():
+    with db.get_conn() as conn:
+        return conn.execute(
+            "SELECT id, employee_id, work_date, start_time, end_time, notes FROM timesheets ORDER BY id;"
+        ).fetchall()
+
+
+def test_delta_round_trip():
+    """Client changes reach the master, master changes come back, nothing echoes"""
+    print("1. Testing delta push/pull...")
+    saved = db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER
+    db.DB_DIR = tempfile.mkdtemp()
+    db.BACKUP_DIR = os.path.join(db.DB_DIR, "backups")
+    db.BACKUP_MARKER = os.path.join(db.BACKUP_DIR, "last_backup.txt")
+    master = os.path.join(db.DB_DIR, "master.db")
+    client = os.path.join(db.DB_DIR, "client.db")
+    try:
+        _use(master)
+        db.init_db()
+        db.add_employee("Ali", "1", "", "", "Ankara")
+        emp_id = db.list_employees()[0][0]
+        for day in range(1, 4):
+            db.add_timesheet(emp_id, f"2026-01-{day:02d}", "09:00", "18:00", 60, 0, "", "Ankara")
+
+        # First sync is a full download
+        db.create_backup(client)
+        _use(client)
+        db.init_db()
+        push_seq, pull_seq = db.reset_sync_watermark("Ankara"), db.get_sync_watermark("Ankara")[1]
+        ids = [row[0] for row in _timesheets()]
+        db.add_timesheet(emp_id, "2026-01-05", "09:00", "18:00", 60, 0, "yeni", "Ankara")
+        db.update_timesheet(ids[0], emp_id, "2026-01-01", "08:00", "17:00", 60, 0, "erken", "Ankara")
+        db.delete_timesheet(ids[1])
+        outgoing = db.collect_sync_delta(push_seq)
+        assert len(outgoing["upserts"]["timesheets"]["rows"]) == 2
+        assert outgoing["deletes"] == {"timesheets": [ids[1]]}
+
+        _use(master)
+        db.add_employee("Veli", "2", "", "", "Izmir")
+        assert db.sync_delta_available(pull_seq)
+        counts = db.apply_sync_delta(outgoing, origin="Ankara")
+        assert counts["timesheets"] == {"upserted": 2, "deleted": 1, "skipped": 0}
+        incoming = db.collect_sync_delta(pull_seq, skip_origin="Ankara")
+        assert list(incoming["upserts"]) == ["employees"] and not incoming["deletes"]
+        with db.get_conn() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM deleted_records WHERE record_id = ?;", (ids[1],)).fetchone() == (1,)
+        master_rows = _timesheets()
+
+        _use(client)
+        db.apply_sync_delta(incoming, protect_after=outgoing["seq"])
+        db.set_sync_watermark("Ankara", push_seq=outgoing["seq"], pull_seq=incoming["seq"])
+        assert sorted(row[1] for row in db.list_employees()) == ["Ali", "Veli"]
+        assert _timesheets() == master_rows
+        # Applied rows are not logged again for the next push
+        pending = db.collect_sync_delta(outgoing["seq"])
+        assert not pending["upserts"] and not pending["deletes"]
+    finally:
+        db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER = saved
+    print("   ✓ delta applied both ways without echo")
+
+
+def test_clients_in_one_region():
+    """Two PCs of one region keep their own watermarks and get each other's changes, never their own"""
+    print("2. Testing sync clients...")
+    saved = db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER
+    db.DB_DIR = tempfile.mkdtemp()
+    db.BACKUP_DIR = os.path.join(db.DB_DIR, "backups")
+    db.BACKUP_MARKER = os.path.join(db.BACKUP_DIR, "last_backup.txt")
+    master = os.path.join(db.DB_DIR, "puantaj.db")
+    pc1 = os.path.join(db.DB_DIR, "pc1.db")
+    try:
+        _use(master)
+        spec = importlib.util.spec_from_file_location("puantaj_server", os.path.join(APP_DIR, "server", "app.py"))
+        server = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(server)
+        server.db.DB_DIR, server.db.DB_PATH = db.DB_DIR, db.DB_PATH
+        server.db.BACKUP_DIR, server.db.BACKUP_MARKER = db.BACKUP_DIR, db.BACKUP_MARKER
+        db.init_db()
+        db.add_employee("Ali", "1", "", "", "Ankara")
+        since = db.latest_change_seq()
+
+        # Both PCs start with a full sync: upload merged, then the master downloaded
+        db.create_backup(pc1)
+        for name in ("pc1", "pc2"):
+            upload = os.path.join(db.DB_DIR, f"{name}-upload.db")
+            db.create_backup(upload)
+            server._merge_upload(upload, "Ankara", "ALL", name)
+            assert db.get_sync_watermark(name) == (0, since)
+        _use(pc1)
+        db.init_db()
+        push_seq = db.reset_sync_watermark("pc1")
+        db.add_employee("Veli", "2", "", "", "Ankara")
+        outgoing = db.collect_sync_delta(push_seq)
+        _use(master)
+
+        client = server.app.test_client()
+
+        def delta(name, payload):
+            headers = {"X-Region": "Ankara", "X-Sync-Client": name}
+            return client.post("/sync/delta", json=payload, headers=headers).get_json()
+
+        sent = delta("pc1", dict(outgoing, since=since))
+        assert sent["applied"]["employees"]["upserted"] == 1 and not sent["upserts"]
+        received = delta("pc2", {"since": since})
+        assert [row[1] for row in received["upserts"]["employees"]["rows"]] == ["Veli"]
+        assert db.get_sync_watermark("pc1") == (outgoing["seq"], sent["seq"])
+        assert db.get_sync_watermark("pc2") == (0, received["seq"])
+        assert not db.sync_delta_available(0)
+
+        # Rows merged from a full upload carry the uploader too
+        upload = os.path.join(db.DB_DIR, "upload.db")
+        db.create_backup(upload)
+        conn = sqlite3.connect(upload)
+        conn.execute("UPDATE employees SET title = 'Usta' WHERE full_name = 'Ali';")
+        conn.commit()
+        conn.close()
+        before = db.latest_change_seq()
+        assert server._merge_upload(upload, "Ankara", "ALL", "pc2")["merged"]["tables"]["employees"]["updated"] == 1
+        assert not db.collect_sync_delta(before, skip_origin="pc2")["upserts"]
+        assert list(db.collect_sync_delta(before, skip_origin="pc1")["upserts"]) == ["employees"]
+    finally:
+        db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER = saved
+    print("   ✓ per-client watermarks, own changes filtered")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🧪 DELTA SYNC TEST")
+    print("=" * 60)
+
+    try:
+        test_delta_round_trip()
+        test_clients_in_one_region()
+    except Exception as e:
+        print(f"   ✗ Test error: {e}")
+        sys.exit(1)
+    print("✅ All tests passed!")
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Test connection reuse, retries and per-endpoint timeouts in http_transport"""
+
+import sys
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add parent dir to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import http_transport
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = set()
+    failures = {"/flaky": 2}
+    calls = []
+
+    def _reply(self, status, body=b"{}"):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        Handler.connections.add(self.client_address)
+        Handler.calls.append(("GET", self.path))
+        if Handler.failures.get(self.path):
+            Handler.failures[self.path] -= 1
+            self._reply(503)
+            return
+        self._reply(200)
+
+    def do_POST(self):
+        Handler.calls.append(("POST", self.path))
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self._reply(503)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_transport():
+    """Calls share one keep-alive connection; idempotent calls retry 503, POST does not"""
+    print("1. Testing pooled transport...")
+    assert http_transport.timeout_for("https://host/sync/delta") == http_transport.TIMEOUTS["/sync/delta"]
+    assert http_transport.timeout_for("https://host/api/sync/push") == http_transport.TIMEOUTS["/api/sync/"]
+    assert http_transport.timeout_for("https://host/other") == http_transport.DEFAULT_TIMEOUT
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    timings = []
+
+    def hook(method, url, status, seconds):
+        timings.append((method, status))
+
+    http_transport.add_timing_hook(hook)
+    http_transport.RETRY_BACKOFF_FACTOR, saved_backoff = 0, http_transport.RETRY_BACKOFF_FACTOR
+    http_transport.close()
+    try:
+        for _ in range(5):
+            assert http_transport.get(base + "/health").status_code == 200
+        assert len(Handler.connections) == 1
+
+        assert http_transport.get(base + "/flaky").status_code == 200
+        assert Handler.calls.count(("GET", "/flaky")) == 3
+        assert http_transport.post(base + "/sync", data=b"x").status_code == 503
+        assert Handler.calls.count(("POST", "/sync")) == 1
+        assert ("GET", 200) in timings and ("POST", 503) in timings
+    finally:
+        http_transport.RETRY_BACKOFF_FACTOR = saved_backoff
+        http_transport.remove_timing_hook(hook)
+        http_transport.close()
+        server.shutdown()
+    print(f"   ✓ {len(Handler.calls)} calls over {len(Handler.connections)} connection(s)")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🧪 HTTP TRANSPORT TEST")
+    print("=" * 60)
+
+    try:
+        test_transport()
+    except Exception as e:
+        print(f"   ✗ Test error: {e}")
+        sys.exit(1)
+    print("✅ All tests passed!")
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""Test the /sync merge job queue: 202 + polling, per-client coalescing, restart recovery"""
+
+import sys
+import os
+import time
+import tempfile
+import threading
+import importlib.util
+
+# Add parent and server dirs to path
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, "server"))
+
+import puantaj_db as db
+import merge_queue
+
+
+def save_upload(queue, job_id):
+    with open(queue.upload_path(job_id), "wb") as f:
+        f.write(b"upload")
+
+
+def test_coalesce_and_recover():
+    """Queued uploads of one client merge once (newest file); jobs survive a restart"""
+    print("1. Testing coalescing and recovery...")
+    work_dir = tempfile.mkdtemp()
+    merged = []
+    release = threading.Event()
+
+    def merge(path, region, scope, client):
+        # Other writers (delta pushes) wait on the same lock
+        assert queue.write_lock.locked()
+        release.wait(5)
+        merged.append((os.path.basename(path), region, client))
+        return {"merged": {"tables": {}}}
+
+    # Jobs queued while nothing runs are picked up by the next process
+    queue = merge_queue.MergeQueue(work_dir, merge)
+    first = queue.new_job_id()
+    save_upload(queue, first)
+    queue.enqueue(first, "Ankara")
+    queue = merge_queue.MergeQueue(work_dir, merge)
+    queue.start()
+    wait_until = time.monotonic() + 5
+    while queue.get(first)["status"] != merge_queue.RUNNING:
+        assert time.monotonic() < wait_until
+        time.sleep(0.01)
+
+    later = []
+    # Two PCs in Ankara: each one's uploads coalesce, neither replaces the other's
+    for region, client in (("Ankara", "pc1"), ("Izmir", None), ("Ankara", "pc1"), ("Ankara", "pc2")):
+        job_id = queue.new_job_id()
+        save_upload(queue, job_id)
+        later.append(queue.enqueue(job_id, region, client=client)["job_id"])
+    assert queue.get(later[2])["position"] == 2
+    release.set()
+    for job_id in [first] + later:
+        assert queue.wait(job_id, 5)["status"] == merge_queue.DONE
+    assert merged == [
+        (f"{first}.db", "Ankara", "Ankara"), (f"{later[2]}.db", "Ankara", "pc1"),
+        (f"{later[1]}.db", "Izmir", "Izmir"), (f"{later[3]}.db", "Ankara", "pc2"),
+    ]
+    assert queue.get(later[0])["coalesced_into"] == later[2]
+    assert queue.get(later[0])["result"] == {"merged": {"tables": {}}}
+    assert not [name for name in os.listdir(work_dir) if name != "merge_jobs.db"]
+    print("   ✓ 5 uploads, 4 merges")
+
+
+def test_sync_endpoint():
+    """/sync answers 202 with a job to poll; clients that do not opt in wait; delta pushes share the writer"""
+    print("2. Testing /sync job endpoints...")
+    saved = db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER
+    db.DB_DIR = tempfile.mkdtemp()
+    db.DB_PATH = os.path.join(db.DB_DIR, "puantaj.db")
+    db.BACKUP_DIR = os.path.join(db.DB_DIR, "backups")
+    db.BACKUP_MARKER = os.path.join(db.BACKUP_DIR, "last_backup.txt")
+    try:
+        spec = importlib.util.spec_from_file_location("puantaj_server", os.path.join(APP_DIR, "server", "app.py"))
+        server = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(server)
+        server.db.DB_DIR, server.db.DB_PATH = db.DB_DIR, db.DB_PATH
+        server.db.BACKUP_DIR, server.db.BACKUP_MARKER = db.BACKUP_DIR, db.BACKUP_MARKER
+        db.init_db()
+        db.add_employee("Ali", "1", "", "", "Ankara")
+        db.checkpoint()
+        upload = os.path.join(db.DB_DIR, "client.db")
+        db.create_backup(upload)
+        client = server.app.test_client()
+
+        def post(headers):
+            with open(upload, "rb") as f:
+                return client.post("/sync", data=f.read(), headers={
+                    "Content-Type": "application/octet-stream", "X-Region": "Ankara", **headers
+                })
+
+        response = post({"Prefer": "respond-async"})
+        assert response.status_code in (200, 202)
+        job = response.get_json()
+        assert job["status_url"] == f"/sync/jobs/{job['job_id']}"
+        deadline = time.monotonic() + 10
+        while response.status_code == 202:
+            assert time.monotonic() < deadline and response.headers["Location"] == job["status_url"]
+            time.sleep(0.05)
+            response = client.get(job["status_url"])
+        body = response.get_json()
+        assert response.status_code == 200 and body["status"] == "done"
+        assert body["merged"]["tables"]["employees"]["unchanged"] == 1
+        # Hours are re-materialized inside the merge job, not on a detached thread
+        assert body["hours_recomputed"] == 0
+
+        response = post({})
+        assert response.status_code == 200 and response.get_json()["action"] == "sync_upload_merged"
+
+        # Delta pushes write through the same lock as the merge worker
+        payload = dict(db.collect_sync_delta(0), since=0)
+        replies = []
+        with server.merge_jobs().write_lock:
+            pusher = threading.Thread(target=lambda: replies.append(
+                client.post("/sync/delta", json=payload, headers={"X-Region": "Ankara"})
+            ))
+            pusher.start()
+            pusher.join(0.3)
+            assert not replies
+        pusher.join(5)
+        assert replies[0].status_code == 200 and "hours_recomputed" in replies[0].get_json()
+        assert client.get("/sync/jobs/unknown").status_code == 404
+    finally:
+        db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER = saved
+    print("   ✓ 202 -> poll -> 200")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🧪 MERGE QUEUE TEST")
+    print("=" * 60)
+
+    try:
+        test_coalesce_and_recover()
+        test_sync_endpoint()
+    except Exception as e:
+        print(f"   ✗ Test error: {e}")
+        sys.exit(1)
+    print("✅ All tests passed!")
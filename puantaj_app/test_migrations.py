@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Test PRAGMA user_version migrations in puantaj_db"""
+
+import sys
+import os
+import sqlite3
+import tempfile
+
+# Add parent dir to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import puantaj_db as db
+
+
+def test_migrations():
+    """Unversioned DB is upgraded once; a current DB runs no DDL"""
+    print("1. Testing schema migrations...")
+    saved = db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER
+    db.DB_DIR = tempfile.mkdtemp()
+    db.DB_PATH = os.path.join(db.DB_DIR, "puantaj.db")
+    db.BACKUP_DIR = os.path.join(db.DB_DIR, "backups")
+    db.BACKUP_MARKER = os.path.join(db.BACKUP_DIR, "last_backup.txt")
+    try:
+        # Pre-versioning database without region / computed hour columns
+        conn = sqlite3.connect(db.DB_PATH)
+        conn.execute("CREATE TABLE timesheets (id INTEGER PRIMARY KEY AUTOINCREMENT, employee_id INTEGER NOT NULL, "
+                     "work_date TEXT NOT NULL, start_time TEXT NOT NULL, end_time TEXT NOT NULL, "
+                     "break_minutes INTEGER NOT NULL DEFAULT 0, is_special INTEGER NOT NULL DEFAULT 0, notes TEXT);")
+        conn.commit()
+        conn.close()
+
+        db.init_db()
+        with db.get_conn() as conn:
+            assert conn.execute("PRAGMA user_version;").fetchone()[0] == db.SCHEMA_VERSION
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(timesheets);")}
+            assert {"region", "hours_version"} <= columns
+            indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index';")}
+            assert {name for name, _ in db.SCHEMA_INDEXES} <= indexes
+
+        db.close_connections()
+        statements = []
+        original_connect = sqlite3.connect
+
+        def traced_connect(*args, **kwargs):
+            conn = original_connect(*args, **kwargs)
+            conn.set_trace_callback(statements.append)
+            return conn
+
+        sqlite3.connect = traced_connect
+        try:
+            db.init_db()
+        finally:
+            sqlite3.connect = original_connect
+        assert statements
+        assert not [sql for sql in statements if sql.lstrip().upper().startswith(("CREATE", "ALTER"))]
+    finally:
+        db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER = saved
+    print(f"   ✓ schema v{db.SCHEMA_VERSION}, no DDL on second init")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🧪 MIGRATION TEST")
+    print("=" * 60)
+
+    try:
+        test_migrations()
+    except Exception as e:
+        print(f"   ✗ Test error: {e}")
+        sys.exit(1)
+    print("✅ All tests passed!")
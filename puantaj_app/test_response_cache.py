@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Test the read API response cache: generation keys, ETag/304, size bound"""
+
+import sys
+import os
+import tempfile
+import importlib.util
+
+# Add parent and server dirs to path
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, "server"))
+
+import puantaj_db as db
+import response_cache
+
+
+def test_cache_entries():
+    """Entries miss under another generation; bumps drop everything; LRU keeps the size bound"""
+    print("1. Testing cache entries...")
+    data = {"generation": "a"}
+    cache = response_cache.ResponseCache(lambda: data["generation"], max_bytes=10)
+    generation = cache.generation()
+    body, etag = cache.put("k1", generation, b"1234")
+    assert cache.get("k1", generation) == (body, etag)
+    data["generation"] = "b"
+    assert cache.get("k1", cache.generation()) is None
+
+    generation = cache.generation()
+    cache.bump()
+    # Built before the bump: not stored
+    cache.put("k1", generation, b"1234")
+    assert cache.stats()["entries"] == 0
+
+    generation = cache.generation()
+    for key in ("k1", "k2", "k3"):
+        cache.put(key, generation, b"1234")
+    assert cache.stats() == {"entries": 2, "bytes": 8}
+    assert cache.get("k1", generation) is None and cache.get("k3", generation)
+    cache.put("big", generation, b"x" * 11)
+    assert cache.get("big", generation) is None and cache.stats()["entries"] == 2
+    print("   ✓ generation keys and size bound")
+
+
+def test_api_revalidation():
+    """Repeated reads revalidate to 304 until a write changes the data"""
+    print("2. Testing ETag revalidation...")
+    saved = db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER
+    db.DB_DIR = tempfile.mkdtemp()
+    db.DB_PATH = os.path.join(db.DB_DIR, "puantaj.db")
+    db.BACKUP_DIR = os.path.join(db.DB_DIR, "backups")
+    db.BACKUP_MARKER = os.path.join(db.BACKUP_DIR, "last_backup.txt")
+    try:
+        spec = importlib.util.spec_from_file_location("puantaj_server", os.path.join(APP_DIR, "server", "app.py"))
+        server = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(server)
+        server.db.DB_DIR, server.db.DB_PATH = db.DB_DIR, db.DB_PATH
+        server.db.BACKUP_DIR, server.db.BACKUP_MARKER = db.BACKUP_DIR, db.BACKUP_MARKER
+        db.init_db()
+        db.add_vehicle("06 ABC 01", "", "", "", 0, None, None, None, None, None, None, "", "Ankara")
+        client = server.app.test_client()
+        assert client.get("/api/vehicles").status_code == 302
+
+        with client.session_transaction() as s:
+            s["user_id"] = "ankara1"
+        views = []
+        list_vehicles = db.list_vehicles
+        db.list_vehicles = lambda region=None: views.append(region) or list_vehicles(region)
+        try:
+            first = client.get("/api/vehicles")
+            etag = first.headers["ETag"]
+            assert first.status_code == 200 and len(first.get_json()) == 1
+            again = client.get("/api/vehicles", headers={"If-None-Match": etag})
+            assert again.status_code == 304 and again.data == b""
+            assert client.get("/api/vehicles").data == first.data
+            assert views == ["Ankara"]
+
+            db.add_vehicle("06 ABC 02", "", "", "", 0, None, None, None, None, None, None, "", "Ankara")
+            changed = client.get("/api/vehicles", headers={"If-None-Match": etag})
+            assert changed.status_code == 200 and len(changed.get_json()) == 2
+            assert changed.headers["ETag"] != etag and views == ["Ankara", "Ankara"]
+
+            # Other regions and query args are separate entries
+            with client.session_transaction() as s:
+                s["user_id"] = "izmir1"
+            assert client.get("/api/vehicles").get_json() == []
+            assert client.get("/api/vehicles?x=1").get_json() == []
+            assert views == ["Ankara", "Ankara", "Izmir", "Izmir"]
+
+            server.api_cache.bump()
+            client.get("/api/vehicles")
+            assert len(views) == 5
+        finally:
+            db.list_vehicles = list_vehicles
+    finally:
+        db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER = saved
+    print("   ✓ 200 -> 304 -> 200 after a write")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🧪 RESPONSE CACHE TEST")
+    print("=" * 60)
+
+    try:
+        test_cache_entries()
+        test_api_revalidation()
+    except Exception as e:
+        print(f"   ✗ Test error: {e}")
+        sys.exit(1)
+    print("✅ All tests passed!")
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Test gzip/zstd negotiation and streaming decode in sync_codec"""
+
+import sys
+import os
+import io
+import json
+import tempfile
+
+# Add parent dir to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import sync_codec
+
+
+def test_negotiation():
+    """Accept-Encoding picks the best supported coding; q=0 and unknown codings are skipped"""
+    print("1. Testing encoding negotiation...")
+    assert sync_codec.choose_encoding("gzip, deflate") == "gzip"
+    assert sync_codec.choose_encoding("br, gzip;q=0") is None
+    assert sync_codec.choose_encoding("") is None
+    assert sync_codec.choose_encoding("*") == sync_codec.supported_encodings()[0]
+    print(f"   ✓ supported: {sync_codec.accept_encoding_header()}")
+
+
+def test_stream_round_trip():
+    """Files compress and decode in chunks; corrupt, truncated and oversized bodies are rejected"""
+    print("2. Testing streaming round trip...")
+    work_dir = tempfile.mkdtemp()
+    source = os.path.join(work_dir, "puantaj.db")
+    data = b"SQLite format 3\x00" + os.urandom(64) * 40000
+    with open(source, "wb") as f:
+        f.write(data)
+
+    for encoding in sync_codec.supported_encodings():
+        encoded = sync_codec.encoded_copy(source, encoding)
+        assert encoded == f"{source}.{encoding}" and os.path.getsize(encoded) < len(data) // 10
+        target = os.path.join(work_dir, f"decoded.{encoding}")
+        assert sync_codec.decode_file(encoded, target, encoding) == len(data)
+        with open(target, "rb") as f:
+            assert f.read() == data
+
+    target = os.path.join(work_dir, "bad.db")
+    # Highly compressible: a few KB that would expand past the limit
+    bomb = b"\0" * (64 * sync_codec.CHUNK_SIZE)
+    for encoding in sync_codec.supported_encodings():
+        body = sync_codec.encode_bytes(data, encoding)
+        cases = (
+            (body[:-20], None), (body[:len(body) // 2], None), (b"not " + encoding.encode(), None),
+            (body, 1000), (sync_codec.encode_bytes(bomb, encoding), 2 * sync_codec.CHUNK_SIZE),
+        )
+        for stream, limit in cases:
+            try:
+                sync_codec.decode_stream(io.BytesIO(stream), target, encoding,
+                                         limit=limit or sync_codec.MAX_DECODED_SIZE)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(f"decode_stream should reject the {encoding} body")
+            assert not os.path.exists(target)
+            try:
+                sync_codec.decode_bytes(stream, encoding, limit=limit or sync_codec.MAX_DECODED_SIZE)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(f"decode_bytes should reject the {encoding} body")
+    body = sync_codec.encode_bytes(data, "gzip")
+    try:
+        sync_codec.decode_bytes(b"x", "br")
+    except sync_codec.UnsupportedEncoding:
+        pass
+    else:
+        raise AssertionError("decode_bytes should reject unknown encodings")
+    print(f"   ✓ {len(data)} bytes -> {len(body)} gzip")
+
+
+def test_json_middleware():
+    """Encoded JSON request bodies reach the app decoded; unknown encodings get 415"""
+    print("3. Testing JSON request middleware...")
+    seen = {}
+
+    def app(environ, start_response):
+        seen["body"] = environ["wsgi.input"].read(int(environ["CONTENT_LENGTH"]))
+        seen["encoding"] = environ.get("HTTP_CONTENT_ENCODING")
+        start_response("200 OK", [])
+        return [b""]
+
+    statuses = []
+    middleware = sync_codec.DecodedJSONRequests(app)
+    payload = {"since": 0, "rows": ["x" * 50] * 100}
+    body, headers = sync_codec.encode_json(payload, "gzip")
+    assert headers["Content-Encoding"] == "gzip"
+    environ = {
+        "CONTENT_TYPE": headers["Content-Type"],
+        "CONTENT_LENGTH": str(len(body)),
+        "HTTP_CONTENT_ENCODING": "gzip",
+        "wsgi.input": io.BytesIO(body),
+    }
+    middleware(environ, lambda status, response_headers: statuses.append(status))
+    assert json.loads(seen["body"]) == payload and seen["encoding"] is None
+
+    environ.update({"HTTP_CONTENT_ENCODING": "br", "wsgi.input": io.BytesIO(body)})
+    middleware(environ, lambda status, response_headers: statuses.append((status, dict(response_headers))))
+    assert statuses[0] == "200 OK"
+    assert statuses[1][0].startswith("415") and "gzip" in statuses[1][1]["Accept-Encoding"]
+    # Small bodies are not worth compressing
+    assert "Content-Encoding" not in sync_codec.encode_json({"since": 0}, "gzip")[1]
+    print("   ✓ decoded before the app, 415 for unknown codings")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🧪 SYNC CODEC TEST")
+    print("=" * 60)
+
+    try:
+        test_negotiation()
+        test_stream_round_trip()
+        test_json_middleware()
+    except Exception as e:
+        print(f"   ✗ Test error: {e}")
+        sys.exit(1)
+    print("✅ All tests passed!")
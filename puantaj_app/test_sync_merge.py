@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Test the set-based puantaj_db.merge_databases engine"""
+
+import sys
+import os
+import sqlite3
+import tempfile
+
+# Add parent dir to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import puantaj_db as db
+
+
+def _rollups():
+    with db.get_conn() as conn:
+        return conn.execute("SELECT * FROM timesheet_rollups ORDER BY employee_id, region, year_month;").fetchall()
+
+
+def test_merge_counts():
+    """Tombstones, exclusions, upserts and identical rows are counted per table"""
+    print("1. Testing set-based merge...")
+    saved = db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER
+    db.DB_DIR = tempfile.mkdtemp()
+    db.BACKUP_DIR = os.path.join(db.DB_DIR, "backups")
+    db.BACKUP_MARKER = os.path.join(db.BACKUP_DIR, "last_backup.txt")
+    master = os.path.join(db.DB_DIR, "master.db")
+    incoming = os.path.join(db.DB_DIR, "incoming.db")
+    try:
+        db.DB_PATH = master
+        db.init_db()
+        db.add_employee("Ali", "1", "", "", "Ankara")
+        emp_id = db.list_employees()[0][0]
+        for day in range(1, 5):
+            db.add_timesheet(emp_id, f"2026-01-{day:02d}", "09:00", "18:00", 60, 0, "", "Ankara")
+        db.replace_stock_bulk("Ankara", [("K1", "Urun", "S1", "OK", "2026-01-01", "system", 1),
+                                         ("K2", "Urun", "S2", "OK", "2026-01-01", "system", 1)])
+        ids = [row[0] for row in db.list_timesheets()]
+        db.create_backup(incoming)
+
+        # Master deletes one row; the region still has it
+        db.delete_timesheet(ids[0])
+        # Region edits one row, deletes one, adds one and drops a stock item
+        db.DB_PATH = incoming
+        db.update_timesheet(ids[1], emp_id, "2026-01-03", "08:00", "20:00", 60, 0, "uzun", "Ankara")
+        db.delete_timesheet(ids[2])
+        db.add_timesheet(emp_id, "2026-01-10", "09:00", "18:00", 60, 0, "", "Ankara")
+        db.replace_stock_bulk("Ankara", [("K1", "Urun", "S1", "OK", "2026-01-01", "system", 1)])
+        db.checkpoint()
+        db.close_connections()
+
+        db.DB_PATH = master
+        seq = db.latest_change_seq()
+        result = db.merge_databases(incoming, replace_tables=("stock_inventory",))
+        assert result["tombstones"] == 1
+        assert result["tables"]["timesheets"] == {
+            "inserted": 1, "updated": 1, "unchanged": 1, "excluded": 1, "deleted": 1,
+        }
+        assert result["tables"]["employees"]["unchanged"] == 1
+        with db.get_conn() as conn:
+            assert conn.execute("SELECT seri_no FROM stock_inventory;").fetchall() == [("S1",)]
+            tombstones = conn.execute("SELECT COUNT(*) FROM deleted_records WHERE table_name = 'timesheets';").fetchone()
+        assert tombstones == (2,)
+        assert sorted(row[0] for row in db.list_timesheets()) == sorted([ids[1], ids[3], max(ids) + 1])
+        # Only rows that actually changed are journaled
+        assert {(row[1], row[2]) for row in db.list_changes(seq)} == {
+            ("timesheets", ids[1]), ("timesheets", ids[2]), ("timesheets", max(ids) + 1),
+            # replace_stock_bulk re-inserted S1 under a new id in the region
+            ("stock_inventory", 1), ("stock_inventory", 2), ("stock_inventory", 3),
+        }
+        maintained = _rollups()
+        db.rebuild_timesheet_rollups()
+        assert maintained == _rollups()
+
+        # Merging the same file again changes nothing
+        again = db.merge_databases(incoming, replace_tables=("stock_inventory",))
+        assert again["tombstones"] == 0 and again["tables"]["timesheets"]["inserted"] == 0
+        assert again["tables"]["timesheets"]["updated"] == 0
+    finally:
+        db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER = saved
+    print(f"   ✓ {result['tables']['timesheets']}")
+
+
+def test_merge_old_schema():
+    """Incoming files from older schemas merge on their shared columns"""
+    print("2. Testing merge from an old schema...")
+    saved = db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER
+    db.DB_DIR = tempfile.mkdtemp()
+    db.DB_PATH = os.path.join(db.DB_DIR, "master.db")
+    db.BACKUP_DIR = os.path.join(db.DB_DIR, "backups")
+    db.BACKUP_MARKER = os.path.join(db.BACKUP_DIR, "last_backup.txt")
+    incoming = os.path.join(db.DB_DIR, "old.db")
+    try:
+        db.init_db()
+        conn = sqlite3.connect(incoming)
+        conn.execute("CREATE TABLE employees (id INTEGER PRIMARY KEY, full_name TEXT NOT NULL, identity_no TEXT);")
+        conn.execute("INSERT INTO employees VALUES (5, 'Eski', '9');")
+        conn.commit()
+        conn.close()
+        result = db.merge_databases(incoming)
+        assert result == {"tombstones": 0, "tables": {"employees": {
+            "inserted": 1, "updated": 0, "unchanged": 0, "excluded": 0, "deleted": 0,
+        }}}
+        assert db.list_employees()[0][:3] == (5, "Eski", "9")
+    finally:
+        db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER = saved
+    print("   ✓ shared columns merged")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🧪 SYNC MERGE TEST")
+    print("=" * 60)
+
+    try:
+        test_merge_counts()
+        test_merge_old_schema()
+    except Exception as e:
+        print(f"   ✗ Test error: {e}")
+        sys.exit(1)
+    print("✅ All tests passed!")
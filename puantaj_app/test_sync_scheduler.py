@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Test trigger coalescing, debounce and backoff in sync_scheduler"""
+
+import sys
+import os
+import time
+import threading
+
+# Add parent dir to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import sync_scheduler
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_coalesce_and_debounce():
+    """A burst of write triggers becomes one run after the debounce; manual runs at once"""
+    print("1. Testing coalescing and debounce...")
+    runs = []
+    scheduler = sync_scheduler.SyncScheduler(runs.append, debounce=0.2, max_debounce=1.0)
+    scheduler.start()
+    try:
+        started = time.monotonic()
+        for reason in ("employee", "timesheet", "employee", "vehicle"):
+            scheduler.trigger(reason)
+            time.sleep(0.05)
+        wait_for(lambda: runs)
+        assert time.monotonic() - started >= 0.35
+        assert runs == [["employee", "timesheet", "vehicle"]]
+        wait_for(lambda: scheduler.state()["state"] == sync_scheduler.IDLE)
+        assert scheduler.state()["last_duration"] is not None
+
+        scheduler.trigger("timesheet")
+        scheduler.trigger("manual", immediate=True)
+        wait_for(lambda: len(runs) == 2)
+        assert runs[1] == ["timesheet", "manual"]
+    finally:
+        scheduler.stop(timeout=2)
+    assert scheduler.state()["state"] == sync_scheduler.STOPPED
+    print("   ✓ one run per burst")
+
+
+def test_backoff():
+    """Failed runs retry with growing, jittered delays and keep their reasons"""
+    print("2. Testing backoff...")
+    attempts = []
+    states = []
+    done = threading.Event()
+
+    def run(reasons):
+        attempts.append((time.monotonic(), list(reasons)))
+        if len(attempts) < 3:
+            raise RuntimeError("HTTP 503")
+        done.set()
+
+    scheduler = sync_scheduler.SyncScheduler(run, states.append, debounce=0.05, backoff_base=0.2, backoff_max=1.0)
+    scheduler.start()
+    try:
+        scheduler.trigger("employee")
+        assert done.wait(5)
+        gaps = [attempts[i + 1][0] - attempts[i][0] for i in range(2)]
+        # base 0.2 then 0.4, each jittered down to half at most
+        assert 0.1 <= gaps[0] < 0.35 and 0.2 <= gaps[1] < 0.6
+        assert all(reasons == ["employee"] for _, reasons in attempts)
+        assert any(state["state"] == sync_scheduler.BACKOFF and state["failures"] == 2 for state in states)
+        wait_for(lambda: scheduler.state()["failures"] == 0)
+        assert scheduler.state()["last_error"] is None
+    finally:
+        scheduler.stop(timeout=2)
+    print(f"   ✓ retries after {gaps[0]:.2f}s, {gaps[1]:.2f}s")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🧪 SYNC SCHEDULER TEST")
+    print("=" * 60)
+
+    try:
+        test_coalesce_and_debounce()
+        test_backoff()
+    except Exception as e:
+        print(f"   ✗ Test error: {e}")
+        sys.exit(1)
+    print("✅ All tests passed!")
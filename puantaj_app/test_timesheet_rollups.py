@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""Test trigger-maintained timesheet_rollups against a full rebuild"""
+
+import sys
+import os
+import random
+import tempfile
+import importlib.util
+from datetime import date
+
+# Add parent dir to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import puantaj_db as db
+import calc
+
+
+def _use_temp_db():
+    saved = db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER
+    db.DB_DIR = tempfile.mkdtemp()
+    db.DB_PATH = os.path.join(db.DB_DIR, "puantaj.db")
+    db.BACKUP_DIR = os.path.join(db.DB_DIR, "backups")
+    db.BACKUP_MARKER = os.path.join(db.BACKUP_DIR, "last_backup.txt")
+    return saved
+
+
+def _rollup_rows():
+    with db.get_conn() as conn:
+        rows = conn.execute("SELECT * FROM timesheet_rollups ORDER BY employee_id, region, year_month;").fetchall()
+    return [row[:3] + tuple(round(value, 6) for value in row[3:-2]) + row[-2:] for row in rows]
+
+
+def test_rollups_match_rebuild():
+    """Random add/update/delete/replace keeps rollups equal to a GROUP BY rebuild"""
+    print("1. Testing rollups after random writes...")
+    saved = _use_temp_db()
+    try:
+        db.init_db()
+        for i in range(3):
+            db.add_employee(f"Test {i}", str(i), "", "", "Ankara")
+        employees = [row[0] for row in db.list_employees()]
+        rng = random.Random(3)
+
+        def rand_time():
+            return f"{rng.randint(0, 23):02d}:{rng.choice(['00', '30'])}"
+
+        for step in range(300):
+            ids = [row[0] for row in db.list_timesheets()]
+            args = (rng.choice(employees), f"2026-{rng.randint(1, 2):02d}-{rng.randint(1, 4):02d}",
+                    rand_time(), rand_time(), rng.choice([0, 60]), rng.choice([0, 1]), "",
+                    rng.choice(["Ankara", "Izmir", None]))
+            action = rng.random()
+            if action < 0.5 or not ids:
+                db.add_timesheet(*args)
+            elif action < 0.8:
+                db.update_timesheet(rng.choice(ids), *args)
+            elif action < 0.9:
+                db.delete_timesheet(rng.choice(ids))
+            else:
+                with db.get_conn() as conn:
+                    row = conn.execute("SELECT * FROM timesheets WHERE id = ?;", (rng.choice(ids),)).fetchone()
+                    conn.execute(f"INSERT OR REPLACE INTO timesheets VALUES ({', '.join('?' * len(row))});",
+                                 row[:4] + ("23:00",) + row[5:])
+            if step == 150:
+                db.set_setting("weekday_hours", "7.5")
+                db.recompute_stale_timesheets()
+
+        maintained = _rollup_rows()
+        db.rebuild_timesheet_rollups()
+        assert maintained == _rollup_rows()
+        assert sum(row[-2] for row in db.list_timesheet_rollups()) == len(db.list_timesheets())
+    finally:
+        db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER = saved
+    print(f"   ✓ {len(maintained)} rollup rows match rebuild")
+
+
+def test_employee_overtime():
+    """Rollup and grouped overtime totals match per-row calc, stale rows included, within period and region"""
+    print("2. Testing employee overtime totals...")
+    saved = _use_temp_db()
+    try:
+        db.init_db()
+        db.add_employee("Ali", "1", "", "", "Ankara")
+        db.add_employee("Veli", "2", "", "", "Izmir")
+        db.add_employee("Bos", "3", "", "", "Ankara")
+        ali, veli = [row[0] for row in db.list_employees()][:2]
+        for employee_id, work_date, end in ((ali, "2026-03-02", "20:00"), (ali, "2026-03-31", "19:30"),
+                                            (ali, "2026-04-01", "21:00"), (veli, "2026-03-05", "22:00")):
+            db.add_timesheet(employee_id, work_date, "08:00", end, 60, 0, "", "Ankara")
+        # Rules changed without recompute: materialized hours of every row are stale
+        db.set_setting("weekday_hours", "7.5")
+        db.add_timesheet(ali, "2026-03-10", "08:00", "23:00", 60, 0, "", "Ankara")
+
+        rules = calc.get_rules(db.get_all_settings())
+
+        def expected(employee_id, start_date, end_date):
+            rows = db.list_timesheets(employee_id=employee_id, start_date=start_date, end_date=end_date)
+            hours = calc.calc_timesheet_rows(rows, rules, skip_invalid=True)
+            return round(sum(row_hours[2] for row_hours in hours if row_hours is not None), 6)
+
+        totals = {row[0]: row for row in db.list_employee_overtime("2026-03-01", "2026-03-31")}
+        assert len(totals) == 3 and totals[ali][1] == "Ali" and totals[ali][5] == "Ankara"
+        for employee_id in (ali, veli):
+            assert round(totals[employee_id][6], 6) == expected(employee_id, "2026-03-01", "2026-03-31")
+        assert totals[ali][6] > 0 and [row[6] for row in totals.values()].count(0) == 1
+
+        ankara = db.list_employee_overtime(month="04", region="Ankara")
+        assert [row[1] for row in ankara] == ["Ali", "Bos"]
+        assert round(ankara[0][6], 6) == expected(ali, "2026-04-01", "2026-04-30") > 0
+
+        # Whole months read the rollups; a range cutting a month falls back to timesheets
+        statements = []
+        with db.get_read_conn() as conn:
+            conn.set_trace_callback(statements.append)
+            try:
+                db.list_employee_overtime("2026-04-01", "2026-04-31")
+                assert any("LEFT JOIN timesheet_rollups" in sql for sql in statements)
+                statements.clear()
+                partial = {row[0]: row[6] for row in db.list_employee_overtime("2026-03-02", "2026-03-30")}
+                assert not any("timesheet_rollups" in sql for sql in statements)
+            finally:
+                conn.set_trace_callback(None)
+        assert round(partial[ali], 6) == expected(ali, "2026-03-02", "2026-03-30")
+    finally:
+        db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER = saved
+    print("   ✓ grouped totals match per-row calc")
+
+
+def test_dashboard_summary():
+    """Summary KPIs and series match the rollups; cached until the next write"""
+    print("3. Testing dashboard summary...")
+    saved = _use_temp_db()
+    try:
+        db.init_db()
+        db.add_employee("Ali", "1", "Depo", "", "Ankara")
+        db.add_employee("Veli", "2", "", "", "Izmir")
+        ali, veli = [row[0] for row in db.list_employees()]
+        for employee_id, work_date, region in ((ali, "2026-10-12", "Ankara"), (ali, "2026-10-13", "Ankara"),
+                                               (veli, "2026-10-14", "Izmir"), (veli, "2026-08-03", "Izmir")):
+            db.add_timesheet(employee_id, work_date, "08:00", "21:00", 60, 0, "", region)
+        today = date(2026, 10, 17)
+
+        summary = db.dashboard_summary(today=today)
+        rollups = db.list_timesheet_rollups(year_month="2026-10")
+        assert summary["kpis"]["employees"] == 2 and summary["kpis"]["timesheets"] == 4
+        assert summary["kpis"]["overtime_hours"] == round(sum(row[7] for row in rollups), 2) > 0
+        assert summary["kpis"]["top_overtime"]["name"] == "Ali"
+        assert [row["bucket"] for row in summary["series"]["monthly"]] == ["2026-08", "2026-10"]
+        assert [row["bucket"] for row in summary["series"]["daily"]] == ["2026-10-12", "2026-10-13", "2026-10-14"]
+        weekly = summary["series"]["overtime"]["weekly"]["region"]
+        assert {(row["bucket"], row["key"]) for row in weekly} == {
+            ("2026-08-03", "Izmir"), ("2026-10-12", "Ankara"), ("2026-10-12", "Izmir"),
+        }
+        assert db.dashboard_summary(today=today) is summary
+
+        izmir = db.dashboard_summary(region="Izmir", today=today)
+        assert izmir["kpis"]["employees"] == 1 and izmir["kpis"]["top_overtime"]["name"] == "Veli"
+
+        db.add_timesheet(veli, "2026-10-15", "08:00", "21:00", 60, 0, "", "Izmir")
+        updated = db.dashboard_summary(today=today)
+        assert updated["generation"] != summary["generation"] and updated["kpis"]["timesheets"] == 5
+    finally:
+        db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER = saved
+    print("   ✓ summary matches rollups, refreshed after a write")
+
+
+def test_overtime_invalid_settings():
+    """/api/employee-overtime answers 0 per employee, not 500, when hour settings are invalid"""
+    print("4. Testing overtime with invalid hour settings...")
+    saved = _use_temp_db()
+    try:
+        app_dir = os.path.dirname(os.path.abspath(__file__))
+        sys.path.insert(0, os.path.join(app_dir, "server"))
+        spec = importlib.util.spec_from_file_location("puantaj_server", os.path.join(app_dir, "server", "app.py"))
+        server = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(server)
+        server.db.DB_DIR, server.db.DB_PATH = db.DB_DIR, db.DB_PATH
+        server.db.BACKUP_DIR, server.db.BACKUP_MARKER = db.BACKUP_DIR, db.BACKUP_MARKER
+        db.init_db()
+        db.add_employee("Ali", "1", "", "", "Ankara")
+        ali = db.list_employees()[0][0]
+        db.add_timesheet(ali, "2026-10-12", "08:00", "21:00", 60, 0, "", "Ankara")
+        db.set_setting("weekday_hours", "dokuz")
+
+        client = server.app.test_client()
+        with client.session_transaction() as s:
+            s["user_id"] = "ankara1"
+        response = client.get("/api/employee-overtime?year=2026&month=10")
+        assert response.status_code == 200, response.get_json()
+        assert [(row["name"], row["overtime"]) for row in response.get_json()] == [("Ali", 0.0)]
+    finally:
+        db.DB_DIR, db.DB_PATH, db.BACKUP_DIR, db.BACKUP_MARKER = saved
+    print("   ✓ zero totals, no server error")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🧪 TIMESHEET ROLLUP TEST")
+    print("=" * 60)
+
+    try:
+        test_rollups_match_rebuild()
+        test_employee_overtime()
+        test_dashboard_summary()
+        test_overtime_invalid_settings()
+    except Exception as e:
+        print(f"   ✗ Test error: {e}")
+        sys.exit(1)
+    print("✅ All tests passed!")
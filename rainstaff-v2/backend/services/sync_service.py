@@ -9,7 +9,6 @@ from sqlalchemy import and_, or_
 from typing import List, Dict, Optional, Tuple, Any
 from datetime import datetime, timedelta
 import json
-import requests
 from loguru import logger
 
 from backend.models.messaging import SyncLog
@@ -20,10 +19,11 @@ from backend.models.vehicle import Vehicle
 from backend.models.driver import Driver
 from shared.auth import AuthContext
 from shared.config import AppConfig
+from shared import sync_codec, http_transport
 
 
 class CloudSyncClient:
-    """HTTP client for cloud sync API"""
+    """HTTP client for cloud sync API (pooled keep-alive session, per-endpoint timeouts)"""
     
     def __init__(self, api_url: str, api_token: str):
         self.api_url = api_url.rstrip('/')
@@ -31,13 +31,13 @@ class CloudSyncClient:
         self.headers = {'X-API-Token': api_token, 'Content-Type': 'application/json'}
     
     def push_entities(self, entities: List[Dict]) -> Dict[str, Any]:
-        """Push local changes to cloud"""
+        """Push local changes to cloud (gzip/zstd compressed body)"""
         try:
-            response = requests.post(
+            response = sync_codec.post_json(
+                http_transport.post,
                 f"{self.api_url}/api/sync/push",
+                {'entities': entities},
                 headers=self.headers,
-                json={'entities': entities},
-                timeout=60,
             )
             response.raise_for_status()
             return response.json()
@@ -46,7 +46,7 @@ class CloudSyncClient:
             raise
     
     def pull_entities(self, entity_type: Optional[str] = None, since: Optional[str] = None) -> List[Dict]:
-        """Pull updates from cloud"""
+        """Pull updates from cloud (requests decodes the gzip/zstd response it advertised)"""
         try:
             params = {}
             if entity_type:
@@ -54,11 +54,10 @@ class CloudSyncClient:
             if since:
                 params['since'] = since
             
-            response = requests.get(
+            response = http_transport.get(
                 f"{self.api_url}/api/sync/pull",
                 headers=self.headers,
                 params=params,
-                timeout=60,
             )
             response.raise_for_status()
             result = response.json()
@@ -70,11 +69,10 @@ class CloudSyncClient:
     def send_message(self, data: Dict) -> Dict[str, Any]:
         """Send cross-region message"""
         try:
-            response = requests.post(
+            response = http_transport.post(
                 f"{self.api_url}/api/messages/send",
                 headers=self.headers,
                 json=data,
-                timeout=30,
             )
             response.raise_for_status()
             return response.json()
@@ -85,11 +83,10 @@ class CloudSyncClient:
     def get_inbox(self, username: str) -> List[Dict]:
         """Get inbox messages"""
         try:
-            response = requests.get(
+            response = http_transport.get(
                 f"{self.api_url}/api/messages/inbox",
                 headers=self.headers,
                 params={'username': username},
-                timeout=30,
             )
             response.raise_for_status()
             result = response.json()
@@ -101,7 +98,7 @@ class CloudSyncClient:
     def heartbeat(self, username: str, status: str = 'online', device_info: Optional[str] = None) -> Dict[str, Any]:
         """Send presence heartbeat"""
         try:
-            response = requests.post(
+            response = http_transport.post(
                 f"{self.api_url}/api/presence/heartbeat",
                 headers=self.headers,
                 json={
@@ -109,7 +106,6 @@ class CloudSyncClient:
                     'status': status,
                     'device_info': device_info,
                 },
-                timeout=30,
             )
             response.raise_for_status()
             return response.json()
@@ -120,10 +116,9 @@ class CloudSyncClient:
     def get_online_users(self) -> List[Dict]:
         """Get online users in region"""
         try:
-            response = requests.get(
+            response = http_transport.get(
                 f"{self.api_url}/api/presence/online",
                 headers=self.headers,
-                timeout=30,
             )
             response.raise_for_status()
             result = response.json()
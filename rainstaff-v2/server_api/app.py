@@ -17,12 +17,20 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from loguru import logger
 import queue
 import time
+import sys
+
+# Shared modules live in rainstaff-v2/shared, next to this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared import sync_codec
 
 # Flask app
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100 MB max upload
 
+# gzip/zstd: encoded JSON bodies (sync push) are decoded before Flask parses them
+app.wsgi_app = sync_codec.DecodedJSONRequests(app.wsgi_app, limit=app.config['MAX_CONTENT_LENGTH'])
+
 # Database path
 DB_PATH = Path(__file__).parent / 'data' / 'rainstaff_cloud.db'
 DB_PATH.parent.mkdir(parents=True, exist_ok=True)
@@ -148,6 +156,12 @@ def init_database():
         logger.info("Database initialized successfully")
 
 
+@app.after_request
+def compress_json(response):
+    """Compress JSON responses (sync pull) for clients that accept gzip/zstd"""
+    return sync_codec.compress_response(response, request.headers.get('Accept-Encoding'))
+
+
 # ============================================================================
 # Authentication
 # ============================================================================
@@ -2,4 +2,4 @@
 Rainstaff v2 - Shared Package
 """
 
-__all__ = ["config", "enums", "auth", "utils"]
+__all__ = ["config", "enums", "auth", "utils", "sync_codec", "http_transport"]
@@ -0,0 +1,145 @@
+"""
+Shared HTTP transport for client -> server calls (sync steps, heartbeats, status checks).
+One requests.Session per process: pooled keep-alive connections (no TLS handshake per call),
+urllib3 Retry with backoff on idempotent requests, per-endpoint timeouts and timing hooks.
+"""
+
+import time
+import logging
+import threading
+from urllib.parse import urljoin, urlsplit
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+except ImportError:
+    requests = None
+
+logger = logging.getLogger("rainstaff")
+
+# Hosts kept in the pool, connections kept per host (sync thread + keepalive + UI calls)
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 8
+# Idempotent requests (GET/HEAD/PUT/DELETE) retry connection errors, read errors and these
+# statuses (Render cold starts, proxies); POST only retries failures to connect
+RETRY_TOTAL = 3
+RETRY_BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (502, 503, 504)
+# (connect, read) seconds; the longest matching endpoint wins. Read timeouts bound the wait
+# for the next bytes, not the whole transfer.
+TIMEOUTS = {
+    "/health": (3.05, 6),
+    "/sync/status": (3.05, 5),
+    "/sync/delta": (5, 15),
+    "/sync/download": (5, 30),
+    "/sync": (5, 60),
+    "/sync/uploads/": (5, 60),
+    "/api/sync/": (5, 60),
+    "/api/presence/": (3.05, 10),
+}
+DEFAULT_TIMEOUT = (5, 30)
+# Following a 202 Accepted job: Retry-After is honoured up to this, for at most JOB_TIMEOUT
+JOB_POLL_MAX_SECONDS = 5.0
+JOB_TIMEOUT_SECONDS = 300.0
+
+_session = None
+_session_lock = threading.Lock()
+_timing_hooks = []
+
+
+def session():
+    """The process-wide pooled session, created on first use"""
+    global _session
+    if requests is None:
+        raise RuntimeError("requests is not installed")
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=RETRY_TOTAL,
+                backoff_factor=RETRY_BACKOFF_FACTOR,
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+                raise_on_status=False,
+                respect_retry_after_header=True,
+            )
+            adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+            _session = requests.Session()
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+            _session.hooks["response"].append(_on_response)
+        return _session
+
+
+def close():
+    """Drop pooled connections (app shutdown); the next call opens a fresh session"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def timeout_for(url):
+    """(connect, read) timeout of the endpoint a URL points at"""
+    path = urlsplit(url).path.rstrip("/")
+    for endpoint in sorted(TIMEOUTS, key=len, reverse=True):
+        # "/api/sync/" style keys cover everything below them; others match the path's end
+        if (endpoint in path + "/") if endpoint.endswith("/") else path.endswith(endpoint):
+            return TIMEOUTS[endpoint]
+    return DEFAULT_TIMEOUT
+
+
+def request(method, url, **kwargs):
+    """Session request with the endpoint's timeout unless one is given"""
+    kwargs.setdefault("timeout", timeout_for(url))
+    return session().request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def wait_for_job(response, timeout=JOB_TIMEOUT_SECONDS, **kwargs):
+    """
+    Follow a 202 Accepted response: GET its Location, Retry-After apart, until the answer is
+    not 202 or timeout passed. Returns the last response (still 202 on timeout).
+    """
+    deadline = time.monotonic() + timeout
+    while response.status_code == 202 and response.headers.get("Location"):
+        try:
+            delay = float(response.headers.get("Retry-After", 1))
+        except ValueError:
+            delay = 1.0
+        delay = max(0.1, min(delay, JOB_POLL_MAX_SECONDS))
+        if time.monotonic() + delay > deadline:
+            break
+        time.sleep(delay)
+        response = get(urljoin(response.url, response.headers["Location"]), **kwargs)
+    return response
+
+
+def add_timing_hook(hook):
+    """hook(method, url, status_code, seconds) runs after every response (time to headers)"""
+    _timing_hooks.append(hook)
+
+
+def remove_timing_hook(hook):
+    if hook in _timing_hooks:
+        _timing_hooks.remove(hook)
+
+
+def _on_response(response, *args, **kwargs):
+    seconds = response.elapsed.total_seconds()
+    method = response.request.method if response.request is not None else "?"
+    logger.debug("HTTP %s %s -> %s in %.3fs", method, response.url, response.status_code, seconds)
+    for hook in list(_timing_hooks):
+        try:
+            hook(method, response.url, response.status_code, seconds)
+        except Exception:
+            pass
+    return response
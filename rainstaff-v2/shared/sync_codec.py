@@ -0,0 +1,478 @@
+"""
+Content-Encoding helpers for sync transfers.
+gzip is always available; zstd is used when the zstandard package is installed.
+Everything here works on file objects in CHUNK_SIZE pieces so whole databases never sit in memory.
+"""
+
+import io
+import os
+import json
+import time
+import zlib
+import shutil
+import hashlib
+import tempfile
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CHUNK_SIZE = 1024 * 1024
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+# Smaller JSON bodies are sent as is; headers would eat the gain
+MIN_COMPRESS_SIZE = 1024
+# Decoded bodies larger than these are rejected (decompression bombs)
+MAX_DECODED_SIZE = 1024 * 1024 * 1024
+MAX_JSON_SIZE = 128 * 1024 * 1024
+# Resumable uploads (/sync/uploads): chunk size unless the server suggests one, and how many
+# connection failures in a row a single upload_resumable() call rides out
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+UPLOAD_CHUNK_ATTEMPTS = 5
+# zstd input is fed in steps this small, so one step decodes to at most about CHUNK_SIZE
+# bytes (a 4-byte RLE block expands to 128 KiB)
+ZSTD_INPUT_STEP = 32
+
+
+class UnsupportedEncoding(ValueError):
+    """Content-Encoding this side cannot decode (servers answer 415)"""
+
+
+def supported_encodings():
+    """Encodings this side can produce and decode, best first"""
+    return ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+
+def accept_encoding_header():
+    """Accept-Encoding value advertising supported_encodings()"""
+    return ", ".join(supported_encodings())
+
+
+def choose_encoding(accept_encoding):
+    """Best supported encoding allowed by an Accept-Encoding header, None for identity"""
+    weights = {}
+    for part in (accept_encoding or "").split(","):
+        token, _, params = part.partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        weight = 1.0
+        params = params.strip().lower()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[token] = weight
+    for encoding in supported_encodings():
+        if weights.get(encoding, weights.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def _compressor(encoding):
+    if encoding == "gzip":
+        return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    if encoding == "zstd" and zstandard is not None:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    raise UnsupportedEncoding(encoding)
+
+
+def _check_decodable(encoding):
+    if encoding not in supported_encodings():
+        raise UnsupportedEncoding(encoding)
+
+
+def _normalize(encoding):
+    encoding = (encoding or "").strip().lower()
+    return None if encoding in ("", "identity") else encoding
+
+
+def encode_bytes(data, encoding):
+    """Compress a small in-memory body (JSON payloads)"""
+    encoding = _normalize(encoding)
+    if encoding is None:
+        return data
+    compressor = _compressor(encoding)
+    return compressor.compress(data) + compressor.flush()
+
+
+def decode_bytes(data, encoding, limit=MAX_DECODED_SIZE):
+    """Decompress a small in-memory body; UnsupportedEncoding / ValueError on bad input"""
+    encoding = _normalize(encoding)
+    if encoding is None:
+        return data
+    decoded = []
+    size = 0
+    for piece in _decoded_blocks(io.BytesIO(data), encoding):
+        size += len(piece)
+        if size > limit:
+            raise ValueError("Decoded body too large")
+        decoded.append(piece)
+    return b"".join(decoded)
+
+
+def encode_file(source_path, target_path, encoding):
+    """Stream-compress source_path into target_path (written next to it, then renamed)"""
+    compressor = _compressor(_normalize(encoding))
+    handle, partial_path = tempfile.mkstemp(prefix=os.path.basename(target_path) + ".", suffix=".part",
+                                            dir=os.path.dirname(os.path.abspath(target_path)))
+    try:
+        with open(source_path, "rb") as source, os.fdopen(handle, "wb") as target:
+            for block in iter(lambda: source.read(CHUNK_SIZE), b""):
+                target.write(compressor.compress(block))
+            target.write(compressor.flush())
+        os.replace(partial_path, target_path)
+    except Exception:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    return target_path
+
+
+def encoded_copy(path, encoding):
+    """Compressed sibling of an immutable file (path.gzip / path.zstd), built on first use"""
+    target_path = f"{path}.{_normalize(encoding)}"
+    if not os.path.exists(target_path):
+        encode_file(path, target_path, encoding)
+    return target_path
+
+
+def _decoded_blocks(stream, encoding):
+    """Decoded pieces of a readable body, each at most about CHUNK_SIZE bytes"""
+    encoding = _normalize(encoding)
+    if encoding is None:
+        return iter(lambda: stream.read(CHUNK_SIZE), b"")
+    _check_decodable(encoding)
+    return _decode_gzip(stream) if encoding == "gzip" else _decode_zstd(stream)
+
+
+def _decode_gzip(stream):
+    decompressor = zlib.decompressobj(31)
+    try:
+        for block in iter(lambda: stream.read(CHUNK_SIZE), b""):
+            # Bounded output per step: a small block can expand enormously
+            while block:
+                yield decompressor.decompress(block, CHUNK_SIZE)
+                block = decompressor.unconsumed_tail
+        yield decompressor.flush()
+    except zlib.error as e:
+        raise ValueError(f"Invalid gzip body: {e}")
+    if not decompressor.eof:
+        raise ValueError("Truncated gzip body")
+
+
+def _decode_zstd(stream):
+    decompressor = zstandard.ZstdDecompressor()
+    frame = decompressor.decompressobj()
+    pending, pending_size = [], 0
+    try:
+        for block in iter(lambda: stream.read(CHUNK_SIZE), b""):
+            view = memoryview(block)
+            for pos in range(0, len(view), ZSTD_INPUT_STEP):
+                data = view[pos:pos + ZSTD_INPUT_STEP]
+                while data:
+                    if frame.eof:
+                        # Concatenated frames: the rest of the input starts the next one
+                        frame = decompressor.decompressobj()
+                    piece = frame.decompress(data)
+                    data = frame.unused_data if frame.eof else b""
+                    pending.append(piece)
+                    pending_size += len(piece)
+                if pending_size >= CHUNK_SIZE:
+                    yield b"".join(pending)
+                    pending, pending_size = [], 0
+    except zstandard.ZstdError as e:
+        raise ValueError(f"Invalid zstd body: {e}")
+    yield b"".join(pending)
+    if not frame.eof:
+        raise ValueError("Truncated zstd body")
+
+
+def decode_stream(stream, target_path, encoding, limit=MAX_DECODED_SIZE):
+    """
+    Stream-decompress a readable body (request.stream, a raw response, a file) into target_path.
+    Returns the decoded size; raises UnsupportedEncoding or ValueError (corrupt / truncated / over limit).
+    """
+    blocks = _decoded_blocks(stream, encoding)
+    written = 0
+    try:
+        with open(target_path, "wb") as target:
+            for piece in blocks:
+                written += len(piece)
+                if written > limit:
+                    raise ValueError("Decoded body too large")
+                target.write(piece)
+    except Exception:
+        if os.path.exists(target_path):
+            os.remove(target_path)
+        raise
+    return written
+
+
+def decode_file(source_path, target_path, encoding):
+    """Decompress a downloaded file into target_path"""
+    with open(source_path, "rb") as source:
+        return decode_stream(source, target_path, encoding)
+
+
+# ============================================================================
+# CLIENT SIDE (post is requests.post or a Session's post)
+# ============================================================================
+
+def encode_json(payload, encoding):
+    """(body, headers) for a JSON request; bodies of MIN_COMPRESS_SIZE or more are compressed"""
+    body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+    headers = {"Content-Type": "application/json"}
+    encoding = _normalize(encoding)
+    if encoding is not None and len(body) >= MIN_COMPRESS_SIZE:
+        body = encode_bytes(body, encoding)
+        headers["Content-Encoding"] = encoding
+    return body, headers
+
+
+def fallback_encoding(response, sent):
+    """Encoding to resend a rejected compressed body with: what a 415 lists (RFC 7694), else identity"""
+    if response.status_code == 415:
+        encoding = choose_encoding(response.headers.get("Accept-Encoding"))
+        if encoding != sent:
+            return encoding
+    return None
+
+
+def post_json(post, url, payload, headers=None, **kwargs):
+    """
+    POST payload as compressed JSON. 415 resends with an encoding the server lists;
+    400 from a server that predates encoded bodies resends it uncompressed.
+    """
+    encoding = supported_encodings()[0]
+    while True:
+        body, body_headers = encode_json(payload, encoding)
+        response = post(url, data=body, headers={**(headers or {}), **body_headers}, **kwargs)
+        if response.status_code not in (400, 415) or "Content-Encoding" not in body_headers:
+            return response
+        encoding = fallback_encoding(response, encoding)
+
+
+def post_file(post, url, path, headers=None, fallback=None, **kwargs):
+    """
+    POST a file as a compressed application/octet-stream body (encoded into a temp file first).
+    415 resends with an encoding the server lists; 400 (server predates raw uploads) returns
+    fallback() when given, e.g. the old multipart upload.
+    """
+    encoding = supported_encodings()[0]
+    while encoding is not None:
+        encoded_path = encode_file(path, f"{path}.upload.{encoding}", encoding)
+        try:
+            with open(encoded_path, "rb") as body:
+                response = post(url, data=body, headers={
+                    **(headers or {}), "Content-Type": "application/octet-stream", "Content-Encoding": encoding,
+                }, **kwargs)
+        finally:
+            os.remove(encoded_path)
+        if response.status_code not in (400, 415):
+            return response
+        if response.status_code == 400 and fallback is not None:
+            return fallback()
+        encoding = fallback_encoding(response, encoding)
+    with open(path, "rb") as body:
+        return post(url, data=body, headers={**(headers or {}), "Content-Type": "application/octet-stream"}, **kwargs)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for block in iter(lambda: source.read(CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def upload_resumable(request, sync_url, path, headers=None, state_path=None, **kwargs):
+    """
+    Upload a file through /sync/uploads: compressed into a snapshot file, created as a session
+    with its size and SHA-256, sent in PUT chunks (Upload-Offset + X-Chunk-SHA256), then finalized.
+    request is requests.request-like: request(method, url, **kwargs).
+    state_path: JSON file keeping the open session between calls (kept outside the uploaded
+    file). The snapshot is kept until the session ends, so the next call continues it from the
+    server's acknowledged offset even if path was written meanwhile; a file changed since the
+    snapshot is then uploaded again, so the last finalized upload always matches path.
+    Connection errors on a chunk are retried in place (a 409 reports the real offset).
+    Returns the finalize response (answers like POST /sync), or None when the server has no
+    /sync/uploads (use post_file instead).
+    """
+    headers = headers or {}
+    base_url = sync_url.rstrip("/") + "/sync/uploads"
+    resume = _load_upload_state(state_path)
+    if resume:
+        response = _resume_snapshot(request, base_url, resume, headers, state_path, **kwargs)
+        if response is not None and (response.status_code >= 400 or _file_stamp(path) == resume.get("source")):
+            return response
+
+    encoding = supported_encodings()[0]
+    while True:
+        snapshot_path = f"{path}.upload.{encoding or 'identity'}"
+        source = _file_stamp(path)
+        if encoding is None:
+            shutil.copyfile(path, snapshot_path)
+        else:
+            encode_file(path, snapshot_path, encoding)
+        session = {"sha256": file_sha256(snapshot_path), "encoding": encoding,
+                   "snapshot": snapshot_path, "source": source}
+        try:
+            response = request("POST", base_url, headers=headers, json={
+                "size": os.path.getsize(snapshot_path), "sha256": session["sha256"], "encoding": encoding,
+            }, **kwargs)
+            if response.status_code in (404, 405):
+                return None
+            if response.status_code == 415 and encoding is not None:
+                encoding = fallback_encoding(response, encoding)
+                continue
+            if response.status_code != 201:
+                return response
+            upload = response.json()
+            session["upload_id"] = upload["upload_id"]
+            _save_upload_state(state_path, session)
+            return _send_chunks(request, f"{base_url}/{upload['upload_id']}", snapshot_path, upload,
+                                headers, lambda ended: _save_upload_state(state_path, ended), **kwargs)
+        finally:
+            # Kept only while a saved session still points at it
+            if _load_upload_state(state_path) != session and os.path.exists(snapshot_path):
+                os.remove(snapshot_path)
+
+
+def _resume_snapshot(request, base_url, resume, headers, state_path, **kwargs):
+    """Continue the saved session from its snapshot; None when it cannot be continued"""
+    snapshot_path = resume.get("snapshot")
+    try:
+        if resume.get("upload_id") and snapshot_path and os.path.exists(snapshot_path) \
+                and file_sha256(snapshot_path) == resume.get("sha256"):
+            response = request("GET", f"{base_url}/{resume['upload_id']}", headers=headers, **kwargs)
+            if response.status_code == 200:
+                return _send_chunks(request, f"{base_url}/{resume['upload_id']}", snapshot_path,
+                                    response.json(), headers,
+                                    lambda ended: _save_upload_state(state_path, ended), **kwargs)
+        _save_upload_state(state_path, None)
+        return None
+    finally:
+        if _load_upload_state(state_path) != resume and snapshot_path and os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+
+
+def _file_stamp(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _load_upload_state(state_path):
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (TypeError, OSError, ValueError):
+        return None
+
+
+def _save_upload_state(state_path, session):
+    if state_path is None:
+        return
+    if session is None:
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        return
+    with open(state_path, "w", encoding="utf-8") as f:
+        json.dump(session, f)
+
+
+def _send_chunks(request, upload_url, upload_path, upload, headers, on_session, **kwargs):
+    size = os.path.getsize(upload_path)
+    chunk_size = upload.get("chunk_size") or UPLOAD_CHUNK_SIZE
+    offset = upload["offset"]
+    failures = 0
+    with open(upload_path, "rb") as source:
+        while offset < size:
+            source.seek(offset)
+            chunk = source.read(chunk_size)
+            try:
+                response = request("PUT", upload_url, data=chunk, headers={
+                    **headers,
+                    "Content-Type": "application/octet-stream",
+                    "Upload-Offset": str(offset),
+                    "X-Chunk-SHA256": hashlib.sha256(chunk).hexdigest(),
+                }, **kwargs)
+            except OSError:
+                # requests errors are OSErrors; the session stays saved for the next call
+                failures += 1
+                if failures >= UPLOAD_CHUNK_ATTEMPTS:
+                    raise
+                time.sleep(2 ** (failures - 1))
+                continue
+            if response.status_code not in (200, 409):
+                if response.status_code == 404:
+                    on_session(None)
+                return response
+            # 409: an earlier reply got lost; the server says where to continue
+            offset = response.json()["offset"]
+            failures = 0
+    response = request("POST", upload_url + "/finalize", headers=headers, **kwargs)
+    if response.status_code != 409:
+        on_session(None)
+    return response
+
+
+# ============================================================================
+# SERVER SIDE (Flask / WSGI)
+# ============================================================================
+
+def compress_response(response, accept_encoding):
+    """after_request hook body: compress a buffered JSON response the client can decode"""
+    if (response.mimetype != "application/json" or response.direct_passthrough or response.is_streamed
+            or "Content-Encoding" in response.headers or response.status_code in (204, 304)):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding(accept_encoding)
+    data = response.get_data()
+    if encoding is None or len(data) < MIN_COMPRESS_SIZE:
+        return response
+    response.set_data(encode_bytes(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+class DecodedJSONRequests:
+    """
+    WSGI middleware: decodes Content-Encoding on JSON request bodies before the app parses them.
+    Other bodies (database uploads) stay encoded for decode_stream(); unknown encodings get 415.
+    """
+
+    def __init__(self, app, limit=MAX_JSON_SIZE):
+        self.app = app
+        self.limit = limit
+
+    def __call__(self, environ, start_response):
+        encoding = _normalize(environ.get("HTTP_CONTENT_ENCODING"))
+        mimetype = environ.get("CONTENT_TYPE", "").split(";")[0].strip().lower()
+        if encoding is None or mimetype != "application/json":
+            return self.app(environ, start_response)
+        try:
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+            if length > self.limit:
+                raise ValueError("Request body too large")
+            body = decode_bytes(environ["wsgi.input"].read(length), encoding, self.limit)
+        except UnsupportedEncoding:
+            return self._reject(start_response, "415 Unsupported Media Type", "Unsupported Content-Encoding")
+        except ValueError as e:
+            return self._reject(start_response, "400 Bad Request", str(e))
+        environ = dict(environ)
+        environ.pop("HTTP_CONTENT_ENCODING", None)
+        environ["wsgi.input"] = io.BytesIO(body)
+        environ["CONTENT_LENGTH"] = str(len(body))
+        return self.app(environ, start_response)
+
+    def _reject(self, start_response, status, message):
+        body = json.dumps({"error": message}).encode("utf-8")
+        start_response(status, [
+            ("Content-Type", "application/json"),
+            ("Content-Length", str(len(body))),
+            ("Accept-Encoding", accept_encoding_header()),
+        ])
+        return [body]
@@ -9,11 +9,12 @@ import sqlite3
 from datetime import datetime
 from contextlib import contextmanager
 from functools import wraps
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, send_file
 
 # Add parent to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import staff_db as db
+import sync_codec
 
 # Fix template and static folders for Render
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -22,6 +23,18 @@ app = Flask(__name__,
             static_folder=os.path.join(BASE_DIR, 'static'))
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 
+# Request threads share a small pool of WAL connections
+db.configure_connections(mode="pool", pool_size=int(os.environ.get('DB_POOL_SIZE', '8')))
+
+# gzip/zstd: encoded JSON bodies are decoded before Flask parses them
+app.wsgi_app = sync_codec.DecodedJSONRequests(app.wsgi_app)
+
+
+@app.after_request
+def compress_json(response):
+    """Compress JSON responses for clients that accept gzip/zstd"""
+    return sync_codec.compress_response(response, request.headers.get('Accept-Encoding'))
+
 
 # Decorator to mark endpoints as public (exempt from auth)
 def public_endpoint(f):
@@ -118,8 +131,10 @@ def sync_reset():
             return jsonify({'error': 'Invalid reset key'}), 403
         
         db_path = db.DB_PATH
-        if os.path.exists(db_path):
-            os.remove(db_path)
+        db.close_connections()
+        for path in (db_path, db_path + "-wal", db_path + "-shm"):
+            if os.path.exists(path):
+                os.remove(path)
         
         # Reinitialize empty database
         db.init_db()
@@ -142,30 +157,41 @@ def sync_upload():
     Respects deleted_records table to prevent deleted data from reappearing.
     """
     try:
-        # Accept both 'db' and 'file' keys for backwards compatibility
-        if 'db' in request.files:
-            file = request.files['db']
-        elif 'file' in request.files:
-            file = request.files['file']
-        else:
-            return jsonify({'error': 'No file provided'}), 400
-        
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
-        
         db_path = db.DB_PATH
         print(f"DEBUG: Sync Upload Target Path: {db_path}") # Log to server console
         
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
-        
-        # Save incoming DB to temp location
         temp_path = db_path + ".incoming"
-        file.save(temp_path)
+        
+        if request.mimetype == 'application/octet-stream':
+            # Raw body, optionally gzip/zstd encoded: decoded straight to disk
+            try:
+                sync_codec.decode_stream(request.stream, temp_path, request.headers.get('Content-Encoding'))
+            except sync_codec.UnsupportedEncoding:
+                return jsonify({'error': 'Unsupported Content-Encoding'}), 415, {
+                    'Accept-Encoding': sync_codec.accept_encoding_header()
+                }
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        else:
+            # Accept both 'db' and 'file' keys for backwards compatibility
+            if 'db' in request.files:
+                file = request.files['db']
+            elif 'file' in request.files:
+                file = request.files['file']
+            else:
+                return jsonify({'error': 'No file provided'}), 400
+            
+            if file.filename == '':
+                return jsonify({'error': 'No file selected'}), 400
+            
+            # Save incoming DB to temp location
+            file.save(temp_path)
         print(f"DEBUG: Saved incoming file to {temp_path}, size: {os.path.getsize(temp_path)}")
         
         # If master DB doesn't exist, just use incoming as master
         if not os.path.exists(db_path):
-            os.rename(temp_path, db_path)
+            db.replace_db_file(temp_path)
             return jsonify({
                 'success': True,
                 'action': 'sync_upload_new',
@@ -176,13 +202,8 @@ def sync_upload():
         db.init_db()
         
         # Merge incoming DB into master
-        logs = []
         try:
-            logs = db.merge_databases(temp_path, db_path)
-        except AttributeError:
-             # Fallback if staff_db doesn't have merge_databases yet
-             from server.app import _merge_databases
-             logs = _merge_databases(temp_path, db_path)
+            merged = db.merge_databases(temp_path, db_path)
         finally:
             if os.path.exists(temp_path):
                 os.remove(temp_path)
@@ -190,7 +211,7 @@ def sync_upload():
         return jsonify({
             'success': True,
             'action': 'sync_upload_merged',
-            'debug_logs': logs,
+            'merged': merged,
             'timestamp': datetime.now().isoformat()
         }), 200
     
@@ -198,141 +219,89 @@ def sync_upload():
         return jsonify({'error': str(e)}), 500
 
 
-def _merge_databases(incoming_path, master_path):
-    """
-    Merge incoming database into master, respecting deletions.
-    Returns a list of debug log strings.
-    """
-    logs = []
-    incoming_conn = sqlite3.connect(incoming_path)
-    master_conn = sqlite3.connect(master_path)
-    
-    try:
-        # Ensure deleted_records table exists in both DBs
-        for conn in [incoming_conn, master_conn]:
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS deleted_records (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    table_name TEXT NOT NULL,
-                    record_id INTEGER NOT NULL,
-                    deleted_at TEXT NOT NULL,
-                    deleted_by TEXT
-                );
-            """)
-        master_conn.commit()
-        
-        # 1. Get deleted records from incoming
-        deleted = set()
-        try:
-            cursor = incoming_conn.execute("SELECT table_name, record_id FROM deleted_records")
-            rows = cursor.fetchall()
-            logs.append(f"Incoming deleted_records count: {len(rows)}")
-            for row in rows:
-                deleted.add((row[0], row[1]))
-                logs.append(f"Incoming deleted: {row[0]} #{row[1]}")
-        except sqlite3.OperationalError:
-            logs.append("No deleted_records table in incoming")
-        
-        # 2. Apply deletions to master and track them
-        for table_name, record_id in deleted:
-            # Delete from master
-            master_conn.execute(f"DELETE FROM {table_name} WHERE id = ?", (record_id,))
-            # Record deletion in master's deleted_records
-            master_conn.execute(
-                "INSERT OR IGNORE INTO deleted_records (table_name, record_id, deleted_at) VALUES (?, ?, ?)",
-                (table_name, record_id, datetime.now().isoformat())
-            )
-            logs.append(f"Applied deletion to master: {table_name} #{record_id}")
-        
-        # 3. Get existing deleted records from master (to skip during merge)
-        master_deleted = set()
-        try:
-            cursor = master_conn.execute("SELECT table_name, record_id FROM deleted_records")
-            rows = cursor.fetchall()
-            logs.append(f"Master deleted_records count: {len(rows)}")
-            for row in rows:
-                master_deleted.add((row[0], row[1]))
-        except sqlite3.OperationalError:
-            pass
-        
-        # Combine both deletion sets
-        all_deleted = deleted | master_deleted
-        
-        # 4. Merge timesheets from incoming (skip deleted)
-        try:
-            cursor = incoming_conn.execute(
-                "SELECT id, employee_id, work_date, start_time, end_time, break_minutes, is_special, notes, region FROM timesheets"
-            )
-            count = 0
-            skipped = 0
-            for row in cursor.fetchall():
-                record_id = row[0]
-                if ("timesheets", record_id) in all_deleted:
-                    skipped += 1
-                    continue  # Skip deleted record
-                # Upsert: Insert or replace
-                master_conn.execute(
-                    "INSERT OR REPLACE INTO timesheets (id, employee_id, work_date, start_time, end_time, break_minutes, is_special, notes, region) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                    row
-                )
-                count += 1
-            logs.append(f"Merged timesheets: {count} inserted/updated, {skipped} skipped (deleted)")
-        except sqlite3.OperationalError as e:
-            logs.append(f"Error merging timesheets: {e}")
-        
-        # 5. Merge employees from incoming (skip deleted)
-        try:
-            cursor = incoming_conn.execute(
-                "SELECT id, full_name, identity_no, department, title, region FROM employees"
-            )
-            count = 0
-            skipped = 0
-            for row in cursor.fetchall():
-                record_id = row[0]
-                if ("employees", record_id) in all_deleted:
-                    skipped += 1
-                    continue  # Skip deleted record
-                master_conn.execute(
-                    "INSERT OR REPLACE INTO employees (id, full_name, identity_no, department, title, region) VALUES (?, ?, ?, ?, ?, ?)",
-                    row
-                )
-                count += 1
-            logs.append(f"Merged employees: {count} inserted/updated, {skipped} skipped (deleted)")
-        except sqlite3.OperationalError as e:
-            logs.append(f"Error merging employees: {e}")
-        
-        master_conn.commit()
-        return logs
-    
-    finally:
-        incoming_conn.close()
-        master_conn.close()
-
-
 @app.route('/sync/download', methods=['GET'])
 @public_endpoint
 def sync_download():
     """
     Download current database from server
-    Returns: SQLite DB file (binary)
+    Returns: SQLite DB file (binary), streamed from a snapshot
+    ETag is the content hash: If-None-Match -> 304, Range/If-Range resume a partial download
+    Accept-Encoding gzip/zstd serves a precompressed copy (Range applies to the encoded bytes)
+    X-Region other than ALL gets only that region's rows (and the rows they reference)
     """
     try:
         db_path = db.DB_PATH
         if not os.path.exists(db_path):
             return jsonify({'error': 'Database not found'}), 404
         
-        with open(db_path, 'rb') as f:
-            db_content = f.read()
-        
-        return db_content, 200, {
-            'Content-Type': 'application/octet-stream',
-            'Content-Disposition': 'attachment; filename=puantaj.db'
-        }
+        region = request.headers.get('X-Region', '') or 'ALL'
+        snapshot_path, etag = db.download_snapshot(db_path, region)
+        encoding = sync_codec.choose_encoding(request.headers.get('Accept-Encoding'))
+        if encoding:
+            snapshot_path = sync_codec.encoded_copy(snapshot_path, encoding)
+            etag = f"{etag}-{encoding}"
+        response = send_file(
+            snapshot_path,
+            mimetype='application/octet-stream',
+            as_attachment=True,
+            download_name='puantaj.db',
+            etag=etag,
+            conditional=True,
+            max_age=0
+        )
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.update(('Accept-Encoding', 'X-Region'))
+        return response
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/sync/delta', methods=['GET', 'POST'])
+@public_endpoint
+def sync_delta():
+    """
+    Row-level sync. POST applies the client's changed rows and tombstones;
+    both methods return master rows changed since the client's watermark
+    (?since= or body "since"), minus rows the client itself sent.
+    X-Sync-Scope (the region of the client's download subset) limits them to that region.
+    409 means the watermark is unknown here: fall back to /sync + /sync/download.
+    """
+    try:
+        region = request.headers.get('X-Region', '') or 'ALL'
+        scope = request.headers.get('X-Sync-Scope', '') or 'ALL'
+        payload = (request.get_json(silent=True) or {}) if request.method == 'POST' else {}
+        since = request.args.get('since', type=int)
+        if since is None:
+            since = payload.get('since')
+        if not isinstance(since, int):
+            return jsonify({'error': 'since required'}), 400
+        if not os.path.exists(db.DB_PATH) or not db.sync_delta_available(since):
+            return jsonify({'error': 'full_sync_required', 'seq': since}), 409
+
+        applied = {}
+        if payload.get('upserts') or payload.get('deletes'):
+            applied = db.apply_sync_delta(payload, origin=region)
+        delta = db.collect_sync_delta(since, skip_origin=region, region=None if scope == 'ALL' else scope)
+        db.set_sync_watermark(region, push_seq=payload.get('seq'), pull_seq=delta['seq'])
+        # Entries every delta region has pulled are no longer needed
+        db.compact_change_log(db.min_sync_pull_seq())
+
+        return jsonify({
+            'success': True,
+            'action': 'sync_delta',
+            'applied': applied,
+            'seq': delta['seq'],
+            'upserts': delta['upserts'],
+            'deletes': delta['deletes'],
+            'timestamp': datetime.now().isoformat()
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 # ============================================================================
 # AUTHENTICATION CHECK (Protect Dashboard/Admin Routes)
 # ============================================================================
@@ -351,7 +320,7 @@ def check_auth():
             return
 
     # Hardcoded whitelist fallback (legacy support)
-    public_endpoints = {'static', 'auto_sync', 'health', 'sync_upload', 'sync_download', 'login', 'index', 'debug_auth', 'sync_reset'}
+    public_endpoints = {'static', 'auto_sync', 'health', 'sync_upload', 'sync_download', 'sync_delta', 'login', 'index', 'debug_auth', 'sync_reset'}
     
     if request.endpoint in public_endpoints:
         return  # Public endpoint - no auth required
@@ -402,18 +371,33 @@ def dashboard():
         return redirect(url_for('login'))
     
     try:
+        # Sayfa iskelet olarak gelir; sayilar /api/dashboard/summary'den okunur
         user = db.get_user(session['user_id'])
-        employees = db.get_all_employees()
-        timesheets = db.get_all_timesheets()
-        
-        return render_template('dashboard.html', 
+        return render_template('dashboard.html',
                              user=user,
-                             employees=employees,
-                             timesheets=timesheets)
+                             summary={},
+                             alert_counts={},
+                             oil_counts={},
+                             quality_counts={},
+                             range_summary={})
     except Exception as e:
         return render_template('error.html', error=str(e)), 500
 
 
+@app.route('/api/dashboard/summary')
+def api_dashboard_summary():
+    """Current month KPIs and daily/weekly/monthly hour series (cached per data generation)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    try:
+        user = db.get_user(session['user_id'])
+        region = None if user['region'] == 'ALL' else user['region']
+        return jsonify(db.dashboard_summary(region=region)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/alerts')
 def alerts():
     if 'user_id' not in session:
@@ -1,11 +1,19 @@
 import os
+import re
+import glob
 import sqlite3
 import shutil
 import zipfile
 import hashlib
+import threading
+import weakref
+from pathlib import Path
 from datetime import datetime, timedelta
 from contextlib import contextmanager
 
+import sync_codec
+import http_transport
+
 APP_NAME = "Rainstaff"
 LOCAL_DB_DIR = os.path.join(os.path.dirname(__file__), "data")
 
@@ -49,6 +57,59 @@ DEFAULT_SETTINGS = {
     "admin_entry_region": "Ankara",
 }
 
+# Ikincil indexler (ad, "tablo (kolonlar)")
+SCHEMA_INDEXES = (
+    # list_timesheets filtreleri; rollup gun sayaci ayni gunku kayitlari arar
+    ("idx_timesheets_employee_date", "timesheets (employee_id, work_date)"),
+    ("idx_timesheets_region_date", "timesheets (region, work_date)"),
+    ("idx_timesheets_work_date", "timesheets (work_date)"),
+    ("idx_employees_region", "employees (region, full_name)"),
+    ("idx_vehicles_region", "vehicles (region, plate)"),
+    ("idx_drivers_region", "drivers (region, full_name)"),
+    ("idx_vehicle_faults_vehicle_status", "vehicle_faults (vehicle_id, status)"),
+    ("idx_vehicle_faults_region_status", "vehicle_faults (region, status)"),
+    ("idx_vehicle_inspections_vehicle_week", "vehicle_inspections (vehicle_id, week_start)"),
+    ("idx_vehicle_inspections_driver_date", "vehicle_inspections (driver_id, inspection_date)"),
+    ("idx_vehicle_inspection_results_inspection", "vehicle_inspection_results (inspection_id)"),
+    ("idx_vehicle_service_visits_vehicle_date", "vehicle_service_visits (vehicle_id, start_date)"),
+    ("idx_stock_inventory_bolge_durum", "stock_inventory (bolge, durum)"),
+    ("idx_stock_inventory_kod_seri", "stock_inventory (stok_kod, seri_no)"),
+    ("idx_deleted_records_table_record", "deleted_records (table_name, record_id)"),
+)
+
+TIMESHEET_PAGE_SIZE = 500
+# Web paneli serileri: gunluk seride gun, haftalikta hafta, aylikta ay sayisi
+DASHBOARD_DAYS = 30
+DASHBOARD_WEEKS = 12
+DASHBOARD_MONTHS = 12
+
+# Satir bazli delta senkronun tasidigi tablolar; once ebeveynler (silme ters sirada)
+SYNC_TABLES = ("employees", "timesheets", "vehicles", "drivers", "stock_inventory")
+# Bolgeye ait tablolarin bolge sutunu (bolgesel indirme kopyalari, delta cekimleri)
+REGION_COLUMNS = {
+    "employees": "region",
+    "timesheets": "region",
+    "vehicles": "region",
+    "drivers": "region",
+    "stock_inventory": "bolge",
+    "vehicle_faults": "region",
+    "vehicle_service_visits": "region",
+}
+# change_log'a yazilan tablolar (delta senkron ve artimli okuyucular)
+CHANGE_LOG_TABLES = SYNC_TABLES + ("vehicle_faults", "vehicle_service_visits", "vehicle_inspections")
+CHANGE_LOG_PAGE_SIZE = 1000
+# change_log.op degerleri
+CHANGE_INSERT = "I"
+CHANGE_UPDATE = "U"
+CHANGE_DELETE = "D"
+
+# Online yedek: adim basina sayfa sayisi ve adimlar arasi bekleme (yazanlar beklemesin)
+BACKUP_PAGES_PER_STEP = 1024
+BACKUP_STEP_SLEEP = 0.005
+
+# Kopan /sync/download istegi Range ile en fazla bu kadar denenir
+SYNC_DOWNLOAD_ATTEMPTS = 3
+
 DEFAULT_USERS = [
     ("ankara1", "060106", "user", "Ankara"),
     ("izmir1", "350235", "user", "Izmir"),
@@ -70,24 +131,80 @@ def _migrate_local_db():
         shutil.copy2(local_db, DB_PATH)
 
 
-def _backup_db_if_needed():
-    if not os.path.isfile(DB_PATH):
+_auto_backup_lock = threading.Lock()
+_auto_backup_thread = None
+
+
+def start_auto_backup():
+    """Gunluk yedegi arka planda alir; acilis kopyayi beklemez."""
+    global _auto_backup_thread
+    # Yollar simdi baglanir; thread sonradan degisen DB_PATH'i takip etmez
+    _auto_backup_thread = threading.Thread(
+        target=_backup_db_if_needed,
+        args=(DB_PATH, BACKUP_DIR, BACKUP_MARKER),
+        name="staff-auto-backup",
+        daemon=True,
+    )
+    _auto_backup_thread.start()
+    return _auto_backup_thread
+
+
+def wait_for_auto_backup(timeout=None):
+    thread = _auto_backup_thread
+    if thread is not None:
+        thread.join(timeout)
+
+
+def _backup_db_if_needed(db_path, backup_dir, marker_path):
+    if not os.path.isfile(db_path):
         return
-    os.makedirs(BACKUP_DIR, exist_ok=True)
-    last_time = None
-    if os.path.isfile(BACKUP_MARKER):
-        try:
-            with open(BACKUP_MARKER, "r", encoding="ascii") as handle:
-                last_time = datetime.fromisoformat(handle.read().strip())
-        except Exception:
-            last_time = None
-    now = datetime.now()
-    if last_time and now - last_time < timedelta(days=1):
+    if not _auto_backup_lock.acquire(blocking=False):
         return
-    stamp = now.strftime("%Y%m%d_%H%M%S")
-    create_backup(os.path.join(BACKUP_DIR, f"puantaj_{stamp}.db"))
-    with open(BACKUP_MARKER, "w", encoding="ascii") as handle:
-        handle.write(now.isoformat())
+    try:
+        os.makedirs(backup_dir, exist_ok=True)
+        last_time = None
+        if os.path.isfile(marker_path):
+            try:
+                with open(marker_path, "r", encoding="ascii") as handle:
+                    last_time = datetime.fromisoformat(handle.read().strip())
+            except Exception:
+                last_time = None
+        now = datetime.now()
+        if last_time and now - last_time < timedelta(days=1):
+            return
+        stamp = now.strftime("%Y%m%d_%H%M%S")
+        _copy_database(db_path, os.path.join(backup_dir, f"puantaj_{stamp}.db"))
+        with open(marker_path, "w", encoding="ascii") as handle:
+            handle.write(now.isoformat())
+    except Exception:
+        pass
+    finally:
+        _auto_backup_lock.release()
+
+
+def _copy_database(source_path, target_path):
+    """SQLite backup API ile tutarli online kopya, adim basina BACKUP_PAGES_PER_STEP sayfa."""
+    partial_path = target_path + ".part"
+    if os.path.exists(partial_path):
+        os.remove(partial_path)
+    # Salt-okunur kaynak: WAL uzerinden okur, yazanlari bloklamaz, veritabani olmayan dosyayi reddeder
+    source = sqlite3.connect(Path(os.path.abspath(source_path)).as_uri() + "?mode=ro", uri=True, timeout=30.0)
+    try:
+        target = sqlite3.connect(partial_path)
+        try:
+            source.backup(target, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP)
+            # Kopya tek dosya olarak kalsin (yanina -wal/-shm acilmasin)
+            target.execute("PRAGMA journal_mode = DELETE;")
+        finally:
+            target.close()
+    except Exception:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    finally:
+        source.close()
+    os.replace(partial_path, target_path)
+    return target_path
 
 
 def create_backup(dest_path=None):
@@ -97,20 +214,147 @@ def create_backup(dest_path=None):
     if not dest_path:
         stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         dest_path = os.path.join(BACKUP_DIR, f"puantaj_{stamp}.db")
-    shutil.copy2(DB_PATH, dest_path)
-    return dest_path
+    return _copy_database(DB_PATH, dest_path)
+
+
+_download_snapshot_lock = threading.Lock()
+_download_snapshots = {}
+
+
+def _file_state(path):
+    # DB ve WAL'in (mtime, boyut) degerleri; her yazimda degisir
+    state = []
+    for candidate in (path, path + "-wal"):
+        try:
+            stat = os.stat(candidate)
+            state.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            state.append(None)
+    return tuple(state)
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def download_snapshot(db_path=None, region=None):
+    """
+    /sync/download icin DB'nin tutarli kopyasi ve icerik ozeti (ETag): (yol, etag).
+    Kopya yalnizca DB degistikten sonra yeniden alinir; ayni icerik ayni ETag'i korur.
+    ALL disindaki bir bolge o bolgenin alt kumesini alir: tam kopyadan nesil (tam ETag)
+    basina bir kez kesilir, sonraki degisiklige kadar onbellekte kalir.
+    """
+    db_path = db_path or DB_PATH
+    with _download_snapshot_lock:
+        state = _file_state(db_path)
+        full = _download_snapshots.get(db_path)
+        if not (full and full[0] == state and os.path.exists(full[1])):
+            partial_path = _copy_database(db_path, db_path + ".snapshot")
+            full = _store_snapshot(db_path, partial_path, state, f"{db_path}.snapshot-")
+        if not region or region == "ALL":
+            return full[1], full[2]
+        subset = _download_snapshots.get((db_path, region))
+        if not (subset and subset[0] == full[2] and os.path.exists(subset[1])):
+            label = re.sub(r"[^0-9A-Za-z_-]", "_", region)
+            partial_path = _copy_database(full[1], f"{db_path}.snapshot.{label}")
+            _reduce_to_region(partial_path, region)
+            subset = _store_snapshot((db_path, region), partial_path, full[2], f"{db_path}.snapshot-{label}-")
+        return subset[1], subset[2]
+
+
+def _store_snapshot(key, partial_path, generation, prefix):
+    # Bitmis kopyayi icerik ozetiyle adlandirir, yerini aldigi kopyayi siler
+    etag = _file_sha256(partial_path)
+    # Icerige gore adlandirilir: eski kopyayi hala gonderen yanit kendi dosyasini korur
+    snapshot_path = f"{prefix}{etag[:16]}"
+    os.replace(partial_path, snapshot_path)
+    previous = _download_snapshots.get(key)
+    if previous and previous[1] != snapshot_path:
+        # Eski kopya ve sikistirilmis halleri (sync_codec.encoded_copy)
+        for stale_path in glob.glob(glob.escape(previous[1]) + "*"):
+            try:
+                os.remove(stale_path)
+            except OSError:
+                pass
+    _download_snapshots[key] = (generation, snapshot_path, etag)
+    return _download_snapshots[key]
+
+
+def _reduce_to_region(path, region):
+    """
+    Kopyayi tek bolgeye indirir: bolgenin REGION_COLUMNS satirlari, bunlarin (ve onlara bagli
+    bolgesiz satirlarin, orn. denetimler) isaret ettigi her satir; diger tablolar oldugu gibi kalir.
+    Silmeler tetikleyicilerden gecer (rollup'lar dogru kalir); change_log kayitlari geri alinir.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA foreign_keys = ON;")
+        conn.execute("BEGIN IMMEDIATE;")
+        before = _change_seq(conn)
+        conn.execute("""
+            CREATE TEMP TABLE keep (table_name TEXT NOT NULL, id INTEGER NOT NULL, PRIMARY KEY (table_name, id))
+            WITHOUT ROWID;
+        """)
+        for table, column in REGION_COLUMNS.items():
+            conn.execute(f"INSERT INTO keep SELECT ?, id FROM {table} WHERE {column} = ?;", (table, region))
+
+        tables = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%';"
+        )]
+        # Bolgeli tablolara her referans: (cocuk, sutun, ebeveyn, on_delete)
+        links = [
+            (table, fk[3], fk[2], fk[6])
+            for table in tables
+            for fk in conn.execute(f"PRAGMA foreign_key_list({table});").fetchall()
+            if fk[2] in REGION_COLUMNS
+        ]
+        survivors = {}
+        for child, column, parent, on_delete in links:
+            if child in REGION_COLUMNS:
+                survivors[child] = f"c.id IN (SELECT id FROM keep WHERE table_name = '{child}')"
+            elif on_delete == "CASCADE":
+                # Bolgesiz satir, cascade ebeveynlerinin hepsi kaldikca kalir
+                condition = f"(c.{column} IS NULL OR c.{column} IN (SELECT id FROM keep WHERE table_name = '{parent}'))"
+                survivors[child] = f"{survivors[child]} AND {condition}" if child in survivors else condition
+        while True:
+            added = 0
+            for child, column, parent, _ in links:
+                added += conn.execute(f"""
+                    INSERT OR IGNORE INTO keep SELECT ?, c.{column} FROM {child} c
+                    WHERE c.{column} IS NOT NULL AND {survivors.get(child, "1")};
+                """, (parent,)).rowcount
+            if not added:
+                break
+
+        for table in REGION_COLUMNS:
+            conn.execute(
+                f"DELETE FROM {table} WHERE id NOT IN (SELECT id FROM keep WHERE table_name = ?);", (table,)
+            )
+        # Kesim yerel degisiklik degildir: istemcinin gonderme isareti master'in seq'inden baslar
+        conn.execute("DELETE FROM change_log WHERE seq > ?;", (before,))
+        conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'change_log';", (before,))
+        conn.commit()
+        conn.execute("VACUUM;")
+    finally:
+        conn.close()
 
 
 def restore_backup(src_path):
     if not os.path.isfile(src_path):
         raise FileNotFoundError("Backup not found")
     ensure_db_dir()
+    # Once dogrulanmis kopya canli dosyanin yanina yazilir, sonra tek rename ile degistirilir
+    temp_path = _copy_database(src_path, DB_PATH + ".restore")
     if os.path.isfile(DB_PATH):
         stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         recovery_path = os.path.join(BACKUP_DIR, f"pre_restore_{stamp}.db")
         os.makedirs(BACKUP_DIR, exist_ok=True)
-        shutil.copy2(DB_PATH, recovery_path)
-    shutil.copy2(src_path, DB_PATH)
+        _copy_database(DB_PATH, recovery_path)
+    replace_db_file(temp_path)
 
 
 def export_data_zip(dest_path=None):
@@ -120,6 +364,7 @@ def export_data_zip(dest_path=None):
     if not dest_path:
         stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         dest_path = os.path.join(EXPORT_DIR, f"rainstaff_export_{stamp}.zip")
+    checkpoint()
     with zipfile.ZipFile(dest_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
         zf.write(DB_PATH, arcname="puantaj.db")
     return dest_path
@@ -137,289 +382,542 @@ def import_data_zip(src_path):
         with zf.open("puantaj.db") as src, open(temp_path, "wb") as dst:
             shutil.copyfileobj(src, dst)
     restore_backup(temp_path)
-    if os.path.isfile(temp_path):
-        os.remove(temp_path)
+    for path in (temp_path, temp_path + "-wal", temp_path + "-shm"):
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+class _ThreadConnections(dict):
+    """(path, readonly) -> (conn, generation) held by one thread"""
+
+
+class ConnectionManager:
+    """
+    Reuses SQLite connections instead of opening one per call.
+    mode="thread": each thread keeps its connection (desktop, Tk + worker threads)
+    mode="pool": up to pool_size idle connections shared by threads (Flask server)
+    Connection PRAGMAs run once when a connection is opened.
+    """
+
+    def __init__(self, mode="thread", pool_size=4, cache_size=-16000, mmap_size=64 * 1024 * 1024):
+        self.mode = mode
+        self.pool_size = pool_size
+        self.cache_size = cache_size  # negative = KiB (SQLite convention)
+        self.mmap_size = mmap_size
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._idle = {}  # (path, readonly) -> [conn], pool mode
+        self._depth = {}  # open conn -> nesting depth (0 = idle)
+        self._generation = 0
+
+    def configure(self, mode=None, pool_size=None, cache_size=None, mmap_size=None):
+        if mode is not None:
+            self.mode = mode
+        if pool_size is not None:
+            self.pool_size = pool_size
+        if cache_size is not None:
+            self.cache_size = cache_size
+        if mmap_size is not None:
+            self.mmap_size = mmap_size
+        self.close_all()
+
+    def _connect(self, path, readonly):
+        if readonly:
+            uri = Path(os.path.abspath(path)).as_uri() + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, timeout=30.0, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+            # WAL: readers never wait for a writer (e.g. a sync merge)
+            conn.execute("PRAGMA journal_mode = WAL;")
+        conn.execute("PRAGMA synchronous = NORMAL;")
+        conn.execute("PRAGMA foreign_keys = ON;")
+        conn.execute("PRAGMA busy_timeout = 30000;")
+        # INSERT OR REPLACE must fire DELETE triggers so timesheet_rollups stay exact
+        conn.execute("PRAGMA recursive_triggers = ON;")
+        conn.execute(f"PRAGMA cache_size = {int(self.cache_size)};")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)};")
+        if readonly:
+            conn.execute("PRAGMA query_only = ON;")
+        return conn
+
+    def _held(self):
+        held = getattr(self._local, "held", None)
+        if held is None:
+            held = self._local.held = _ThreadConnections()
+            owned = held.owned = []
+            # Close thread-mode connections when their thread exits
+            weakref.finalize(held, self._discard, owned)
+        return held
+
+    def _discard(self, conns):
+        with self._lock:
+            closing = [conn for conn in conns if self._depth.pop(conn, None) is not None]
+        for conn in closing:
+            conn.close()
+
+    def acquire(self, path, readonly=False):
+        """Connection for this thread; nested calls share the outer connection"""
+        key = (path, readonly)
+        held = self._held()
+        with self._lock:
+            conn, generation = held.get(key, (None, None))
+            depth = self._depth.get(conn)
+            if depth is not None and (depth > 0 or generation == self._generation):
+                self._depth[conn] = depth + 1
+                return conn
+            idle = self._idle.get(key) if self.mode == "pool" else None
+            conn = idle.pop() if idle else None
+        if conn is None:
+            conn = self._connect(path, readonly)
+            held.owned.append(conn)
+        with self._lock:
+            self._depth[conn] = 1
+            held[key] = (conn, self._generation)
+        return conn
+
+    def release(self, conn):
+        held = self._held()
+        with self._lock:
+            depth = self._depth.get(conn)
+            if depth is None:
+                return
+            self._depth[conn] = depth - 1
+            if depth > 1:
+                return
+            key, (_, generation) = next((k, v) for k, v in held.items() if v[0] is conn)
+            if generation == self._generation and self.mode != "pool":
+                return  # stays with this thread
+            del held[key]
+            if conn in held.owned:
+                held.owned.remove(conn)
+            idle = self._idle.setdefault(key, [])
+            if generation == self._generation and len(idle) < self.pool_size:
+                idle.append(conn)
+                return
+            del self._depth[conn]
+        conn.close()
+
+    def close_all(self):
+        """Close idle connections; busy ones are closed when released"""
+        with self._lock:
+            self._generation += 1
+            self._idle.clear()
+            idle = [conn for conn, depth in self._depth.items() if depth == 0]
+            for conn in idle:
+                del self._depth[conn]
+        for conn in idle:
+            conn.close()
+
+
+
+connections = ConnectionManager()
+
+
+def configure_connections(mode=None, pool_size=None, cache_size=None, mmap_size=None):
+    """Change connection reuse mode / pool size / cache_size / mmap_size"""
+    connections.configure(mode, pool_size, cache_size, mmap_size)
+
+
+def close_connections():
+    """Close pooled connections (before the database file is replaced)"""
+    connections.close_all()
 
 
 @contextmanager
 def get_conn():
-    """SQLite baglantrsi, otomatik commit ve rollback ile."""
+    """SQLite connection with automatic commit and rollback"""
     ensure_db_dir()
-    conn = sqlite3.connect(DB_PATH, timeout=30.0)
+    conn = connections.acquire(DB_PATH)
+    outermost = connections._depth[conn] == 1
     try:
-        conn.execute("PRAGMA foreign_keys = ON;")
-        conn.execute("PRAGMA busy_timeout = 30000;")  # 30 saniye
         yield conn
-        conn.commit()  # Basarili islemler commit edilir
+        if outermost:
+            conn.commit()
     except Exception:
-        conn.rollback()  # Hata durumunda geri al
+        if outermost:
+            conn.rollback()
         raise
     finally:
-        conn.close()
+        connections.release(conn)
+
+
+@contextmanager
+def get_read_conn():
+    """Read-only connection for listings and reports (never blocks behind a writer)"""
+    ensure_db_dir()
+    conn = connections.acquire(DB_PATH, readonly=True)
+    try:
+        yield conn
+    finally:
+        connections.release(conn)
+
+
+def checkpoint():
+    """Fold the WAL into the main file so DB_PATH can be copied or uploaded as is"""
+    with get_conn() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+
+
+def replace_db_file(source_path):
+    """Atomically replace the database with source_path (sync download, restore, import)"""
+    close_connections()
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(DB_PATH + suffix):
+            os.remove(DB_PATH + suffix)
+    os.replace(source_path, DB_PATH)
 
 
-def merge_databases(incoming_path, master_path):
+def _table_columns(conn, schema, table):
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table});")]
+
+
+def merge_databases(incoming_path, master_path=None, replace_tables=(), region=None):
     """
-    Merge incoming database into master, respecting deletions.
+    Gelen DB dosyasini master'a ATTACH ile, tek transaction'da birkac kume
+    sorgusuyla birlestirir: gelen silme kayitlari yazilir ve uygulanir, silinmis
+    satirlar dislanir, degisen satirlar upsert edilir (son yazan kazanir), ayni
+    satirlara dokunulmaz. replace_tables gelen dosyanin birebir kopyasi olur; region
+    verilirse (bolgesel kopyadan yukleme) bunlarin yalnizca o bolgeye ait satirlari degisir.
+    Doner: {"tombstones": n, "tables": {tablo: {"inserted", "updated", "unchanged", "excluded", "deleted"}}}
     """
-    incoming_conn = sqlite3.connect(incoming_path)
-    master_conn = sqlite3.connect(master_path)
-    
+    conn = sqlite3.connect(master_path or DB_PATH, timeout=30.0)
     try:
-        # 1. Get deleted records from incoming
-        deleted = set()
+        # FK aksiyonlari kapali: REPLACE degisen ebeveynin cocuklarini cascade ile silmesin;
+        # recursive_triggers REPLACE sirasinda rollup ve change_log tetikleyicilerini calistirir
+        conn.execute("PRAGMA foreign_keys = OFF;")
+        conn.execute("PRAGMA busy_timeout = 30000;")
+        conn.execute("PRAGMA recursive_triggers = ON;")
+        conn.execute("ATTACH DATABASE ? AS incoming;", (incoming_path,))
         try:
-            cursor = incoming_conn.execute("SELECT table_name, record_id FROM deleted_records")
-            for row in cursor.fetchall():
-                deleted.add((row[0], row[1]))
-        except sqlite3.OperationalError:
-            pass
-        
-        # 2. Apply deletions to master
-        for table_name, record_id in deleted:
-            master_conn.execute(f"DELETE FROM {table_name} WHERE id = ?", (record_id,))
-            master_conn.execute(
-                "INSERT OR IGNORE INTO deleted_records (table_name, record_id, deleted_at) VALUES (?, ?, ?)",
-                (table_name, record_id, datetime.now().isoformat())
-            )
-        
-        # 3. Merge data from incoming (skip deleted)
-        for table in ["timesheets", "employees", "vehicles", "drivers", "stock_inventory"]:
-            try:
-                # Get column names
-                cursor = incoming_conn.execute(f"PRAGMA table_info({table})")
-                cols = [c[1] for c in cursor.fetchall()]
-                col_str = ", ".join(cols)
-                placeholder = ", ".join(["?"] * len(cols))
-                
-                cursor = incoming_conn.execute(f"SELECT * FROM {table}")
-                for row in cursor.fetchall():
-                    if (table, row[0]) in deleted: continue
-                    master_conn.execute(
-                        f"INSERT OR REPLACE INTO {table} ({col_str}) VALUES ({placeholder})",
-                        row
-                    )
-            except sqlite3.OperationalError:
-                continue
-        
-        master_conn.commit()
+            conn.execute("BEGIN IMMEDIATE;")
+            result = _merge_attached(conn, replace_tables, region)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.execute("DETACH DATABASE incoming;")
+        return result
     finally:
-        incoming_conn.close()
-        master_conn.close()
+        conn.close()
 
 
-def init_db():
-    with get_conn() as conn:
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS employees (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                full_name TEXT NOT NULL,
-                identity_no TEXT,
-                department TEXT,
-                title TEXT
-            );
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS timesheets (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                employee_id INTEGER NOT NULL,
-                work_date TEXT NOT NULL,
-                start_time TEXT NOT NULL,
-                end_time TEXT NOT NULL,
-                break_minutes INTEGER NOT NULL DEFAULT 0,
-                is_special INTEGER NOT NULL DEFAULT 0,
-                notes TEXT,
-                FOREIGN KEY (employee_id) REFERENCES employees (id) ON DELETE CASCADE
-            );
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS settings (
-                key TEXT PRIMARY KEY,
-                value TEXT NOT NULL
-            );
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS reports (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                file_path TEXT NOT NULL,
-                created_at TEXT NOT NULL,
-                employee TEXT,
-                start_date TEXT,
-                end_date TEXT
-            );
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS shift_templates (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE,
-                start_time TEXT NOT NULL,
-                end_time TEXT NOT NULL,
-                break_minutes INTEGER NOT NULL DEFAULT 0
-            );
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS vehicles (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                plate TEXT NOT NULL UNIQUE,
-                brand TEXT,
-                model TEXT,
-                year TEXT,
-                km INTEGER,
-                inspection_date TEXT,
-                insurance_date TEXT,
-                maintenance_date TEXT,
-                oil_change_date TEXT,
-                oil_change_km INTEGER,
-                oil_interval_km INTEGER,
-                notes TEXT
-            );
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS drivers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                full_name TEXT NOT NULL UNIQUE,
-                license_class TEXT,
-                license_expiry TEXT,
-                phone TEXT,
-                notes TEXT
-            );
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL UNIQUE,
-                password_hash TEXT NOT NULL,
-                role TEXT NOT NULL,
-                region TEXT NOT NULL
-            );
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS vehicle_faults (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                vehicle_id INTEGER NOT NULL,
-                title TEXT NOT NULL,
-                description TEXT,
-                opened_date TEXT,
-                closed_date TEXT,
-                status TEXT DEFAULT 'Acik',
-                FOREIGN KEY (vehicle_id) REFERENCES vehicles (id) ON DELETE CASCADE
-            );
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS vehicle_inspections (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                vehicle_id INTEGER NOT NULL,
-                driver_id INTEGER,
-                inspection_date TEXT NOT NULL,
-                week_start TEXT NOT NULL,
-                km INTEGER,
-                notes TEXT,
-                fault_id INTEGER,
-                fault_status TEXT,
-                service_visit INTEGER DEFAULT 0,
-                FOREIGN KEY (vehicle_id) REFERENCES vehicles (id) ON DELETE CASCADE,
-                FOREIGN KEY (driver_id) REFERENCES drivers (id) ON DELETE SET NULL,
-                FOREIGN KEY (fault_id) REFERENCES vehicle_faults (id) ON DELETE SET NULL
-            );
-            """
+def _merge_attached(conn, replace_tables, region=None):
+    master_tables = {row[0] for row in conn.execute("SELECT name FROM main.sqlite_master WHERE type = 'table';")}
+    incoming_tables = {row[0] for row in conn.execute("SELECT name FROM incoming.sqlite_master WHERE type = 'table';")}
+    _ensure_deleted_records_table(conn)
+    result = {"tombstones": 0, "tables": {}}
+
+    def table_counts(table):
+        return result["tables"].setdefault(
+            table, {"inserted": 0, "updated": 0, "unchanged": 0, "excluded": 0, "deleted": 0}
         )
-        conn.execute(
+
+    # 1. Gelen silme kayitlari: yenileri yaz, satirlarini master'dan sil
+    if "deleted_records" in incoming_tables:
+        result["tombstones"] = conn.execute(
             """
-            CREATE TABLE IF NOT EXISTS vehicle_service_visits (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                vehicle_id INTEGER NOT NULL,
-                fault_id INTEGER,
-                start_date TEXT NOT NULL,
-                end_date TEXT,
-                reason TEXT,
-                cost REAL,
-                notes TEXT,
-                FOREIGN KEY (vehicle_id) REFERENCES vehicles (id) ON DELETE CASCADE,
-                FOREIGN KEY (fault_id) REFERENCES vehicle_faults (id) ON DELETE SET NULL
-            );
+            INSERT INTO main.deleted_records (table_name, record_id, deleted_at, deleted_by)
+            SELECT table_name, record_id, MIN(deleted_at), MAX(deleted_by) FROM incoming.deleted_records d
+            WHERE NOT EXISTS (SELECT 1 FROM main.deleted_records m
+                              WHERE m.table_name = d.table_name AND m.record_id = d.record_id)
+            GROUP BY table_name, record_id;
             """
-        )
+        ).rowcount
+        for (table,) in conn.execute("SELECT DISTINCT table_name FROM incoming.deleted_records;").fetchall():
+            if table in master_tables:
+                table_counts(table)["deleted"] += conn.execute(
+                    f"DELETE FROM main.{table} WHERE id IN "
+                    "(SELECT record_id FROM incoming.deleted_records WHERE table_name = ?);",
+                    (table,),
+                ).rowcount
+
+    # 2. Degisen satirlari upsert et; master'da silinmis olanlari atla
+    for table in SYNC_TABLES:
+        if table not in master_tables or table not in incoming_tables:
+            continue
+        shared = set(_table_columns(conn, "incoming", table))
+        columns = [column for column in _table_columns(conn, "main", table) if column in shared]
+        if "id" not in columns:
+            continue
+        live = "NOT EXISTS (SELECT 1 FROM main.deleted_records d WHERE d.table_name = ? AND d.record_id = i.id)"
+        same = " AND ".join(f"m.{column} IS i.{column}" for column in columns)
+        identical = f"EXISTS (SELECT 1 FROM main.{table} m WHERE m.id = i.id AND {same})"
+        known = f"EXISTS (SELECT 1 FROM main.{table} m WHERE m.id = i.id)"
+        kinds = dict(conn.execute(
+            f"""
+            SELECT kind, COUNT(*) FROM (
+                SELECT CASE WHEN NOT {live} THEN 'excluded' WHEN {identical} THEN 'unchanged'
+                            WHEN {known} THEN 'updated' ELSE 'inserted' END AS kind
+                FROM incoming.{table} i
+            ) GROUP BY kind;
+            """,
+            (table,),
+        ).fetchall())
+        counts = table_counts(table)
+        if table in replace_tables:
+            scope, params = "", (table,)
+            if region and table in REGION_COLUMNS:
+                scope, params = f" AND {REGION_COLUMNS[table]} = ?", (table, region)
+            counts["deleted"] += conn.execute(
+                f"DELETE FROM main.{table} WHERE id NOT IN (SELECT i.id FROM incoming.{table} i WHERE {live}){scope};",
+                params,
+            ).rowcount
+        column_list = ", ".join(columns)
         conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS vehicle_inspection_results (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                inspection_id INTEGER NOT NULL,
-                item_key TEXT NOT NULL,
-                status TEXT NOT NULL,
-                note TEXT,
-                FOREIGN KEY (inspection_id) REFERENCES vehicle_inspections (id) ON DELETE CASCADE
-            );
-            """
+            f"""
+            INSERT OR REPLACE INTO main.{table} ({column_list})
+            SELECT {", ".join(f"i.{column}" for column in columns)} FROM incoming.{table} i
+            WHERE {live} AND NOT {identical};
+            """,
+            (table,),
         )
+        for kind in ("inserted", "updated", "unchanged", "excluded"):
+            counts[kind] = kinds.get(kind, 0)
+    return result
+
+
+def init_db():
+    """Semayi PRAGMA user_version ile gunceller; sema guncelse hicbir DDL calismaz."""
+    with get_conn() as conn:
+        _run_migrations(conn)
+    start_auto_backup()
+
+
+def _run_migrations(conn):
+    version = conn.execute("PRAGMA user_version;").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+    conn.commit()
+    while True:
+        conn.execute("BEGIN IMMEDIATE;")
+        # Baska bir surec kilidi beklerken migrate etmis olabilir
+        version = conn.execute("PRAGMA user_version;").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            conn.commit()
+            return
+        MIGRATIONS[version](conn)
+        conn.execute(f"PRAGMA user_version = {version + 1};")
+        conn.commit()
+
+
+def _migrate_base_schema(conn):
+    """v1: tablolar, varsayilan kayitlar ve surumsuz eski DB'ler icin kolon kontrolleri."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS employees (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            full_name TEXT NOT NULL,
+            identity_no TEXT,
+            department TEXT,
+            title TEXT
+        );
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS timesheets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            employee_id INTEGER NOT NULL,
+            work_date TEXT NOT NULL,
+            start_time TEXT NOT NULL,
+            end_time TEXT NOT NULL,
+            break_minutes INTEGER NOT NULL DEFAULT 0,
+            is_special INTEGER NOT NULL DEFAULT 0,
+            notes TEXT,
+            FOREIGN KEY (employee_id) REFERENCES employees (id) ON DELETE CASCADE
+        );
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS reports (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_path TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            employee TEXT,
+            start_date TEXT,
+            end_date TEXT
+        );
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS shift_templates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            start_time TEXT NOT NULL,
+            end_time TEXT NOT NULL,
+            break_minutes INTEGER NOT NULL DEFAULT 0
+        );
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS vehicles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            plate TEXT NOT NULL UNIQUE,
+            brand TEXT,
+            model TEXT,
+            year TEXT,
+            km INTEGER,
+            inspection_date TEXT,
+            insurance_date TEXT,
+            maintenance_date TEXT,
+            oil_change_date TEXT,
+            oil_change_km INTEGER,
+            oil_interval_km INTEGER,
+            notes TEXT
+        );
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS drivers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            full_name TEXT NOT NULL UNIQUE,
+            license_class TEXT,
+            license_expiry TEXT,
+            phone TEXT,
+            notes TEXT
+        );
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            password_hash TEXT NOT NULL,
+            role TEXT NOT NULL,
+            region TEXT NOT NULL
+        );
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS vehicle_faults (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            vehicle_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            description TEXT,
+            opened_date TEXT,
+            closed_date TEXT,
+            status TEXT DEFAULT 'Acik',
+            FOREIGN KEY (vehicle_id) REFERENCES vehicles (id) ON DELETE CASCADE
+        );
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS vehicle_inspections (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            vehicle_id INTEGER NOT NULL,
+            driver_id INTEGER,
+            inspection_date TEXT NOT NULL,
+            week_start TEXT NOT NULL,
+            km INTEGER,
+            notes TEXT,
+            fault_id INTEGER,
+            fault_status TEXT,
+            service_visit INTEGER DEFAULT 0,
+            FOREIGN KEY (vehicle_id) REFERENCES vehicles (id) ON DELETE CASCADE,
+            FOREIGN KEY (driver_id) REFERENCES drivers (id) ON DELETE SET NULL,
+            FOREIGN KEY (fault_id) REFERENCES vehicle_faults (id) ON DELETE SET NULL
+        );
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS vehicle_service_visits (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            vehicle_id INTEGER NOT NULL,
+            fault_id INTEGER,
+            start_date TEXT NOT NULL,
+            end_date TEXT,
+            reason TEXT,
+            cost REAL,
+            notes TEXT,
+            FOREIGN KEY (vehicle_id) REFERENCES vehicles (id) ON DELETE CASCADE,
+            FOREIGN KEY (fault_id) REFERENCES vehicle_faults (id) ON DELETE SET NULL
+        );
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS vehicle_inspection_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            inspection_id INTEGER NOT NULL,
+            item_key TEXT NOT NULL,
+            status TEXT NOT NULL,
+            note TEXT,
+            FOREIGN KEY (inspection_id) REFERENCES vehicle_inspections (id) ON DELETE CASCADE
+        );
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS stock_inventory (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            stok_kod TEXT,
+            stok_adi TEXT,
+            seri_no TEXT NOT NULL UNIQUE,
+            durum TEXT,
+            tarih TEXT,
+            girdi_yapan TEXT,
+            bolge TEXT NOT NULL,
+            adet INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """
+    )
+    # Delete tracking table for multi-PC sync (23 Ocak 2026)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS deleted_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            record_id INTEGER NOT NULL,
+            deleted_at TEXT NOT NULL,
+            deleted_by TEXT
+        );
+        """
+    )
+    for key, value in DEFAULT_SETTINGS.items():
         conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS stock_inventory (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                stok_kod TEXT,
-                stok_adi TEXT,
-                seri_no TEXT NOT NULL UNIQUE,
-                durum TEXT,
-                tarih TEXT,
-                girdi_yapan TEXT,
-                bolge TEXT NOT NULL,
-                adet INTEGER,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-            """
+            "INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?);",
+            (key, value),
         )
-        # Delete tracking table for multi-PC sync (23 Ocak 2026)
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS deleted_records (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                table_name TEXT NOT NULL,
-                record_id INTEGER NOT NULL,
-                deleted_at TEXT NOT NULL,
-                deleted_by TEXT
-            );
-            """
+    cur = conn.execute("SELECT COUNT(*) FROM shift_templates;")
+    if cur.fetchone()[0] == 0:
+        conn.executemany(
+            "INSERT INTO shift_templates (name, start_time, end_time, break_minutes) VALUES (?, ?, ?, ?);",
+            [
+                ("Hafta Ici 09-18", "09:00", "18:00", 60),
+                ("Cumartesi 09-14", "09:00", "14:00", 0),
+            ],
         )
-        for key, value in DEFAULT_SETTINGS.items():
-            conn.execute(
-                "INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?);",
-                (key, value),
-            )
-        cur = conn.execute("SELECT COUNT(*) FROM shift_templates;")
-        if cur.fetchone()[0] == 0:
-            conn.executemany(
-                "INSERT INTO shift_templates (name, start_time, end_time, break_minutes) VALUES (?, ?, ?, ?);",
-                [
-                    ("Hafta Ici 09-18", "09:00", "18:00", 60),
-                    ("Cumartesi 09-14", "09:00", "14:00", 0),
-                ],
-            )
-        _ensure_timesheet_columns(conn)
-        _ensure_vehicle_columns(conn)
-        _ensure_region_columns(conn)
-        _ensure_deleted_records_table(conn)
-        _seed_default_users(conn)
-        conn.commit()
-    _backup_db_if_needed()
+    _ensure_timesheet_columns(conn)
+    _ensure_vehicle_columns(conn)
+    _ensure_region_columns(conn)
+    _ensure_deleted_records_table(conn)
+    _ensure_timesheet_rollups(conn)
+    _seed_default_users(conn)
+
+
+def _migrate_indexes(conn):
+    """v2: liste filtreleri, aramalar ve sync merge icin ikincil indexler."""
+    for name, target in SCHEMA_INDEXES:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target};")
 
 
 def _ensure_deleted_records_table(conn):
@@ -442,7 +940,6 @@ def _ensure_timesheet_columns(conn):
     columns = {row[1] for row in cur.fetchall()}
     if "is_special" not in columns:
         conn.execute("ALTER TABLE timesheets ADD COLUMN is_special INTEGER NOT NULL DEFAULT 0;")
-        conn.commit()
 
 
 def _ensure_vehicle_columns(conn):
@@ -486,6 +983,123 @@ def _ensure_region_columns(conn):
         )
 
 
+def _rollup_minutes_sql(column):
+    return f"(CAST(substr({column}, 1, 2) AS INTEGER) * 60 + CAST(substr({column}, 4, 2) AS INTEGER))"
+
+
+def _rollup_worked_sql(row):
+    """Worked hours of a timesheet row in SQL, same rule as the web dashboard."""
+    start, end = f"{row}start_time", f"{row}end_time"
+    valid = " AND ".join(
+        f"({col} GLOB '[01][0-9]:[0-5][0-9]' OR {col} GLOB '2[0-3]:[0-5][0-9]')" for col in (start, end)
+    )
+    return (
+        f"(CASE WHEN {valid} THEN (({_rollup_minutes_sql(end)} - {_rollup_minutes_sql(start)} + 1440) % 1440) / 60.0"
+        f" - COALESCE({row}break_minutes, 0) / 60.0 ELSE 0 END)"
+    )
+
+
+def _rollup_values_sql(row):
+    worked = _rollup_worked_sql(row)
+    overtime = f"(CASE WHEN {worked} > 9 THEN {worked} - 9 ELSE 0 END)"
+    special = f"(CASE WHEN {row}is_special THEN {worked} ELSE 0 END)"
+    return worked, overtime, special
+
+
+def _rollup_day_is_unique(row):
+    return (
+        "(CASE WHEN EXISTS (SELECT 1 FROM timesheets WHERE employee_id = {0}.employee_id "
+        "AND work_date = {0}.work_date AND COALESCE(region, '') = COALESCE({0}.region, '') "
+        "AND id != {0}.id) THEN 0 ELSE 1 END)".format(row)
+    )
+
+
+def _ensure_timesheet_rollups(conn):
+    """Calisan/bolge/ay bazinda toplamlar; timesheets trigger'lari ile guncel tutulur."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'timesheet_rollups';"
+    ).fetchone()
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS timesheet_rollups (
+            employee_id INTEGER NOT NULL,
+            region TEXT NOT NULL DEFAULT '',
+            year_month TEXT NOT NULL,
+            worked_hours REAL NOT NULL DEFAULT 0,
+            overtime_hours REAL NOT NULL DEFAULT 0,
+            special_hours REAL NOT NULL DEFAULT 0,
+            row_count INTEGER NOT NULL DEFAULT 0,
+            day_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (employee_id, region, year_month)
+        );
+        """
+    )
+    new_worked, new_overtime, new_special = _rollup_values_sql("NEW.")
+    old_worked, old_overtime, old_special = _rollup_values_sql("OLD.")
+    old_key = (
+        "employee_id = OLD.employee_id AND region = COALESCE(OLD.region, '') "
+        "AND year_month = substr(OLD.work_date, 1, 7)"
+    )
+    add_sql = f"""
+        INSERT INTO timesheet_rollups
+            (employee_id, region, year_month, worked_hours, overtime_hours, special_hours, row_count, day_count)
+        VALUES (NEW.employee_id, COALESCE(NEW.region, ''), substr(NEW.work_date, 1, 7),
+                {new_worked}, {new_overtime}, {new_special}, 1, {_rollup_day_is_unique("NEW")})
+        ON CONFLICT (employee_id, region, year_month) DO UPDATE SET
+            worked_hours = worked_hours + excluded.worked_hours,
+            overtime_hours = overtime_hours + excluded.overtime_hours,
+            special_hours = special_hours + excluded.special_hours,
+            row_count = row_count + 1,
+            day_count = day_count + excluded.day_count;
+    """
+    remove_sql = f"""
+        UPDATE timesheet_rollups SET
+            worked_hours = worked_hours - {old_worked},
+            overtime_hours = overtime_hours - {old_overtime},
+            special_hours = special_hours - {old_special},
+            row_count = row_count - 1,
+            day_count = day_count - {_rollup_day_is_unique("OLD")}
+        WHERE {old_key};
+        DELETE FROM timesheet_rollups WHERE {old_key} AND row_count <= 0;
+    """
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_timesheets_rollup_insert AFTER INSERT ON timesheets
+        BEGIN {add_sql} END;
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_timesheets_rollup_delete AFTER DELETE ON timesheets
+        BEGIN {remove_sql} END;
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_timesheets_rollup_update
+        AFTER UPDATE OF employee_id, work_date, start_time, end_time, break_minutes, is_special, region ON timesheets
+        BEGIN {remove_sql} {add_sql} END;
+        """
+    )
+    if not exists:
+        _rebuild_timesheet_rollups(conn)
+
+
+def _rebuild_timesheet_rollups(conn):
+    worked, overtime, special = _rollup_values_sql("")
+    conn.execute("DELETE FROM timesheet_rollups;")
+    conn.execute(
+        f"""
+        INSERT INTO timesheet_rollups
+            (employee_id, region, year_month, worked_hours, overtime_hours, special_hours, row_count, day_count)
+        SELECT employee_id, COALESCE(region, ''), substr(work_date, 1, 7),
+               SUM({worked}), SUM({overtime}), SUM({special}), COUNT(*), COUNT(DISTINCT work_date)
+        FROM timesheets
+        GROUP BY employee_id, COALESCE(region, ''), substr(work_date, 1, 7);
+        """
+    )
+
+
 def _seed_default_users(conn):
     conn.executemany(
         "INSERT OR IGNORE INTO users (username, password_hash, role, region) VALUES (?, ?, ?, ?);",
@@ -493,6 +1107,61 @@ def _seed_default_users(conn):
     )
 
 
+def _migrate_change_log(conn):
+    """v3: SYNC_TABLES tetikleyicileriyle beslenen change_log ve bolge bazli senkron watermark'lari."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            ts TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%S', 'now')),
+            origin TEXT
+        );
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sync_watermarks (
+            region TEXT PRIMARY KEY,
+            push_seq INTEGER NOT NULL DEFAULT 0,
+            pull_seq INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT
+        );
+        """
+    )
+    _create_change_log_triggers(conn, SYNC_TABLES)
+
+
+def _migrate_change_log_tables(conn):
+    """v4: kalan arac tablolari da change_log'a yazilir; tablo bazli okuma icin index."""
+    _create_change_log_triggers(conn, CHANGE_LOG_TABLES[len(SYNC_TABLES):])
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_change_log_table_seq ON change_log (table_name, seq);")
+
+
+def _create_change_log_triggers(conn, tables):
+    for table in tables:
+        events = (("INSERT", CHANGE_INSERT, "NEW"), ("UPDATE", CHANGE_UPDATE, "NEW"), ("DELETE", CHANGE_DELETE, "OLD"))
+        for event, op, ref in events:
+            conn.execute(
+                f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_log_{op.lower()} AFTER {event} ON {table}
+                BEGIN INSERT INTO change_log (table_name, row_id, op) VALUES ('{table}', {ref}.id, '{op}'); END;
+                """
+            )
+
+
+# MIGRATIONS[n] DB'yi user_version n'den n + 1'e tasir; sadece sona ekleyin
+MIGRATIONS = [
+    _migrate_base_schema,
+    _migrate_indexes,
+    _migrate_change_log,
+    _migrate_change_log_tables,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
 def hash_password(password):
     text = f"rainstaff::{password}"
     return hashlib.sha256(text.encode("utf-8")).hexdigest()
@@ -594,7 +1263,7 @@ def delete_employee(employee_id, deleted_by=None):
 
 
 def list_employees(region=None):
-    with get_conn() as conn:
+    with get_read_conn() as conn:
         query = "SELECT id, full_name, identity_no, department, title, region FROM employees"
         params = []
         if region and region != "ALL":
@@ -648,7 +1317,7 @@ def delete_timesheet(ts_id, deleted_by=None):
         conn.commit()
 
 
-def list_timesheets(employee_id=None, start_date=None, end_date=None, region=None):
+def _timesheet_query(employee_id=None, start_date=None, end_date=None, region=None, after=None):
     query = (
         "SELECT t.id, t.employee_id, e.full_name, t.work_date, t.start_time, t.end_time, "
         "t.break_minutes, t.is_special, t.notes, t.region "
@@ -668,19 +1337,222 @@ def list_timesheets(employee_id=None, start_date=None, end_date=None, region=Non
     if end_date:
         conditions.append("t.work_date <= ?")
         params.append(end_date)
+    if after:
+        conditions.append("(t.work_date, t.id) > (?, ?)")
+        params.extend(after)
     if conditions:
         query += " WHERE " + " AND ".join(conditions)
+    return query, params
+
+
+def list_timesheets(employee_id=None, start_date=None, end_date=None, region=None):
+    query, params = _timesheet_query(employee_id, start_date, end_date, region)
     query += " ORDER BY t.work_date, e.full_name;"
 
-    with get_conn() as conn:
+    with get_read_conn() as conn:
+        cur = conn.execute(query, params)
+        return cur.fetchall()
+
+
+def list_timesheets_page(after_work_date=None, after_id=None, limit=TIMESHEET_PAGE_SIZE,
+                         employee_id=None, start_date=None, end_date=None, region=None):
+    """Keyset sayfasi (work_date, id artan); sonraki sayfa icin son satirin work_date ve id'sini verin."""
+    after = (after_work_date, after_id) if after_work_date is not None and after_id is not None else None
+    query, params = _timesheet_query(employee_id, start_date, end_date, region, after)
+    query += " ORDER BY t.work_date, t.id LIMIT ?;"
+    params.append(int(limit))
+
+    with get_read_conn() as conn:
         cur = conn.execute(query, params)
         return cur.fetchall()
 
 
+def iter_timesheets(employee_id=None, start_date=None, end_date=None, region=None, batch_size=TIMESHEET_PAGE_SIZE):
+    """list_timesheets satirlarini sayfa sayfa uretir; bellekte tek sayfa tutulur."""
+    after_work_date = after_id = None
+    while True:
+        page = list_timesheets_page(after_work_date, after_id, batch_size, employee_id, start_date, end_date, region)
+        yield from page
+        if len(page) < batch_size:
+            return
+        after_work_date, after_id = page[-1][3], page[-1][0]
+
+
 def get_all_timesheets():
     return list_timesheets()
 
 
+def rebuild_timesheet_rollups():
+    with get_conn() as conn:
+        _rebuild_timesheet_rollups(conn)
+        conn.commit()
+
+
+def list_timesheet_rollups(year_month=None, region=None, employee_id=None):
+    """Aylik calisan toplamlari: (employee_id, full_name, region, year_month, worked, overtime, special, rows, days)."""
+    query = (
+        "SELECT r.employee_id, e.full_name, r.region, r.year_month, ROUND(r.worked_hours, 2), "
+        "ROUND(r.overtime_hours, 2), ROUND(r.special_hours, 2), r.row_count, r.day_count "
+        "FROM timesheet_rollups r JOIN employees e ON e.id = r.employee_id"
+    )
+    conditions = []
+    params = []
+    if year_month:
+        conditions.append("r.year_month = ?")
+        params.append(year_month)
+    if region and region != "ALL":
+        conditions.append("r.region = ?")
+        params.append(region)
+    if employee_id:
+        conditions.append("r.employee_id = ?")
+        params.append(employee_id)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY r.year_month DESC, e.full_name;"
+
+    with get_read_conn() as conn:
+        cur = conn.execute(query, params)
+        return cur.fetchall()
+
+
+_dashboard_summary_lock = threading.Lock()
+_dashboard_summaries = {}
+
+
+def dashboard_summary(region=None, today=None):
+    """
+    Web paneli: bu ayin KPI'lari ve gunluk/haftalik/aylik saat serileri, GROUP BY sorgulariyla
+    (aylik rakamlar timesheet_rollups'tan). data_generation() ve bolge basina onbellekte;
+    sadece guncel nesil tutulur.
+    """
+    today = today or datetime.now().date()
+    key = (region or "ALL", today.isoformat())
+    generation = data_generation()
+    with _dashboard_summary_lock:
+        cached = _dashboard_summaries.get(key)
+        if cached and cached[0] == generation:
+            return cached[1]
+    summary = _build_dashboard_summary(region, today)
+    summary["generation"] = generation
+    with _dashboard_summary_lock:
+        for stale in [k for k, (g, _) in _dashboard_summaries.items() if g != generation]:
+            del _dashboard_summaries[stale]
+        _dashboard_summaries[key] = (generation, summary)
+    return summary
+
+
+def _build_dashboard_summary(region, today):
+    if region == "ALL":
+        region = None
+    month = today.strftime("%Y-%m")
+    # Aylik seri bu aydan sonraki aylari kapsar
+    months = today.year * 12 + today.month - 1 - DASHBOARD_MONTHS
+    before_month = f"{months // 12}-{months % 12 + 1:02d}"
+    first_day = (today - timedelta(days=DASHBOARD_DAYS - 1)).isoformat()
+    first_week = (today - timedelta(days=today.weekday() + 7 * (DASHBOARD_WEEKS - 1))).isoformat()
+    end_day = today.isoformat()
+    # Saatler trigger'larla ayni kuralla SQL'de (9 saat ustu fazla mesai); gece saati tutulmuyor
+    worked, overtime, special = _rollup_values_sql("t.")
+    rollup_hours = (
+        "ROUND(SUM(r.worked_hours), 2), ROUND(SUM(r.overtime_hours), 2), 0, ROUND(SUM(r.special_hours), 2)"
+    )
+    timesheet_hours = f"ROUND(SUM({worked}), 2), ROUND(SUM({overtime}), 2), 0, ROUND(SUM({special}), 2)"
+    region_params = [region] if region else []
+
+    def where_region(column):
+        return f" AND {column} = ?" if region else ""
+
+    def hours_row(bucket, row):
+        worked_hours, overtime_hours, night_hours, special_hours = (value or 0 for value in row)
+        return {
+            "bucket": bucket, "worked": worked_hours, "overtime": overtime_hours,
+            "night": night_hours, "special": special_hours,
+        }
+
+    with get_read_conn() as conn:
+        def count(table, column, condition=""):
+            return conn.execute(
+                f"SELECT COUNT(*) FROM {table} WHERE 1=1{condition}{where_region(column)};", region_params
+            ).fetchone()[0]
+
+        current = hours_row(month, conn.execute(
+            f"SELECT {rollup_hours} FROM timesheet_rollups r WHERE r.year_month = ?{where_region('r.region')};",
+            [month] + region_params,
+        ).fetchone())
+        top = conn.execute(
+            f"""
+            SELECT e.full_name, ROUND(SUM(r.overtime_hours), 2) AS overtime
+            FROM timesheet_rollups r JOIN employees e ON e.id = r.employee_id
+            WHERE r.year_month = ?{where_region('r.region')}
+            GROUP BY r.employee_id HAVING overtime > 0 ORDER BY overtime DESC LIMIT 1;
+            """,
+            [month] + region_params,
+        ).fetchone()
+        kpis = {
+            "employees": count("employees", "region"),
+            "timesheets": count("timesheets", "region"),
+            "vehicles": count("vehicles", "region"),
+            "drivers": count("drivers", "region"),
+            "open_faults": count("vehicle_faults", "region", " AND status = 'Acik'"),
+            "worked_hours": current["worked"],
+            "overtime_hours": current["overtime"],
+            "night_hours": current["night"],
+            "special_hours": current["special"],
+            "top_overtime": {"name": top[0], "overtime": top[1]} if top else None,
+        }
+
+        monthly = [hours_row(row[0], row[1:]) for row in conn.execute(
+            f"""
+            SELECT r.year_month, {rollup_hours} FROM timesheet_rollups r
+            WHERE r.year_month > ?{where_region('r.region')}
+            GROUP BY r.year_month ORDER BY r.year_month;
+            """,
+            [before_month] + region_params,
+        )]
+        daily = [hours_row(row[0], row[1:]) for row in conn.execute(
+            f"""
+            SELECT t.work_date, {timesheet_hours} FROM timesheets t
+            WHERE t.work_date BETWEEN ? AND ?{where_region('t.region')}
+            GROUP BY t.work_date ORDER BY t.work_date;
+            """,
+            [first_day, end_day] + region_params,
+        )]
+
+        def overtime_series(bucket, since, key):
+            rows = conn.execute(
+                f"""
+                SELECT {bucket} AS bucket, {key} AS key, ROUND(SUM({overtime}), 2)
+                FROM timesheets t JOIN employees e ON e.id = t.employee_id
+                WHERE t.work_date BETWEEN ? AND ?{where_region('t.region')}
+                GROUP BY bucket, key ORDER BY bucket, key;
+                """,
+                [since, end_day] + region_params,
+            )
+            return [{"bucket": row[0], "key": row[1], "overtime": row[2]} for row in rows]
+
+        # Haftalar pazartesi baslar
+        week = "date(t.work_date, 'weekday 0', '-6 days')"
+        department = "COALESCE(NULLIF(e.department, ''), '-')"
+        region_key = "COALESCE(NULLIF(t.region, ''), '-')"
+        overtime_by = {
+            "daily": {
+                "department": overtime_series("t.work_date", first_day, department),
+                "region": overtime_series("t.work_date", first_day, region_key),
+            },
+            "weekly": {
+                "department": overtime_series(week, first_week, department),
+                "region": overtime_series(week, first_week, region_key),
+            },
+        }
+
+    return {
+        "region": region or "ALL",
+        "month": month,
+        "kpis": kpis,
+        "series": {"monthly": monthly, "daily": daily, "overtime": overtime_by},
+    }
+
+
 def list_shift_templates():
     with get_conn() as conn:
         cur = conn.execute(
@@ -700,7 +1572,7 @@ def add_report_log(file_path, created_at, employee, start_date, end_date):
 
 
 def list_report_logs():
-    with get_conn() as conn:
+    with get_read_conn() as conn:
         cur = conn.execute(
             "SELECT id, file_path, created_at, employee, start_date, end_date "
             "FROM reports ORDER BY created_at DESC;"
@@ -818,7 +1690,7 @@ def delete_vehicle(vehicle_id):
 
 
 def list_vehicles(region=None):
-    with get_conn() as conn:
+    with get_read_conn() as conn:
         query = (
             "SELECT id, plate, brand, model, year, km, inspection_date, insurance_date, maintenance_date, "
             "oil_change_date, oil_change_km, oil_interval_km, notes, region "
@@ -878,7 +1750,7 @@ def delete_driver(driver_id):
 
 
 def list_drivers(region=None):
-    with get_conn() as conn:
+    with get_read_conn() as conn:
         query = "SELECT id, full_name, license_class, license_expiry, phone, notes, region FROM drivers"
         params = []
         if region and region != "ALL":
@@ -953,7 +1825,7 @@ def list_vehicle_inspections(vehicle_id=None, week_start=None, region=None):
     if conditions:
         query += " WHERE " + " AND ".join(conditions)
     query += " ORDER BY i.inspection_date DESC;"
-    with get_conn() as conn:
+    with get_read_conn() as conn:
         cur = conn.execute(query, params)
         return cur.fetchall()
 
@@ -981,7 +1853,7 @@ def list_driver_inspections(driver_id, region=None):
         query += " AND i.region = ?"
         params.append(region)
     query += " ORDER BY i.inspection_date DESC;"
-    with get_conn() as conn:
+    with get_read_conn() as conn:
         cur = conn.execute(query, params)
         return cur.fetchall()
 
@@ -1060,7 +1932,7 @@ def list_vehicle_faults(vehicle_id=None, status=None, region=None):
     if conditions:
         query += " WHERE " + " AND ".join(conditions)
     query += " ORDER BY f.opened_date DESC, f.id DESC;"
-    with get_conn() as conn:
+    with get_read_conn() as conn:
         cur = conn.execute(query, params)
         return cur.fetchall()
 
@@ -1140,7 +2012,7 @@ def list_vehicle_service_visits(vehicle_id=None, fault_id=None, start_date=None,
     if conditions:
         query += " WHERE " + " AND ".join(conditions)
     query += " ORDER BY s.start_date DESC, s.id DESC;"
-    with get_conn() as conn:
+    with get_read_conn() as conn:
         cur = conn.execute(query, params)
         return cur.fetchall()
 
@@ -1167,14 +2039,300 @@ def delete_shift_template(template_id):
 # SYNC FUNCTIONS - Multi-region database synchronization (Added 19 Ocak 2026)
 # ============================================================================
 
-def sync_with_server(sync_url, api_key, region):
+def _change_seq(conn):
+    # sqlite_sequence silinen log satirlarindan etkilenmez
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log';").fetchone()
+    return row[0] if row else 0
+
+
+def _change_floor(conn):
+    # Okunabilen en eski konum: sonrasindaki tum degisiklikler change_log'da
+    first = conn.execute("SELECT MIN(seq) FROM change_log;").fetchone()[0]
+    return _change_seq(conn) if first is None else first - 1
+
+
+def latest_change_seq():
+    with get_read_conn() as conn:
+        return _change_seq(conn)
+
+
+def data_generation():
+    """
+    Her yazimda degisen belirtec: change_log konumu + DB ve WAL dosya durumu (ayarlar ve dosya
+    degisimi gunluge yazilmaz). Veriden turetilen gorunumlerin onbellek anahtari.
+    """
+    with get_read_conn() as conn:
+        seq = _change_seq(conn)
+    return hashlib.sha1(repr((seq, _file_state(DB_PATH))).encode()).hexdigest()[:16]
+
+
+def list_changes(since_seq=0, limit=CHANGE_LOG_PAGE_SIZE, tables=None):
+    """
+    since_seq'ten sonraki change_log kayitlari, eskiden yeniye:
+    (seq, table_name, row_id, op, ts). since_seq sikistirilmis bolgedeyse ValueError
+    (okuyucu bastan kurmali).
+    """
+    with get_read_conn() as conn:
+        if since_seq < _change_floor(conn):
+            raise ValueError(f"change_log compacted past seq {since_seq}")
+        query = "SELECT seq, table_name, row_id, op, ts FROM change_log WHERE seq > ?"
+        params = [since_seq]
+        if tables:
+            query += f" AND table_name IN ({', '.join('?' * len(tables))})"
+            params.extend(tables)
+        query += " ORDER BY seq LIMIT ?;"
+        params.append(limit)
+        return conn.execute(query, params).fetchall()
+
+
+def compact_change_log(up_to_seq):
+    """Onaylanmis kayitlari (seq <= up_to_seq) siler; silinen sayisini doner."""
+    with get_conn() as conn:
+        return conn.execute("DELETE FROM change_log WHERE seq <= ?;", (up_to_seq,)).rowcount
+
+
+def min_sync_pull_seq():
+    """Tum bolgelerin cektigi en dusuk master konumu; oncesi onaylanmistir."""
+    with get_read_conn() as conn:
+        return conn.execute("SELECT COALESCE(MIN(pull_seq), 0) FROM sync_watermarks;").fetchone()[0]
+
+
+def get_sync_watermark(region):
+    """Bolgenin (push_seq, pull_seq) degerleri; ilk delta senkrondan once None."""
+    with get_read_conn() as conn:
+        row = conn.execute(
+            "SELECT push_seq, pull_seq FROM sync_watermarks WHERE region = ?;", (region,)
+        ).fetchone()
+    return tuple(row) if row else None
+
+
+def set_sync_watermark(region, push_seq=None, pull_seq=None):
+    with get_conn() as conn:
+        conn.execute(
+            """
+            INSERT INTO sync_watermarks (region, push_seq, pull_seq, updated_at) VALUES (?, COALESCE(?, 0), COALESCE(?, 0), ?)
+            ON CONFLICT(region) DO UPDATE SET push_seq = COALESCE(?, push_seq), pull_seq = COALESCE(?, pull_seq),
+            updated_at = excluded.updated_at;
+            """,
+            (region, push_seq, pull_seq, datetime.now().isoformat(), push_seq, pull_seq),
+        )
+
+
+def reset_sync_watermark(region):
+    """Tam /sync/download sonrasi: dosya master'dan geldi, iki taraf da son seq'te."""
+    with get_conn() as conn:
+        seq = _change_seq(conn)
+        conn.execute("DELETE FROM sync_watermarks;")
+        conn.execute(
+            "INSERT INTO sync_watermarks (region, push_seq, pull_seq, updated_at) VALUES (?, ?, ?, ?);",
+            (region, seq, seq, datetime.now().isoformat()),
+        )
+    return seq
+
+
+def sync_delta_available(since):
+    """since bu change_log'da okunabilir bir konum degilse (sikistirildi, sifirlandi, degisti) False."""
+    with get_read_conn() as conn:
+        return _change_floor(conn) <= since <= _change_seq(conn)
+
+
+def collect_sync_delta(since, skip_origin=None, region=None):
+    """
+    since'ten sonra degisen SYNC_TABLES satirlari:
+    {"seq", "upserts": {tablo: {"columns", "rows"}}, "deletes": {tablo: [id]}}.
+    Son degisikligi skip_origin'den gelen satirlar atlanir (gonderene geri donmez).
+    region verilirse yalnizca o bolgenin satirlari gonderilir (bolgesel indirme kopyalari).
+    """
+    delta = {"seq": since, "upserts": {}, "deletes": {}}
+    with get_read_conn() as conn:
+        conn.execute("BEGIN;")
+        try:
+            delta["seq"] = _change_seq(conn)
+            for table in SYNC_TABLES:
+                # Ciplak origin MAX(seq) satirindan gelir: satirin son degisikligi
+                changed = [
+                    row_id for row_id, origin, _ in conn.execute(
+                        """
+                        SELECT row_id, origin, MAX(seq) FROM change_log
+                        WHERE table_name = ? AND seq > ? AND seq <= ? GROUP BY row_id;
+                        """,
+                        (table, since, delta["seq"]),
+                    ) if skip_origin is None or origin != skip_origin
+                ]
+                if not changed:
+                    continue
+                rows = []
+                for start in range(0, len(changed), 500):
+                    chunk = changed[start:start + 500]
+                    cursor = conn.execute(f"SELECT * FROM {table} WHERE id IN ({', '.join('?' * len(chunk))});", chunk)
+                    rows.extend(cursor.fetchall())
+                columns = [column[0] for column in cursor.description]
+                present = {row[0] for row in rows}
+                if region and table in REGION_COLUMNS:
+                    # Baska bolgenin satirlari silinmis sayilmaz: yalnizca gonderilmez
+                    position = columns.index(REGION_COLUMNS[table])
+                    rows = [row for row in rows if row[position] == region]
+                if rows:
+                    delta["upserts"][table] = {"columns": columns, "rows": [list(row) for row in rows]}
+                removed = [row_id for row_id in changed if row_id not in present]
+                if removed:
+                    delta["deletes"][table] = removed
+        finally:
+            conn.rollback()
+    return delta
+
+
+def apply_sync_delta(delta, origin=None, protect_after=None):
     """
-    Upload local database to server and download merged version
+    collect_sync_delta() ciktisini tek transaction'da uygular; silmeler deleted_records'a yazilir.
+    origin: delta'yi gonderen bolge, olusan change_log satirlarina yazilir. None ise (istemci
+    master delta'sini uyguluyor) satirlar silinir, geri gonderilmez.
+    protect_after: bu yerel seq'ten sonra degisen satirlar yerel halini korur.
+    Doner: {tablo: {"upserted": n, "deleted": n, "skipped": n}}
+    """
+    counts = {}
+    with get_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE;")
+        before = _change_seq(conn)
+        protected = set()
+        if protect_after is not None:
+            protected = set(conn.execute(
+                "SELECT table_name, row_id FROM change_log WHERE seq > ?;", (protect_after,)
+            ).fetchall())
+        upserts = delta.get("upserts") or {}
+        deletes = delta.get("deletes") or {}
+        for table in SYNC_TABLES:
+            if table not in upserts:
+                continue
+            known = {column[1] for column in conn.execute(f"PRAGMA table_info({table});")}
+            columns = upserts[table]["columns"]
+            keep = [i for i, column in enumerate(columns) if column in known]
+            names = [columns[i] for i in keep]
+            values = ", ".join("?" * len(names))
+            updates = ", ".join(f"{name} = excluded.{name}" for name in names if name != "id")
+            upsert_sql = f"INSERT INTO {table} ({', '.join(names)}) VALUES ({values}) ON CONFLICT(id) DO UPDATE SET {updates};"
+            replace_sql = f"INSERT OR REPLACE INTO {table} ({', '.join(names)}) VALUES ({values});"
+            table_counts = counts.setdefault(table, {"upserted": 0, "deleted": 0, "skipped": 0})
+            for row in upserts[table]["rows"]:
+                params = [row[i] for i in keep]
+                if (table, params[names.index("id")]) in protected:
+                    table_counts["skipped"] += 1
+                    continue
+                try:
+                    conn.execute(upsert_sql, params)
+                except sqlite3.IntegrityError:
+                    # Ayni dogal anahtar (plaka, seri_no) baska id'de: gelen satir kazanir
+                    try:
+                        conn.execute(replace_sql, params)
+                    except sqlite3.IntegrityError:
+                        table_counts["skipped"] += 1
+                        continue
+                table_counts["upserted"] += 1
+        deleted_at = datetime.now().isoformat()
+        for table in reversed(SYNC_TABLES):
+            ids = [row_id for row_id in deletes.get(table) or () if (table, row_id) not in protected]
+            if not ids:
+                continue
+            table_counts = counts.setdefault(table, {"upserted": 0, "deleted": 0, "skipped": 0})
+            for row_id in ids:
+                table_counts["deleted"] += conn.execute(f"DELETE FROM {table} WHERE id = ?;", (row_id,)).rowcount
+            conn.executemany(
+                "INSERT INTO deleted_records (table_name, record_id, deleted_at) VALUES (?, ?, ?);",
+                [(table, row_id, deleted_at) for row_id in ids],
+            )
+        if origin is None:
+            conn.execute("DELETE FROM change_log WHERE seq > ?;", (before,))
+        else:
+            conn.execute("UPDATE change_log SET origin = ? WHERE seq > ?;", (origin, before))
+    return counts
+
+
+def _sync_delta_with_server(sync_url, api_key, region, scope="ALL"):
+    """Sadece degisen satirlar; tam senkron gerekiyorsa None, aksi halde (success, message)."""
+    push_seq, pull_seq = get_sync_watermark(region)
+    outgoing = collect_sync_delta(push_seq)
+    payload = {
+        "since": pull_seq,
+        "seq": outgoing["seq"],
+        "upserts": outgoing["upserts"],
+        "deletes": outgoing["deletes"],
+    }
+    headers = {
+        "X-API-KEY": api_key,
+        "X-Region": region,
+        "X-Sync-Scope": scope,
+        "X-Reason": "periodic_sync"
+    }
+    resp = sync_codec.post_json(http_transport.post, sync_url.rstrip("/") + "/sync/delta", payload,
+                                headers=headers)
+    # Eski sunucu (404) veya bilinmeyen watermark (409): tam senkrona don
+    if resp.status_code in (404, 409):
+        return None
+    if resp.status_code != 200:
+        return False, f"Delta sync failed: HTTP {resp.status_code}"
+    incoming = resp.json()
+    apply_sync_delta(incoming, protect_after=outgoing["seq"])
+    set_sync_watermark(region, push_seq=outgoing["seq"], pull_seq=incoming["seq"])
+    compact_change_log(outgoing["seq"])
+    return True, "Delta sync completed successfully"
+
+
+def _download_db_file(download_url, headers, download_path, etag=None):
+    """
+    /sync/download -> download_path, akisla; kopan indirme Range + If-Range ile devam eder.
+    Doner: (HTTP durum, ETag); 304 = etag hala gecerli, dosya yazilmadi.
+    gzip/zstd govde sikistirilmis haliyle indirilir, sonra diske acilir.
+    """
+    import requests
+    from urllib3.exceptions import HTTPError as TransferError
+
+    transfer_path = download_path + ".transfer"
+    offset = 0
+    response_etag = None
+    encoding = None
+    for attempt in range(SYNC_DOWNLOAD_ATTEMPTS):
+        request_headers = dict(headers, **{"Accept-Encoding": sync_codec.accept_encoding_header()})
+        if offset and response_etag:
+            request_headers["Range"] = f"bytes={offset}-"
+            request_headers["If-Range"] = response_etag
+        elif etag:
+            request_headers["If-None-Match"] = etag
+        try:
+            with http_transport.get(download_url, headers=request_headers, stream=True) as resp:
+                if resp.status_code == 304:
+                    return 304, etag
+                if resp.status_code == 200:
+                    # Tam icerik (ilk istek ya da sunucu kopyasi degisti): bastan yaz
+                    offset = 0
+                elif resp.status_code != 206:
+                    return resp.status_code, None
+                response_etag = resp.headers.get("ETag")
+                encoding = resp.headers.get("Content-Encoding")
+                with open(transfer_path, "r+b" if offset else "wb") as handle:
+                    handle.seek(offset)
+                    handle.truncate()
+                    # Ham baytlar: Range ofsetleri sikistirilmis govdeye aittir
+                    for chunk in resp.raw.stream(sync_codec.CHUNK_SIZE, decode_content=False):
+                        handle.write(chunk)
+                        offset += len(chunk)
+            sync_codec.decode_file(transfer_path, download_path, encoding)
+            os.remove(transfer_path)
+            return 200, response_etag
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError, TransferError):
+            if not (offset and response_etag) or attempt == SYNC_DOWNLOAD_ATTEMPTS - 1:
+                raise
+
+
+def sync_with_server(sync_url, api_key, region, scope=None):
+    """
+    Sync local database with server: row-level delta via /sync/delta when a
+    watermark exists, otherwise upload the file and download the merged version
     
     Args:
         sync_url: Server URL (e.g., https://rainstaff.onrender.com)
         api_key: API authentication token
         region: Current region (Ankara, Istanbul, etc)
+        scope: Region subset to download (None/ALL = whole database)
     
     Returns:
         tuple: (success: bool, message: str)
@@ -1182,38 +2340,81 @@ def sync_with_server(sync_url, api_key, region):
     import requests
     
     try:
-        # Step 1: Upload local DB to server
-        with open(DB_PATH, "rb") as f:
-            files = {"db": (f"puantaj_{region}.db", f, "application/octet-stream")}
-            headers = {
-                "X-API-KEY": api_key,
-                "X-Region": region,
-                "X-Reason": "periodic_sync"
-            }
-            upload_url = sync_url.rstrip("/") + "/sync"
-            
-            resp = requests.post(upload_url, headers=headers, files=files, timeout=15)
-            
-            if resp.status_code != 200:
-                return False, f"Upload failed: HTTP {resp.status_code}"
+        # Yerel dosyanin kapsami son indirmeden bilinir; kapsam degistiyse tam senkron
+        scope = scope or "ALL"
+        held_scope = get_setting("sync_download_scope") or "ALL"
+        
+        # Step 0: Watermark varsa sadece degisen satirlar
+        if scope == held_scope and get_sync_watermark(region) is not None:
+            result = _sync_delta_with_server(sync_url, api_key, region, scope)
+            if result is not None:
+                return result
+        
+        # Step 1: Upload local DB to server (gzip/zstd compressed raw body)
+        checkpoint()
+        headers = {
+            "X-API-KEY": api_key,
+            "X-Region": region,
+            "X-Sync-Scope": held_scope,
+            "X-Reason": "periodic_sync",
+            # Birlestirmeyi kuyruga alan sunucu 202 + is kimligi doner
+            "Prefer": "respond-async"
+        }
+        upload_url = sync_url.rstrip("/") + "/sync"
+        
+        def upload_multipart():
+            # Sunucu sikistirilmis ham govdeyi tanimiyor: eski multipart yukleme
+            with open(DB_PATH, "rb") as f:
+                files = {"db": (f"puantaj_{region}.db", f, "application/octet-stream")}
+                return http_transport.post(upload_url, headers=headers, files=files)
+        
+        # Parcali, kaldigi yerden devam eden yukleme; /sync/uploads olmayan sunucuda tek govde
+        resp = sync_codec.upload_resumable(http_transport.request, sync_url, DB_PATH, headers=headers,
+                                           state_path=DB_PATH + ".upload.json")
+        if resp is None:
+            resp = sync_codec.post_file(http_transport.post, upload_url, DB_PATH, headers=headers,
+                                        fallback=upload_multipart)
+        # Indirme birlestirme bittikten sonra: kuyruktaki isin durumu sorgulanir
+        resp = http_transport.wait_for_job(resp, headers={"X-API-KEY": api_key})
+        if resp.status_code == 202:
+            return False, "Upload failed: server merge still running"
+        if resp.status_code != 200:
+            return False, f"Upload failed: HTTP {resp.status_code}"
         
         # Step 2: Download merged database from server
-        headers = {"X-API-KEY": api_key}
+        # X-Region: sunucu bu bolgenin alt kumesini gonderir (ALL = tum DB)
+        headers = {"X-API-KEY": api_key, "X-Region": scope}
         download_url = sync_url.rstrip("/") + "/sync/download"
+        # Saklanan ETag yerel dosyayi ancak o indirmeden beri yerel degisiklik yoksa tanimlar
+        etag = None
+        if scope == held_scope and get_setting("sync_download_seq") == str(latest_change_seq()):
+            etag = get_setting("sync_download_etag") or None
         
-        resp = requests.get(download_url, headers=headers, timeout=15)
+        download_path = DB_PATH + ".download"
+        status, new_etag = _download_db_file(download_url, headers, download_path, etag)
         
-        if resp.status_code != 200:
-            return False, f"Download failed: HTTP {resp.status_code}"
+        if status == 304:
+            # Sunucu kopyasi degismedi: yerel DB yeniden yazilmaz
+            compact_change_log(reset_sync_watermark(region))
+            return True, "Sync completed successfully (not modified)"
+        if status != 200:
+            return False, f"Download failed: HTTP {status}"
         
         # Step 3: Backup current local database
         backup_path = DB_PATH + ".sync_backup"
         if os.path.isfile(DB_PATH):
-            shutil.copy2(DB_PATH, backup_path)
+            create_backup(backup_path)
         
-        # Step 4: Write downloaded database as new local DB
-        with open(DB_PATH, "wb") as f:
-            f.write(resp.content)
+        # Step 4: Swap the downloaded database in as the new local DB
+        replace_db_file(download_path)
+        
+        # Step 5: Sonraki senkronlar bu dosyadan itibaren delta ile
+        init_db()
+        compact_change_log(reset_sync_watermark(region))
+        set_setting("sync_download_scope", scope)
+        if new_etag:
+            set_setting("sync_download_etag", new_etag)
+            set_setting("sync_download_seq", str(latest_change_seq()))
         
         return True, "Sync completed successfully"
     
@@ -1236,13 +2437,11 @@ def get_sync_status(sync_url, api_key):
     Returns:
         dict: Server status information or None if error
     """
-    import requests
-    
     try:
         headers = {"X-API-KEY": api_key}
         url = sync_url.rstrip("/") + "/sync/status"
         
-        resp = requests.get(url, headers=headers, timeout=5)
+        resp = http_transport.get(url, headers=headers)
         
         if resp.status_code == 200:
             return resp.json()
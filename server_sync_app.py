@@ -17,11 +17,14 @@ import os
 import sqlite3
 import shutil
 import hashlib
+import tempfile
 import threading
 from datetime import datetime
 from contextlib import contextmanager
 from flask import Flask, request, jsonify, send_file
-import io
+
+from staff_db import merge_databases as merge_database_file, download_snapshot
+import sync_codec
 
 app = Flask(__name__)
 
@@ -196,56 +199,28 @@ def init_master_db():
                     ("admin", "748774", "admin", "ALL"))
 
 
-def merge_databases(desktop_db_bytes, region):
+def merge_databases(temp_db, region):
     """
-    Merge desktop DB with master DB
+    Merge desktop DB (uploaded to temp_db, removed afterwards) with master DB
     Strategy: Last-write-wins for same records, union for different records
+    (set-based staff_db merge engine; returns per-table counts)
     """
     with SYNC_LOCK:
-        # Write uploaded DB to temp file
-        temp_db = os.path.join(DB_DIR, f"temp_{region}.db")
-        with open(temp_db, "wb") as f:
-            f.write(desktop_db_bytes)
-        
         try:
-            desktop_conn = sqlite3.connect(temp_db)
-            
-            # Get all tables from master
-            with get_master_db() as master_conn:
-                master_cur = master_conn.cursor()
-                master_cur.execute("SELECT name FROM sqlite_master WHERE type='table'")
-                tables = [row[0] for row in master_cur.fetchall()]
-                
-                for table in tables:
-                    # For each table, get records from desktop
-                    desktop_cur = desktop_conn.cursor()
-                    desktop_cur.execute(f"SELECT * FROM {table}")
-                    desktop_records = desktop_cur.fetchall()
-                    
-                    # Simple merge: if table is timesheets or employees, merge by ID
-                    if table in ["timesheets", "employees", "vehicles", "drivers"]:
-                        for record in desktop_records:
-                            record_id = record[0]
-                            # Check if exists in master
-                            master_cur.execute(f"SELECT id FROM {table} WHERE id = ?", (record_id,))
-                            exists = master_cur.fetchone() is not None
-                            
-                            if not exists:
-                                # Insert new record
-                                placeholders = ",".join(["?" for _ in record])
-                                master_conn.execute(f"INSERT INTO {table} VALUES ({placeholders})", record)
-            
-            master_conn.commit()
-            return True, "Merge successful"
-        
+            return True, merge_database_file(temp_db, MASTER_DB)
         except Exception as e:
             return False, str(e)
         finally:
-            desktop_conn.close()
             if os.path.exists(temp_db):
                 os.remove(temp_db)
 
 
+@app.after_request
+def compress_json(response):
+    """Compress JSON responses for clients that accept gzip/zstd"""
+    return sync_codec.compress_response(response, request.headers.get("Accept-Encoding"))
+
+
 @app.route("/health", methods=["GET"])
 def health():
     """Health check endpoint (for monitoring)"""
@@ -263,7 +238,8 @@ def sync_desktop_db():
         X-Reason: Sync reason (manual, auto, etc)
     
     Body:
-        file: multipart database file
+        file: multipart database file, or the raw file as application/octet-stream
+        (Content-Encoding gzip/zstd decoded straight to disk)
     """
     
     # Authentication
@@ -275,21 +251,33 @@ def sync_desktop_db():
     region = request.headers.get("X-Region", "Unknown")
     reason = request.headers.get("X-Reason", "unknown")
     
-    # Check file
-    if "db" not in request.files:
-        return jsonify({"success": False, "error": "No database file in request"}), 400
-    
-    file = request.files["db"]
+    # Save the upload without holding it in memory
+    handle, temp_db = tempfile.mkstemp(prefix=f"temp_{region}_", suffix=".db", dir=DB_DIR)
+    os.close(handle)
+    try:
+        if request.mimetype == "application/octet-stream":
+            sync_codec.decode_stream(request.stream, temp_db, request.headers.get("Content-Encoding"))
+        elif "db" in request.files:
+            request.files["db"].save(temp_db)
+        else:
+            os.remove(temp_db)
+            return jsonify({"success": False, "error": "No database file in request"}), 400
+    except sync_codec.UnsupportedEncoding:
+        return jsonify({"success": False, "error": "Unsupported Content-Encoding"}), 415, {
+            "Accept-Encoding": sync_codec.accept_encoding_header()
+        }
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
     
     try:
-        db_bytes = file.read()
-        success, msg = merge_databases(db_bytes, region)
+        success, msg = merge_databases(temp_db, region)
         
         if success:
             log_sync_activity("upload", region, reason, "success")
             return jsonify({
                 "success": True,
                 "message": "Database synced successfully",
+                "merged": msg,
                 "timestamp": datetime.now().isoformat(),
                 "region": region
             })
@@ -314,7 +302,7 @@ def download_latest_db():
     Download latest merged database
     
     Query params:
-        region: (optional) Return only region's data
+        region: (optional) Return only region's data (or X-Region header; ALL = everything)
     """
     
     api_key = request.headers.get("X-API-KEY", "")
@@ -322,15 +310,26 @@ def download_latest_db():
         return jsonify({"success": False, "error": "Invalid API key"}), 401
     
     try:
-        with open(MASTER_DB, "rb") as f:
-            db_bytes = f.read()
-        
-        return send_file(
-            io.BytesIO(db_bytes),
+        # ETag = icerik ozeti; If-None-Match -> 304, Range ile devam
+        region = request.args.get("region") or request.headers.get("X-Region") or "ALL"
+        snapshot_path, etag = download_snapshot(MASTER_DB, region)
+        encoding = sync_codec.choose_encoding(request.headers.get("Accept-Encoding"))
+        if encoding:
+            snapshot_path = sync_codec.encoded_copy(snapshot_path, encoding)
+            etag = f"{etag}-{encoding}"
+        response = send_file(
+            snapshot_path,
             mimetype="application/octet-stream",
             as_attachment=True,
-            download_name="puantaj.db"
+            download_name="puantaj.db",
+            etag=etag,
+            conditional=True,
+            max_age=0
         )
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        response.vary.update(("Accept-Encoding", "X-Region"))
+        return response
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 